@@ -11,7 +11,7 @@ Clients send the key in one of two headers:
 - ``Authorization: Bearer <key>``
 
 The key is checked twice. ``is_request_authorized`` serves the middleware,
-which rejects a request before its body is buffered. ``require_api_key`` is the
+which rejects a request before its body is read. ``require_api_key`` is the
 route dependency, which documents both schemes in the OpenAPI schema and covers
 a route the middleware misses.
 """
@@ -41,7 +41,7 @@ UNAUTHORIZED_MESSAGE = "Invalid or missing API key"
 # The paths the key protects. The middleware and the route dependency read this
 # one definition, so the two cannot drift apart.
 PROTECTED_PATHS = frozenset({"/docx-template", "/pptx-template"})
-PROTECTED_PATH_PREFIXES = ("/convert/",)
+PROTECTED_PATH_PREFIXES = ("/convert/", "/jobs/", "/templates/")
 
 # auto_error=False keeps both schemes optional, so a missing header reaches
 # require_api_key instead of failing inside the security dependency.
@@ -0,0 +1,225 @@
+"""
+What the binaries of this container can do, probed once instead of per request.
+
+The Pandoc-Version header of every conversion, /version and /health all used to
+fork ``pandoc --version`` (and /health ``tectonic --version`` as well) each time
+they answered. The CapabilityRegistry runs these probes in the lifespan and keeps
+the result: the pandoc version with its input and output formats and extensions,
+the tectonic version with the state of its bundle cache, and the Chromium
+version. Everything that needs one of them reads the snapshot.
+
+The binaries do not change while the service runs, so the snapshot is normally
+taken once. CAPABILITIES_REFRESH_INTERVAL (seconds, default 0 = never) re-probes
+periodically, for a deployment that swaps binaries under a running process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import subprocess
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import anyio
+
+from app.chromium_manager import get_chromium_manager
+from app.constants import get_int_env
+
+PANDOC_PATH = "/usr/local/bin/pandoc"
+TECTONIC_PATH = "/usr/bin/tectonic"
+
+DEFAULT_REFRESH_INTERVAL = 0
+MAX_REFRESH_INTERVAL = 86400
+
+# Tectonic's own default when TECTONIC_CACHE_DIR is not set.
+DEFAULT_TECTONIC_CACHE_DIR = Path.home() / ".cache" / "Tectonic"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    """
+    One snapshot of the binaries' capabilities.
+
+    Attributes:
+        pandoc_version: Version of the pandoc binary, None if it could not be run.
+        input_formats: Formats pandoc reads.
+        output_formats: Formats pandoc writes.
+        extensions: Names of the extensions pandoc knows.
+        tectonic: "available", "unavailable" (missing or failing) or "unknown" (unexpected error).
+        tectonic_version: Version of the tectonic binary, None unless available.
+        tectonic_bundle_cached: Whether the TeX bundle is already in tectonic's cache,
+            so the first PDF does not have to download it.
+        chromium_version: Version of the SVG rasterizer's browser, None if it is not running.
+        probed_at: When the snapshot was taken (epoch seconds), None before the first probe.
+    """
+
+    pandoc_version: str | None = None
+    input_formats: frozenset[str] = field(default_factory=frozenset)
+    output_formats: frozenset[str] = field(default_factory=frozenset)
+    extensions: frozenset[str] = field(default_factory=frozenset)
+    tectonic: str = "unknown"
+    tectonic_version: str | None = None
+    tectonic_bundle_cached: bool = False
+    chromium_version: str | None = None
+    probed_at: float | None = None
+
+
+class CapabilityRegistry:
+    """Holds the latest Capabilities snapshot and refreshes it on request or on an interval."""
+
+    def __init__(self, refresh_interval: int | None = None) -> None:
+        """
+        Initialize the registry.
+
+        Args:
+            refresh_interval: Seconds between background refreshes, 0 for none.
+                If None, CAPABILITIES_REFRESH_INTERVAL is read (0-86400, default 0).
+        """
+        if refresh_interval is None:
+            refresh_interval = get_int_env("CAPABILITIES_REFRESH_INTERVAL", DEFAULT_REFRESH_INTERVAL, 0, MAX_REFRESH_INTERVAL)
+        self.refresh_interval = refresh_interval
+        self._capabilities = Capabilities()
+        self._refresh_task: asyncio.Task[None] | None = None
+
+    def get(self) -> Capabilities:
+        """The latest snapshot. Before the first refresh every capability reads as absent."""
+        return self._capabilities
+
+    async def refresh(self) -> Capabilities:
+        """Probe all binaries concurrently and keep the result."""
+        pandoc_version, input_formats, output_formats, extensions, (tectonic, tectonic_version) = await asyncio.gather(
+            probe_pandoc_version(),
+            probe_pandoc_list("--list-input-formats"),
+            probe_pandoc_list("--list-output-formats"),
+            probe_pandoc_list("--list-extensions"),
+            probe_tectonic(),
+        )
+        self._capabilities = Capabilities(
+            pandoc_version=pandoc_version,
+            input_formats=input_formats,
+            output_formats=output_formats,
+            # Listed with their default state, e.g. "+smart" or "-raw_html".
+            extensions=frozenset(extension.lstrip("+-") for extension in extensions),
+            tectonic=tectonic,
+            tectonic_version=tectonic_version,
+            tectonic_bundle_cached=is_tectonic_bundle_cached(),
+            chromium_version=get_chromium_manager().get_version(),
+            probed_at=time.time(),
+        )
+        return self._capabilities
+
+    def start_periodic_refresh(self) -> None:
+        """Start re-probing in the background, if an interval is configured."""
+        if self.refresh_interval > 0 and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+            logger.info("Capabilities are re-probed every %ds", self.refresh_interval)
+
+    async def stop_periodic_refresh(self) -> None:
+        """Stop the background refresh, if it runs."""
+        if self._refresh_task is None:
+            return
+        self._refresh_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._refresh_task
+        self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            # A failed refresh keeps the previous snapshot.
+            except Exception:
+                logger.exception("Error refreshing capabilities")
+
+
+async def probe_pandoc_version() -> str | None:
+    """Get the pandoc version from ``pandoc --version``."""
+    try:
+        result = await anyio.run_process([PANDOC_PATH, "--version"], check=True)
+        # "pandoc 3.8.3" on the first line
+        return _version_from_output(result.stdout)
+    # A missing pandoc version must not fail the caller.
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"Error getting pandoc version: {e}")
+        return None
+
+
+async def probe_pandoc_list(option: str) -> frozenset[str]:
+    """Read one of pandoc's --list-* outputs, one entry per line."""
+    try:
+        result = await anyio.run_process([PANDOC_PATH, option], check=True)
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"Error running pandoc {option}: {e}")
+        return frozenset()
+    return frozenset(line.strip() for line in result.stdout.decode().splitlines() if line.strip())
+
+
+async def probe_tectonic() -> tuple[str, str | None]:
+    """
+    Check the tectonic binary.
+
+    Returns:
+        The availability ("available", "unavailable" or "unknown") and, when
+        available, the version.
+    """
+    try:
+        result = await anyio.run_process([TECTONIC_PATH, "--version"], check=True)
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        logger.warning(f"Tectonic check failed: {e}")
+        return "unavailable", None
+    except Exception as e:  # noqa: BLE001
+        logger.warning(f"Tectonic check error: {e}")
+        return "unknown", None
+    # "Tectonic 0.16.9"
+    return "available", _version_from_output(result.stdout)
+
+
+def _version_from_output(output: bytes) -> str | None:
+    """The last word on the first line of a --version output."""
+    lines = output.decode().splitlines()
+    words = lines[0].split() if lines else []
+    return words[-1] if words else None
+
+
+def is_tectonic_bundle_cached() -> bool:
+    """Whether tectonic's cache directory holds anything, i.e. the bundle was warmed."""
+    cache_dir = Path(os.environ.get("TECTONIC_CACHE_DIR") or DEFAULT_TECTONIC_CACHE_DIR)
+    try:
+        return any(cache_dir.iterdir())
+    except OSError:
+        return False
+
+
+class _RegistryHolder:
+    """Holder class for the global CapabilityRegistry singleton."""
+
+    instance: CapabilityRegistry | None = None
+
+
+def get_capability_registry() -> CapabilityRegistry:
+    """
+    Get the global CapabilityRegistry instance.
+
+    Returns:
+        The global CapabilityRegistry singleton
+    """
+    if _RegistryHolder.instance is None:
+        _RegistryHolder.instance = CapabilityRegistry()
+    return _RegistryHolder.instance
+
+
+def get_capabilities() -> Capabilities:
+    """The latest capabilities snapshot of the global registry."""
+    return get_capability_registry().get()
+
+
+def reset_capability_registry() -> None:
+    """Reset the global CapabilityRegistry instance (useful for testing)."""
+    _RegistryHolder.instance = None
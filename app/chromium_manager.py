@@ -13,6 +13,8 @@ shared "SVG conversion" logic can later be extracted into a common library.
 
 The browser is Playwright's bundled Chromium, installed in the image via
 ``playwright install chromium`` and located through PLAYWRIGHT_BROWSERS_PATH.
+With CHROMIUM_CDP_ENDPOINT set, the manager connects to a browser shared by
+several worker processes instead of launching its own.
 """
 
 from __future__ import annotations
@@ -41,6 +43,16 @@ if TYPE_CHECKING:
 
     from playwright.async_api import Browser, BrowserContext, Page, Playwright
 
+CHROMIUM_ARGS = [
+    "--no-sandbox",
+    "--disable-gpu",
+    "--disable-software-rasterizer",
+    "--disable-dev-shm-usage",
+    "--disable-web-security",  # Allow rendering of local and data URLs without CORS restrictions
+    "--disable-features=IsolateOrigins,site-per-process",  # Disable strict site isolation (needed for local/data URLs to access embedded resources)
+    "--hide-scrollbars",
+]
+
 
 @dataclass
 class ChromiumConfig:
@@ -58,6 +70,8 @@ class ChromiumConfig:
         conversion_timeout: Timeout in seconds for each conversion (5-300, default 30).
         health_check_interval: Interval in seconds for background health checks (10-300, default 30).
         health_check_enabled: Enable background health monitoring (default True).
+        cdp_endpoint: CDP endpoint of a shared browser to connect to instead of launching one
+            (default CHROMIUM_CDP_ENDPOINT, unset = launch).
     """
 
     device_scale_factor: float | None = None
@@ -67,6 +81,7 @@ class ChromiumConfig:
     conversion_timeout: int | None = None
     health_check_interval: int | None = None
     health_check_enabled: bool | None = None
+    cdp_endpoint: str | None = None
 
 
 @dataclass
@@ -294,6 +309,7 @@ class ChromiumManager:
         self.conversion_timeout = self._validate_conversion_timeout(config.conversion_timeout)
         self.health_check_interval = self._validate_health_check_interval(config.health_check_interval)
         self.health_check_enabled = self._validate_health_check_enabled(config.health_check_enabled)
+        self.cdp_endpoint = config.cdp_endpoint or os.environ.get("CHROMIUM_CDP_ENDPOINT") or None
 
         self._playwright: Playwright | None = None
         self._browser: Browser | None = None
@@ -329,18 +345,7 @@ class ChromiumManager:
             self.log.info("Starting Chromium browser process via Playwright...")
             self._playwright = await async_playwright().start()
 
-            self._browser = await self._playwright.chromium.launch(
-                headless=True,
-                args=[
-                    "--no-sandbox",
-                    "--disable-gpu",
-                    "--disable-software-rasterizer",
-                    "--disable-dev-shm-usage",
-                    "--disable-web-security",  # Allow rendering of local and data URLs without CORS restrictions
-                    "--disable-features=IsolateOrigins,site-per-process",  # Disable strict site isolation (needed for local/data URLs to access embedded resources)
-                    "--hide-scrollbars",
-                ],
-            )
+            self._browser = await self._connect_or_launch(self._playwright)
 
             self._started = True
             self._metrics.reset_start_time()
@@ -384,6 +389,19 @@ class ChromiumManager:
             self._started = False
             raise
 
+    async def _connect_or_launch(self, playwright: Playwright) -> Browser:
+        """Connect to the shared browser if there is one, else launch a browser of this process."""
+        if self.cdp_endpoint:
+            try:
+                browser = await playwright.chromium.connect_over_cdp(self.cdp_endpoint)
+            # A shared browser that is gone must not take SVG conversion down with it.
+            except Exception as e:  # noqa: BLE001
+                self.log.warning("Could not connect to the shared Chromium at %s, launching one: %s", self.cdp_endpoint, e)
+            else:
+                self.log.info("Connected to the shared Chromium at %s", self.cdp_endpoint)
+                return browser
+        return await playwright.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+
     async def stop(self) -> None:
         """Stop the persistent Chromium browser process."""
         async with self._lock:
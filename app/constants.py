@@ -1,5 +1,6 @@
 """Small shared helpers for environment configuration."""
 
+import logging
 import os
 
 # API version for compatibility checking with docx-exporter.
@@ -9,7 +10,41 @@ API_VERSION = 1
 
 _TRUTHY_VALUES = ("true", "1", "yes", "on")
 
+logger = logging.getLogger(__name__)
+
 
 def get_bool_env(name: str, default: bool = False) -> bool:
     """Read a boolean environment variable."""
     return os.environ.get(name, str(default).lower()).lower() in _TRUTHY_VALUES
+
+
+def get_int_env(name: str, default: int, min_value: int, max_value: int) -> int:
+    """Read an integer environment variable, falling back to the default when it is invalid or out of range."""
+    configured = os.environ.get(name)
+    if configured is None or not configured.strip():
+        return default
+    try:
+        value = int(configured)
+    except ValueError:
+        logger.warning("%s value '%s' is not a valid integer, using default: %s", name, configured, default)
+        return default
+    if not (min_value <= value <= max_value):
+        logger.warning("%s must be between %s and %s, using default: %s", name, min_value, max_value, default)
+        return default
+    return value
+
+
+def get_float_env(name: str, default: float, min_value: float, max_value: float) -> float:
+    """Read a float environment variable, falling back to the default when it is invalid or out of range."""
+    configured = os.environ.get(name)
+    if configured is None or not configured.strip():
+        return default
+    try:
+        value = float(configured)
+    except ValueError:
+        logger.warning("%s value '%s' is not a valid number, using default: %s", name, configured, default)
+        return default
+    if not (min_value <= value <= max_value):
+        logger.warning("%s must be between %s and %s, using default: %s", name, min_value, max_value, default)
+        return default
+    return value
@@ -0,0 +1,309 @@
+"""
+Compressed request and response bodies.
+
+The textual outputs (HTML, Markdown, LaTeX, JSON, plain text, Textile, RTF) went
+out uncompressed, and HTML sources with inline base64 images came in
+uncompressed, often tens of MB across a WAN link. Two ASGI middlewares handle
+the content codings now, gzip always and zstd where Python was built with it:
+
+- ResponseCompressionMiddleware compresses a textual response while it streams,
+  in the coding the client prefers in Accept-Encoding.
+- RequestDecompressionMiddleware decompresses a request body sent with
+  Content-Encoding while it streams. It hands the application at most
+  DECODED_CHUNK_SIZE bytes at a time and sits in front of the
+  RequestSizeLimitMiddleware, so the body limit applies to the decompressed
+  stream: a small body that inflates beyond it gets 413 once the limit is
+  crossed, before the rest of it is decompressed.
+"""
+
+from __future__ import annotations
+
+import logging
+import zlib
+from typing import TYPE_CHECKING, Any, Protocol
+
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.constants import get_bool_env, get_int_env
+
+try:
+    from compression import zstd
+# Python's zstd module needs libzstd at build time.
+except ImportError:
+    zstd = None
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+GZIP = "gzip"
+ZSTD = "zstd"
+IDENTITY = "identity"
+
+DEFAULT_MIN_COMPRESSED_SIZE = 1024
+MAX_MIN_COMPRESSED_SIZE = 1024 * 1024 * 1024
+
+# Largest piece of a decompressed request body handed to the application at once.
+DECODED_CHUNK_SIZE = 64 * 1024
+
+# gzip framing for zlib's (de)compressobj.
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Compressible types besides text/*.
+_TEXTUAL_MEDIA_TYPES = frozenset({"application/json", "application/xml", "application/x-latex", "application/x-tex", "application/rtf", "application/javascript"})
+
+
+def get_supported_encodings() -> tuple[str, ...]:
+    """The content codings this Python supports, the preferred one first."""
+    return (ZSTD, GZIP) if zstd is not None else (GZIP,)
+
+
+def is_response_compression_enabled() -> bool:
+    """Whether textual responses are compressed for clients that accept it (RESPONSE_COMPRESSION_ENABLED, default true)."""
+    return get_bool_env("RESPONSE_COMPRESSION_ENABLED", default=True)
+
+
+def get_min_compressed_size() -> int:
+    """Smallest response body worth compressing in bytes (RESPONSE_COMPRESSION_MIN_SIZE, default 1024)."""
+    return get_int_env("RESPONSE_COMPRESSION_MIN_SIZE", DEFAULT_MIN_COMPRESSED_SIZE, 0, MAX_MIN_COMPRESSED_SIZE)
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """
+    Negotiate the coding of a response.
+
+    Returns:
+        The supported coding with the highest quality in the Accept-Encoding
+        header, the server's preference breaking ties, or None for identity.
+    """
+    if not accept_encoding:
+        return None
+    qualities: dict[str, float] = {}
+    for entry in accept_encoding.split(","):
+        coding, _, parameters = entry.partition(";")
+        quality = 1.0
+        name, _, value = parameters.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in get_supported_encodings():
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def is_textual(media_type: str) -> bool:
+    """Whether a response of this Content-Type is worth compressing."""
+    media_type = media_type.partition(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in _TEXTUAL_MEDIA_TYPES or media_type.endswith(("+json", "+xml"))
+
+
+class _Compressor(Protocol):
+    def compress(self, data: bytes, /) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+def _make_compressor(encoding: str) -> _Compressor:
+    if encoding == ZSTD and zstd is not None:
+        return zstd.ZstdCompressor()
+    return zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS)
+
+
+class ResponseCompressionMiddleware:
+    """Compresses textual responses in the coding the client accepts."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding")) if scope["type"] == "http" and is_response_compression_enabled() else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        min_size = get_min_compressed_size()
+        compressor: _Compressor | None = None
+
+        async def compressing_send(message: Message) -> None:
+            nonlocal compressor
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if _should_compress(message["status"], headers, min_size):
+                    compressor = _make_compressor(encoding)
+                    del headers["content-length"]
+                    headers["content-encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    # The compressed bytes are another representation; If-None-Match compares weak tags alike.
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        headers["etag"] = f"W/{etag}"
+            elif message["type"] == "http.response.body" and compressor is not None:
+                more_body = message.get("more_body", False)
+                body = compressor.compress(message.get("body", b""))
+                if not more_body:
+                    body += compressor.flush()
+                # An empty piece in the middle is not worth a message.
+                if not body and more_body:
+                    return
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await send(message)
+
+        # A file sent by the server itself would bypass the compression.
+        extensions = {name: value for name, value in scope.get("extensions", {}).items() if name != "http.response.pathsend"}
+        await self.app({**scope, "extensions": extensions}, receive, compressing_send)
+
+
+def _should_compress(status: int, headers: MutableHeaders, min_size: int) -> bool:
+    if status in {204, 206, 304} or "content-encoding" in headers or not is_textual(headers.get("content-type", "")):
+        return False
+    content_length = headers.get("content-length")
+    return content_length is None or not content_length.isdigit() or int(content_length) >= min_size
+
+
+# What a corrupt body raises while it is decompressed.
+_DECODE_ERRORS: tuple[type[Exception], ...] = (zlib.error, ValueError) if zstd is None else (zlib.error, ValueError, zstd.ZstdError)
+
+
+class _StreamDecoder:
+    """Decompresses a body of one or more gzip members or zstd frames, a bounded piece at a time."""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        # zlib keeps the input its output limit held back in unconsumed_tail, zstd keeps it inside.
+        self._is_gzip = encoding == GZIP
+        self._decompressor = self._new_decompressor()
+
+    # zlib exports no name for the type of its decompressor.
+    def _new_decompressor(self) -> Any:
+        if self.encoding == ZSTD and zstd is not None:
+            return zstd.ZstdDecompressor()
+        return zlib.decompressobj(_GZIP_WBITS)
+
+    @property
+    def eof(self) -> bool:
+        """Whether the input ended at the end of a member or frame."""
+        return self._decompressor.eof and not self._decompressor.unused_data
+
+    def has_pending_output(self) -> bool:
+        """Whether the input fed so far yields more output."""
+        decompressor = self._decompressor
+        if decompressor.eof:
+            # The start of the next member or frame.
+            return bool(decompressor.unused_data)
+        if self._is_gzip:
+            return bool(decompressor.unconsumed_tail)
+        return not decompressor.needs_input
+
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        """Feed more input and return at most max_length bytes of output."""
+        decompressor = self._decompressor
+        if decompressor.eof:
+            data = decompressor.unused_data + data
+            if not data:
+                return b""
+            decompressor = self._decompressor = self._new_decompressor()
+        if self._is_gzip:
+            return decompressor.decompress(decompressor.unconsumed_tail + data, max_length)
+        return decompressor.decompress(data, max_length)
+
+
+class RequestDecompressionMiddleware:
+    """Decompresses request bodies sent with Content-Encoding while they stream."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application, the RequestSizeLimitMiddleware for the body limit to apply after decompression.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = Headers(scope=scope).get("content-encoding", IDENTITY).strip().lower() if scope["type"] == "http" else IDENTITY
+        if encoding == IDENTITY:
+            await self.app(scope, receive, send)
+            return
+        if encoding not in get_supported_encodings():
+            logger.error("Unsupported request Content-Encoding '%s'", encoding)
+            supported = ", ".join(get_supported_encodings())
+            await PlainTextResponse(f"Unsupported Content-Encoding '{encoding}', expected one of: {supported}", status_code=415, headers={"Accept-Encoding": supported})(scope, receive, send)
+            return
+
+        await _DecodedRequest(self.app, scope, receive, send, _StreamDecoder(encoding)).run()
+
+
+class _DecodedRequest:
+    """The state of one request whose body is decompressed on its way to the application."""
+
+    def __init__(self, app: ASGIApp, scope: Scope, receive: Receive, send: Send, decoder: _StreamDecoder) -> None:
+        self.app = app
+        # The size of the decompressed body is unknown, so the body limit counts it as it streams.
+        self.scope = {**scope, "headers": [(name, value) for name, value in scope["headers"] if name not in {b"content-encoding", b"content-length"}]}
+        self.receive = receive
+        self.send = send
+        self.decoder = decoder
+        self.upstream_done = False
+        self.body_done = False
+        self.failed = False
+        self.response_started = False
+
+    async def run(self) -> None:
+        await self.app(self.scope, self.decoded_receive, self.guarded_send)
+
+    async def decoded_receive(self) -> Message:
+        if self.failed:
+            return {"type": "http.disconnect"}
+        # Past the body, the application only waits for the disconnect.
+        if self.body_done:
+            return await self.receive()
+        while True:
+            if self.decoder.has_pending_output() or self.upstream_done:
+                data = b""
+            else:
+                message = await self.receive()
+                if message["type"] != "http.request":
+                    return message
+                data = message.get("body", b"")
+                self.upstream_done = not message.get("more_body", False)
+            try:
+                body = self.decoder.decompress(data, DECODED_CHUNK_SIZE)
+            except _DECODE_ERRORS as e:
+                return await self._reject(e)
+            finished = self.upstream_done and not self.decoder.has_pending_output()
+            if finished and not self.decoder.eof:
+                return await self._reject(ValueError("The compressed body ends early"))
+            if body or finished:
+                self.body_done = finished
+                return {"type": "http.request", "body": body, "more_body": not finished}
+
+    async def guarded_send(self, message: Message) -> None:
+        if self.failed:
+            # The 400 went out in place of whatever the application answers.
+            return
+        if message["type"] == "http.response.start":
+            self.response_started = True
+        await self.send(message)
+
+    async def _reject(self, error: Exception) -> Message:
+        self.failed = True
+        logger.error("Invalid compressed request body: %s", error)
+        # A response already on its way cannot be replaced; the disconnect alone then stops the upload.
+        if not self.response_started:
+            await PlainTextResponse(f"Invalid compressed request body: {error}", status_code=400)(self.scope, self.receive, self.send)
+        return {"type": "http.disconnect"}
@@ -0,0 +1,94 @@
+"""
+A cheap scan of a source for the constructs the optional stages of its pipeline handle.
+
+Several stages only ever change a document that contains a certain construct:
+inline_styles.lua rewrites elements carrying inline CSS, the list stages
+rewrite lists, the table filters tables, the math colour stages equations. The
+scan searches the bytes of an HTML source, or the body parts of a DOCX (the
+parts the DOCX preprocessing rewrites), for the markup of each construct, and a
+pipeline skips the stages whose construct is absent (ConversionPipeline.requires).
+
+The patterns err on the side of finding a construct: text that merely looks like
+the markup only costs a stage that would have changed nothing. A source that
+cannot be scanned (a DOCX that is not a zip, HTML that is not in an ASCII-based
+encoding) has no features, and every stage runs.
+"""
+
+from __future__ import annotations
+
+import io
+import re
+import zipfile
+import zlib
+
+from .docx_ooxml import enumerate_body_parts
+
+INLINE_CSS = "inline_css"
+LISTS = "lists"
+TABLES = "tables"
+IMAGES = "images"
+MATH = "math"
+CAPTIONS = "captions"
+
+# A style attribute, or a paragraph-format wrapper written into the source
+# itself (inline_styles.lua handles div.pandoc-para without looking further).
+_HTML_FEATURES: dict[str, re.Pattern[bytes]] = {
+    INLINE_CSS: re.compile(rb"style\s*=|pandoc-para", re.IGNORECASE),
+    LISTS: re.compile(rb"<[ou]l[\s>/]", re.IGNORECASE),
+    TABLES: re.compile(rb"<table[\s>/]", re.IGNORECASE),
+    IMAGES: re.compile(rb"<img[\s>/]", re.IGNORECASE),
+    MATH: re.compile(rb"math/tex", re.IGNORECASE),
+    CAPTIONS: re.compile(rb"polarion-rte-caption"),
+}
+
+# Element names with any namespace prefix: the WordprocessingML and Office math
+# namespaces are conventionally w: and m:, but a prefix is the writer's choice.
+_DOCX_FEATURES: dict[str, re.Pattern[bytes]] = {
+    LISTS: re.compile(rb"<(?:[\w.-]+:)?numPr[\s>/]"),
+    TABLES: re.compile(rb"<(?:[\w.-]+:)?tbl[\s>/]"),
+    MATH: re.compile(rb"<(?:[\w.-]+:)?oMath"),
+}
+
+# A BOM or a NUL byte early on marks an encoding the byte patterns cannot read.
+_WIDE_ENCODING_PREFIXES = (b"\xff\xfe", b"\xfe\xff")
+_ENCODING_PROBE_SIZE = 1024
+
+SCANNED_FORMATS = frozenset({"html", "docx"})
+
+# A damaged, encrypted or exotically compressed package is left to pandoc to refuse.
+_UNREADABLE_PACKAGE_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError)
+
+
+def scan_content(source: bytes, source_format: str) -> frozenset[str] | None:
+    """
+    The constructs a source contains.
+
+    Returns:
+        The features found, or None if the source cannot be scanned.
+    """
+    if source_format == "html":
+        return _scan_html(source)
+    if source_format == "docx":
+        return _scan_docx(source)
+    return None
+
+
+def _scan_html(source: bytes) -> frozenset[str] | None:
+    if source.startswith(_WIDE_ENCODING_PREFIXES) or b"\x00" in source[:_ENCODING_PROBE_SIZE]:
+        return None
+    return frozenset(feature for feature, pattern in _HTML_FEATURES.items() if pattern.search(source))
+
+
+def _scan_docx(source: bytes) -> frozenset[str] | None:
+    try:
+        with zipfile.ZipFile(io.BytesIO(source)) as docx:
+            parts = enumerate_body_parts(docx.namelist())
+            features: set[str] = set()
+            for part in parts:
+                xml = docx.read(part)
+                features.update(feature for feature, pattern in _DOCX_FEATURES.items() if feature not in features and pattern.search(xml))
+                if len(features) == len(_DOCX_FEATURES):
+                    break
+    except _UNREADABLE_PACKAGE_ERRORS:
+        return None
+    return frozenset(features)
@@ -0,0 +1,76 @@
+"""
+Packaging of the documents of a multi-target conversion into one response body.
+
+A zip archive is the default. A client that accepts ``multipart/mixed`` gets the
+documents as the parts of a multipart body instead, with nothing to unpack. The
+body is written to a file, so the documents are copied in chunks and never all
+held in memory at once.
+"""
+
+from __future__ import annotations
+
+import shutil
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+ZIP_MEDIA_TYPE = "application/zip"
+MULTIPART_MEDIA_TYPE = "multipart/mixed"
+
+# These containers are zip archives or compressed already; deflating them again costs time and saves nothing.
+_STORED_FORMATS = frozenset({"docx", "pptx", "odt", "epub", "pdf"})
+
+_COPY_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class BundleEntry:
+    """One document of a bundle: the post-processed bytes, or the path of pandoc's output file."""
+
+    target_format: str
+    file_name: str
+    media_type: str
+    content: bytes | Path
+
+
+def wants_multipart(accept: str | None) -> bool:
+    """Whether an Accept header asks for multipart/mixed rather than the default zip archive."""
+    if not accept:
+        return False
+    media_ranges = [media_range.split(";", 1)[0].strip().lower() for media_range in accept.split(",")]
+    return MULTIPART_MEDIA_TYPE in media_ranges and ZIP_MEDIA_TYPE not in media_ranges
+
+
+def create_boundary() -> str:
+    return f"pandoc-service-{uuid.uuid4().hex}"
+
+
+def write_zip(entries: Sequence[BundleEntry], destination: Path) -> None:
+    """Write the documents into a zip archive, one file per target."""
+    with zipfile.ZipFile(destination, "w") as archive:
+        for entry in entries:
+            compress_type = zipfile.ZIP_STORED if entry.target_format in _STORED_FORMATS else zipfile.ZIP_DEFLATED
+            if isinstance(entry.content, Path):
+                archive.write(entry.content, entry.file_name, compress_type=compress_type)
+            else:
+                archive.writestr(entry.file_name, entry.content, compress_type=compress_type)
+
+
+def write_multipart(entries: Sequence[BundleEntry], destination: Path, boundary: str) -> None:
+    """Write the documents as the parts of a multipart/mixed body delimited by boundary."""
+    with destination.open("wb") as body:
+        for entry in entries:
+            headers = f"--{boundary}\r\nContent-Type: {entry.media_type}\r\nContent-Disposition: attachment; filename={entry.file_name}\r\n\r\n"
+            body.write(headers.encode("utf-8"))
+            if isinstance(entry.content, Path):
+                with entry.content.open("rb") as content:
+                    shutil.copyfileobj(content, body, _COPY_CHUNK_SIZE)
+            else:
+                body.write(entry.content)
+            body.write(b"\r\n")
+        body.write(f"--{boundary}--\r\n".encode("ascii"))
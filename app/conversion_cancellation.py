@@ -0,0 +1,195 @@
+"""
+Cancellation of conversions nobody waits for anymore.
+
+A caller that times out or disconnects used to leave its conversion running:
+the SVG rasterization in Chromium, pandoc and the tectonic it spawns all went
+on to completion, for an answer nobody read. The
+ConversionCancellationMiddleware runs each conversion as a task of its own and
+cancels it when
+
+- the client disconnects before the response starts, or
+- its deadline passes: the ``timeout`` query parameter or the
+  ``X-Conversion-Timeout`` header in seconds, by default and at most
+  CONVERSION_TIMEOUT (600 s, 0 for none). The client then gets 504.
+
+The cancellation travels down the awaits of the conversion. The executor kills
+pandoc's process group (tectonic included), a pending SVG conversion closes its
+Chromium page, and the scratch files are removed on the way out. Cancelled
+conversions are counted in pandoc_cancelled_conversions_total.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import math
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs
+
+from fastapi.responses import PlainTextResponse
+
+from app.constants import get_int_env
+from app.load_shedding import get_conversion_target_format
+from app.prometheus_metrics import increment_cancelled_conversion
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONVERSION_TIMEOUT = 600
+MAX_CONVERSION_TIMEOUT = 86400
+
+TIMEOUT_QUERY_PARAMETER = "timeout"
+TIMEOUT_HEADER = b"x-conversion-timeout"
+
+CONVERSION_TIMEOUT_MESSAGE = "Conversion timed out"
+
+
+def get_conversion_timeout() -> int:
+    """Default and largest conversion deadline in seconds, 0 for none (CONVERSION_TIMEOUT)."""
+    return get_int_env("CONVERSION_TIMEOUT", DEFAULT_CONVERSION_TIMEOUT, 0, MAX_CONVERSION_TIMEOUT)
+
+
+def get_requested_timeout(scope: Scope) -> float | None:
+    """
+    Read the deadline a client asked for.
+
+    The query parameter takes precedence over the header.
+
+    Returns:
+        The requested timeout in seconds, None if the client asked for none.
+
+    Raises:
+        ValueError: If the value is not a positive, finite number.
+    """
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    configured = query[TIMEOUT_QUERY_PARAMETER][0] if TIMEOUT_QUERY_PARAMETER in query else None
+    if configured is None:
+        configured = next((value.decode("latin-1") for name, value in scope.get("headers", []) if name == TIMEOUT_HEADER), None)
+    if configured is None:
+        return None
+    timeout = float(configured)
+    if not (0 < timeout < math.inf):
+        raise ValueError(f"Timeout must be a positive number of seconds, got '{configured}'")
+    return timeout
+
+
+class ConversionCancellationMiddleware:
+    """Cancels a conversion whose client disconnected or whose deadline passed."""
+
+    def __init__(self, app: ASGIApp, default_timeout: int | None = None) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application.
+            default_timeout: Deadline of a conversion that asks for none, and the
+                longest one it may ask for; 0 for none. If None, CONVERSION_TIMEOUT
+                is read (0-86400, default 600).
+        """
+        self.app = app
+        self.default_timeout = get_conversion_timeout() if default_timeout is None else default_timeout
+
+    def get_timeout(self, scope: Scope) -> float | None:
+        """The deadline of one conversion in seconds, None for none."""
+        requested = get_requested_timeout(scope)
+        if requested is None:
+            return self.default_timeout or None
+        return min(requested, self.default_timeout) if self.default_timeout else requested
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        target_format = get_conversion_target_format(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if target_format is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            timeout = self.get_timeout(scope)
+        except ValueError as e:
+            logger.error("Invalid conversion timeout: %s", e)
+            await PlainTextResponse(content=f"Invalid conversion timeout: {e}", status_code=400)(scope, receive, send)
+            return
+
+        await _CancellableConversion(self.app, scope, receive, send, target_format).run(timeout)
+
+
+class _CancellableConversion:
+    """The state of one conversion request between the server and the application."""
+
+    def __init__(self, app: ASGIApp, scope: Scope, receive: Receive, send: Send, target_format: str) -> None:
+        self.app = app
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.target_format = target_format
+        self.cancel_reason: str | None = None
+        self.response_started = False
+        self.disconnected = asyncio.Event()
+        self.app_task: asyncio.Task[None] | None = None
+        self.watcher: asyncio.Task[None] | None = None
+
+    async def run(self, time_limit: float | None) -> None:
+        # A task of its own, so it can be cancelled once. A cancellation that
+        # repeats on every await would also break off the cleanup it triggers.
+        self.app_task = asyncio.create_task(self.app(self.scope, self.guarded_receive, self.guarded_send))
+        deadline = asyncio.get_running_loop().call_later(time_limit, self.cancel, "deadline") if time_limit else None
+        try:
+            await self.app_task
+        except asyncio.CancelledError:
+            if not self.app_task.done():
+                # The server cancelled this request, so the conversion goes too.
+                self.app_task.cancel()
+                raise
+            if self.cancel_reason is None:
+                raise
+            increment_cancelled_conversion(self.target_format, self.cancel_reason)
+            if self.cancel_reason == "disconnect":
+                logger.warning("Client disconnected, cancelled conversion to %s", self.target_format)
+            else:
+                logger.warning("%s after %ss, cancelled conversion to %s", CONVERSION_TIMEOUT_MESSAGE, time_limit, self.target_format)
+                await PlainTextResponse(content=f"{CONVERSION_TIMEOUT_MESSAGE} after {time_limit:g} seconds", status_code=504)(self.scope, self.receive, self.send)
+        finally:
+            if deadline is not None:
+                deadline.cancel()
+            await self._stop_watcher()
+
+    def cancel(self, reason: str) -> None:
+        """Cancel the conversion, unless its response is already on its way."""
+        if self.response_started or self.cancel_reason is not None or self.app_task is None or self.app_task.done():
+            return
+        self.cancel_reason = reason
+        self.app_task.cancel()
+
+    async def guarded_receive(self) -> Message:
+        if self.watcher is not None:
+            # The watcher reads the connection now, the application only learns of the disconnect.
+            await self.disconnected.wait()
+            return {"type": "http.disconnect"}
+        message = await self.receive()
+        if message["type"] == "http.disconnect":
+            # Gone while uploading: the application sees it and stops reading.
+            self.disconnected.set()
+        elif not message.get("more_body", False):
+            self.watcher = asyncio.create_task(self._watch_for_disconnect())
+        return message
+
+    async def guarded_send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # The conversion is done; sending its result is neither timed nor cancelled.
+            self.response_started = True
+        await self.send(message)
+
+    async def _watch_for_disconnect(self) -> None:
+        while (await self.receive())["type"] != "http.disconnect":
+            pass
+        self.disconnected.set()
+        self.cancel("disconnect")
+
+    async def _stop_watcher(self) -> None:
+        if self.watcher is None or self.watcher.done():
+            return
+        self.watcher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.watcher
@@ -0,0 +1,338 @@
+"""
+Bounded, non-blocking execution of the pandoc subprocess.
+
+The conversion endpoints are async, so a pandoc run must never block the event
+loop: a large DOCX -> PDF through tectonic would otherwise freeze health checks,
+metrics and every other upload for its whole duration. The ConversionExecutor
+drives pandoc's pipes on the event loop and admits at most
+PANDOC_MAX_CONCURRENT_CONVERSIONS runs at a time. A conversion beyond that waits in a FIFO queue (asyncio's
+semaphore wakes its waiters in arrival order and lets no newcomer overtake
+them), and the queue depth and waiting time are exported to Prometheus.
+
+asyncio would reap pandoc itself and drop its resource usage, so the executor
+spawns it with Popen and reaps it with os.wait4 once its pidfd tells it
+exited. The usage of each run is accounted from that (app.resource_accounting).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import subprocess
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from app.constants import get_int_env
+from app.pandoc_runtime import HEAP_OVERFLOW_EXIT_CODE, PandocHeapExhaustedError
+from app.prometheus_metrics import observe_queue_wait_duration, observe_subprocess_duration
+from app.resource_accounting import ResourceUsage, record_child_usage
+from app.scratch_workspace import get_scratch_dir
+
+if TYPE_CHECKING:
+    import resource
+    from collections.abc import AsyncGenerator
+
+DEFAULT_MAX_CONCURRENT_CONVERSIONS = 4
+MIN_CONCURRENT_CONVERSIONS = 1
+MAX_CONCURRENT_CONVERSIONS = 100
+MAX_SATURATION_QUEUE_SIZE = 10000
+
+
+@dataclass
+class ConversionExecutorMetrics:
+    """
+    Queue and admission statistics of the ConversionExecutor.
+
+    Attributes:
+        queue_size: Current number of conversions waiting for a slot.
+        max_queue_size: Largest queue observed since start.
+        active_conversions: Current number of running pandoc subprocesses.
+        total_admitted: Number of conversions that obtained a slot since start.
+        total_queue_time_ms: Total time admitted conversions spent waiting (for averaging).
+        avg_queue_time_ms: Average time a conversion waited for its slot.
+    """
+
+    queue_size: int = 0
+    max_queue_size: int = 0
+    active_conversions: int = 0
+    total_admitted: int = 0
+    total_queue_time_ms: float = 0.0
+    avg_queue_time_ms: float = 0.0
+
+    def record_admission(self, queue_time_ms: float) -> None:
+        """Record that a waiting conversion obtained a slot."""
+        self.total_admitted += 1
+        self.total_queue_time_ms += queue_time_ms
+        self.avg_queue_time_ms = self.total_queue_time_ms / self.total_admitted
+
+    def update_queue_metrics(self, queue_size: int, active_conversions: int) -> None:
+        """Update the current queue depth and the number of running conversions."""
+        self.queue_size = queue_size
+        self.active_conversions = active_conversions
+        self.max_queue_size = max(self.max_queue_size, queue_size)
+
+
+class ConversionExecutor:
+    """
+    Runs pandoc subprocesses without blocking the event loop, at most N at a time.
+
+    Every caller of run() first waits for a slot, then spawns the process and
+    awaits its exit. A caller cancelled while its process runs kills
+    that process and its children, so an abandoned conversion does not keep its
+    slot.
+    """
+
+    def __init__(self, max_concurrent_conversions: int | None = None, logger: logging.Logger | None = None, saturation_queue_size: int | None = None) -> None:
+        """
+        Initialize the executor.
+
+        Args:
+            max_concurrent_conversions: Maximum number of pandoc subprocesses running at once.
+                If None, PANDOC_MAX_CONCURRENT_CONVERSIONS is read (1-100, default 4).
+            logger: Optional logger; if None, a module-level logger is used.
+            saturation_queue_size: Number of waiting conversions at which the executor
+                counts as saturated. If None, PANDOC_SATURATION_QUEUE_SIZE is read
+                (1-10000, default max_concurrent_conversions).
+        """
+        self.log = logger or logging.getLogger(__name__)
+        if max_concurrent_conversions is None:
+            max_concurrent_conversions = get_int_env("PANDOC_MAX_CONCURRENT_CONVERSIONS", DEFAULT_MAX_CONCURRENT_CONVERSIONS, MIN_CONCURRENT_CONVERSIONS, MAX_CONCURRENT_CONVERSIONS)
+        if not (MIN_CONCURRENT_CONVERSIONS <= max_concurrent_conversions <= MAX_CONCURRENT_CONVERSIONS):
+            raise ValueError(f"max_concurrent_conversions must be between {MIN_CONCURRENT_CONVERSIONS} and {MAX_CONCURRENT_CONVERSIONS}")
+        self.max_concurrent_conversions = max_concurrent_conversions
+        if saturation_queue_size is None:
+            saturation_queue_size = get_int_env("PANDOC_SATURATION_QUEUE_SIZE", max_concurrent_conversions, 1, MAX_SATURATION_QUEUE_SIZE)
+        self.saturation_queue_size = saturation_queue_size
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_conversions)
+        self._metrics = ConversionExecutorMetrics()
+        self._waiting_in_queue = 0
+        self._active_conversions = 0
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncGenerator[None]:
+        """
+        Hold one conversion slot for the duration of the context.
+
+        The counters are only touched from the event loop thread, between
+        awaits, so they need no lock of their own.
+        """
+        queue_entry_time = time.time()
+        self._waiting_in_queue += 1
+        self._publish_queue_state()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            # Leaves the queue whether the slot was obtained or the wait was cancelled.
+            self._waiting_in_queue -= 1
+        try:
+            queue_time = time.time() - queue_entry_time
+            self._metrics.record_admission(queue_time * 1000)
+            observe_queue_wait_duration(queue_time)
+            self._active_conversions += 1
+            self._publish_queue_state()
+            yield
+        finally:
+            self._active_conversions -= 1
+            self._publish_queue_state()
+            self._semaphore.release()
+
+    async def run(self, cmd: list[str]) -> None:
+        """
+        Run one pandoc invocation once a slot is free.
+
+        Args:
+            cmd: The complete, already validated command line.
+
+        Raises:
+            PandocHeapExhaustedError: If pandoc ran out of the heap its runtime options allow.
+            subprocess.CalledProcessError: If the process exits with any other non-zero status.
+        """
+        await self._run(cmd, None, capture_output=False)
+
+    async def run_piped(self, cmd: list[str], source: bytes | None) -> bytes:
+        """
+        Run one pandoc invocation that writes its output to stdout once a slot is free.
+
+        Args:
+            cmd: The complete, already validated command line, with ``-o -``.
+            source: Written to pandoc's stdin, or None if pandoc reads a source file.
+
+        Returns:
+            What pandoc wrote to stdout.
+
+        Raises:
+            PandocHeapExhaustedError: If pandoc ran out of the heap its runtime options allow.
+            subprocess.CalledProcessError: If the process exits with any other non-zero status.
+        """
+        return await self._run(cmd, source, capture_output=True)
+
+    async def _run(self, cmd: list[str], source: bytes | None, *, capture_output: bool) -> bytes:
+        # Whatever pandoc and its PDF engine write besides the output lands in the scratch workspace of the conversion.
+        scratch_dir = str(get_scratch_dir())
+        async with self.admit():
+            subprocess_start_time = time.time()
+            # The command is built from allowlisted formats and options only.
+            # A session of its own makes pandoc the leader of a process group
+            # that also holds the PDF engine it spawns.
+            process = subprocess.Popen(  # noqa: ASYNC220, S603
+                cmd,
+                stdin=subprocess.DEVNULL if source is None else subprocess.PIPE,
+                stdout=subprocess.PIPE if capture_output else None,
+                cwd=scratch_dir,
+                env={**os.environ, "TMPDIR": scratch_dir},
+                start_new_session=True,
+            )
+            reaped = _reap(process.pid)
+            try:
+                output = await _communicate(process, source)
+                returncode, rusage = await asyncio.shield(reaped)
+            except asyncio.CancelledError:
+                self.log.warning("Conversion cancelled, killing pandoc process group %d", process.pid)
+                kill_process_group(process.pid)
+                # A killed conversion is reaped, but not accounted.
+                process.returncode, _ = await asyncio.shield(reaped)
+                raise
+            process.returncode = returncode
+            observe_subprocess_duration(time.time() - subprocess_start_time)
+            record_child_usage(ResourceUsage.from_rusage(rusage))
+
+        if returncode == HEAP_OVERFLOW_EXIT_CODE:
+            raise PandocHeapExhaustedError(returncode, cmd)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+        # No stdout pipe, no output: pandoc wrote its file.
+        return output
+
+    def get_queue_size(self) -> int:
+        """Number of conversions currently waiting for a slot."""
+        return self._waiting_in_queue
+
+    def get_active_conversions(self) -> int:
+        """Number of pandoc subprocesses currently running."""
+        return self._active_conversions
+
+    def is_saturated(self) -> bool:
+        """Whether as many conversions wait for a slot as the saturation threshold allows."""
+        return self._waiting_in_queue >= self.saturation_queue_size
+
+    def get_metrics(self) -> dict[str, int | float]:
+        """
+        Get the current queue and admission metrics.
+
+        Returns:
+            Dictionary containing queue depth, running conversions and waiting times.
+        """
+        return {
+            "queue_size": self._metrics.queue_size,
+            "max_queue_size": self._metrics.max_queue_size,
+            "active_conversions": self._metrics.active_conversions,
+            "total_admitted": self._metrics.total_admitted,
+            "avg_queue_time_ms": round(self._metrics.avg_queue_time_ms, 2),
+            "max_concurrent_conversions": self.max_concurrent_conversions,
+        }
+
+    def _publish_queue_state(self) -> None:
+        self._metrics.update_queue_metrics(self._waiting_in_queue, self._active_conversions)
+
+
+async def _communicate(process: subprocess.Popen[bytes], source: bytes | None) -> bytes:
+    """Feed pandoc's stdin and drain its stdout on the event loop at once, so neither pipe fills up and stalls pandoc."""
+    loop = asyncio.get_running_loop()
+    transports: list[asyncio.BaseTransport] = []
+    try:
+        if process.stdin is not None:
+            stdin, _ = await loop.connect_write_pipe(asyncio.BaseProtocol, process.stdin)
+            transports.append(stdin)
+            # Written as pandoc reads it; an early exit of pandoc drops the rest.
+            stdin.write(source or b"")
+            stdin.write_eof()
+        if process.stdout is None:
+            return b""
+        reader = asyncio.StreamReader()
+        stdout, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), process.stdout)
+        transports.append(stdout)
+        return await reader.read()
+    finally:
+        for transport in transports:
+            transport.close()
+
+
+def _reap(pid: int) -> asyncio.Future[tuple[int, resource.struct_rusage]]:
+    """
+    Reap a child once it exited, with the resource usage the kernel reports for it.
+
+    Returns:
+        A future of the exit code, as Popen reports it, and the usage.
+    """
+    loop = asyncio.get_running_loop()
+    if not hasattr(os, "pidfd_open"):
+        # Without pidfds (macOS), a worker thread waits for the exit.
+        return loop.run_in_executor(None, _wait4, pid)
+    reaped: asyncio.Future[tuple[int, resource.struct_rusage]] = loop.create_future()
+    pidfd = os.pidfd_open(pid)
+
+    def on_exit() -> None:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+        # The child has exited, so wait4 returns at once.
+        try:
+            reaped.set_result(_wait4(pid))
+        except OSError as e:
+            reaped.set_exception(e)
+
+    # A pidfd becomes readable when its process exits.
+    loop.add_reader(pidfd, on_exit)
+    return reaped
+
+
+def _wait4(pid: int) -> tuple[int, resource.struct_rusage]:
+    _, status, rusage = os.wait4(pid, 0)
+    return os.waitstatus_to_exitcode(status), rusage
+
+
+def kill_process_group(pgid: int) -> None:
+    """
+    Kill the process group a child leads, e.g. pandoc and the tectonic it runs.
+
+    Once the leader is reaped, its pid may be handed out again, so the group is
+    only killed while the leader still runs or waits to be reaped. Where the
+    kernel has pidfds, the executor reaps on the event loop thread, which runs
+    the check and the kill with no await in between. A group that is gone
+    already is fine.
+    """
+    try:
+        # Tells a running or exited child from a reaped one, without reaping it.
+        os.waitid(os.P_PID, pgid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+    except ChildProcessError:
+        return
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(pgid, signal.SIGKILL)
+
+
+class _ExecutorHolder:
+    """Holder class for the global ConversionExecutor singleton."""
+
+    instance: ConversionExecutor | None = None
+
+
+def get_conversion_executor() -> ConversionExecutor:
+    """
+    Get the global ConversionExecutor instance.
+
+    Returns:
+        The global ConversionExecutor singleton
+    """
+    if _ExecutorHolder.instance is None:
+        _ExecutorHolder.instance = ConversionExecutor()
+    return _ExecutorHolder.instance
+
+
+def reset_conversion_executor() -> None:
+    """Reset the global ConversionExecutor instance (useful for testing)."""
+    _ExecutorHolder.instance = None
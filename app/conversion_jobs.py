@@ -0,0 +1,508 @@
+"""
+Asynchronous conversion jobs.
+
+A large DOCX to PDF export through tectonic can take minutes, longer than many
+proxies and clients wait on the synchronous conversion route. A job is
+submitted instead: its source is stored and the client gets a job id at once.
+A bounded pool of workers (JOBS_MAX_WORKERS) runs the jobs in submission order
+through the same conversion pipeline, and the client polls the job and
+downloads its result once it has succeeded.
+
+Jobs live in a local on-disk store (JOBS_DIR), one directory per job holding
+its metadata, its source and, once converted, its result. A finished job is
+kept for JOBS_TTL seconds; the oldest finished jobs go earlier when the store
+outgrows JOBS_MAX_STORE_MB. On a restart, queued jobs are queued again and jobs
+that were running are marked failed.
+
+Several worker processes can share the store. A job records the process that
+queued or adopted it, and only the jobs of a process that is gone are
+recovered, at startup and by the janitor, so a worker never fails or runs
+twice a job another live worker holds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import functools
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import anyio
+import psutil
+
+from app.constants import get_int_env
+from app.prometheus_metrics import increment_finished_job
+from app.resource_accounting import account_conversion
+from app.scratch_workspace import get_scratch_space
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_JOB_STATES = frozenset({JOB_SUCCEEDED, JOB_FAILED})
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_QUEUED = 100
+DEFAULT_JOB_TTL = 3600
+DEFAULT_MAX_STORE_MB = 1024
+
+# The janitor evicts expired jobs this often.
+EVICTION_INTERVAL = 60.0
+
+METADATA_FILE = "job.json"
+SOURCE_FILE = "source"
+RESULT_FILE = "result"
+# Recoveries of the processes sharing the store take turns on this file.
+LOCK_FILE = ".lock"
+
+INTERRUPTED_JOB_MESSAGE = "The service restarted while the job was running"
+
+# A job id is a uuid4 in hex. Anything else never names a job directory.
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while JOBS_MAX_QUEUED jobs are waiting."""
+
+
+def get_jobs_dir() -> Path:
+    """Root directory of the job store (JOBS_DIR)."""
+    return Path(os.environ.get("JOBS_DIR") or Path(tempfile.gettempdir()) / "pandoc-service-jobs")
+
+
+def get_process_owner(pid: int | None = None) -> str | None:
+    """
+    Identify a process by its pid and start time, so a reused pid never passes for the process that held a job.
+
+    Returns:
+        The identity, or None if there is no such process.
+    """
+    try:
+        process = psutil.Process(pid)
+        return f"{process.pid}:{process.create_time()}"
+    except psutil.Error:
+        return None
+
+
+def is_owner_alive(owner: str) -> bool:
+    """Whether the process a job was recorded for is still running."""
+    pid, _, _ = owner.partition(":")
+    return pid.isdigit() and get_process_owner(int(pid)) == owner
+
+
+@dataclass
+class ConversionJob:
+    """
+    One conversion submitted through the job API, as stored in its job.json.
+
+    Attributes:
+        source_format: Format of the stored source.
+        target_format: Format to convert to.
+        file_name: File name the result is downloaded as.
+        paper_size: Paper size of a DOCX, slide size of a PPTX result.
+        orientation: Page orientation of a DOCX result.
+        scale_factor: Scale factor of rasterized SVGs in an HTML source.
+        preserve_table_styles: Keep CSS table cell styles in a DOCX result.
+        job_id: Id the client polls the job with.
+        status: One of queued, running, succeeded and failed.
+        created_at: Submission time, seconds since the epoch.
+        started_at: Time a worker picked the job up.
+        finished_at: Time the job succeeded or failed.
+        error: Why the job failed.
+        result_size: Size of the result in bytes.
+        owner: Process that queued or adopted the job, see get_process_owner.
+    """
+
+    source_format: str
+    target_format: str
+    file_name: str
+    paper_size: str | None = None
+    orientation: str | None = None
+    scale_factor: float | None = None
+    preserve_table_styles: bool = False
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = JOB_QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+    result_size: int | None = None
+    owner: str | None = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job succeeded or failed."""
+        return self.status in FINISHED_JOB_STATES
+
+
+class JobStore:
+    """The on-disk store of conversion jobs, one directory per job."""
+
+    def __init__(self, root: Path | None = None, ttl: int | None = None, max_bytes: int | None = None, clock: Callable[[], float] = time.time) -> None:
+        """
+        Initialize the store. Its directory is created with the first job.
+
+        Args:
+            root: Directory of the store. If None, JOBS_DIR is read.
+            ttl: Seconds a finished job is kept. If None, JOBS_TTL is read
+                (60-604800, default 3600).
+            max_bytes: Size of the store above which the oldest finished jobs are
+                evicted early. If None, JOBS_MAX_STORE_MB is read (1-1048576,
+                default 1024).
+            clock: Time source for the expiry of finished jobs.
+        """
+        self.root = root or get_jobs_dir()
+        self.ttl = ttl if ttl is not None else get_int_env("JOBS_TTL", DEFAULT_JOB_TTL, 60, 7 * 24 * 3600)
+        self.max_bytes = max_bytes if max_bytes is not None else get_int_env("JOBS_MAX_STORE_MB", DEFAULT_MAX_STORE_MB, 1, 1024 * 1024) * 1024 * 1024
+        self._clock = clock
+        self.owner = get_process_owner()
+
+    def get_job_dir(self, job_id: str) -> Path:
+        """Directory of a job, whether or not it exists."""
+        return self.root / job_id
+
+    def get_source_path(self, job_id: str) -> Path:
+        """Path of a job's stored source."""
+        return self.get_job_dir(job_id) / SOURCE_FILE
+
+    def get_result_path(self, job_id: str) -> Path:
+        """Path of a job's result."""
+        return self.get_job_dir(job_id) / RESULT_FILE
+
+    def create(self, job: ConversionJob, source: bytes | str | Path) -> None:
+        """
+        Store a new job with its source.
+
+        Args:
+            job: The job to store.
+            source: The source as spooled from the request. A spooled file is
+                moved into the job's directory, not copied.
+        """
+        job.owner = self.owner
+        job_dir = self.get_job_dir(job.job_id)
+        job_dir.mkdir(parents=True)
+        source_path = self.get_source_path(job.job_id)
+        if isinstance(source, Path):
+            shutil.move(source, source_path)
+        else:
+            source_path.write_bytes(source.encode("utf-8") if isinstance(source, str) else source)
+        self.save(job)
+
+    def save(self, job: ConversionJob) -> None:
+        """Write a job's metadata, unless the job was deleted meanwhile."""
+        job_dir = self.get_job_dir(job.job_id)
+        # Written aside and renamed, so a reader never sees half a file.
+        partial = job_dir / f"{METADATA_FILE}.partial"
+        with contextlib.suppress(FileNotFoundError):
+            partial.write_text(json.dumps(asdict(job)), encoding="utf-8")
+            partial.replace(job_dir / METADATA_FILE)
+
+    def load(self, job_id: str) -> ConversionJob | None:
+        """
+        Read a job.
+
+        Returns:
+            The job, or None if there is no such job.
+        """
+        if not _JOB_ID.match(job_id):
+            return None
+        try:
+            return ConversionJob(**json.loads((self.get_job_dir(job_id) / METADATA_FILE).read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Job %s has unreadable metadata: %s", job_id, e)
+            return None
+
+    def list_jobs(self) -> list[ConversionJob]:
+        """All readable jobs in the store, oldest first."""
+        if not self.root.is_dir():
+            return []
+        jobs = [job for job in (self.load(entry.name) for entry in self.root.iterdir()) if job is not None]
+        return sorted(jobs, key=lambda job: job.created_at)
+
+    def store_result(self, job_id: str, output: bytes | Path) -> int:
+        """
+        Store the result of a job and drop its source.
+
+        Args:
+            job_id: The job.
+            output: The converted document, or the path of the file holding it,
+                which is moved into the job's directory.
+
+        Returns:
+            The size of the result in bytes.
+        """
+        result_path = self.get_result_path(job_id)
+        if not self.get_job_dir(job_id).is_dir():
+            # Deleted while it was converted.
+            if isinstance(output, Path):
+                output.unlink(missing_ok=True)
+            return 0
+        if isinstance(output, Path):
+            shutil.move(output, result_path)
+        else:
+            result_path.write_bytes(output)
+        self.discard_source(job_id)
+        return result_path.stat().st_size
+
+    def discard_source(self, job_id: str) -> None:
+        """Remove the source of a job that needs it no more."""
+        self.get_source_path(job_id).unlink(missing_ok=True)
+
+    def delete(self, job_id: str) -> None:
+        """Remove a job with everything it stored."""
+        shutil.rmtree(self.get_job_dir(job_id), ignore_errors=True)
+
+    def get_size(self, job_id: str) -> int:
+        """Bytes stored for a job."""
+        job_dir = self.get_job_dir(job_id)
+        if not job_dir.is_dir():
+            return 0
+        return sum(entry.stat().st_size for entry in job_dir.iterdir() if entry.is_file())
+
+    def recover(self, own_jobs: bool = True) -> list[str]:
+        """
+        Tidy up after a restart: the running jobs of processes that are gone are
+        marked failed, and their queued jobs are adopted by this process.
+
+        Args:
+            own_jobs: Recover the jobs recorded for this process, too. A process
+                that starts has nothing running yet; the janitor leaves them alone.
+
+        Returns:
+            The ids of the jobs adopted, oldest first, to be queued again.
+        """
+        if not self.root.is_dir():
+            return []
+        queued = []
+        with (self.root / LOCK_FILE).open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for job in self.list_jobs():
+                if job.finished or self._is_held(job, own_jobs):
+                    continue
+                if job.status == JOB_QUEUED:
+                    job.owner = self.owner
+                    queued.append(job.job_id)
+                else:
+                    job.status = JOB_FAILED
+                    job.error = INTERRUPTED_JOB_MESSAGE
+                    job.finished_at = self._clock()
+                    self.discard_source(job.job_id)
+                self.save(job)
+        return queued
+
+    def _is_held(self, job: ConversionJob, own_jobs: bool) -> bool:
+        """Whether a live process other than the recovering one holds a job."""
+        if job.owner is None or (own_jobs and job.owner == self.owner):
+            return False
+        return is_owner_alive(job.owner)
+
+    def evict(self) -> int:
+        """
+        Remove the finished jobs past their TTL, then the oldest finished ones
+        while the store is larger than its limit.
+
+        Returns:
+            The number of jobs removed.
+        """
+        now = self._clock()
+        jobs = self.list_jobs()
+        sizes = {job.job_id: self.get_size(job.job_id) for job in jobs}
+        total = sum(sizes.values())
+        evicted = 0
+        for job in sorted((job for job in jobs if job.finished), key=lambda job: job.finished_at or 0):
+            expired = (job.finished_at or 0) + self.ttl <= now
+            if not expired and total <= self.max_bytes:
+                break
+            self.delete(job.job_id)
+            total -= sizes[job.job_id]
+            evicted += 1
+        if evicted:
+            logger.info("Evicted %d finished job(s) from the job store", evicted)
+        return evicted
+
+
+class JobManager:
+    """Queues conversion jobs and runs them on a bounded pool of workers."""
+
+    def __init__(
+        self,
+        run_conversion: Callable[[ConversionJob, Path], Awaitable[bytes | Path]],
+        store: JobStore | None = None,
+        max_workers: int | None = None,
+        max_queued: int | None = None,
+    ) -> None:
+        """
+        Initialize the manager. Nothing runs before start().
+
+        Args:
+            run_conversion: Converts the source of a job at the given path and
+                returns the result, or the path of the file holding it.
+            store: Where the jobs are kept. If None, a JobStore configured from
+                the environment.
+            max_workers: Jobs converted at once. If None, JOBS_MAX_WORKERS is read
+                (1-64, default 2).
+            max_queued: Waiting jobs at which a submission is refused. If None,
+                JOBS_MAX_QUEUED is read (1-10000, default 100).
+        """
+        self.run_conversion = run_conversion
+        self.store = store or JobStore()
+        self.max_workers = max_workers if max_workers is not None else get_int_env("JOBS_MAX_WORKERS", DEFAULT_MAX_WORKERS, 1, 64)
+        self.max_queued = max_queued if max_queued is not None else get_int_env("JOBS_MAX_QUEUED", DEFAULT_MAX_QUEUED, 1, 10000)
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._running: dict[str, asyncio.Task[bytes | Path]] = {}
+        self._deleted: set[str] = set()
+
+    def get_queue_size(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        """Queue the jobs left from before a restart again, then start the workers and the janitor."""
+        if self._tasks:
+            return
+        # The queue is rebuilt from the store, on the running event loop.
+        self._queue = asyncio.Queue()
+        for job_id in await anyio.to_thread.run_sync(self.store.recover):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.max_workers)]
+        self._tasks.append(asyncio.create_task(self._evict_periodically()))
+
+    async def stop(self) -> None:
+        """Stop the workers. A job they were running is marked failed on the next start."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def submit(self, job: ConversionJob, source: bytes | str | Path) -> None:
+        """
+        Store a job and queue it.
+
+        Raises:
+            JobQueueFullError: If JOBS_MAX_QUEUED jobs are already waiting.
+        """
+        if self._queue.qsize() >= self.max_queued:
+            raise JobQueueFullError(f"{self._queue.qsize()} jobs are waiting already")
+        await anyio.to_thread.run_sync(self.store.create, job, source)
+        self._queue.put_nowait(job.job_id)
+        logger.info("Queued job %s: %s to %s", job.job_id, job.source_format, job.target_format)
+
+    def get(self, job_id: str) -> ConversionJob | None:
+        """The current state of a job, None if there is no such job."""
+        return self.store.load(job_id)
+
+    async def delete(self, job_id: str) -> bool:
+        """
+        Delete a job. A running job is cancelled first.
+
+        Returns:
+            False if there is no such job.
+        """
+        if await anyio.to_thread.run_sync(self.store.load, job_id) is None:
+            return False
+        task = self._running.get(job_id)
+        if task is not None and not task.done():
+            # The worker removes the job once its conversion has stopped.
+            self._deleted.add(job_id)
+            task.cancel()
+            return True
+        await anyio.to_thread.run_sync(self.store.delete, job_id)
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = await anyio.to_thread.run_sync(self.store.load, job_id)
+            # Deleted while it waited.
+            if job is None or job.status != JOB_QUEUED:
+                continue
+            try:
+                await self._run(job)
+            # A store that cannot be written fails the job, not the worker.
+            except OSError as e:
+                logger.error("Job %s could not be run: %s", job_id, e)
+
+    async def _run(self, job: ConversionJob) -> None:
+        # The files of the conversion go to a workspace of the job, removed once its result is stored.
+        async with get_scratch_space().workspace():
+            with account_conversion(job.source_format, job.target_format) as resources:
+                await self._run_in_workspace(job)
+        logger.info("Job %s used %s", job.job_id, resources.describe())
+
+    async def _run_in_workspace(self, job: ConversionJob) -> None:
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        await anyio.to_thread.run_sync(self.store.save, job)
+        # A task of its own, so deleting the job cancels the conversion and not the worker.
+        task = asyncio.create_task(self.run_conversion(job, self.store.get_source_path(job.job_id)))
+        self._running[job.job_id] = task
+        try:
+            output = await task
+        except asyncio.CancelledError:
+            current_task = asyncio.current_task()
+            if current_task is not None and current_task.cancelling():
+                # The service stops; the awaited conversion was cancelled with the worker.
+                raise
+            if job.job_id in self._deleted:
+                self._deleted.discard(job.job_id)
+                await anyio.to_thread.run_sync(self.store.delete, job.job_id)
+                logger.info("Cancelled deleted job %s", job.job_id)
+                return
+            await self._finish(job, error="The conversion was cancelled")
+            return
+        # A failed conversion fails its job, not the worker.
+        except Exception as e:  # noqa: BLE001
+            await self._finish(job, error=getattr(e, "message", None) or str(e) or repr(e))
+            return
+        finally:
+            self._running.pop(job.job_id, None)
+
+        try:
+            job.result_size = await anyio.to_thread.run_sync(self.store.store_result, job.job_id, output)
+        except OSError as e:
+            await self._finish(job, error=f"Storing the result failed: {e}")
+            return
+        await self._finish(job)
+
+    async def _finish(self, job: ConversionJob, error: str | None = None) -> None:
+        job.status = JOB_FAILED if error else JOB_SUCCEEDED
+        job.error = error
+        job.finished_at = time.time()
+        if error:
+            logger.warning("Job %s failed: %s", job.job_id, error)
+            await anyio.to_thread.run_sync(self.store.discard_source, job.job_id)
+        await anyio.to_thread.run_sync(self.store.save, job)
+        increment_finished_job(job.target_format, job.status)
+
+    async def _evict_periodically(self) -> None:
+        while True:
+            try:
+                await anyio.to_thread.run_sync(self.store.evict)
+                # The jobs of a worker process that went away are picked up by the ones left.
+                for job_id in await anyio.to_thread.run_sync(functools.partial(self.store.recover, own_jobs=False)):
+                    self._queue.put_nowait(job_id)
+            # The janitor keeps going; the next round may succeed.
+            except OSError as e:
+                logger.warning("Evicting or recovering jobs failed: %s", e)
+            await asyncio.sleep(EVICTION_INTERVAL)
@@ -0,0 +1,194 @@
+"""
+The stages of a conversion, declared for each pair of source and target format.
+
+A conversion runs through up to four stages, in this order:
+
+* html_prepare: the table layouts are read from an HTML source and its SVGs
+  rasterized (app.html_table_layout, app.svg_processor),
+* a pre-processing stage, which rewrites the source in the processing pool so
+  pandoc keeps formatting its reader would drop (app.processing_stages),
+* pandoc, with the Lua filters of the pipeline (filters/),
+* a post-processing stage, which rewrites the DOCX or PPTX pandoc wrote.
+
+PIPELINES declares the pairs that run more than pandoc and the post-processing
+of their target; every other pair gets the default pipeline of get_pipeline.
+A pipeline may declare filters and steps of its pre-processing that only run
+when the source contains a construct (requires). The source is then scanned
+once before the pre-processing (content_scan, app.content_features), and those
+whose construct is absent are skipped; pandoc_pipeline_gated_stages_total
+counts both outcomes.
+
+Each stage a conversion runs is timed in pandoc_pipeline_stage_duration_seconds,
+labelled by stage. The pandoc stage includes the wait for a pandoc slot; a
+multi-target conversion reads its source into an AST (pandoc_read) and renders
+each target from it (pandoc_render) instead.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from app.content_features import CAPTIONS, IMAGES, INLINE_CSS, LISTS, MATH, TABLES
+from app.prometheus_metrics import increment_gated_stage, observe_pipeline_stage
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Mapping
+
+HTML_PREPARE_STAGE = "html_prepare"
+CONTENT_SCAN_STAGE = "content_scan"
+PANDOC_STAGE = "pandoc"
+PANDOC_READ_STAGE = "pandoc_read"
+PANDOC_RENDER_STAGE = "pandoc_render"
+
+# The outputs the service rewrites after pandoc, whatever their source.
+POST_PROCESS_STAGES: Mapping[str, str] = {
+    "docx": "docx_post_process",
+    "pptx": "pptx_post_process",
+}
+
+# The filters of the docx->latex path, in the order they run. They are the
+# components of filters/docx_latex_bundle.lua, which lists them the same way.
+DOCX_LATEX_FILTERS = (
+    # Must precede docx_colors_to_latex: it rewrites underline/strikeout that
+    # carry other formatting into ulem and strips highlight from inside them,
+    # before the colour filter turns those spans into \textcolor/\hl.
+    "docx_text_decorations",
+    "docx_colors_to_latex",
+    "docx_math_colors_to_latex",
+    "docx_paragraphs_to_latex",
+    "docx_lists_to_latex",
+    "docx_tables_to_latex",
+    # Strip "Table N" / "Figure N" prefix from Caption blocks so LaTeX's
+    # own \caption counter doesn't duplicate the numbering.
+    "docx_caption_labels_to_latex",
+)
+
+
+@dataclass(frozen=True)
+class ConversionPipeline:
+    """
+    The stages of the conversions of one source format to one target format.
+
+    Attributes:
+        prepare_html: Whether the source runs through the html_prepare stage.
+        extract_table_layouts: Whether html_prepare reads the table layouts for the post-processing.
+        pre_process: Stage rewriting the source before pandoc reads it, if any.
+        reader_extensions: Extensions of pandoc's reader, e.g. "+styles".
+        filters: Names of the Lua filters pandoc runs, in order.
+        filter_bundle: Name of a filter that runs all of filters in one Lua interpreter, if there is one.
+        table_styles: Whether the preserve_table_styles parameter applies.
+        post_process: Stage rewriting pandoc's output, if any.
+        requires: The filters and pre-processing steps that only run when the source
+            has a feature (app.content_features), by name.
+    """
+
+    prepare_html: bool = False
+    extract_table_layouts: bool = False
+    pre_process: str | None = None
+    reader_extensions: str = ""
+    filters: tuple[str, ...] = ()
+    filter_bundle: str | None = None
+    table_styles: bool = False
+    post_process: str | None = None
+    requires: Mapping[str, str] = field(default_factory=dict)
+
+    @property
+    def reading(self) -> tuple[str | None, str]:
+        """How pandoc gets to read the source. Conversions that read it alike can share one AST."""
+        return self.pre_process, self.reader_extensions
+
+    def get_skipped(self, features: frozenset[str] | None) -> frozenset[str]:
+        """The filters and steps a source with these features skips: none if it could not be scanned."""
+        if features is None:
+            return frozenset()
+        return frozenset(name for name, feature in self.requires.items() if feature not in features)
+
+
+# html -> docx: the preprocessors rewrite orphan lists, styled paragraphs,
+# coloured math and unsized images so pandoc's HTML reader keeps them, and the
+# filters pair with them. inline_styles turns inline CSS into raw OOXML runs,
+# which only the DOCX writer renders, html_lists strips the marker paragraph of
+# the synthetic list items, and html_captions marks the genuine Polarion
+# captions (the <span data-sequence=...> counter) with the "Caption" style, so
+# docx_references_post_process recognises them structurally. The table layouts
+# the HTML reader drops are restored by the post-processing.
+_HTML_TO_DOCX = ConversionPipeline(
+    prepare_html=True,
+    extract_table_layouts=True,
+    pre_process="html_pre_process",
+    filters=("inline_styles", "html_lists", "html_captions"),
+    table_styles=True,
+    post_process=POST_PROCESS_STAGES["docx"],
+    requires={
+        "html_lists_pre_process": LISTS,
+        "html_paragraph_pre_process": INLINE_CSS,
+        "html_math_color_pre_process": MATH,
+        "html_image_pre_process": IMAGES,
+        "inline_styles": INLINE_CSS,
+        "html_lists": LISTS,
+        "html_captions": CAPTIONS,
+    },
+)
+
+# html -> pdf/latex: recover table width and horizontal alignment from the
+# <table style> that pandoc's HTML reader keeps in the Table Attr but the
+# LaTeX writer ignores. The LaTeX counterpart to the DOCX post-processing.
+_HTML_TO_LATEX = ConversionPipeline(prepare_html=True, filters=("html_tables_to_latex",), requires={"html_tables_to_latex": TABLES})
+
+# docx -> pdf/latex: pandoc's DOCX reader drops run colours, paragraph
+# alignment and indent, and flattens level-skipping lists. The preprocessing
+# turns them into synthetic styles, which the +styles reader surfaces as
+# custom-style attributes, and the filters re-emit them as raw LaTeX.
+_DOCX_TO_LATEX = ConversionPipeline(
+    pre_process="docx_latex_pre_process",
+    reader_extensions="+styles",
+    filters=DOCX_LATEX_FILTERS,
+    filter_bundle="docx_latex_bundle",
+    requires={
+        "docx_list_level_pre_process": LISTS,
+        "docx_math_color_pre_process": MATH,
+        "docx_lists_to_latex": LISTS,
+        "docx_math_colors_to_latex": MATH,
+        "docx_tables_to_latex": TABLES,
+    },
+)
+
+PIPELINES: Mapping[tuple[str, str], ConversionPipeline] = {
+    ("html", "docx"): _HTML_TO_DOCX,
+    ("html", "latex"): _HTML_TO_LATEX,
+    ("html", "pdf"): _HTML_TO_LATEX,
+    ("docx", "latex"): _DOCX_TO_LATEX,
+    ("docx", "pdf"): _DOCX_TO_LATEX,
+}
+
+
+def get_pipeline(source_format: str, target_format: str) -> ConversionPipeline:
+    """
+    The pipeline of a conversion: the declared one, else pandoc alone.
+
+    An HTML source of an undeclared pair is still prepared, for its SVGs, and a
+    DOCX or PPTX output still post-processed.
+    """
+    pipeline = PIPELINES.get((source_format, target_format))
+    if pipeline is not None:
+        return pipeline
+    return ConversionPipeline(prepare_html=source_format == "html", post_process=POST_PROCESS_STAGES.get(target_format))
+
+
+def gate_stages(pipeline: ConversionPipeline, features: frozenset[str] | None) -> frozenset[str]:
+    """Decide which of the gated filters and steps of a pipeline a source skips, and count the outcome of each."""
+    skipped = pipeline.get_skipped(features)
+    for name in pipeline.requires:
+        increment_gated_stage(name, skipped=name in skipped)
+    return skipped
+
+
+@contextlib.contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Observe how long the stage in the context took. A stage that raises is not observed."""
+    started = time.perf_counter()
+    yield
+    observe_pipeline_stage(stage, time.perf_counter() - started)
@@ -27,10 +27,11 @@ def _rewrite_body_part(
     has_styles: bool,
     color_styles: dict[str, docx_color_pre_process._StyleSpec],
     para_styles: dict[str, docx_paragraph_pre_process._StyleSpec],
+    skipped: frozenset[str] = frozenset(),
 ) -> tuple[bytes, bool]:
     """Run the colour → paragraph → list → table rewrites over one body part,
-    collecting any synthetic styles into the shared dicts.  Returns
-    (new_xml, changed)."""
+    collecting any synthetic styles into the shared dicts, but none of the
+    rewrites in ``skipped``.  Returns (new_xml, changed)."""
     changed = False
     if has_styles:
         rewritten, color_used = docx_color_pre_process.rewrite_part(xml)
@@ -41,22 +42,28 @@ def _rewrite_body_part(
         if para_used:
             xml, changed = rewritten, True
             para_styles.update(para_used)
-    rewritten, list_changed = docx_list_level_pre_process.rewrite_part(xml)
-    if list_changed:
-        xml, changed = rewritten, True
+    if "docx_list_level_pre_process" not in skipped:
+        rewritten, list_changed = docx_list_level_pre_process.rewrite_part(xml)
+        if list_changed:
+            xml, changed = rewritten, True
     rewritten, table_changed = docx_table_pre_process.rewrite_part(xml)
     if table_changed:
         xml, changed = rewritten, True
-    rewritten, math_color_changed = docx_math_color_pre_process.rewrite_part(xml)
-    if math_color_changed:
-        xml, changed = rewritten, True
+    if "docx_math_color_pre_process" not in skipped:
+        rewritten, math_color_changed = docx_math_color_pre_process.rewrite_part(xml)
+        if math_color_changed:
+            xml, changed = rewritten, True
     return xml, changed
 
 
-def preprocess(docx_bytes: bytes) -> bytes:
+def preprocess(docx_bytes: bytes, skipped: frozenset[str] = frozenset()) -> bytes:
     """Apply the colour, paragraph, list-level, table-cell and math-colour
     rewrites in one unzip/re-zip.
 
+    The list-level and math-colour rewrites named in ``skipped``
+    (``docx_list_level_pre_process``, ``docx_math_color_pre_process``) are left
+    out, for a source the content scan found without lists or math.
+
     Equivalent to chaining ``docx_color_pre_process.preprocess``,
     ``docx_paragraph_pre_process.preprocess``, ``docx_list_level_pre_process
     .preprocess``, ``docx_table_pre_process.preprocess`` and
@@ -80,7 +87,7 @@ def preprocess(docx_bytes: bytes) -> bytes:
     changed = False
 
     for part in body_parts:
-        entries[part], part_changed = _rewrite_body_part(entries[part], has_styles, color_styles, para_styles)
+        entries[part], part_changed = _rewrite_body_part(entries[part], has_styles, color_styles, para_styles, skipped)
         changed = changed or part_changed
 
     if not changed:
@@ -0,0 +1,118 @@
+"""
+Background probing of the service's dependencies for the health endpoints.
+
+Docker's HEALTHCHECK and the liveness and readiness probes of an orchestrator
+ask every few seconds, per replica. Answering each of them with a fresh check
+(a temp-file write, the Chromium connection, the probed binaries) put that work
+on the request path. The HealthProber runs the check in the background every
+HEALTH_PROBE_INTERVAL seconds and keeps the result, so /health and
+/health/ready answer from the last snapshot.
+
+Until the background task runs, e.g. before the lifespan started, there is no
+snapshot to trust and the check runs on demand instead.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import anyio.to_thread
+
+from app.constants import get_int_env
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping
+
+DEFAULT_PROBE_INTERVAL = 10
+MIN_PROBE_INTERVAL = 1
+MAX_PROBE_INTERVAL = 300
+
+# The dependency states that make the service unhealthy.
+UNHEALTHY_STATES = frozenset({"unavailable", "unwritable", "unknown"})
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HealthSnapshot:
+    """
+    The result of one dependency check.
+
+    Attributes:
+        dependencies: State of each dependency by name, e.g. {"pandoc": "available"}.
+        checked_at: When the check ran (epoch seconds).
+    """
+
+    dependencies: Mapping[str, str] = field(default_factory=dict)
+    checked_at: float = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        """Whether no dependency is in an unhealthy state."""
+        return not any(state in UNHEALTHY_STATES for state in self.dependencies.values())
+
+
+class HealthProber:
+    """Runs a dependency check in the background and keeps its latest result."""
+
+    def __init__(self, check: Callable[[], Mapping[str, str]], interval: int | None = None) -> None:
+        """
+        Initialize the prober.
+
+        Args:
+            check: Returns the state of each dependency. It may block, the
+                background task runs it in a worker thread.
+            interval: Seconds between two checks. If None, HEALTH_PROBE_INTERVAL
+                is read (1-300, default 10).
+        """
+        self.check = check
+        if interval is None:
+            interval = get_int_env("HEALTH_PROBE_INTERVAL", DEFAULT_PROBE_INTERVAL, MIN_PROBE_INTERVAL, MAX_PROBE_INTERVAL)
+        self.interval = interval
+        self._snapshot: HealthSnapshot | None = None
+        self._probe_task: asyncio.Task[None] | None = None
+
+    def probe(self) -> HealthSnapshot:
+        """Run the check now."""
+        return HealthSnapshot(dependencies=dict(self.check()), checked_at=time.time())
+
+    def get_snapshot(self) -> HealthSnapshot:
+        """The latest background result, or a fresh one while the background task does not run."""
+        if self._probe_task is None or self._snapshot is None:
+            return self.probe()
+        return self._snapshot
+
+    async def start(self) -> None:
+        """Take a first snapshot and keep refreshing it in the background."""
+        if self._probe_task is not None:
+            return
+        await self._refresh()
+        self._probe_task = asyncio.create_task(self._probe_loop())
+        logger.info("Dependencies are probed every %ds for the health endpoints", self.interval)
+
+    async def stop(self) -> None:
+        """Stop the background task and forget its snapshot."""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._probe_task
+            self._probe_task = None
+        self._snapshot = None
+
+    async def _refresh(self) -> None:
+        self._snapshot = await anyio.to_thread.run_sync(self.probe)
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._refresh()
+            # A check that fails outright must not leave an older, healthy answer in place.
+            except Exception:
+                logger.exception("Error probing dependencies")
+                self._snapshot = HealthSnapshot(dependencies={"probe": "unknown"}, checked_at=time.time())
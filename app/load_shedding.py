@@ -0,0 +1,311 @@
+"""
+Load shedding for the conversion endpoints.
+
+Without admission control a burst of PDF exports is accepted in full: every
+request spools its upload, preprocesses it and waits for a pandoc slot, until
+the pod runs out of memory. The LoadSheddingMiddleware refuses a conversion
+with 503 and a Retry-After header before a byte of its body is read, when
+admitting it would exceed one of the configured limits:
+
+- the weighted load of the conversions already in progress, where a PDF export
+  counts more than a Markdown one (LOAD_SHED_MAX_ACTIVE_WEIGHT, LOAD_SHED_FORMAT_WEIGHTS),
+- the number of conversions waiting for a pandoc slot (LOAD_SHED_MAX_QUEUED),
+- the resident memory of the service and its pandoc processes (LOAD_SHED_MAX_RSS_MB),
+- the memory used in the container's cgroup relative to its limit
+  (LOAD_SHED_MAX_MEMORY_FRACTION),
+- the bytes in the scratch workspaces (SCRATCH_MAX_MB, see scratch_workspace).
+
+Every limit is disabled at 0, which is the default. A shed request counts in
+the pandoc_shed_requests_total metric.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import psutil
+from fastapi.responses import PlainTextResponse
+
+from app.constants import get_float_env, get_int_env
+from app.conversion_executor import get_conversion_executor
+from app.prometheus_metrics import increment_shed_request
+from app.scratch_workspace import get_scratch_space
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping
+
+    from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# A PDF runs pandoc and tectonic, DOCX and PPTX are post-processed in the
+# service itself; anything else is a single pandoc writer pass.
+# "multiple" is a multi-target conversion, weighed like the usual DOCX and PDF pair.
+DEFAULT_FORMAT_WEIGHTS: Mapping[str, int] = {"pdf": 4, "docx": 2, "pptx": 2, "multiple": 6}
+DEFAULT_FORMAT_WEIGHT = 1
+MAX_FORMAT_WEIGHT = 100
+
+DEFAULT_RETRY_AFTER = 5
+MAX_RETRY_AFTER = 3600
+
+# Memory is sampled at most this often, not once per request.
+MEMORY_SAMPLE_INTERVAL = 1.0
+
+CGROUP_V2_MEMORY_CURRENT = Path("/sys/fs/cgroup/memory.current")
+CGROUP_V2_MEMORY_MAX = Path("/sys/fs/cgroup/memory.max")
+CGROUP_V1_MEMORY_USAGE = Path("/sys/fs/cgroup/memory/memory.usage_in_bytes")
+CGROUP_V1_MEMORY_LIMIT = Path("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+# cgroup v1 reports an unlimited group with a limit near the largest page-aligned int64.
+CGROUP_V1_UNLIMITED = 1 << 62
+
+# The source and target format of each conversion route.
+_CONVERSION_PATH = re.compile(r"^/convert/(?P<source_format>[^/]+)/to/(?P<target_format>[^/]+?)/?$")
+_TEMPLATE_TARGETS = {"docx-with-template": "docx", "pptx-with-template": "pptx"}
+
+SERVICE_OVERLOADED_MESSAGE = "Service overloaded"
+
+
+@dataclass(frozen=True)
+class LoadSheddingPolicy:
+    """
+    The limits above which a conversion is shed. A limit of 0 is disabled.
+
+    Attributes:
+        max_active_weight: Largest summed weight of the conversions in progress.
+        max_queued: Number of conversions waiting for a pandoc slot at which new ones are shed.
+        max_rss_bytes: Largest resident memory of the service and its child processes.
+        max_memory_fraction: Largest share of the cgroup memory limit in use (0-1).
+        retry_after: Seconds a shed client is asked to wait before retrying.
+        format_weights: Weight of a conversion by target format.
+    """
+
+    max_active_weight: int = 0
+    max_queued: int = 0
+    max_rss_bytes: int = 0
+    max_memory_fraction: float = 0.0
+    retry_after: int = DEFAULT_RETRY_AFTER
+    format_weights: Mapping[str, int] = field(default_factory=lambda: dict(DEFAULT_FORMAT_WEIGHTS))
+
+    @classmethod
+    def from_env(cls) -> LoadSheddingPolicy:
+        """Read the policy from the LOAD_SHED_* environment variables."""
+        return cls(
+            max_active_weight=get_int_env("LOAD_SHED_MAX_ACTIVE_WEIGHT", 0, 0, 100000),
+            max_queued=get_int_env("LOAD_SHED_MAX_QUEUED", 0, 0, 100000),
+            max_rss_bytes=get_int_env("LOAD_SHED_MAX_RSS_MB", 0, 0, 1024 * 1024) * 1024 * 1024,
+            max_memory_fraction=get_float_env("LOAD_SHED_MAX_MEMORY_FRACTION", 0.0, 0.0, 1.0),
+            retry_after=get_int_env("LOAD_SHED_RETRY_AFTER", DEFAULT_RETRY_AFTER, 1, MAX_RETRY_AFTER),
+            format_weights=parse_format_weights(os.environ.get("LOAD_SHED_FORMAT_WEIGHTS", "")),
+        )
+
+    def get_weight(self, target_format: str) -> int:
+        """Weight of one conversion to the given format."""
+        return self.format_weights.get(target_format, DEFAULT_FORMAT_WEIGHT)
+
+
+def parse_format_weights(configured: str) -> dict[str, int]:
+    """
+    Parse LOAD_SHED_FORMAT_WEIGHTS, e.g. "pdf=6,latex=2", on top of the default weights.
+
+    An entry that is not ``format=weight`` with a weight between 1 and 100 is
+    skipped with a warning.
+    """
+    weights = dict(DEFAULT_FORMAT_WEIGHTS)
+    for entry in (part.strip() for part in configured.split(",")):
+        if not entry:
+            continue
+        target_format, _, weight = entry.partition("=")
+        try:
+            value = int(weight)
+        except ValueError:
+            value = 0
+        if not target_format.strip() or not (1 <= value <= MAX_FORMAT_WEIGHT):
+            logger.warning("LOAD_SHED_FORMAT_WEIGHTS entry '%s' is not format=weight with a weight between 1 and %d, ignoring it", entry, MAX_FORMAT_WEIGHT)
+            continue
+        weights[target_format.strip()] = value
+    return weights
+
+
+def read_cgroup_memory_fraction() -> float | None:
+    """
+    Share of the cgroup memory limit in use.
+
+    Returns:
+        The fraction, or None outside a cgroup or in one without a memory limit.
+    """
+    for usage_file, limit_file in ((CGROUP_V2_MEMORY_CURRENT, CGROUP_V2_MEMORY_MAX), (CGROUP_V1_MEMORY_USAGE, CGROUP_V1_MEMORY_LIMIT)):
+        try:
+            usage = usage_file.read_text(encoding="utf-8").strip()
+            limit = limit_file.read_text(encoding="utf-8").strip()
+        except OSError:
+            continue
+        # cgroup v2 writes "max" for no limit.
+        if not limit.isdigit() or not usage.isdigit() or int(limit) == 0 or int(limit) >= CGROUP_V1_UNLIMITED:
+            return None
+        return int(usage) / int(limit)
+    return None
+
+
+def read_process_tree_rss() -> int:
+    """Resident memory of this process and all of its children (pandoc, tectonic, Chromium) in bytes."""
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            # A child may exit between the listing and the reading.
+            continue
+    return rss
+
+
+class LoadShedder:
+    """Decides whether a conversion is admitted, and tracks the weight of those in progress."""
+
+    def __init__(self, policy: LoadSheddingPolicy | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Initialize the shedder.
+
+        Args:
+            policy: The limits to enforce. If None, they are read from the environment.
+            clock: Time source for the memory sampling interval.
+        """
+        self.policy = policy or LoadSheddingPolicy.from_env()
+        self._clock = clock
+        self._active_weight = 0
+        self._memory_sampled_at: float | None = None
+        self._rss_bytes = 0
+        self._memory_fraction: float | None = None
+
+    def get_active_weight(self) -> int:
+        """Summed weight of the conversions in progress."""
+        return self._active_weight
+
+    def try_acquire(self, weight: int) -> str | None:
+        """
+        Admit a conversion of the given weight, unless a limit is exceeded.
+
+        The counters are only touched from the event loop thread, between
+        awaits, so they need no lock of their own.
+
+        Returns:
+            None if the conversion was admitted and must be released, else the
+            reason it was shed: "active", "queued", "rss", "memory" or "scratch".
+        """
+        reason = self._get_shed_reason(weight)
+        if reason is None:
+            self._active_weight += weight
+        return reason
+
+    def release(self, weight: int) -> None:
+        """Release an admitted conversion."""
+        self._active_weight -= weight
+
+    def _get_shed_reason(self, weight: int) -> str | None:
+        policy = self.policy
+        # An idle service admits a conversion heavier than the limit, or it could never run.
+        if policy.max_active_weight and self._active_weight and self._active_weight + weight > policy.max_active_weight:
+            return "active"
+        if policy.max_queued and get_conversion_executor().get_queue_size() >= policy.max_queued:
+            return "queued"
+        if policy.max_rss_bytes or policy.max_memory_fraction:
+            self._sample_memory()
+            if policy.max_rss_bytes and self._rss_bytes > policy.max_rss_bytes:
+                return "rss"
+            if policy.max_memory_fraction and self._memory_fraction is not None and self._memory_fraction > policy.max_memory_fraction:
+                return "memory"
+        if get_scratch_space().is_full():
+            return "scratch"
+        return None
+
+    def _sample_memory(self) -> None:
+        now = self._clock()
+        if self._memory_sampled_at is not None and now - self._memory_sampled_at < MEMORY_SAMPLE_INTERVAL:
+            return
+        self._memory_sampled_at = now
+        if self.policy.max_rss_bytes:
+            self._rss_bytes = read_process_tree_rss()
+        if self.policy.max_memory_fraction:
+            self._memory_fraction = read_cgroup_memory_fraction()
+
+
+def get_conversion_formats(path: str) -> tuple[str, str] | None:
+    """The source and target format of a conversion route, None for any other path."""
+    match = _CONVERSION_PATH.match(path)
+    if match is None:
+        return None
+    target_format = match.group("target_format")
+    return match.group("source_format"), _TEMPLATE_TARGETS.get(target_format, target_format)
+
+
+def get_conversion_target_format(path: str) -> str | None:
+    """The target format of a conversion route, None for any other path."""
+    formats = get_conversion_formats(path)
+    return None if formats is None else formats[1]
+
+
+class LoadSheddingMiddleware:
+    """Answers a conversion with 503 and Retry-After while the service is overloaded."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        target_format = get_conversion_target_format(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if target_format is None:
+            await self.app(scope, receive, send)
+            return
+
+        shedder = get_load_shedder()
+        weight = shedder.policy.get_weight(target_format)
+        reason = shedder.try_acquire(weight)
+        if reason is not None:
+            increment_shed_request(target_format, reason)
+            logger.warning("%s, shedding conversion to %s (limit: %s)", SERVICE_OVERLOADED_MESSAGE, target_format, reason)
+            response = PlainTextResponse(
+                content=f"{SERVICE_OVERLOADED_MESSAGE}, retry later",
+                status_code=503,
+                headers={"Retry-After": str(shedder.policy.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            shedder.release(weight)
+
+
+class _ShedderHolder:
+    """Holder class for the global LoadShedder singleton."""
+
+    instance: LoadShedder | None = None
+
+
+def get_load_shedder() -> LoadShedder:
+    """
+    Get the global LoadShedder instance.
+
+    Returns:
+        The global LoadShedder singleton
+    """
+    if _ShedderHolder.instance is None:
+        _ShedderHolder.instance = LoadShedder()
+    return _ShedderHolder.instance
+
+
+def reset_load_shedder() -> None:
+    """Reset the global LoadShedder instance (useful for testing)."""
+    _ShedderHolder.instance = None
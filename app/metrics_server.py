@@ -4,6 +4,10 @@ Dedicated metrics server for Prometheus metrics endpoint.
 This module provides a separate FastAPI application serving only the /metrics
 endpoint on a dedicated port for security purposes. This allows network-level
 isolation between the main application API and the metrics endpoint.
+
+With several worker processes, the supervisor serves the endpoint from a thread
+of its own and adds up what the workers wrote to PROMETHEUS_MULTIPROC_DIR. The
+workers publish their gauges there every GAUGE_PUBLISH_INTERVAL seconds.
 """
 
 from __future__ import annotations
@@ -12,14 +16,17 @@ import asyncio
 import contextlib
 import logging
 import os
+import threading
 
 import uvicorn
 from fastapi import FastAPI, Response
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
 
 from app.chromium_manager import get_chromium_manager
+from app.conversion_executor import get_conversion_executor
 from app.pandoc_metrics import get_pandoc_metrics
-from app.prometheus_metrics import update_gauges_from_chromium_manager, update_gauges_from_pandoc_metrics
+from app.prometheus_metrics import update_gauges_from_chromium_manager, update_gauges_from_conversion_executor, update_gauges_from_pandoc_metrics, update_gauges_from_scratch_space
+from app.scratch_workspace import get_scratch_space
 from app.tls import METRICS_TLS_PREFIX, get_scheme, load_tls_options
 
 logger = logging.getLogger(__name__)
@@ -30,6 +37,9 @@ MAX_VALID_PORT = 65535
 DEFAULT_METRICS_PORT = 9182
 STARTUP_TIMEOUT_SECONDS = 10.0
 
+# Seconds between two publications of a worker's gauges in multiprocess mode.
+GAUGE_PUBLISH_INTERVAL = 5.0
+
 # Minimal FastAPI app for metrics only
 metrics_app = FastAPI(
     title="Pandoc Metrics",
@@ -49,18 +59,47 @@ async def metrics() -> Response:
     - Custom conversion metrics (success/failure counts, durations)
     - Request/response size histograms
     - Service uptime and active conversions
+    - Conversion queue depth and waiting time
 
     The metrics are automatically scraped by Prometheus for monitoring and alerting.
 
     Note: Counters are incremented when events occur. This endpoint only updates gauges
     to reflect current state (uptime, active conversions, error rate, etc.).
     """
-    pandoc_metrics = get_pandoc_metrics()
-    update_gauges_from_pandoc_metrics(pandoc_metrics)
-    update_gauges_from_chromium_manager(get_chromium_manager())
+    if is_multiprocess_mode():
+        # The workers publish their own gauges; the supervisor only adds them up.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    update_gauges()
     return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
+def is_multiprocess_mode() -> bool:
+    """Whether the metrics of several worker processes are shared through PROMETHEUS_MULTIPROC_DIR."""
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def update_gauges() -> None:
+    """Set the gauges from the current state of this process."""
+    update_gauges_from_pandoc_metrics(get_pandoc_metrics())
+    update_gauges_from_chromium_manager(get_chromium_manager())
+    update_gauges_from_conversion_executor(get_conversion_executor())
+    update_gauges_from_scratch_space(get_scratch_space())
+
+
+async def publish_gauges_periodically() -> None:
+    """Keep the gauges of a worker process current in PROMETHEUS_MULTIPROC_DIR, where no scrape updates them."""
+    while True:
+        update_gauges()
+        await asyncio.sleep(GAUGE_PUBLISH_INTERVAL)
+
+
+def mark_worker_stopped() -> None:
+    """Drop the live gauges of this worker process from PROMETHEUS_MULTIPROC_DIR once it stops."""
+    multiprocess.mark_process_dead(os.getpid())
+
+
 def get_metrics_port() -> int:
     """
     Get metrics server port from environment variable.
@@ -170,3 +209,22 @@ class MetricsServer:
     def is_running(self) -> bool:
         """Check if the server is running."""
         return self._started
+
+
+def serve_metrics_in_thread(port: int = DEFAULT_METRICS_PORT) -> threading.Thread:
+    """
+    Serve the metrics endpoint from a daemon thread of the supervisor of several workers.
+
+    The thread runs its own event loop; it ends with the supervisor.
+    """
+    config = uvicorn.Config(
+        app=metrics_app,
+        host="0.0.0.0",  # noqa: S104
+        port=port,
+        log_level="warning",
+        **load_tls_options(METRICS_TLS_PREFIX),
+    )
+    thread = threading.Thread(target=uvicorn.Server(config).run, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info("Metrics server of the workers started on port %d", port)
+    return thread
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import contextlib
-import io
 import logging
 import os
 import platform
 import subprocess
 import tempfile
 import time
+from datetime import UTC, datetime
 from http import HTTPStatus
 from pathlib import Path
 from typing import TYPE_CHECKING
@@ -18,18 +19,30 @@ import uvicorn
 from bs4 import BeautifulSoup
 from fastapi import Depends, FastAPI, Request, Response
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from prometheus_fastapi_instrumentator import Instrumentator
+from starlette.background import BackgroundTask
 
 from app.auth import ApiKeyError, get_api_keys, is_request_authorized, require_api_key
-from app.schema import VersionSchema
+from app.schema import JobSchema, TemplateSchema, VersionSchema
 from app.tls import API_TLS_PREFIX, METRICS_TLS_PREFIX, get_scheme, get_tls_options, load_tls_options
 
-from . import docx_latex_pre_process, docx_post_process, html_image_pre_process, html_lists_pre_process, html_math_color_pre_process, html_paragraph_pre_process, html_table_layout, pptx_post_process
+from . import conversion_bundle, html_table_layout, processing_stages
+from .capabilities import PANDOC_PATH, Capabilities, get_capabilities, get_capability_registry
 from .chromium_manager import get_chromium_manager
-from .constants import API_VERSION
-from .metrics_server import MetricsServer, get_metrics_port, is_metrics_server_enabled
+from .constants import API_VERSION, get_bool_env
+from .content_encoding import RequestDecompressionMiddleware, ResponseCompressionMiddleware
+from .content_features import scan_content
+from .conversion_cancellation import ConversionCancellationMiddleware, get_conversion_timeout
+from .conversion_executor import get_conversion_executor
+from .conversion_jobs import JOB_SUCCEEDED, ConversionJob, JobManager, JobQueueFullError
+from .conversion_pipeline import CONTENT_SCAN_STAGE, HTML_PREPARE_STAGE, PANDOC_READ_STAGE, PANDOC_RENDER_STAGE, PANDOC_STAGE, POST_PROCESS_STAGES, ConversionPipeline, gate_stages, get_pipeline, time_stage
+from .health_prober import HealthProber
+from .load_shedding import SERVICE_OVERLOADED_MESSAGE, LoadSheddingMiddleware, get_load_shedder
+from .metrics_server import MetricsServer, get_metrics_port, is_metrics_server_enabled, is_multiprocess_mode, mark_worker_stopped, publish_gauges_periodically
 from .pandoc_metrics import get_pandoc_metrics
+from .pandoc_runtime import PandocHeapExhaustedError, get_pandoc_runtime
+from .processing_pool import get_processing_pool
 from .prometheus_metrics import (
     increment_conversion_failure,
     increment_conversion_success,
@@ -38,19 +51,27 @@ from .prometheus_metrics import (
     observe_post_processing_duration,
     observe_request_body_size,
     observe_response_body_size,
-    observe_subprocess_duration,
 )
+from .reference_docs import get_reference_doc_cache
+from .request_coalescing import get_conversion_coalescer, is_coalescing_enabled
+from .request_log import RequestLogMiddleware
+from .request_size_limit import RequestSizeLimitMiddleware
+from .result_cache import build_cache_key, get_result_cache, is_cheap_to_hash, is_result_cache_enabled
+from .scratch_workspace import ScratchWorkspaceMiddleware, get_scratch_dir, get_scratch_space
 from .svg_processor import SvgProcessor
+from .template_store import InvalidTemplateError, StoredTemplate, TemplateNotFoundError, TemplateStoreFullError, get_template_store
+from .upload_spool import discard_source, get_source_size, load_source, read_form, spool_stream, spool_upload
+from .workers import CHROMIUM_SHARED, get_chromium_mode, get_worker_count, is_supervised_worker, run_workers
 
 if TYPE_CHECKING:
     from collections.abc import AsyncGenerator, Awaitable, Callable
 
 
-CUSTOM_REFERENCE_DOCX = "custom-reference.docx"
-CUSTOM_REFERENCE_PPTX = "custom-reference.pptx"
-PANDOC_PATH = "/usr/local/bin/pandoc"
 FILTER_BASE_PATH = "/usr/local/share/pandoc/filters"
 
+# The variable that tells filters/docx_latex_bundle.lua which of its components to leave out.
+SKIP_FILTERS_VARIABLE = "skip-filters"
+
 FILTERS = {
     "page_break": f"{FILTER_BASE_PATH}/pagebreak.lua",
     "page_orientation": f"{FILTER_BASE_PATH}/page_orientation.lua",
@@ -66,8 +87,10 @@ FILTERS = {
     "html_tables_to_latex": f"{FILTER_BASE_PATH}/html_tables_to_latex.lua",
     "html_captions": f"{FILTER_BASE_PATH}/html_captions.lua",
     "docx_caption_labels_to_latex": f"{FILTER_BASE_PATH}/docx_caption_labels_to_latex.lua",
+    "docx_latex_bundle": f"{FILTER_BASE_PATH}/docx_latex_bundle.lua",
     "strip_raw_tex": f"{FILTER_BASE_PATH}/strip_raw_tex.lua",
     "strip_document_images": f"{FILTER_BASE_PATH}/strip_document_images.lua",
+    "embed_media": f"{FILTER_BASE_PATH}/embed_media.lua",
 }
 
 # List of allowed pandoc options for security
@@ -86,6 +109,7 @@ ALLOWED_PANDOC_OPTIONS = [
     f"--lua-filter={FILTERS['html_tables_to_latex']}",
     f"--lua-filter={FILTERS['html_captions']}",
     f"--lua-filter={FILTERS['docx_caption_labels_to_latex']}",
+    f"--lua-filter={FILTERS['docx_latex_bundle']}",
     "--track-changes=all",
     "--reference-doc=",  # Prefix for reference-doc option
     "--pdf-engine=tectonic",
@@ -93,11 +117,18 @@ ALLOWED_PANDOC_OPTIONS = [
 ]
 
 # Target formats whose writer ultimately produces LaTeX (PDF goes through
-# tectonic, latex is the raw .tex file). The DOCX color preprocessor only
-# helps for these targets — for DOCX -> DOCX/HTML/etc. we leave the input
-# alone.
+# tectonic, latex is the raw .tex file).
 _LATEX_TARGET_FORMATS = frozenset({"pdf", "latex"})
 
+# The formats pandoc reads as a zip archive, from a file, and the ones it writes
+# as one (or, for PDF, through the engine's files). Every other format is text,
+# which a source in memory and its output pass through pipes.
+_BINARY_SOURCE_FORMATS = frozenset({"docx", "epub"})
+_BINARY_TARGET_FORMATS = frozenset({"docx", "epub", "odt", "pdf", "pptx"})
+
+# The command line's stdin and stdout, where pandoc reads and writes a document it pipes.
+STDIO = "-"
+
 # Only these turn the sandbox off, everything else keeps it on.
 _SANDBOX_OFF_VALUES = frozenset({"false", "0", "no", "off"})
 _SANDBOX_ON_VALUES = frozenset({"true", "1", "yes", "on"})
@@ -120,6 +151,8 @@ MIME_TYPES = {
     "tex": "application/x-tex",
     "rtf": "application/rtf",
     "txt": "text/plain",
+    "plain": "text/plain",
+    "textile": "text/plain",
     "json": "application/json",
     "xml": "application/xml",
 }
@@ -159,6 +192,9 @@ FILE_EXTENSIONS = {
 # Build default options dynamically
 DEFAULT_CONVERSION_OPTIONS = ["--track-changes=all", f"--lua-filter={FILTERS['page_break']}", f"--lua-filter={FILTERS['heading_levels']}"]
 
+# Seconds a client may keep a default reference document before it revalidates it with its ETag.
+REFERENCE_DOC_MAX_AGE = 86400
+
 logger = logging.getLogger(__name__)
 
 
@@ -178,6 +214,42 @@ async def _start_chromium() -> None:
         logger.exception("Failed to start Chromium for SVG conversion; SVG rasterization disabled: %s", e)
 
 
+def log_capabilities(capabilities: Capabilities) -> None:
+    """Report the probed binaries, and warn about what would make conversions fail or stall."""
+    logger.info("Pandoc version: %s", capabilities.pandoc_version)
+    logger.info("Tectonic: %s (version: %s)", capabilities.tectonic, capabilities.tectonic_version)
+    if capabilities.tectonic == "available" and not capabilities.tectonic_bundle_cached:
+        logger.warning("The tectonic bundle is not cached; the first PDF conversion downloads it")
+    # An empty list means the probe failed, which was reported already.
+    if capabilities.input_formats:
+        missing_readers = sorted(set(ALLOWED_SOURCE_FORMATS) - capabilities.input_formats)
+        if missing_readers:
+            logger.warning("Pandoc cannot read these allowed source formats: %s", ", ".join(missing_readers))
+    if capabilities.output_formats:
+        # PDF is written through the PDF engine, pandoc lists no writer of that name.
+        missing_writers = sorted(set(ALLOWED_TARGET_FORMATS) - capabilities.output_formats - {"pdf"})
+        if missing_writers:
+            logger.warning("Pandoc cannot write these allowed target formats: %s", ", ".join(missing_writers))
+
+
+async def _start_metrics_server() -> MetricsServer | None:
+    """Start the metrics server if it is enabled. A failed start is logged, not raised."""
+    if not is_metrics_server_enabled():
+        return None
+    metrics_port = get_metrics_port()
+    # A broken TLS configuration is not an operational hiccup. It is read
+    # here, outside the tolerant start below, so it stops the service
+    # instead of leaving the metrics port silently absent.
+    load_tls_options(METRICS_TLS_PREFIX)
+    metrics_server = MetricsServer(port=metrics_port)
+    try:
+        await metrics_server.start()
+    except Exception as e:  # noqa: BLE001
+        logger.error("Failed to start metrics server: %s", e)
+        return None
+    return metrics_server
+
+
 async def _stop_chromium() -> None:
     """Stop the persistent Chromium browser if it is running."""
     if not is_svg_conversion_enabled():
@@ -190,6 +262,29 @@ async def _stop_chromium() -> None:
             logger.exception("Error stopping Chromium: %s", e)
 
 
+def log_conversion_settings() -> None:
+    """
+    Log how conversions run.
+
+    The settings are read here at startup, so a bad value is reported at once
+    instead of at the first conversion.
+    """
+    logger.info("Pandoc conversions run at most %d at a time", get_conversion_executor().max_concurrent_conversions)
+    logger.info("Pre- and post-processing run in %s", get_processing_pool().describe())
+
+    timeout = get_conversion_timeout()
+    logger.info("Conversions time out after %s", f"{timeout}s" if timeout else "no fixed time")
+
+    shedding_policy = get_load_shedder().policy
+    logger.info(
+        "Load shedding limits (0 = disabled): active weight %d, queued %d, RSS %d MB, memory fraction %.2f",
+        shedding_policy.max_active_weight,
+        shedding_policy.max_queued,
+        shedding_policy.max_rss_bytes // (1024 * 1024),
+        shedding_policy.max_memory_fraction,
+    )
+
+
 @contextlib.asynccontextmanager
 async def lifespan(app_instance: FastAPI) -> AsyncGenerator[None]:  # noqa: ARG001
     """
@@ -201,11 +296,29 @@ async def lifespan(app_instance: FastAPI) -> AsyncGenerator[None]:  # noqa: ARG0
     The metrics server is started on a dedicated port (default: 9182) for
     security isolation from the main application API.
     """
-    # Initialize metrics and cache pandoc version
+    # Start the persistent Chromium browser used to rasterize embedded SVGs.
+    # It starts first, so the capability probe below finds its version.
+    await _start_chromium()
+
+    # Probe the binaries once; headers, /version and /health read the result.
+    capability_registry = get_capability_registry()
+    capabilities = await capability_registry.refresh()
+    log_capabilities(capabilities)
+    capability_registry.start_periodic_refresh()
+
+    # The health endpoints answer from the prober's snapshot from here on.
+    await health_prober.start()
+
+    # Jobs left queued by a previous run are picked up again.
+    await job_manager.start()
+    logger.info("Conversion jobs run %d at a time, stored in %s", job_manager.max_workers, job_manager.store.root)
+
+    # Workspaces a previous run left behind go first.
+    get_scratch_space().start_janitor()
+
+    # Initialize metrics with the probed pandoc version
     pandoc_metrics = get_pandoc_metrics()
-    pandoc_version = get_pandoc_version()
-    pandoc_metrics.set_pandoc_version(pandoc_version)
-    logger.info("Pandoc version: %s", pandoc_version)
+    pandoc_metrics.set_pandoc_version(capabilities.pandoc_version)
 
     api_keys = get_api_keys()
     if api_keys:
@@ -213,6 +326,11 @@ async def lifespan(app_instance: FastAPI) -> AsyncGenerator[None]:  # noqa: ARG0
     else:
         logger.info("API key authentication disabled")
 
+    log_conversion_settings()
+
+    # The runtime profiles are tried on the binary once, not by the first conversion of each format.
+    await get_pandoc_runtime().verify()
+
     # Read the TLS configuration at startup, so a broken one is reported here
     # instead of deep inside uvicorn.
     logger.info("Pandoc service scheme: %s", get_scheme(get_tls_options(API_TLS_PREFIX)))
@@ -221,30 +339,27 @@ async def lifespan(app_instance: FastAPI) -> AsyncGenerator[None]:  # noqa: ARG0
     # Guard against repeated lifespan execution (e.g., uvicorn --reload, TestClient)
     service_version = os.environ.get("PANDOC_SERVICE_VERSION", "unknown")
     try:
-        initialize_pandoc_info(pandoc_version or "unknown", service_version)
+        initialize_pandoc_info(capabilities.pandoc_version or "unknown", service_version)
     except ValueError:
         logger.debug("Prometheus info metric already initialized (lifespan re-executed)")
 
-    # Start metrics server if enabled
-    metrics_server: MetricsServer | None = None
-    if is_metrics_server_enabled():
-        metrics_port = get_metrics_port()
-        # A broken TLS configuration is not an operational hiccup. It is read
-        # here, outside the tolerant start below, so it stops the service
-        # instead of leaving the metrics port silently absent.
-        load_tls_options(METRICS_TLS_PREFIX)
-        metrics_server = MetricsServer(port=metrics_port)
-        try:
-            await metrics_server.start()
-        except Exception as e:  # noqa: BLE001
-            logger.error("Failed to start metrics server: %s", e)
-            metrics_server = None
-
-    # Start the persistent Chromium browser used to rasterize embedded SVGs.
-    await _start_chromium()
+    # The supervisor of several workers serves the metrics of all of them,
+    # and each worker publishes its gauges to the shared directory instead.
+    gauge_publisher = asyncio.create_task(publish_gauges_periodically()) if is_multiprocess_mode() else None
+    metrics_server = await _start_metrics_server() if not is_supervised_worker() else None
 
     yield  # Application runs here
 
+    if gauge_publisher is not None:
+        gauge_publisher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await gauge_publisher
+        mark_worker_stopped()
+    await job_manager.stop()
+    get_processing_pool().shutdown()
+    await get_scratch_space().stop_janitor()
+    await health_prober.stop()
+    await capability_registry.stop_periodic_refresh()
     await _stop_chromium()
 
     # Stop metrics server
@@ -293,19 +408,31 @@ env_data_limit = get_request_body_limit_mb()
 data_limit = env_data_limit * 1024 * 1024  # Convert MB to bytes
 
 
-# Set the maximum request body size to data_limit
-@app.middleware("http")
-async def check_request_size(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
-    size = len(await request.body())
-
-    if size > data_limit:
-        return process_error(
-            Exception(f"Body Size {size} > {data_limit}"),
-            "Request Body too large",
-            413,
-        )
+# Cancel conversions whose client is gone or whose deadline passed. Registered
+# first, so it runs last and only a conversion admitted by the others is timed.
+app.add_middleware(ConversionCancellationMiddleware)
 
-    return await call_next(request)
+# Give each request a scratch workspace. It wraps the cancellation, so the
+# workspace is removed once a cancelled conversion has cleaned up.
+app.add_middleware(ScratchWorkspaceMiddleware)
+
+# Log each conversion with the resources its child processes used. It wraps
+# the workspace and cancellation, so the line also covers their cleanup.
+app.add_middleware(RequestLogMiddleware)
+
+# Shed conversions while overloaded. Registered before the checks below, so an
+# overloaded replica still answers 401 and 413 first.
+app.add_middleware(LoadSheddingMiddleware)
+
+# Enforce the body limit while the upload streams in, without buffering it
+app.add_middleware(RequestSizeLimitMiddleware, get_max_body_size=lambda: data_limit)
+
+# Decompress a gzip or zstd request body in front of the body limit, so the
+# limit applies to the decompressed stream.
+app.add_middleware(RequestDecompressionMiddleware)
+
+# Compress textual responses in the coding the client accepts
+app.add_middleware(ResponseCompressionMiddleware)
 
 
 def api_key_error_response(exc: ApiKeyError) -> PlainTextResponse:
@@ -313,9 +440,8 @@ def api_key_error_response(exc: ApiKeyError) -> PlainTextResponse:
     return PlainTextResponse(content=exc.detail, status_code=exc.status_code, headers=exc.headers)
 
 
-# Registered after the size check, so it wraps it and runs first: an
-# unauthenticated request is rejected before check_request_size buffers its
-# body, and therefore costs no memory.
+# Registered after the size limit, so it wraps it and runs first: an
+# unauthenticated request is rejected before a byte of its body is read.
 @app.middleware("http")
 async def check_api_key(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
     if not is_request_authorized(request):
@@ -340,45 +466,9 @@ async def handle_api_key_error(request: Request, exc: ApiKeyError) -> PlainTextR
     return api_key_error_response(exc)
 
 
-def get_pandoc_version() -> str | None:
-    """Get the pandoc version using subprocess."""
-    try:
-        result = subprocess.run(
-            [PANDOC_PATH, "--version"],
-            capture_output=True,
-            text=True,
-            check=True,
-            shell=False,
-        )
-        # Extract version from the first line of output
-        version_line = result.stdout.splitlines()[0]
-        return version_line.split()[-1]  # Last word on the first line is the version
-    # A missing pandoc version must not fail the request.
-    except Exception as e:  # noqa: BLE001
-        logger.error(f"Error getting pandoc version: {e}")
-        return None
-
-
-def get_tectonic_availability() -> str:
-    try:
-        subprocess.run(
-            ["/usr/bin/tectonic", "--version"],
-            capture_output=True,
-            check=True,
-        )
-    except (FileNotFoundError, subprocess.CalledProcessError) as e:
-        logger.warning(f"Tectonic check failed: {e}")
-        return "unavailable"
-    except Exception as e:  # noqa: BLE001
-        logger.warning(f"Tectonic check error: {e}")
-        return "unknown"
-    else:
-        return "available"
-
-
 def get_temp_directory_writability() -> str:
     try:
-        with tempfile.NamedTemporaryFile("w") as probe_file:
+        with tempfile.NamedTemporaryFile("w", dir=get_scratch_dir()) as probe_file:
             probe_file.write("ok")
             return "writable"
     except Exception as e:  # noqa: BLE001
@@ -393,16 +483,33 @@ def get_temp_directory_writability() -> str:
     responses={200: {"description": "Success", "content": {MIME_TYPES["txt"]: {}}}, 422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}}},
 )
 def version() -> VersionSchema:
+    capabilities = get_capabilities()
     return VersionSchema(
         apiVersion=API_VERSION,
         python=platform.python_version(),
-        pandoc=get_pandoc_version(),
+        pandoc=capabilities.pandoc_version,
         pandocService=os.environ.get("PANDOC_SERVICE_VERSION"),
         timestamp=os.environ.get("PANDOC_SERVICE_BUILD_TIMESTAMP"),
-        chromium=get_chromium_manager().get_version(),
+        chromium=capabilities.chromium_version,
+        tectonic=capabilities.tectonic_version,
     )
 
 
+def check_dependencies() -> dict[str, str]:
+    """
+    Check the dependencies of a conversion, for the health prober.
+
+    Note: "chromium" is informational only (values never match the unhealthy
+    trip words) because SVG rasterization is a best-effort enhancement.
+    The pandoc and tectonic states come from the capabilities probed at startup.
+    """
+    capabilities = get_capabilities()
+    return {"pandoc": "available" if capabilities.pandoc_version else "unavailable", "tectonic": capabilities.tectonic, "filesystem": get_temp_directory_writability(), "chromium": get_chromium_health()}
+
+
+health_prober = HealthProber(check_dependencies)
+
+
 @app.get(
     "/health",
     summary="Health check endpoint",
@@ -422,117 +529,124 @@ def health() -> JSONResponse:
     Health check endpoint for monitoring.
 
     Returns:
-        JSONResponse: {status, pandoc, tectonic, filesystem}
+        JSONResponse: {status, pandoc, tectonic, filesystem, chromium}
     """
     logger.debug("Health check endpoint called")
 
-    # Basic health check - service is running
-    # Note: "chromium" is informational only (values never match the unhealthy
-    # trip words below) because SVG rasterization is a best-effort enhancement.
-    health_status = {"status": "healthy", "pandoc": "available" if get_pandoc_version() else "unavailable", "tectonic": get_tectonic_availability(), "filesystem": get_temp_directory_writability(), "chromium": get_chromium_health()}
+    snapshot = health_prober.get_snapshot()
+    health_status = {"status": "healthy" if snapshot.healthy else "unhealthy", **snapshot.dependencies}
+    return JSONResponse(health_status, status_code=200 if snapshot.healthy else 503)
 
-    # Optional: Add dependency checks here
-    # Memory/resource status
 
-    if any(key in ["unavailable", "unwritable", "unknown"] for key in health_status.values()):
-        health_status["status"] = "unhealthy"
-        return JSONResponse(health_status, status_code=503)
+@app.get(
+    "/health/live",
+    summary="Liveness probe",
+    description="Answers as long as the service process serves requests",
+    operation_id="livenessCheck",
+    tags=["meta"],
+    responses={200: {"description": "Service alive", "content": {MIME_TYPES["json"]: {}}}},
+)
+async def health_live() -> JSONResponse:
+    """
+    Liveness probe: the event loop answers, nothing else is checked.
 
-    return JSONResponse(health_status)
+    A missing dependency is not fixed by restarting the process, so it is left
+    to the readiness probe.
+    """
+    return JSONResponse({"status": "alive"})
+
+
+@app.get(
+    "/health/ready",
+    summary="Readiness probe",
+    description="Whether the service should receive conversions: its dependencies are healthy and its conversion queue is not saturated",
+    operation_id="readinessCheck",
+    tags=["meta"],
+    responses={
+        200: {"description": "Service ready", "content": {MIME_TYPES["json"]: {}}},
+        503: {"description": "Service not ready", "content": {MIME_TYPES["json"]: {}}},
+    },
+)
+def health_ready() -> JSONResponse:
+    """
+    Readiness probe for load balancers.
+
+    Returns:
+        JSONResponse: {status, pandoc, tectonic, filesystem, chromium, queue}
+    """
+    snapshot = health_prober.get_snapshot()
+    # The queue is read live: it changes far faster than the probe interval, and reading it costs nothing.
+    saturated = get_conversion_executor().is_saturated()
+    ready = snapshot.healthy and not saturated
+    readiness_status = {"status": "ready" if ready else "not ready", **snapshot.dependencies, "queue": "saturated" if saturated else "available"}
+    return JSONResponse(readiness_status, status_code=200 if ready else 503)
 
 
 @app.get(
     "/docx-template",
-    # The endpoint streams a file or returns plain text, so there is no response model.
+    # The endpoint returns a file or plain text, so there is no response model.
     response_model=None,
     summary="Download DOCX template",
-    description="Get the default DOCX template for document conversion",
+    description="Get the default DOCX template for document conversion. The template is generated once per pandoc version and sent with an ETag and Cache-Control.",
     responses={
         200: {
             "description": "Success",
             "content": {MIME_TYPES["docx"]: {}},
         },
+        304: {"description": "The template named by If-None-Match is still current."},
         401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
         422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}},
         500: {"description": "Internal server error while generating the template.", "content": {MIME_TYPES["txt"]: {}}},
     },
     dependencies=[Depends(require_api_key)],
 )
-async def get_docx_template() -> StreamingResponse | PlainTextResponse:
-    path = Path(CUSTOM_REFERENCE_DOCX)
-    try:
-        # ruff: noqa: S603
-        proc = await anyio.run_process(
-            [
-                PANDOC_PATH,
-                "-o",
-                "custom-reference.docx",
-                "--print-default-data-file",
-                "reference.docx",
-            ],
-            check=True,
-        )
-        if proc.returncode != 0:
-            return process_error(Exception(f"Process failed with return code {proc.returncode}"), "An internal error has occurred while generating the template", 500)
-
-        async with await anyio.open_file(path, "rb") as f:
-            doc_content = await f.read()
-
-        return StreamingResponse(
-            io.BytesIO(doc_content),
-            headers={"Content-Disposition": "attachment; filename=reference.docx"},
-            media_type=MIME_TYPES["docx"],
-        )
-    finally:
-        if Path.exists(path):
-            Path.unlink(path)
+async def get_docx_template(request: Request) -> Response:
+    return await build_reference_doc_response(request, "docx")
 
 
 @app.get(
     "/pptx-template",
-    # The endpoint streams a file or returns plain text, so there is no response model.
+    # The endpoint returns a file or plain text, so there is no response model.
     response_model=None,
     summary="Download PPTX template",
-    description="Get the default PPTX template for presentation conversion",
+    description="Get the default PPTX template for presentation conversion. The template is generated once per pandoc version and sent with an ETag and Cache-Control.",
     responses={
         200: {
             "description": "Success",
             "content": {MIME_TYPES["pptx"]: {}},
         },
+        304: {"description": "The template named by If-None-Match is still current."},
         401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
         422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}},
         500: {"description": "Internal server error while generating the template.", "content": {MIME_TYPES["txt"]: {}}},
     },
     dependencies=[Depends(require_api_key)],
 )
-async def get_pptx_template() -> StreamingResponse | PlainTextResponse:
-    path = Path(CUSTOM_REFERENCE_PPTX)
-    try:
-        # ruff: noqa: S603
-        proc = await anyio.run_process(
-            [
-                PANDOC_PATH,
-                "-o",
-                "custom-reference.pptx",
-                "--print-default-data-file",
-                "reference.pptx",
-            ],
-            check=True,
-        )
-        if proc.returncode != 0:
-            return process_error(Exception(f"Process failed with return code {proc.returncode}"), "An internal error has occurred while generating the template", 500)
+async def get_pptx_template(request: Request) -> Response:
+    return await build_reference_doc_response(request, "pptx")
 
-        async with await anyio.open_file(path, "rb") as f:
-            pptx_content = await f.read()
 
-        return StreamingResponse(
-            io.BytesIO(pptx_content),
-            headers={"Content-Disposition": "attachment; filename=reference.pptx"},
-            media_type=MIME_TYPES["pptx"],
-        )
-    finally:
-        if Path.exists(path):
-            Path.unlink(path)
+async def build_reference_doc_response(request: Request, target_format: str) -> Response:
+    """
+    Send pandoc's default reference document, generated once per pandoc version.
+
+    The document is sent with a strong ETag and may be cached for a day; a client
+    that sends the ETag back in If-None-Match gets a 304 instead.
+    """
+    try:
+        reference_doc = await get_reference_doc_cache().get(target_format, get_capabilities().pandoc_version)
+    except (subprocess.CalledProcessError, OSError) as e:
+        return process_error(e, "An internal error has occurred while generating the template", 500)
+
+    # Behind an API key the document must not land in shared caches.
+    headers = {"ETag": format_etag(reference_doc.etag), "Cache-Control": f"{'private' if get_api_keys() else 'public'}, max-age={REFERENCE_DOC_MAX_AGE}"}
+    if is_etag_matched(request.headers.get("if-none-match"), reference_doc.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        reference_doc.content,
+        headers={**headers, "Content-Disposition": f"attachment; filename=reference.{target_format}"},
+        media_type=MIME_TYPES[target_format],
+    )
 
 
 def _validate_pandoc_options(options: list[str]) -> list[str]:
@@ -576,15 +690,19 @@ def _build_pandoc_command(
     source_path: str,
     output_path: str,
     validated_options: list[str],
-    apply_docx_latex_filters: bool,
     preserve_table_styles: bool = False,
+    reader_format: str | None = None,
+    skipped_filters: frozenset[str] = frozenset(),
 ) -> list[str]:
-    """Build the pandoc CLI invocation for run_pandoc_conversion."""
-    # Source format gains the +styles extension on the docx->latex path so the
-    # synthetic character/paragraph styles the preprocessors injected surface as
-    # custom-style attributes the docx_colors_to_latex / docx_paragraphs_to_latex
-    # filters can pick up.
-    pandoc_source_format = f"{source_format}+styles" if apply_docx_latex_filters else source_format
+    """
+    Build the pandoc CLI invocation for run_pandoc_conversion, with the reader extensions and filters of the conversion's pipeline.
+
+    With a reader_format, pandoc reads the source in that format (the JSON AST
+    parse_to_ast wrote), while the filters are still chosen by source_format.
+    The filters in skipped_filters, which the source has nothing for, are left out.
+    """
+    pipeline = get_pipeline(source_format, target_format)
+    pandoc_source_format = reader_format or f"{source_format}{pipeline.reader_extensions}"
     cmd = [PANDOC_PATH, "-f", pandoc_source_format, "-t", target_format, "-o", output_path, source_path]
 
     # A document names its own resources, and the writers embedding media fetch
@@ -604,62 +722,40 @@ def _build_pandoc_command(
             # inside itself is kept, whatever the source format.
             cmd.append(f"--lua-filter={FILTERS['strip_document_images']}")
 
-    # Convert inline CSS on HTML <span style="..."> into raw OOXML runs for
-    # the DOCX writer. The filter emits RawInline("openxml", ...) nodes which
-    # only render when the target writer is docx; for any other target
-    # (markdown, html, pdf, pptx, ...) those nodes are silently dropped and
-    # the styled-span text disappears entirely, so the filter must be gated
-    # on both source and target.
-    if source_format == "html" and target_format == "docx":
-        cmd.append(f"--lua-filter={FILTERS['inline_styles']}")
-        # Pairs with the html_lists_pre_process pass on the source bytes: the
-        # preprocessor wraps orphan <ol>/<ul> with a sentinel <li>, and this
-        # filter strips the marker paragraph that pandoc would otherwise emit
-        # for those synthetic list items.
-        cmd.append(f"--lua-filter={FILTERS['html_lists']}")
-        # Mark genuine Polarion captions (paragraphs carrying the
-        # <span data-sequence=...> counter) with the "Caption" style so
-        # docx_references_post_process recognises them structurally instead of by
-        # a leaky "text starts with Table/Figure" check. See
-        # filters/html_captions.lua.
-        cmd.append(f"--lua-filter={FILTERS['html_captions']}")
-        # Opt-in: preserve CSS table cell styles (background-color, borders)
-        # by rebuilding styled tables as raw OOXML via the Lua filter.
-        if preserve_table_styles:
-            cmd.extend(["-M", "preserve_table_styles=true"])
-
-    # html -> pdf/latex: recover table width and horizontal alignment from the
-    # <table style> that pandoc's HTML reader keeps in the Table Attr but the
-    # LaTeX writer ignores (every table would otherwise render content-width and
-    # centered). This is the LaTeX counterpart to the DOCX post-processing in
-    # docx_post_process/html_table_layout. The filter emits raw LaTeX (longtable
-    # glue), so it is gated on the latex-producing targets.
-    if source_format == "html" and target_format in _LATEX_TARGET_FORMATS:
-        cmd.append(f"--lua-filter={FILTERS['html_tables_to_latex']}")
-
-    # Companion filters to the DOCX color and paragraph-format preprocessors.
-    # Both only emit raw LaTeX, so they are gated on the docx->latex path. Div
-    # (paragraph) and Span (run color) scopes are independent, so order between
-    # them does not matter.
-    if apply_docx_latex_filters:
-        # Must precede docx_colors_to_latex: it rewrites underline/strikeout that
-        # carry other formatting into ulem and strips highlight from inside them,
-        # before the colour filter turns those spans into \textcolor/\hl.
-        cmd.append(f"--lua-filter={FILTERS['docx_text_decorations']}")
-        cmd.append(f"--lua-filter={FILTERS['docx_colors_to_latex']}")
-        cmd.append(f"--lua-filter={FILTERS['docx_math_colors_to_latex']}")
-        cmd.append(f"--lua-filter={FILTERS['docx_paragraphs_to_latex']}")
-        cmd.append(f"--lua-filter={FILTERS['docx_lists_to_latex']}")
-        cmd.append(f"--lua-filter={FILTERS['docx_tables_to_latex']}")
-        # Strip "Table N" / "Figure N" prefix from Caption blocks so LaTeX's
-        # own \caption counter doesn't duplicate the numbering.
-        cmd.append(f"--lua-filter={FILTERS['docx_caption_labels_to_latex']}")
+    # The filters of the pipeline (app/conversion_pipeline.py). A bundle runs
+    # them all in one Lua interpreter, sharing the walks they can share; see
+    # filters/docx_latex_bundle.lua.
+    if pipeline.filter_bundle is not None and is_filter_bundle_enabled():
+        cmd.append(f"--lua-filter={FILTERS[pipeline.filter_bundle]}")
+        # The bundle loads the filters itself, so it is told which to leave out.
+        bundled_skips = [name for name in pipeline.filters if name in skipped_filters]
+        if bundled_skips:
+            cmd.extend(["-V", f"{SKIP_FILTERS_VARIABLE}={','.join(bundled_skips)}"])
+    else:
+        cmd.extend(f"--lua-filter={FILTERS[name]}" for name in pipeline.filters if name not in skipped_filters)
+    # Opt-in: preserve CSS table cell styles (background-color, borders)
+    # by rebuilding styled tables as raw OOXML via the inline_styles filter.
+    if pipeline.table_styles and preserve_table_styles:
+        cmd.extend(["-M", "preserve_table_styles=true"])
 
     if validated_options:
         cmd.extend(validated_options)
+
+    # The GHC runtime options of the format: allocation area, heap cap, garbage collector.
+    cmd.extend(get_pandoc_runtime().get_arguments(source_format, target_format))
     return cmd
 
 
+def is_content_scan_enabled() -> bool:
+    """Whether a source is scanned for the stages it can skip (PIPELINE_CONTENT_SCAN, default true); see app/content_features.py."""
+    return get_bool_env("PIPELINE_CONTENT_SCAN", default=True)
+
+
+def is_filter_bundle_enabled() -> bool:
+    """Whether the docx->latex filters run as one bundle (DOCX_LATEX_FILTER_BUNDLE, default true) rather than one by one."""
+    return get_bool_env("DOCX_LATEX_FILTER_BUNDLE", default=True)
+
+
 def is_sandbox_enabled() -> bool:
     """
     Whether pandoc runs sandboxed, which is the default.
@@ -738,22 +834,163 @@ async def preprocess_html_svgs(source: str | bytes, scale_factor: float | None =
         return source
 
 
-def run_pandoc_conversion(source_data: str | bytes, source_format: str, target_format: str, options: list[str] | None = None, preserve_table_styles: bool = False) -> bytes:
+async def prepare_html_source(source: bytes | str | Path, scale_factor: float | None, *, extract_table_layouts: bool) -> tuple[bytes | str, list[html_table_layout.TableLayout] | None]:
+    """
+    Run the HTML steps that read the whole document, loading a spooled source first.
+
+    Returns:
+        The source with its SVGs rasterized, and the table layouts if requested.
+    """
+    source = await load_source(source)
+
+    # Recover per-table width/alignment from the HTML before pandoc drops
+    # it, so the DOCX post-processor can restore it (pandoc keeps only an
+    # auto width and no alignment). Read from the original source: SVG
+    # rasterization below never touches tables.
+    table_layouts = await get_processing_pool().run("html_table_layout", html_table_layout.extract, source) if extract_table_layouts else None
+
+    # Rasterize any embedded SVGs to PNG so renderers without full SVG
+    # support get a usable image: Word would otherwise show the draw.io
+    # "Text is not SVG - cannot display" fallback.
+    return await preprocess_html_svgs(source, scale_factor), table_layouts
+
+
+async def prepare_source(source: bytes | str | Path, pipeline: ConversionPipeline, scale_factor: float | None) -> tuple[bytes | str | Path, list[html_table_layout.TableLayout] | None]:
+    """
+    Run the html_prepare stage of a pipeline.
+
+    Without table layouts to read and without SVG rasterization, a spooled HTML
+    source goes to pandoc as it is.
+
+    Returns:
+        The source to hand to pandoc, and the table layouts for the DOCX post-processing
+    """
+    if not pipeline.prepare_html or not (pipeline.extract_table_layouts or is_svg_conversion_enabled()):
+        return source, None
+    with time_stage(HTML_PREPARE_STAGE):
+        return await prepare_html_source(source, scale_factor, extract_table_layouts=pipeline.extract_table_layouts)
+
+
+async def run_pandoc_conversion(source_data: str | bytes | Path, source_format: str, target_format: str, options: list[str] | None = None, preserve_table_styles: bool = False) -> bytes:
+    """
+    Run pandoc conversion and return its output in memory, for the formats the service post-processes.
+
+    Returns:
+        Converted output as bytes
+    """
+    output = await run_pandoc_conversion_to_output(source_data, source_format, target_format, options, preserve_table_styles=preserve_table_styles)
+    if isinstance(output, bytes):
+        return output
+    output_path = output
+    try:
+        return await anyio.Path(output_path).read_bytes()
+    finally:
+        remove_file(output_path)
+
+
+async def run_pandoc_conversion_to_output(source_data: str | bytes | Path, source_format: str, target_format: str, options: list[str] | None = None, preserve_table_styles: bool = False) -> bytes | Path:
     """
     Run pandoc conversion using subprocess.
 
+    The subprocess runs through the ConversionExecutor, so it never blocks the
+    event loop and waits for a free slot when the service is busy.
+
     Args:
-        source_data: The data to convert (string or bytes)
+        source_data: The data to convert (string or bytes), or the path of a
+            source the endpoint spooled to disk. Pandoc reads such a file where
+            it lies unless a preprocessor has to rewrite it first; the caller
+            removes it.
         source_format: The source format
         target_format: The target format
         options: Additional pandoc options
 
     Returns:
-        Converted output as bytes
+        The output in memory if it came through a pipe (see _run_pandoc), else
+        the path of the file pandoc wrote, which the caller removes.
     """
     if options is None:
         options = []
 
+    _validate_formats(source_format, target_format)
+
+    # Validate all options against whitelist to prevent command injection
+    validated_options = _validate_pandoc_options(options)
+
+    source_data, skipped = await _prepare_pandoc_source(source_data, source_format, get_pipeline(source_format, target_format))
+
+    def build_command(source_path: str, output_path: str) -> list[str]:
+        return _build_pandoc_command(
+            source_format=source_format,
+            target_format=target_format,
+            source_path=source_path,
+            output_path=output_path,
+            validated_options=validated_options,
+            preserve_table_styles=preserve_table_styles,
+            skipped_filters=skipped,
+        )
+
+    with time_stage(PANDOC_STAGE):
+        return await _run_pandoc(source_data, build_command, source_format, target_format)
+
+
+async def parse_to_ast(source_data: str | bytes | Path, source_format: str, target_format: str) -> Path:
+    """
+    Read a source into pandoc's JSON AST, the way a conversion to target_format reads it.
+
+    This is the reading half of run_pandoc_conversion_to_output: the same source
+    rewrites, reader format and reader options, but no filter, since the filters
+    depend on the target. Conversions whose pipelines have the same reading
+    read their source alike and can share one AST, which render_ast turns into
+    each of the targets. The media the reader extracts travels inside the AST as
+    data: URIs (filters/embed_media.lua).
+
+    Returns:
+        Path of the AST file. The caller removes it.
+    """
+    _validate_formats(source_format, target_format)
+    pipeline = get_pipeline(source_format, target_format)
+    # The AST serves every target of its reading, so only the source rewrites
+    # are skipped; render_ast runs all the filters of each target.
+    source_data, _ = await _prepare_pandoc_source(source_data, source_format, pipeline)
+    pandoc_source_format = f"{source_format}{pipeline.reader_extensions}"
+
+    def build_command(source_path: str, output_path: str) -> list[str]:
+        # --track-changes is the one reader option among the defaults.
+        cmd = [PANDOC_PATH, "-f", pandoc_source_format, "-t", "json", "-o", output_path, source_path, "--track-changes=all", f"--lua-filter={FILTERS['embed_media']}"]
+        if is_sandbox_enabled():
+            cmd.append("--sandbox")
+        return cmd
+
+    with time_stage(PANDOC_READ_STAGE):
+        return await _run_pandoc_to_file(source_data, build_command)
+
+
+async def render_ast(ast_path: Path, source_format: str, target_format: str, options: list[str] | None = None, preserve_table_styles: bool = False) -> Path:
+    """
+    Render a target from the AST parse_to_ast read, with the filters and options run_pandoc_conversion_to_output applies.
+
+    Returns:
+        Path of the file pandoc wrote. The caller removes it.
+    """
+    _validate_formats(source_format, target_format)
+    validated_options = _validate_pandoc_options(options or [])
+
+    def build_command(source_path: str, output_path: str) -> list[str]:
+        return _build_pandoc_command(
+            source_format=source_format,
+            target_format=target_format,
+            source_path=source_path,
+            output_path=output_path,
+            validated_options=validated_options,
+            preserve_table_styles=preserve_table_styles,
+            reader_format="json",
+        )
+
+    with time_stage(PANDOC_RENDER_STAGE):
+        return await _run_pandoc_to_file(ast_path, build_command)
+
+
+def _validate_formats(source_format: str, target_format: str) -> None:
     # Sanitize format parameters to prevent shell injection
     if not source_format.isalnum() or not target_format.isalnum():
         raise ValueError("Format parameters must be alphanumeric")
@@ -765,8 +1002,17 @@ def run_pandoc_conversion(source_data: str | bytes, source_format: str, target_f
     if target_format not in ALLOWED_TARGET_FORMATS:
         raise ValueError(f"Invalid target format: {target_format}")
 
-    # Validate all options against whitelist to prevent command injection
-    validated_options = _validate_pandoc_options(options)
+
+async def _prepare_pandoc_source(source_data: str | bytes | Path, source_format: str, pipeline: ConversionPipeline) -> tuple[bytes | Path, frozenset[str]]:
+    """
+    Run the pre-processing stage of a pipeline, after scanning the source for the gated steps and filters it can skip.
+
+    Returns:
+        The source to hand to pandoc, and the names of the filters and steps the source skips
+    """
+    # Only a conversion that rewrites its source needs it in memory.
+    if isinstance(source_data, Path) and pipeline.pre_process is not None:
+        source_data = await load_source(source_data)
 
     # Normalize source_data to bytes once, so the rest of the function
     # works with a single type. The temp file below is opened in "wb"
@@ -774,70 +1020,170 @@ def run_pandoc_conversion(source_data: str | bytes, source_format: str, target_f
     if isinstance(source_data, str):
         source_data = source_data.encode("utf-8")
 
-    # Pandoc's DOCX reader drops several direct formatting properties before
-    # producing the AST — run colour/size (<w:color>/<w:shd>/<w:highlight>/<w:sz>),
-    # paragraph alignment (<w:jc>) and indent (<w:ind>), and it flattens
-    # level-skipping lists. For targets that ultimately produce LaTeX (PDF,
-    # latex) we rewrite the source so those properties survive (synthetic
-    # character/paragraph styles surfaced via docx+styles, plus <w:ilvl>
-    # sentinels), and the docx_*_to_latex Lua filters re-emit them. All three
-    # rewrites run in a single unzip/re-zip pass (docx_latex_pre_process) so an
-    # image-heavy document's media is recompressed once, not three times.
-    apply_docx_latex_filters = source_format == "docx" and target_format in _LATEX_TARGET_FORMATS
-    if apply_docx_latex_filters:
-        source_data = docx_latex_pre_process.preprocess(source_data)
-
-    # html -> docx: rewrite orphan <ol>/<ul> directly nested inside another
-    # list so pandoc's HTML reader doesn't synthesize an implicit list item
-    # that the DOCX writer would render as a stray marker (e.g. "a.") above
-    # the deeper item. See app/html_lists_pre_process.py and
-    # filters/html_lists.lua for the full pipeline.
-    # Also wrap each <p style="margin-left: ...; text-align: ..."> in a marker
-    # <div> so the paragraph indent and/or alignment survive pandoc's HTML
-    # reader (which drops <p>'s style attribute outright). See
-    # app/html_paragraph_pre_process.py and the Div handler in
-    # filters/inline_styles.lua for the full pipeline.
-    # Also give un-sized <img> an explicit px width/height read from the inlined
-    # image so pandoc renders it at the 96 dpi CSS reference (not its 72 dpi
-    # no-density fallback), honouring any CSS max-width. See
-    # app/html_image_pre_process.py.
-    if source_format == "html" and target_format == "docx":
-        source_data = html_lists_pre_process.preprocess(source_data)
-        source_data = html_paragraph_pre_process.preprocess(source_data)
-        source_data = html_math_color_pre_process.preprocess(source_data)
-        source_data = html_image_pre_process.preprocess(source_data)
-
-    with tempfile.NamedTemporaryFile(mode="wb", delete=False) as source_file, tempfile.NamedTemporaryFile(delete=False) as output_file:
+    # A source left on disk is not read just to be scanned: it runs every stage.
+    skipped: frozenset[str] = frozenset()
+    if pipeline.requires and isinstance(source_data, bytes) and is_content_scan_enabled():
+        with time_stage(CONTENT_SCAN_STAGE):
+            features = await anyio.to_thread.run_sync(scan_content, source_data, source_format)
+        skipped = gate_stages(pipeline, features)
+
+    if pipeline.pre_process is not None:
+        # All rewrites of the source run as one stage, so the document crosses to a worker process once.
+        with time_stage(pipeline.pre_process):
+            source_data = await get_processing_pool().run(pipeline.pre_process, processing_stages.preprocess_source, source_data, pipeline.pre_process, skipped)
+    return source_data, skipped
+
+
+async def _run_pandoc(source_data: bytes | Path, build_command: Callable[[str, str], list[str]], source_format: str, target_format: str) -> bytes | Path:
+    """
+    Run the pandoc command built for a source path and an output path.
+
+    A source in memory converted to a text format stays off the disk: pandoc
+    reads it from stdin and writes the output to stdout. Only a DOCX or EPUB
+    source is still written to a temp file on that path. A source spooled to
+    disk and a binary output go through files.
+
+    Returns:
+        The output in memory if it came through a pipe, else the path of the file pandoc wrote, which the caller removes.
+    """
+    if isinstance(source_data, Path) or target_format in _BINARY_TARGET_FORMATS:
+        return await _run_pandoc_to_file(source_data, build_command)
+
+    # Run pandoc with validated parameters; the executor measures its duration
+    if source_format not in _BINARY_SOURCE_FORMATS:
+        return await get_conversion_executor().run_piped(build_command(STDIO, STDIO), source_data)
+    source_path = await anyio.to_thread.run_sync(write_scratch_file, source_data, get_scratch_dir())
+    try:
+        return await get_conversion_executor().run_piped(build_command(str(source_path), STDIO), None)
+    finally:
+        remove_file(source_path)
+
+
+async def _run_pandoc_to_file(source_data: bytes | Path, build_command: Callable[[str, str], list[str]]) -> Path:
+    """Run the pandoc command built for a source path and an output path, writing the source to a temp file first unless it is a file already."""
+    scratch_dir = get_scratch_dir()
+    # A source the endpoint spooled to disk is read where it lies; the endpoint also removes it.
+    source_path = source_data if isinstance(source_data, Path) else await anyio.to_thread.run_sync(write_scratch_file, source_data, scratch_dir)
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, dir=scratch_dir) as output_file:
+            output_path = Path(output_file.name)
         try:
-            # Write input data to temporary file
-            source_file.write(source_data)
-            source_file.flush()
-
-            cmd = _build_pandoc_command(
-                source_format=source_format,
-                target_format=target_format,
-                source_path=source_file.name,
-                output_path=output_file.name,
-                validated_options=validated_options,
-                apply_docx_latex_filters=apply_docx_latex_filters,
-                preserve_table_styles=preserve_table_styles,
-            )
-
-            # Run pandoc with validated parameters and measure duration
-            subprocess_start_time = time.time()
-            subprocess.run(cmd, check=True, shell=False, stdin=subprocess.PIPE)
-            subprocess_duration = time.time() - subprocess_start_time
-            observe_subprocess_duration(subprocess_duration)
-
-            # Read output
-            with Path(output_file.name).open("rb") as f:
-                return f.read()
-        finally:
-            # Clean up temporary files
-            if Path(source_file.name).exists():
-                Path(source_file.name).unlink()
-            if Path(output_file.name).exists():
-                Path(output_file.name).unlink()
+            # Run pandoc with validated parameters; the executor measures its duration
+            await get_conversion_executor().run(build_command(str(source_path), str(output_path)))
+        except BaseException:
+            # The output is only handed over when pandoc produced it.
+            remove_file(output_path)
+            raise
+    finally:
+        if source_path is not source_data:
+            remove_file(source_path)
+    return output_path
+
+
+def write_scratch_file(data: bytes, scratch_dir: Path) -> Path:
+    """Write data to a new file in scratch_dir, which the caller removes; blocking, so it runs in a worker thread."""
+    with tempfile.NamedTemporaryFile(mode="wb", delete=False, dir=scratch_dir) as scratch_file:
+        scratch_file.write(data)
+    return Path(scratch_file.name)
+
+
+def remove_file(path: Path) -> None:
+    """Remove a file the service wrote, if it is still there."""
+    path.unlink(missing_ok=True)
+
+
+def build_docx_with_ref_options(extended_options: object, template_filename: str | None) -> list[str]:
+    """
+    Build the pandoc options of a DOCX conversion with an optional template.
+
+    Args:
+        extended_options: The "options" form field, used if it is a string
+        template_filename: Path of the reference document, if one was uploaded
+
+    Returns:
+        The default conversion options with the page orientation filter, the extended options and the reference document
+    """
+    options = DEFAULT_CONVERSION_OPTIONS.copy()
+
+    # Add page orientation filter if not already present
+    page_orientation_filter = f"--lua-filter={FILTERS['page_orientation']}"
+    if page_orientation_filter not in options:
+        options.append(page_orientation_filter)
+
+    if isinstance(extended_options, str):
+        options.append(extended_options)
+
+    if template_filename is not None:
+        options.append(f"--reference-doc={template_filename}")
+    return options
+
+
+async def write_template_file(template: bytes, extension: str) -> str:
+    """Write an uploaded template to a file of its own, where pandoc reads it as --reference-doc; the endpoint removes it."""
+    descriptor, template_filename = tempfile.mkstemp(prefix="pandoc-template-", suffix=f".{extension}", dir=get_scratch_dir())
+    os.close(descriptor)
+    async with await anyio.open_file(template_filename, "wb") as f:
+        await f.write(template)
+    return template_filename
+
+
+def get_template_content(template: bytes | StoredTemplate | None) -> bytes | Path | None:
+    """What the result cache key hashes for a template: the uploaded bytes, or the registered file."""
+    return template.path if isinstance(template, StoredTemplate) else template
+
+
+def get_template_filename(template: bytes | StoredTemplate | None, temp_template_filename: str | None) -> str | None:
+    """The file pandoc reads as --reference-doc: a registered template where it is stored, an uploaded one where it was written."""
+    return str(template.path) if isinstance(template, StoredTemplate) else temp_template_filename
+
+
+class ConversionRequestError(Exception):
+    """A conversion request a template endpoint refuses with a message and status of its own."""
+
+    def __init__(self, cause: Exception, message: str, status: int) -> None:
+        super().__init__(message)
+        self.cause = cause
+        self.message = message
+        self.status = status
+
+
+async def read_conversion_template(template_file: object, template_id: str | None, target_format: str) -> bytes | StoredTemplate | None:
+    """
+    The template of a DOCX or PPTX conversion: an uploaded one, a registered one, or none.
+
+    Returns:
+        The bytes of the "template" form part, the registered template named by
+        template_id, or None.
+
+    Raises:
+        ConversionRequestError: If the template part is not a file, both are given,
+            or the registered template is unknown or of the other format.
+    """
+    if isinstance(template_file, str):
+        raise ConversionRequestError(Exception(f"{'Docx' if target_format == 'docx' else 'PPTX'} template must be a File"), "Invalid template file", 400)
+    if template_id is None:
+        return await template_file.read() if template_file else None  # type: ignore[attr-defined]
+    if template_file:
+        raise ConversionRequestError(Exception("Give either a template file or a template_id"), "Invalid template file", 400)
+    try:
+        stored = await anyio.to_thread.run_sync(get_template_store().get, template_id)
+    except TemplateNotFoundError as e:
+        raise ConversionRequestError(e, "Template not found", 404) from e
+    if stored.template_format != target_format:
+        raise ConversionRequestError(InvalidTemplateError(f"Template {template_id} is a {stored.template_format} template"), "Invalid template file", 400)
+    return stored
+
+
+def build_pptx_with_ref_options(extended_options: object, template_filename: str | None) -> list[str]:
+    """Build the pandoc options of a PPTX conversion with an optional template, like build_docx_with_ref_options."""
+    options = DEFAULT_CONVERSION_OPTIONS.copy()
+
+    if isinstance(extended_options, str):
+        options.append(extended_options)
+
+    if template_filename is not None:
+        options.append(f"--reference-doc={template_filename}")
+    return options
 
 
 @app.post(
@@ -851,8 +1197,10 @@ def run_pandoc_conversion(source_data: str | bytes, source_format: str, target_f
         },
         400: {"description": "Bad request.", "content": {MIME_TYPES["txt"]: {}}},
         401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
-        413: {"description": "Request body too large.", "content": {MIME_TYPES["txt"]: {}}},
+        413: {"description": "Request body too large, or the document too large for the pandoc heap limit.", "content": {MIME_TYPES["txt"]: {}}},
         422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}},
+        503: {"description": "Service overloaded, retry after the number of seconds in the Retry-After header.", "content": {MIME_TYPES["txt"]: {}}},
+        504: {"description": "Conversion timed out (see the timeout query parameter and X-Conversion-Timeout header).", "content": {MIME_TYPES["txt"]: {}}},
     },
     dependencies=[Depends(require_api_key)],
 )
@@ -865,69 +1213,63 @@ async def convert_docx_with_ref(
     orientation: str | None = None,
     scale_factor: float | None = None,
     preserve_table_styles: bool = False,
+    template_id: str | None = None,
 ) -> Response:
     temp_template_filename = None
+    spooled_source = None
     pandoc_metrics = get_pandoc_metrics()
     conversion_start_time = time.time()
     pandoc_metrics.record_conversion_start()
 
     try:
-        form = await request.form(max_part_size=data_limit)  # NOSONAR False positive - max_part_size is valid parameter
-        source_content = form.get("source")
-        source = await get_docx_source_data(source_content, encoding)
-        if not source:
-            pandoc_metrics.record_conversion_failure()
-            increment_conversion_failure(source_format, "docx")
-            return process_error(Exception("No source file"), "No data or file provided using key 'source'", 400)
+        form = await read_form(request, data_limit)
+        source = spooled_source = await read_form_source(form, encoding)
 
         # Record input size
-        input_size = len(source) if isinstance(source, bytes) else len(source.encode("utf-8"))
-        observe_request_body_size(input_size)
-
-        # Optional docx template file
-        docx_template_file = form.get("template")
-
-        if isinstance(docx_template_file, str):
-            pandoc_metrics.record_conversion_failure()
-            increment_conversion_failure(source_format, "docx")
-            return process_error(Exception("Docx template must be a File"), "Invalid template file", 400)
-
-        has_template = bool(docx_template_file)
-        if docx_template_file:
-            temp_template_filename = f"ref_{int(time.time())}.docx"
-            async with await anyio.open_file(temp_template_filename, "wb") as f:
-                await f.write(await docx_template_file.read())
-
-        # Build conversion options including template if provided
-        options = DEFAULT_CONVERSION_OPTIONS.copy()
+        observe_request_body_size(get_source_size(source))
+
+        # Optional docx template: an uploaded file or a registered one
+        template = await read_conversion_template(form.get("template"), template_id, "docx")
+        has_template = template is not None
+
+        # The options are keyed without the template's file name, the template's content stands in for it.
+        conversion_key = await get_conversion_key(
+            source,
+            source_format,
+            "docx",
+            build_docx_with_ref_options(form.get("options"), None),
+            get_template_content(template),
+            paper_size=paper_size,
+            orientation=orientation,
+            scale_factor=scale_factor,
+            preserve_table_styles=preserve_table_styles,
+        )
+        cached_response = await answer_from_result_cache(request, conversion_key, "docx", file_name)
+        if cached_response is not None:
+            pandoc_metrics.record_conversion_cached()
+            return cached_response
 
-        # Add page orientation filter if not already present
-        page_orientation_filter = f"--lua-filter={FILTERS['page_orientation']}"
-        if page_orientation_filter not in options:
-            options.append(page_orientation_filter)
+        response: Response | None = None
 
-        extended_options = form.get("options")
-        if isinstance(extended_options, str):
-            options.append(extended_options)
+        async def run_conversion() -> bytes:
+            nonlocal response, temp_template_filename
+            if isinstance(template, bytes):
+                temp_template_filename = await write_template_file(template, "docx")
 
-        if temp_template_filename is not None:
-            options.append(f"--reference-doc={temp_template_filename}")
+            options = build_docx_with_ref_options(form.get("options"), get_template_filename(template, temp_template_filename))
 
-        # Recover per-table width/alignment from the HTML before pandoc drops
-        # it, so the DOCX post-processor can restore it (pandoc keeps only an
-        # auto width and no alignment). Read from the original source: SVG
-        # rasterization below never touches tables.
-        table_layouts = html_table_layout.extract(source) if source_format == "html" else None
+            prepared_source, table_layouts = await prepare_source(source, get_pipeline(source_format, "docx"), scale_factor)
 
-        # Rasterize any embedded SVGs to PNG so Word gets a usable image
-        # instead of the draw.io "Text is not SVG - cannot display" fallback.
-        if source_format == "html":
-            source = await preprocess_html_svgs(source, scale_factor)
+            # Convert using subprocess instead of pandoc module
+            output = await run_pandoc_conversion(prepared_source, source_format, "docx", options, preserve_table_styles=preserve_table_styles)
 
-        # Convert using subprocess instead of pandoc module
-        output = run_pandoc_conversion(source, source_format, "docx", options, preserve_table_styles=preserve_table_styles)
+            response = await postprocess_and_build_response(output, "docx", file_name, paper_size, orientation, table_layouts)
+            await store_in_result_cache(conversion_key, response.body, response)
+            return response.body
 
-        response = postprocess_and_build_response(output, "docx", file_name, paper_size, orientation, table_layouts)
+        output = await get_conversion_coalescer().run(conversion_key, "docx", run_conversion)
+        # Without a response of its own, the request waited for an identical conversion.
+        response = response or build_output_response(output, "docx", file_name, conversion_key)
 
         # Record success metrics
         duration_seconds = time.time() - conversion_start_time
@@ -936,18 +1278,26 @@ async def convert_docx_with_ref(
         if has_template:
             increment_template_conversion("docx")
 
+    # Refused before pandoc ran, with a status of its own.
+    except ConversionRequestError as e:
+        pandoc_metrics.record_conversion_failure()
+        increment_conversion_failure(source_format, "docx")
+        return process_error(e.cause, e.message, e.status)
+    # A conversion cancelled by ConversionCancellationMiddleware is neither a success nor a failure.
+    except asyncio.CancelledError:
+        pandoc_metrics.record_conversion_cancelled()
+        raise
     # The HTTP boundary must answer, not leak.
     except Exception as e:  # noqa: BLE001
         pandoc_metrics.record_conversion_failure()
         increment_conversion_failure(source_format, "docx")
-        return process_error(e, HTTPStatus.BAD_REQUEST.phrase, HTTPStatus.BAD_REQUEST.value)
+        return process_conversion_error(e)
     else:
         return response
     finally:
-        # A local stat costs less than a thread hop.
-        if temp_template_filename is not None and Path(temp_template_filename).exists():  # noqa: ASYNC240
-            # Same, for the unlink.
-            Path(temp_template_filename).unlink()  # noqa: ASYNC240
+        discard_source(spooled_source)
+        if temp_template_filename is not None:
+            remove_file(Path(temp_template_filename))
 
 
 @app.post(
@@ -961,8 +1311,10 @@ async def convert_docx_with_ref(
         },
         400: {"description": "Bad request.", "content": {MIME_TYPES["txt"]: {}}},
         401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
-        413: {"description": "Request body too large.", "content": {MIME_TYPES["txt"]: {}}},
+        413: {"description": "Request body too large, or the document too large for the pandoc heap limit.", "content": {MIME_TYPES["txt"]: {}}},
         422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}},
+        503: {"description": "Service overloaded, retry after the number of seconds in the Retry-After header.", "content": {MIME_TYPES["txt"]: {}}},
+        504: {"description": "Conversion timed out (see the timeout query parameter and X-Conversion-Timeout header).", "content": {MIME_TYPES["txt"]: {}}},
     },
     dependencies=[Depends(require_api_key)],
 )
@@ -973,57 +1325,55 @@ async def convert_pptx_with_ref(
     file_name: str = "converted-document.pptx",
     slide_size: str | None = None,
     scale_factor: float | None = None,
+    template_id: str | None = None,
 ) -> Response:
     temp_template_filename = None
+    spooled_source = None
     pandoc_metrics = get_pandoc_metrics()
     conversion_start_time = time.time()
     pandoc_metrics.record_conversion_start()
 
     try:
-        form = await request.form(max_part_size=data_limit)  # NOSONAR False positive - max_part_size is valid parameter
-        source_content = form.get("source")
-        source = await get_docx_source_data(source_content, encoding)
-        if not source:
-            pandoc_metrics.record_conversion_failure()
-            increment_conversion_failure(source_format, "pptx")
-            return process_error(Exception("No source file"), "No data or file provided using key 'source'", 400)
+        form = await read_form(request, data_limit)
+        source = spooled_source = await read_form_source(form, encoding)
 
         # Record input size
-        input_size = len(source) if isinstance(source, bytes) else len(source.encode("utf-8"))
-        observe_request_body_size(input_size)
+        observe_request_body_size(get_source_size(source))
 
-        # Optional pptx template file
-        pptx_template_file = form.get("template")
+        # Optional pptx template: an uploaded file or a registered one
+        template = await read_conversion_template(form.get("template"), template_id, "pptx")
+        has_template = template is not None
 
-        if isinstance(pptx_template_file, str):
-            pandoc_metrics.record_conversion_failure()
-            increment_conversion_failure(source_format, "pptx")
-            return process_error(Exception("PPTX template must be a File"), "Invalid template file", 400)
+        # Keyed as in convert_docx_with_ref.
+        conversion_key = await get_conversion_key(source, source_format, "pptx", build_pptx_with_ref_options(form.get("options"), None), get_template_content(template), slide_size=slide_size, scale_factor=scale_factor)
+        cached_response = await answer_from_result_cache(request, conversion_key, "pptx", file_name)
+        if cached_response is not None:
+            pandoc_metrics.record_conversion_cached()
+            return cached_response
 
-        has_template = bool(pptx_template_file)
-        if pptx_template_file:
-            temp_template_filename = f"ref_{int(time.time())}.pptx"
-            async with await anyio.open_file(temp_template_filename, "wb") as f:
-                await f.write(await pptx_template_file.read())
+        response: Response | None = None
 
-        # Build conversion options including template if provided
-        options = DEFAULT_CONVERSION_OPTIONS.copy()
+        async def run_conversion() -> bytes:
+            nonlocal response, temp_template_filename
+            if isinstance(template, bytes):
+                temp_template_filename = await write_template_file(template, "pptx")
 
-        extended_options = form.get("options")
-        if isinstance(extended_options, str):
-            options.append(extended_options)
+            # Build conversion options including template if provided
+            options = build_pptx_with_ref_options(form.get("options"), get_template_filename(template, temp_template_filename))
 
-        if temp_template_filename is not None:
-            options.append(f"--reference-doc={temp_template_filename}")
+            # Rasterize any embedded SVGs to PNG so the slide renderer gets a usable image.
+            prepared_source, _ = await prepare_source(source, get_pipeline(source_format, "pptx"), scale_factor)
 
-        # Rasterize any embedded SVGs to PNG so the slide renderer gets a usable image.
-        if source_format == "html":
-            source = await preprocess_html_svgs(source, scale_factor)
+            # Convert using subprocess instead of pandoc module
+            output = await run_pandoc_conversion(prepared_source, source_format, "pptx", options)
 
-        # Convert using subprocess instead of pandoc module
-        output = run_pandoc_conversion(source, source_format, "pptx", options)
+            response = await postprocess_and_build_response(output, "pptx", file_name, slide_size, None)
+            await store_in_result_cache(conversion_key, response.body, response)
+            return response.body
 
-        response = postprocess_and_build_response(output, "pptx", file_name, slide_size, None)
+        output = await get_conversion_coalescer().run(conversion_key, "pptx", run_conversion)
+        # Waited for an identical conversion, as in convert_docx_with_ref.
+        response = response or build_output_response(output, "pptx", file_name, conversion_key)
 
         # Record success metrics
         duration_seconds = time.time() - conversion_start_time
@@ -1032,18 +1382,154 @@ async def convert_pptx_with_ref(
         if has_template:
             increment_template_conversion("pptx")
 
+    # Same, for the PPTX template endpoint.
+    except ConversionRequestError as e:
+        pandoc_metrics.record_conversion_failure()
+        increment_conversion_failure(source_format, "pptx")
+        return process_error(e.cause, e.message, e.status)
+    # Cancelled, as in convert_docx_with_ref.
+    except asyncio.CancelledError:
+        pandoc_metrics.record_conversion_cancelled()
+        raise
     # Same, for the second conversion endpoint.
     except Exception as e:  # noqa: BLE001
         pandoc_metrics.record_conversion_failure()
         increment_conversion_failure(source_format, "pptx")
-        return process_error(e, "Bad request", 400)
+        return process_conversion_error(e, "Bad request")
+    else:
+        return response
+    finally:
+        discard_source(spooled_source)
+        if temp_template_filename is not None:
+            remove_file(Path(temp_template_filename))
+
+
+def parse_target_formats(targets: str) -> list[str]:
+    """
+    Parse the comma-separated targets of a multi-target conversion, each named once.
+
+    Raises:
+        ValueError: If no target is named or one is not an allowed target format.
+    """
+    target_formats = list(dict.fromkeys(target.strip() for target in targets.split(",") if target.strip()))
+    if not target_formats:
+        raise ValueError("No target format given")
+    for target_format in target_formats:
+        if target_format not in ALLOWED_TARGET_FORMATS:
+            raise ValueError(f"Invalid target format: {target_format}")
+    return target_formats
+
+
+async def build_bundle_response(outputs: dict[str, bytes | Path], file_name: str, accept: str | None) -> FileResponse:
+    """Package the outputs of a multi-target conversion as a zip archive, or as multipart/mixed if the client asks for it."""
+    stem = Path(file_name).stem or "converted-document"
+    entries = [conversion_bundle.BundleEntry(target_format, f"{stem}.{FILE_EXTENSIONS.get(target_format, target_format)}", MIME_TYPES.get(target_format, DEFAULT_MIME_TYPE), output) for target_format, output in outputs.items()]
+    descriptor, bundle_name = tempfile.mkstemp(prefix="pandoc-bundle-", dir=get_scratch_dir())
+    os.close(descriptor)
+    bundle_path = Path(bundle_name)
+    try:
+        if conversion_bundle.wants_multipart(accept):
+            boundary = conversion_bundle.create_boundary()
+            media_type = f"{conversion_bundle.MULTIPART_MEDIA_TYPE}; boundary={boundary}"
+            await anyio.to_thread.run_sync(conversion_bundle.write_multipart, entries, bundle_path, boundary)
+        else:
+            media_type = conversion_bundle.ZIP_MEDIA_TYPE
+            file_name = f"{stem}.zip"
+            await anyio.to_thread.run_sync(conversion_bundle.write_zip, entries, bundle_path)
+    except BaseException:
+        remove_file(bundle_path)
+        raise
+
+    stat_result = await anyio.Path(bundle_path).stat()
+    observe_response_body_size(stat_result.st_size)
+    response = FileResponse(bundle_path, media_type=media_type, stat_result=stat_result, background=BackgroundTask(remove_file, bundle_path))
+    append_conversion_headers(response, file_name)
+    return response
+
+
+def remove_outputs(outputs: dict[str, bytes | Path]) -> None:
+    for output in outputs.values():
+        if isinstance(output, Path):
+            remove_file(output)
+
+
+@app.post(
+    "/convert/{source_format}/to/multiple",
+    summary="Convert a document to several formats",
+    description=(
+        "Converts a source document to each of the comma-separated target formats in the targets query parameter, parsing it once for all targets that read it alike. "
+        "Answers with a zip archive of the documents, or with a multipart/mixed body if the Accept header asks for it. Takes the same parameters as the convert endpoint."
+    ),
+    responses={
+        200: {
+            "description": "Success",
+            "content": {conversion_bundle.ZIP_MEDIA_TYPE: {}, conversion_bundle.MULTIPART_MEDIA_TYPE: {}},
+        },
+        400: {"description": "Bad request.", "content": {MIME_TYPES["txt"]: {}}},
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        413: {"description": "Request body too large, or the document too large for the pandoc heap limit.", "content": {MIME_TYPES["txt"]: {}}},
+        422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}},
+        503: {"description": "Service overloaded, retry after the number of seconds in the Retry-After header.", "content": {MIME_TYPES["txt"]: {}}},
+        504: {"description": "Conversion timed out (see the timeout query parameter and X-Conversion-Timeout header).", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+async def convert_to_multiple(
+    request: Request,
+    source_format: str,
+    targets: str,
+    encoding: str | None = None,
+    file_name: str = "converted-document",
+    paper_size: str | None = None,
+    orientation: str | None = None,
+    scale_factor: float | None = None,
+    preserve_table_styles: bool = False,
+) -> Response:
+    spooled_source = None
+    outputs: dict[str, bytes | Path] = {}
+    target_formats: list[str] = []
+    pandoc_metrics = get_pandoc_metrics()
+    conversion_start_time = time.time()
+    pandoc_metrics.record_conversion_start()
+
+    try:
+        target_formats = parse_target_formats(targets)
+        try:
+            source = spooled_source = await read_conversion_source(request, source_format, encoding)
+        except AttributeError:
+            pandoc_metrics.record_conversion_failure()
+            for target_format in target_formats:
+                increment_conversion_failure(source_format, target_format)
+            return process_error(Exception("Expected file-like object"), "Invalid uploaded file", 400)
+
+        # Record input size
+        observe_request_body_size(get_source_size(source))
+
+        outputs = await convert_source_to_targets(source, source_format, target_formats, paper_size, orientation, scale_factor, preserve_table_styles=preserve_table_styles)
+        response = await build_bundle_response(outputs, file_name, request.headers.get("accept"))
+
+        # Record success metrics, one conversion per target
+        duration_seconds = time.time() - conversion_start_time
+        pandoc_metrics.record_conversion_success(duration_seconds * 1000)
+        for target_format in target_formats:
+            increment_conversion_success(source_format, target_format, duration_seconds)
+
+    # Cancelled, as in convert_docx_with_ref.
+    except asyncio.CancelledError:
+        pandoc_metrics.record_conversion_cancelled()
+        raise
+    # Same, for the multi-target endpoint.
+    except Exception as e:  # noqa: BLE001
+        pandoc_metrics.record_conversion_failure()
+        for target_format in target_formats:
+            increment_conversion_failure(source_format, target_format)
+        return process_conversion_error(e)
     else:
         return response
     finally:
-        # A local stat costs less than a thread hop.
-        if temp_template_filename is not None and Path(temp_template_filename).exists():  # noqa: ASYNC240
-            # Same, for the unlink.
-            Path(temp_template_filename).unlink()  # noqa: ASYNC240
+        discard_source(spooled_source)
+        # The bundle holds copies of the outputs.
+        remove_outputs(outputs)
 
 
 @app.post(
@@ -1057,8 +1543,10 @@ async def convert_pptx_with_ref(
         },
         400: {"description": "Bad request.", "content": {MIME_TYPES["txt"]: {}}},
         401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
-        413: {"description": "Request body too large.", "content": {MIME_TYPES["txt"]: {}}},
+        413: {"description": "Request body too large, or the document too large for the pandoc heap limit.", "content": {MIME_TYPES["txt"]: {}}},
         422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}},
+        503: {"description": "Service overloaded, retry after the number of seconds in the Retry-After header.", "content": {MIME_TYPES["txt"]: {}}},
+        504: {"description": "Conversion timed out (see the timeout query parameter and X-Conversion-Timeout header).", "content": {MIME_TYPES["txt"]: {}}},
     },
     dependencies=[Depends(require_api_key)],
 )
@@ -1073,95 +1561,601 @@ async def convert(
     scale_factor: float | None = None,
     preserve_table_styles: bool = False,
 ) -> Response:
+    spooled_source = None
     pandoc_metrics = get_pandoc_metrics()
     conversion_start_time = time.time()
     pandoc_metrics.record_conversion_start()
 
     try:
-        file_name = file_name or "converted-document." + FILE_EXTENSIONS.get(target_format, "docx")
-        if source_format in {"txt", "markdown", "html"}:
-            data = await request.body()
-            source = data if not encoding else data.decode(encoding)
-        else:
-            form = await request.form(max_part_size=data_limit)  # NOSONAR False positive - max_part_size is valid parameter
-            uploaded_file = form.get("source")
-
-            try:
-                source = await uploaded_file.read()  # type: ignore[union-attr]
-            except AttributeError:
-                pandoc_metrics.record_conversion_failure()
-                increment_conversion_failure(source_format, target_format)
-                return process_error(Exception("Expected file-like object"), "Invalid uploaded file", 400)
+        file_name = file_name or get_default_file_name(target_format)
+        try:
+            source = spooled_source = await read_conversion_source(request, source_format, encoding)
+        except AttributeError:
+            pandoc_metrics.record_conversion_failure()
+            increment_conversion_failure(source_format, target_format)
+            return process_error(Exception("Expected file-like object"), "Invalid uploaded file", 400)
 
         # Record input size
-        input_size = len(source) if isinstance(source, bytes) else len(source.encode("utf-8"))
-        observe_request_body_size(input_size)
-
-        options = DEFAULT_CONVERSION_OPTIONS.copy()
-
-        if target_format == "pdf":
-            options.append("--pdf-engine=tectonic")
-
-        # Recover per-table width/alignment from the HTML before pandoc drops
-        # it (only relevant when producing DOCX; other writers handle table
-        # width natively). Read from the original source: SVG rasterization
-        # below never touches tables.
-        table_layouts = html_table_layout.extract(source) if source_format == "html" and target_format == "docx" else None
+        observe_request_body_size(get_source_size(source))
 
-        # Rasterize any embedded SVGs to PNG so renderers without full SVG
-        # support (e.g. Word) get a usable image instead of a fallback warning.
-        if source_format == "html":
-            source = await preprocess_html_svgs(source, scale_factor)
-
-        # Convert using subprocess instead of pandoc module
-        output = run_pandoc_conversion(source, source_format, target_format, options, preserve_table_styles=preserve_table_styles)
-
-        response = postprocess_and_build_response(output, target_format, file_name, paper_size, orientation, table_layouts)
+        conversion_key = await get_conversion_key(
+            source, source_format, target_format, get_conversion_options(target_format), paper_size=paper_size, orientation=orientation, scale_factor=scale_factor, preserve_table_styles=preserve_table_styles
+        )
+        cached_response = await answer_from_result_cache(request, conversion_key, target_format, file_name)
+        if cached_response is not None:
+            pandoc_metrics.record_conversion_cached()
+            return cached_response
+
+        response: Response | None = None
+
+        async def run_conversion() -> bytes | Path:
+            nonlocal response
+            prepared_source, options, table_layouts = await prepare_conversion(source, source_format, target_format, scale_factor)
+
+            if get_pipeline(source_format, target_format).post_process is not None:
+                # Convert using subprocess instead of pandoc module
+                output = await run_pandoc_conversion(prepared_source, source_format, target_format, options, preserve_table_styles=preserve_table_styles)
+                response = await postprocess_and_build_response(output, target_format, file_name, paper_size, orientation, table_layouts)
+                await store_in_result_cache(conversion_key, response.body, response)
+                return response.body
+            # Nothing rewrites the output, so it is sent as pandoc handed it over: from memory or from pandoc's own file.
+            pandoc_output = await run_pandoc_conversion_to_output(prepared_source, source_format, target_format, options, preserve_table_styles=preserve_table_styles)
+            response = build_output_response(pandoc_output, target_format, file_name, None)
+            await store_in_result_cache(conversion_key, pandoc_output, response)
+            return pandoc_output
+
+        output = await get_conversion_coalescer().run(conversion_key, target_format, run_conversion)
+        # Waited for an identical conversion, as in convert_docx_with_ref.
+        response = response or build_output_response(output, target_format, file_name, conversion_key)
 
         # Record success metrics
         duration_seconds = time.time() - conversion_start_time
         pandoc_metrics.record_conversion_success(duration_seconds * 1000)
         increment_conversion_success(source_format, target_format, duration_seconds)
 
+    # Cancelled, as in convert_docx_with_ref.
+    except asyncio.CancelledError:
+        pandoc_metrics.record_conversion_cancelled()
+        raise
     # Same, for the third conversion endpoint.
     except Exception as e:  # noqa: BLE001
         pandoc_metrics.record_conversion_failure()
         increment_conversion_failure(source_format, target_format)
-        return process_error(e, HTTPStatus.BAD_REQUEST.phrase, HTTPStatus.BAD_REQUEST.value)
+        return process_conversion_error(e)
     else:
         return response
+    finally:
+        discard_source(spooled_source)
+
+
+async def run_conversion_job(job: ConversionJob, source: Path) -> bytes | Path:
+    """Convert the source of a job the way the convert endpoint converts a request, with the same metrics."""
+    pandoc_metrics = get_pandoc_metrics()
+    conversion_start_time = time.time()
+    pandoc_metrics.record_conversion_start()
+
+    try:
+        observe_request_body_size(get_source_size(source))
+        output = await convert_source(source, job.source_format, job.target_format, job.paper_size, job.orientation, job.scale_factor, preserve_table_styles=job.preserve_table_styles)
+    except asyncio.CancelledError:
+        pandoc_metrics.record_conversion_cancelled()
+        raise
+    except Exception:
+        pandoc_metrics.record_conversion_failure()
+        increment_conversion_failure(job.source_format, job.target_format)
+        raise
+
+    duration_seconds = time.time() - conversion_start_time
+    pandoc_metrics.record_conversion_success(duration_seconds * 1000)
+    increment_conversion_success(job.source_format, job.target_format, duration_seconds)
+    return output
+
+
+job_manager = JobManager(run_conversion_job)
+
+
+def build_job_schema(job: ConversionJob) -> JobSchema:
+    def to_timestamp(seconds: float | None) -> str | None:
+        return None if seconds is None else datetime.fromtimestamp(seconds, UTC).isoformat()
+
+    return JobSchema(
+        job_id=job.job_id,
+        status=job.status,
+        source_format=job.source_format,
+        target_format=job.target_format,
+        file_name=job.file_name,
+        created_at=datetime.fromtimestamp(job.created_at, UTC).isoformat(),
+        started_at=to_timestamp(job.started_at),
+        finished_at=to_timestamp(job.finished_at),
+        expires_at=to_timestamp(None if job.finished_at is None else job.finished_at + job_manager.store.ttl),
+        error=job.error,
+        result_size=job.result_size,
+    )
+
+
+def job_not_found_response(job_id: str) -> PlainTextResponse:
+    return PlainTextResponse(content=f"Job {job_id} not found", status_code=404)
+
+
+@app.post(
+    "/jobs/convert/{source_format}/to/{target_format}",
+    summary="Submit a conversion job",
+    description="Stores the source and queues its conversion, then answers at once with the job to poll. Takes the same parameters as the convert endpoint.",
+    status_code=202,
+    response_model=JobSchema,
+    responses={
+        400: {"description": "Bad request.", "content": {MIME_TYPES["txt"]: {}}},
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        413: {"description": "Request body too large.", "content": {MIME_TYPES["txt"]: {}}},
+        422: {"description": "Validation error.", "content": {MIME_TYPES["txt"]: {}}},
+        503: {"description": "Job queue full, retry after the number of seconds in the Retry-After header.", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+async def submit_conversion_job(
+    request: Request,
+    source_format: str,
+    target_format: str,
+    encoding: str | None = None,
+    file_name: str | None = None,
+    paper_size: str | None = None,
+    orientation: str | None = None,
+    scale_factor: float | None = None,
+    preserve_table_styles: bool = False,
+) -> Response:
+    spooled_source = None
+    try:
+        # Refused now rather than as a failed job.
+        _validate_formats(source_format, target_format)
+        try:
+            source = spooled_source = await read_conversion_source(request, source_format, encoding)
+        except AttributeError:
+            return process_error(Exception("Expected file-like object"), "Invalid uploaded file", 400)
+
+        job = ConversionJob(
+            source_format=source_format,
+            target_format=target_format,
+            file_name=file_name or get_default_file_name(target_format),
+            paper_size=paper_size,
+            orientation=orientation,
+            scale_factor=scale_factor,
+            preserve_table_styles=preserve_table_styles,
+        )
+        # A spooled source is moved into the job store.
+        await job_manager.submit(job, source)
+    except JobQueueFullError as e:
+        logger.warning("%s, refusing job for %s: %s", SERVICE_OVERLOADED_MESSAGE, target_format, e)
+        return PlainTextResponse(
+            content=f"{SERVICE_OVERLOADED_MESSAGE}, retry later",
+            status_code=503,
+            headers={"Retry-After": str(get_load_shedder().policy.retry_after)},
+        )
+    # Same boundary as the convert endpoint.
+    except Exception as e:  # noqa: BLE001
+        return process_error(e, HTTPStatus.BAD_REQUEST.phrase, HTTPStatus.BAD_REQUEST.value)
+    finally:
+        discard_source(spooled_source)
+
+    return JSONResponse(build_job_schema(job).model_dump(by_alias=True), status_code=202, headers={"Location": f"/jobs/{job.job_id}"})
+
+
+@app.get(
+    "/jobs/{job_id}",
+    summary="Get a conversion job",
+    description="Returns the status of a conversion job.",
+    response_model=JobSchema,
+    responses={
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        404: {"description": "No such job, or it expired.", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+def get_conversion_job(job_id: str) -> Response:
+    job = job_manager.get(job_id)
+    if job is None:
+        return job_not_found_response(job_id)
+    return JSONResponse(build_job_schema(job).model_dump(by_alias=True))
+
+
+@app.get(
+    "/jobs/{job_id}/result",
+    summary="Download the result of a conversion job",
+    description="Returns the converted document of a job that succeeded.",
+    responses={
+        200: {"description": "Success", "content": {DEFAULT_MIME_TYPE: {}}},
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        404: {"description": "No such job, or it expired.", "content": {MIME_TYPES["txt"]: {}}},
+        409: {"description": "The job has not succeeded (yet).", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+def get_conversion_job_result(job_id: str) -> Response:
+    job = job_manager.get(job_id)
+    if job is None:
+        return job_not_found_response(job_id)
+    if job.status != JOB_SUCCEEDED:
+        reason = f": {job.error}" if job.error else ""
+        return PlainTextResponse(content=f"Job {job_id} is {job.status}{reason}", status_code=409)
+
+    result_path = job_manager.store.get_result_path(job_id)
+    try:
+        stat_result = result_path.stat()
+    # Evicted since the job was read.
+    except FileNotFoundError:
+        return job_not_found_response(job_id)
+    observe_response_body_size(stat_result.st_size)
+    response = FileResponse(result_path, media_type=MIME_TYPES.get(job.target_format, DEFAULT_MIME_TYPE), stat_result=stat_result)
+    append_conversion_headers(response, job.file_name)
+    return response
+
+
+@app.delete(
+    "/jobs/{job_id}",
+    summary="Delete a conversion job",
+    description="Cancels a job that has not finished yet and removes the job with its result.",
+    status_code=204,
+    responses={
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        404: {"description": "No such job, or it expired.", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+async def delete_conversion_job(job_id: str) -> Response:
+    if not await job_manager.delete(job_id):
+        return job_not_found_response(job_id)
+    return Response(status_code=204)
+
+
+def build_template_schema(stored: StoredTemplate) -> TemplateSchema:
+    return TemplateSchema(template_id=stored.template_id, name=stored.name, format=stored.template_format, size=stored.size)
+
+
+@app.put(
+    "/templates/{name}",
+    summary="Register a template",
+    description=(
+        "Stores the DOCX or PPTX reference document in the request body under a name, replacing what the name pointed to. "
+        "Conversions to DOCX or PPTX with a template reference it with the template_id query parameter, by its name or its templateId."
+    ),
+    response_model=TemplateSchema,
+    responses={
+        200: {"description": "The name now points to the template."},
+        201: {"description": "The name was registered."},
+        400: {"description": "Invalid name, or not a DOCX or PPTX file.", "content": {MIME_TYPES["txt"]: {}}},
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        413: {"description": "Request body too large.", "content": {MIME_TYPES["txt"]: {}}},
+        507: {"description": "TEMPLATES_MAX_COUNT templates are registered.", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+async def put_template(request: Request, name: str) -> Response:
+    try:
+        stored, created = await anyio.to_thread.run_sync(get_template_store().put, name, await request.body())
+    except InvalidTemplateError as e:
+        return process_error(e, "Invalid template", 400)
+    except TemplateStoreFullError as e:
+        return process_error(e, "Template store full", HTTPStatus.INSUFFICIENT_STORAGE.value)
+    return JSONResponse(build_template_schema(stored).model_dump(by_alias=True), status_code=201 if created else 200, headers={"ETag": format_etag(stored.template_id)})
+
+
+@app.get(
+    "/templates/{template_ref}",
+    summary="Download a template",
+    description="Returns a registered template by its name or its templateId.",
+    responses={
+        200: {"description": "Success", "content": {MIME_TYPES["docx"]: {}, MIME_TYPES["pptx"]: {}}},
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        404: {"description": "No such template.", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+async def get_template(template_ref: str) -> Response:
+    try:
+        stored = await anyio.to_thread.run_sync(get_template_store().get, template_ref)
+    except TemplateNotFoundError as e:
+        return PlainTextResponse(content=str(e), status_code=404)
+    response = FileResponse(stored.path, media_type=MIME_TYPES[stored.template_format])
+    response.headers["ETag"] = format_etag(stored.template_id)
+    append_conversion_headers(response, f"{stored.name or stored.template_id}.{stored.template_format}")
+    return response
 
 
-async def get_docx_source_data(source_content: starlette.datastructures.UploadFile | str | None, encoding: str | None) -> bytes | str | None:
+@app.delete(
+    "/templates/{template_ref}",
+    summary="Delete a template",
+    description="Removes a name, and its template unless another name points to it; or, by templateId, the template and every name pointing to it.",
+    status_code=204,
+    responses={
+        401: {"description": "Missing or invalid API key (only when API_KEY is configured).", "content": {MIME_TYPES["txt"]: {}}},
+        404: {"description": "No such template.", "content": {MIME_TYPES["txt"]: {}}},
+    },
+    dependencies=[Depends(require_api_key)],
+)
+async def delete_template(template_ref: str) -> Response:
+    try:
+        await anyio.to_thread.run_sync(get_template_store().delete, template_ref)
+    except TemplateNotFoundError as e:
+        return PlainTextResponse(content=str(e), status_code=404)
+    return Response(status_code=204)
+
+
+def get_default_file_name(target_format: str) -> str:
+    return "converted-document." + FILE_EXTENSIONS.get(target_format, "docx")
+
+
+async def read_conversion_source(request: Request, source_format: str, encoding: str | None) -> bytes | str | Path:
+    """
+    Spool the source of a conversion: the body of a text format, the multipart "source" file of any other.
+
+    Raises:
+        AttributeError: If the multipart "source" is not a file.
+    """
+    if source_format in {"txt", "markdown", "html"}:
+        return await spool_stream(request.stream(), encoding)
+    form = await read_form(request, data_limit)
+    return await spool_upload(form.get("source"))  # type: ignore[arg-type]
+
+
+async def prepare_conversion(source: bytes | str | Path, source_format: str, target_format: str, scale_factor: float | None) -> tuple[bytes | str | Path, list[str], list[html_table_layout.TableLayout] | None]:
+    """
+    Preprocess a source and build the pandoc options of the convert endpoint.
+
+    Returns:
+        The source to hand to pandoc, the options and the table layouts for the DOCX post-processing
+    """
+    options = get_conversion_options(target_format)
+    source, table_layouts = await prepare_source(source, get_pipeline(source_format, target_format), scale_factor)
+    return source, options, table_layouts
+
+
+def get_conversion_options(target_format: str) -> list[str]:
+    options = DEFAULT_CONVERSION_OPTIONS.copy()
+
+    if target_format == "pdf":
+        options.append("--pdf-engine=tectonic")
+    return options
+
+
+async def convert_source(
+    source: bytes | str | Path,
+    source_format: str,
+    target_format: str,
+    paper_size: str | None = None,
+    orientation: str | None = None,
+    scale_factor: float | None = None,
+    *,
+    preserve_table_styles: bool = False,
+) -> bytes | Path:
+    """
+    Convert a source the way the convert endpoint does, without building a response.
+
+    Returns:
+        The post-processed document for DOCX and PPTX, else pandoc's output:
+        in memory, or the path of its file, which the caller removes.
+    """
+    source, options, table_layouts = await prepare_conversion(source, source_format, target_format, scale_factor)
+    if get_pipeline(source_format, target_format).post_process is not None:
+        output = await run_pandoc_conversion(source, source_format, target_format, options, preserve_table_styles=preserve_table_styles)
+        return await postprocess_output(output, target_format, paper_size, orientation, table_layouts)
+    return await run_pandoc_conversion_to_output(source, source_format, target_format, options, preserve_table_styles=preserve_table_styles)
+
+
+async def convert_source_to_targets(
+    source: bytes | str | Path,
+    source_format: str,
+    target_formats: list[str],
+    paper_size: str | None = None,
+    orientation: str | None = None,
+    scale_factor: float | None = None,
+    *,
+    preserve_table_styles: bool = False,
+) -> dict[str, bytes | Path]:
+    """
+    Convert a source to several targets, reading it once per set of targets that read it alike.
+
+    The HTML preparation runs once for all targets. The source is then parsed to
+    pandoc's JSON AST once for each distinct reading of the targets' pipelines,
+    so DOCX to PDF and LaTeX share one parse, while DOCX to DOCX, which skips the
+    LaTeX preprocessing, parses on its own. The targets are rendered from their
+    AST at once. If one target fails, the others are cancelled.
+
+    Returns:
+        The output of each target, as convert_source returns it. The caller removes the files.
+    """
+    pipelines = {target_format: get_pipeline(source_format, target_format) for target_format in target_formats}
+    preparation = ConversionPipeline(prepare_html=any(pipeline.prepare_html for pipeline in pipelines.values()), extract_table_layouts=any(pipeline.extract_table_layouts for pipeline in pipelines.values()))
+    source, table_layouts = await prepare_source(source, preparation, scale_factor)
+
+    targets_by_reading: dict[tuple[str | None, str], list[str]] = {}
+    for target_format, pipeline in pipelines.items():
+        targets_by_reading.setdefault(pipeline.reading, []).append(target_format)
+
+    async def render(ast_path: Path, target_format: str) -> bytes | Path:
+        options = get_conversion_options(target_format)
+        output_path = await render_ast(ast_path, source_format, target_format, options, preserve_table_styles=preserve_table_styles)
+        if pipelines[target_format].post_process is None:
+            return output_path
+        try:
+            output = await anyio.Path(output_path).read_bytes()
+        finally:
+            remove_file(output_path)
+        return await postprocess_output(output, target_format, paper_size, orientation, table_layouts)
+
+    ast_paths: list[Path] = []
+    try:
+        ast_paths = await _gather_conversions([parse_to_ast(source, source_format, targets[0]) for targets in targets_by_reading.values()])  # type: ignore[assignment]
+        renders = [(target_format, render(ast_path, target_format)) for ast_path, targets in zip(ast_paths, targets_by_reading.values(), strict=True) for target_format in targets]
+        outputs = await _gather_conversions([coroutine for _, coroutine in renders])
+    finally:
+        for ast_path in ast_paths:
+            remove_file(ast_path)
+    return {target_format: output for (target_format, _), output in zip(renders, outputs, strict=True)}
+
+
+async def _gather_conversions(coroutines: list[Awaitable[bytes | Path]]) -> list[bytes | Path]:
+    """Run conversions at once; if one fails or the caller is cancelled, cancel the others and remove the files they wrote."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Path):
+                remove_file(result)
+        raise
+
+
+async def read_form_source(form: starlette.datastructures.FormData, encoding: str | None) -> bytes | str | Path:
+    """
+    Spool the "source" form part of a template endpoint.
+
+    Raises:
+        ConversionRequestError: If there is no source.
+    """
+    source = await get_docx_source_data(form.get("source"), encoding)
+    if not source:
+        raise ConversionRequestError(Exception("No source file"), "No data or file provided using key 'source'", 400)
+    return source
+
+
+async def get_docx_source_data(source_content: starlette.datastructures.UploadFile | str | None, encoding: str | None) -> bytes | str | Path | None:
     if isinstance(source_content, starlette.datastructures.UploadFile):
-        source_bytes = await source_content.read()
-        if not source_bytes:
-            return None
-        return source_bytes if not encoding else source_bytes.decode(encoding)
+        # A large upload comes back as the path of its scratch file, which is never empty.
+        return await spool_upload(source_content, encoding) or None
     return source_content
 
 
-def postprocess_and_build_response(output: bytes, target_format: str, file_name: str, paper_size: str | None = None, orientation: str | None = None, table_layouts: list[html_table_layout.TableLayout] | None = None) -> Response:
-    if target_format == "docx":
-        post_process_start = time.time()
-        output = docx_post_process.process(output, paper_size, orientation, table_layouts)
-        observe_post_processing_duration("docx", time.time() - post_process_start)
-    elif target_format == "pptx":
-        # For PPTX, paper_size parameter is repurposed as slide_size
-        post_process_start = time.time()
-        output = pptx_post_process.process(output, paper_size)
-        observe_post_processing_duration("pptx", time.time() - post_process_start)
+async def postprocess_and_build_response(output: bytes, target_format: str, file_name: str, paper_size: str | None = None, orientation: str | None = None, table_layouts: list[html_table_layout.TableLayout] | None = None) -> Response:
+    return build_bytes_response(await postprocess_output(output, target_format, paper_size, orientation, table_layouts), target_format, file_name)
+
+
+async def postprocess_output(output: bytes, target_format: str, paper_size: str | None = None, orientation: str | None = None, table_layouts: list[html_table_layout.TableLayout] | None = None) -> bytes:
+    stage = POST_PROCESS_STAGES.get(target_format)
+    if stage is None:
+        return output
+    # Includes the wait for a processing worker; pandoc_processing_seconds has the run time alone.
+    post_process_start = time.time()
+    with time_stage(stage):
+        output = await get_processing_pool().run(stage, processing_stages.postprocess_output, output, target_format, paper_size, orientation, table_layouts)
+    observe_post_processing_duration(target_format, time.time() - post_process_start)
+    return output
+
 
+def build_bytes_response(output: bytes, target_format: str, file_name: str) -> Response:
     # Record final response size after post-processing
     observe_response_body_size(len(output))
     mime_type = MIME_TYPES.get(target_format, DEFAULT_MIME_TYPE)
 
     response = Response(output, media_type=mime_type, status_code=200)
+    append_conversion_headers(response, file_name)
+    return response
+
+
+def build_file_response(output_path: Path, target_format: str, file_name: str) -> FileResponse:
+    """
+    Stream a conversion output from its file, which is removed once it has been sent.
+
+    The size is taken from the file, so the response carries a Content-Length
+    without the output ever being read into memory.
+    """
+    stat_result = output_path.stat()
+    observe_response_body_size(stat_result.st_size)
+    mime_type = MIME_TYPES.get(target_format, DEFAULT_MIME_TYPE)
+
+    response = FileResponse(output_path, media_type=mime_type, stat_result=stat_result, background=BackgroundTask(remove_file, output_path))
+    append_conversion_headers(response, file_name)
+    return response
+
+
+async def get_conversion_key(source: bytes | str | Path, source_format: str, target_format: str, options: list[str], template: bytes | None = None, **parameters: str | float | bool | None) -> str | None:
+    """
+    Key of a conversion in the result cache and among the conversions in flight, None while both are off.
+
+    Besides the request, the key covers the binaries and the settings the result
+    depends on, so an upgrade or a configuration change never serves a stale result.
+    """
+    if not is_result_cache_enabled() and not is_coalescing_enabled():
+        return None
+    capabilities = get_capabilities()
+    key_parameters = {
+        "source_format": source_format,
+        "target_format": target_format,
+        "options": options,
+        **parameters,
+        "pandoc_version": capabilities.pandoc_version,
+        "tectonic_version": capabilities.tectonic_version,
+        "chromium_version": capabilities.chromium_version,
+        "service_version": os.environ.get("PANDOC_SERVICE_VERSION", "unknown"),
+        "sandbox": is_sandbox_enabled(),
+        "svg_conversion": is_svg_conversion_enabled(),
+    }
+    # Every request is hashed while coalescing is on: a large or spooled one in a worker thread.
+    if is_cheap_to_hash(source, template):
+        return build_cache_key(source, key_parameters, template)
+    return await anyio.to_thread.run_sync(build_cache_key, source, key_parameters, template)
+
+
+def format_etag(cache_key: str) -> str:
+    return f'"{cache_key}"'
+
+
+def is_etag_matched(if_none_match: str | None, cache_key: str) -> bool:
+    """Whether an If-None-Match header names the ETag of a cache key. Weak tags compare like strong ones."""
+    if not if_none_match:
+        return False
+    etag = format_etag(cache_key)
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+async def answer_from_result_cache(request: Request, cache_key: str | None, target_format: str, file_name: str) -> Response | None:
+    """
+    Answer a conversion without running it: 304 if the client has the result already, the cached result if there is one.
+
+    Returns:
+        The response, or None if the conversion has to run.
+    """
+    if cache_key is None or not is_result_cache_enabled():
+        return None
+    if is_etag_matched(request.headers.get("if-none-match"), cache_key):
+        response = Response(status_code=HTTPStatus.NOT_MODIFIED.value)
+        response.headers["ETag"] = format_etag(cache_key)
+        return response
+    cached = await anyio.to_thread.run_sync(get_result_cache().get, cache_key)
+    if cached is None:
+        return None
+    # A file from the disk tier is a link of the response's own, removed once it has been sent.
+    return build_output_response(cached, target_format, file_name, cache_key)
+
+
+def build_output_response(output: bytes | Path, target_format: str, file_name: str, conversion_key: str | None) -> Response:
+    """Answer with an output that is ready, tagged with the ETag while the result cache is on. A file is removed once it has been sent."""
+    response = build_bytes_response(output, target_format, file_name) if isinstance(output, bytes) else build_file_response(output, target_format, file_name)
+    if conversion_key is not None and is_result_cache_enabled():
+        response.headers["ETag"] = format_etag(conversion_key)
+    return response
+
+
+async def store_in_result_cache(cache_key: str | None, output: bytes | Path, response: Response) -> None:
+    """Keep the output of a conversion in the result cache and tag its response with the ETag."""
+    if cache_key is None or not is_result_cache_enabled():
+        return
+    await anyio.to_thread.run_sync(get_result_cache().put, cache_key, output)
+    response.headers["ETag"] = format_etag(cache_key)
+
+
+def append_conversion_headers(response: Response, file_name: str) -> None:
     response.headers.append("Content-Disposition", "attachment; filename=" + file_name)
     response.headers.append("Python-Version", platform.python_version())
-    response.headers.append("Pandoc-Version", (get_pandoc_version() or "unknown"))
+    response.headers.append("Pandoc-Version", (get_capabilities().pandoc_version or "unknown"))
     response.headers.append("Pandoc-Service-Version", os.environ.get("PANDOC_SERVICE_VERSION", "unknown"))
-    return response
+
+
+def process_conversion_error(e: Exception, err_msg: str = HTTPStatus.BAD_REQUEST.phrase) -> PlainTextResponse:
+    """Answer a failed conversion: 413 if pandoc ran out of its heap limit, else 400 with the message."""
+    if isinstance(e, PandocHeapExhaustedError):
+        return process_error(e, "Document too large to convert within the pandoc heap limit", HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value)
+    return process_error(e, err_msg, HTTPStatus.BAD_REQUEST.value)
 
 
 def process_error(e: Exception, err_msg: str, status: int) -> PlainTextResponse:
@@ -1174,9 +2168,13 @@ def process_error(e: Exception, err_msg: str, status: int) -> PlainTextResponse:
 
 
 def start_server(port: int) -> None:
-    """Start the server on the specified port.
+    """Start the server on the specified port, in several worker processes if WORKERS is above 1.
 
     Args:
         port: The port number to listen on
     """
+    worker_count = get_worker_count()
+    if worker_count > 1:
+        run_workers(port, worker_count, share_chromium=get_chromium_mode() == CHROMIUM_SHARED and is_svg_conversion_enabled())
+        return
     uvicorn.run(app=app, host="", port=port, **load_tls_options())
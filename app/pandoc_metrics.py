@@ -70,6 +70,16 @@ class PandocMetrics:
             self.failed_conversions += 1
             self.active_conversions = max(0, self.active_conversions - 1)
 
+    def record_conversion_cancelled(self) -> None:
+        """Record that a conversion was cancelled; it is neither a success nor a failure."""
+        with self._lock:
+            self.active_conversions = max(0, self.active_conversions - 1)
+
+    def record_conversion_cached(self) -> None:
+        """Record that a conversion was answered from the result cache; pandoc did not run, so it is neither a success nor a failure."""
+        with self._lock:
+            self.active_conversions = max(0, self.active_conversions - 1)
+
     def get_error_rate(self) -> float:
         """
         Calculate the current error rate.
@@ -0,0 +1,181 @@
+"""
+GHC runtime options of the pandoc subprocess.
+
+pandoc is a Haskell program, and its GHC runtime decides much of the speed and
+peak memory of a large conversion: the allocation area (-A) sets how often the
+garbage collector runs, -M caps the heap, and -qg keeps the collector on one
+thread. Runtime profiles give each format the options that suit it, passed to
+pandoc as ``+RTS ... -RTS``. A conversion runs with the profile of its source
+format, since the reader holds the whole document, else the one of its target
+format, else the default one.
+
+PANDOC_RTS_PROFILES overrides or adds profiles, e.g.
+``docx=-A64m -M2g;default=-A16m -qg``, and PANDOC_MAX_HEAP_MB caps the heap
+of every profile that sets no -M of its own. Both are read at startup, where
+an option that is not an allowlisted runtime flag is dropped with a warning,
+and each profile is tried on the pandoc binary once. A pandoc that runs out of
+its capped heap exits with the runtime's heap overflow status; the executor
+raises PandocHeapExhaustedError for it, which the endpoints answer with 413
+instead of the pod being OOM-killed.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import subprocess
+from typing import TYPE_CHECKING
+
+import anyio
+
+from app.capabilities import PANDOC_PATH
+from app.constants import get_int_env
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+# The status a GHC program exits with when its heap is exhausted (-M).
+HEAP_OVERFLOW_EXIT_CODE = 251
+
+DEFAULT_PROFILE = "default"
+
+# A DOCX or EPUB is a zip of XML that the reader holds in full: a larger
+# allocation area spares it most of its collections. Everything else is a
+# text conversion that is over before a parallel collector pays off.
+DEFAULT_PROFILES: Mapping[str, tuple[str, ...]] = {
+    "docx": ("-A64m",),
+    "epub": ("-A64m",),
+    DEFAULT_PROFILE: ("-qg",),
+}
+
+MAX_HEAP_MB = 1024 * 1024
+
+# The runtime flags a profile may set: sizes of the allocation area, heap and
+# stacks, and the garbage collector and capability settings. Nothing that
+# writes a file or reads one.
+_RTS_OPTION = re.compile(r"^-(?:[AHMKkOn]\d+[kKmMgG]?|qg\d*|qb\d*|qn\d+|N\d*|F\d+(?:\.\d+)?|I\d+(?:\.\d+)?|c)$")
+
+logger = logging.getLogger(__name__)
+
+
+class PandocHeapExhaustedError(subprocess.CalledProcessError):
+    """Pandoc ran out of the heap its runtime profile allows."""
+
+    def __str__(self) -> str:
+        return "pandoc exhausted its heap limit"
+
+
+def is_rts_option(option: str) -> bool:
+    """Whether an option is an allowlisted GHC runtime flag."""
+    return _RTS_OPTION.match(option) is not None
+
+
+def parse_rts_profiles(configured: str) -> dict[str, tuple[str, ...]]:
+    """
+    Parse PANDOC_RTS_PROFILES, e.g. "docx=-A64m -M2g;default=-qg", on top of the default profiles.
+
+    An option that is not an allowlisted runtime flag is dropped with a
+    warning, and so is an entry that is not ``format=options``.
+    """
+    profiles = dict(DEFAULT_PROFILES)
+    for entry in (part.strip() for part in configured.split(";")):
+        if not entry:
+            continue
+        name, separator, options = entry.partition("=")
+        if not separator or not name.strip():
+            logger.warning("PANDOC_RTS_PROFILES entry '%s' is not format=options, ignoring it", entry)
+            continue
+        valid_options = []
+        for option in options.split():
+            if is_rts_option(option):
+                valid_options.append(option)
+            else:
+                logger.warning("PANDOC_RTS_PROFILES option '%s' of '%s' is not an allowed GHC runtime flag, ignoring it", option, name.strip())
+        profiles[name.strip()] = tuple(valid_options)
+    return profiles
+
+
+class PandocRuntime:
+    """The runtime profiles pandoc runs with."""
+
+    def __init__(self, profiles: Mapping[str, tuple[str, ...]] | None = None, max_heap_mb: int | None = None) -> None:
+        """
+        Initialize the runtime profiles.
+
+        Args:
+            profiles: Runtime options by format. If None, PANDOC_RTS_PROFILES is read on top of DEFAULT_PROFILES.
+            max_heap_mb: Heap cap of the profiles without one, 0 for none.
+                If None, PANDOC_MAX_HEAP_MB is read (0-1048576, default 0).
+        """
+        if profiles is None:
+            profiles = parse_rts_profiles(os.environ.get("PANDOC_RTS_PROFILES", ""))
+        if max_heap_mb is None:
+            max_heap_mb = get_int_env("PANDOC_MAX_HEAP_MB", 0, 0, MAX_HEAP_MB)
+        self.max_heap_mb = max_heap_mb
+        self.profiles = {name: self._with_heap_cap(options) for name, options in profiles.items()}
+
+    def _with_heap_cap(self, options: tuple[str, ...]) -> tuple[str, ...]:
+        if not self.max_heap_mb or any(option.startswith("-M") for option in options):
+            return options
+        return (*options, f"-M{self.max_heap_mb}m")
+
+    def get_options(self, source_format: str, target_format: str) -> tuple[str, ...]:
+        """The runtime options of a conversion: those of its source format, else its target format, else the default ones."""
+        for name in (source_format, target_format, DEFAULT_PROFILE):
+            if name in self.profiles:
+                return self.profiles[name]
+        return ()
+
+    def get_arguments(self, source_format: str, target_format: str) -> list[str]:
+        """The ``+RTS ... -RTS`` arguments of a conversion, none if its profile is empty."""
+        options = self.get_options(source_format, target_format)
+        return ["+RTS", *options, "-RTS"] if options else []
+
+    def describe(self) -> str:
+        """The profiles, for the startup log."""
+        return ", ".join(f"{name}: {' '.join(options) or 'none'}" for name, options in sorted(self.profiles.items()))
+
+    async def verify(self) -> None:
+        """
+        Try each profile on the pandoc binary and drop those it refuses.
+
+        A pandoc built without runtime options, or a combination the runtime
+        rejects, would otherwise fail every conversion of that format.
+        """
+        for name, options in list(self.profiles.items()):
+            if not options:
+                continue
+            try:
+                await anyio.run_process([PANDOC_PATH, "+RTS", *options, "-RTS", "--version"], check=True)
+            except subprocess.CalledProcessError as e:
+                logger.warning("pandoc refuses the runtime options '%s' of profile %s (%s), running it without them", " ".join(options), name, e.stderr.decode(errors="replace").strip())
+                self.profiles[name] = ()
+            # The capability probe reports a missing binary.
+            except OSError as e:
+                logger.debug("Cannot try the runtime profiles on %s: %s", PANDOC_PATH, e)
+                return
+        logger.info("Pandoc runtime profiles: %s", self.describe())
+
+
+class _PandocRuntimeHolder:
+    """Holder class for the global PandocRuntime singleton."""
+
+    instance: PandocRuntime | None = None
+
+
+def get_pandoc_runtime() -> PandocRuntime:
+    """
+    Get the global PandocRuntime instance.
+
+    Returns:
+        The global PandocRuntime singleton
+    """
+    if _PandocRuntimeHolder.instance is None:
+        _PandocRuntimeHolder.instance = PandocRuntime()
+    return _PandocRuntimeHolder.instance
+
+
+def reset_pandoc_runtime() -> None:
+    """Reset the global PandocRuntime instance (useful for testing)."""
+    _PandocRuntimeHolder.instance = None
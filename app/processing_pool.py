@@ -0,0 +1,143 @@
+"""
+Off-loop execution of the CPU-bound pre- and post-processing.
+
+The DOCX and HTML preprocessors, the table layout extraction and the DOCX/PPTX
+post-processing are plain Python over lxml and BeautifulSoup. Run inline, a
+large document holds the event loop for seconds, and every other request of the
+process waits, health checks included. The ProcessingPool runs each of these
+stages elsewhere:
+
+- PROCESSING_WORKERS=0 (default): in worker threads. The event loop keeps
+  serving between the GIL switches, and lxml releases the GIL while it parses
+  and serializes.
+- PROCESSING_WORKERS=N: in N worker processes, so the stages of concurrent
+  conversions run on several cores. The input of a stage is pickled to the
+  worker once and its result once back; the stages of one document run as one
+  call where they follow each other (see app/processing_stages.py).
+
+Each stage exports the time it waited for a worker and the time it ran.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Any
+
+from app.constants import get_int_env
+from app.prometheus_metrics import observe_processing_stage
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+DEFAULT_PROCESSING_WORKERS = 0
+MAX_PROCESSING_WORKERS = 64
+
+logger = logging.getLogger(__name__)
+
+
+def get_processing_workers() -> int:
+    """Number of processing worker processes (PROCESSING_WORKERS, 0-64, default 0 = worker threads)."""
+    return get_int_env("PROCESSING_WORKERS", DEFAULT_PROCESSING_WORKERS, 0, MAX_PROCESSING_WORKERS)
+
+
+def _timed[T](fn: Callable[..., T], *args: Any) -> tuple[T, float, float]:
+    # Runs in the worker: the wall clock start is comparable across processes, the duration is not skewed by clock steps.
+    started = time.time()
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter() - start
+
+
+class ProcessingPool:
+    """Runs processing stages in worker threads or worker processes, started on first use."""
+
+    def __init__(self, workers: int | None = None) -> None:
+        """
+        Initialize the pool.
+
+        Args:
+            workers: Number of worker processes, 0 for worker threads.
+                If None, PROCESSING_WORKERS is read.
+        """
+        self.workers = get_processing_workers() if workers is None else workers
+        self._executor: Executor | None = None
+
+    def describe(self) -> str:
+        """Where the stages run, for the startup log."""
+        return f"{self.workers} worker processes" if self.workers else "worker threads"
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers:
+                # Spawned, not forked: the service runs threads (Chromium, metrics) a fork would copy mid-operation.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(thread_name_prefix="processing")
+        return self._executor
+
+    async def run[T](self, stage: str, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run one stage in a worker and record its queue and run time.
+
+        In process mode fn and its arguments must be picklable, i.e. module-level functions of plain data.
+
+        Args:
+            stage: Name of the stage, the label of its metrics.
+            fn: The function to run.
+            *args: Its arguments.
+
+        Returns:
+            The result of fn.
+
+        Raises:
+            BrokenProcessPool: If a worker process died, e.g. killed for its memory. The next stage starts a new pool.
+        """
+        executor = self._get_executor()
+        submitted = time.time()
+        try:
+            result, started, duration = await asyncio.get_running_loop().run_in_executor(executor, functools.partial(_timed, fn, *args))
+        except BrokenProcessPool:
+            # Concurrent stages of the broken pool fail alike; only the first replaces it.
+            if self._executor is executor:
+                logger.error("A processing worker died, starting a new pool for the next stage")
+                self.shutdown()
+            raise
+        observe_processing_stage(stage, max(0.0, started - submitted), duration)
+        return result
+
+    def shutdown(self) -> None:
+        """Stop the workers; stages still waiting for one are cancelled."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class _ProcessingPoolHolder:
+    """Holder class for the global ProcessingPool singleton."""
+
+    instance: ProcessingPool | None = None
+
+
+def get_processing_pool() -> ProcessingPool:
+    """
+    Get the global ProcessingPool instance.
+
+    Returns:
+        The global ProcessingPool singleton
+    """
+    if _ProcessingPoolHolder.instance is None:
+        _ProcessingPoolHolder.instance = ProcessingPool()
+    return _ProcessingPoolHolder.instance
+
+
+def reset_processing_pool() -> None:
+    """Shut down and reset the global ProcessingPool instance (useful for testing)."""
+    if _ProcessingPoolHolder.instance is not None:
+        _ProcessingPoolHolder.instance.shutdown()
+    _ProcessingPoolHolder.instance = None
@@ -0,0 +1,70 @@
+"""
+The CPU-bound Python steps around a pandoc run, as plain functions of bytes.
+
+The processing pool (app/processing_pool.py) runs them in worker threads or in
+worker processes. A worker process imports this module, not the app, so it only
+holds the rewriters; its arguments and result are pickled once each way.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from . import docx_latex_pre_process, docx_post_process, html_image_pre_process, html_lists_pre_process, html_math_color_pre_process, html_paragraph_pre_process, pptx_post_process
+
+if TYPE_CHECKING:
+    from .html_table_layout import TableLayout
+
+
+def preprocess_source(source_data: bytes, stage: str, skipped: frozenset[str] = frozenset()) -> bytes:
+    """
+    Rewrite the source so pandoc keeps formatting its reader would drop, as the pre-processing stage of its pipeline does.
+
+    The steps in skipped, whose construct the source does not contain (ConversionPipeline.requires), are left out.
+    """
+    # Pandoc's DOCX reader drops several direct formatting properties before
+    # producing the AST — run colour/size (<w:color>/<w:shd>/<w:highlight>/<w:sz>),
+    # paragraph alignment (<w:jc>) and indent (<w:ind>), and it flattens
+    # level-skipping lists. For targets that ultimately produce LaTeX (PDF,
+    # latex) we rewrite the source so those properties survive (synthetic
+    # character/paragraph styles surfaced via docx+styles, plus <w:ilvl>
+    # sentinels), and the docx_*_to_latex Lua filters re-emit them. All three
+    # rewrites run in a single unzip/re-zip pass (docx_latex_pre_process) so an
+    # image-heavy document's media is recompressed once, not three times.
+    if stage == "docx_latex_pre_process":
+        source_data = docx_latex_pre_process.preprocess(source_data, skipped)
+
+    # html -> docx: rewrite orphan <ol>/<ul> directly nested inside another
+    # list so pandoc's HTML reader doesn't synthesize an implicit list item
+    # that the DOCX writer would render as a stray marker (e.g. "a.") above
+    # the deeper item. See app/html_lists_pre_process.py and
+    # filters/html_lists.lua for the full pipeline.
+    # Also wrap each <p style="margin-left: ...; text-align: ..."> in a marker
+    # <div> so the paragraph indent and/or alignment survive pandoc's HTML
+    # reader (which drops <p>'s style attribute outright). See
+    # app/html_paragraph_pre_process.py and the Div handler in
+    # filters/inline_styles.lua for the full pipeline.
+    # Also give un-sized <img> an explicit px width/height read from the inlined
+    # image so pandoc renders it at the 96 dpi CSS reference (not its 72 dpi
+    # no-density fallback), honouring any CSS max-width. See
+    # app/html_image_pre_process.py.
+    if stage == "html_pre_process":
+        if "html_lists_pre_process" not in skipped:
+            source_data = html_lists_pre_process.preprocess(source_data)
+        if "html_paragraph_pre_process" not in skipped:
+            source_data = html_paragraph_pre_process.preprocess(source_data)
+        if "html_math_color_pre_process" not in skipped:
+            source_data = html_math_color_pre_process.preprocess(source_data)
+        if "html_image_pre_process" not in skipped:
+            source_data = html_image_pre_process.preprocess(source_data)
+    return source_data
+
+
+def postprocess_output(output: bytes, target_format: str, paper_size: str | None, orientation: str | None, table_layouts: list[TableLayout] | None) -> bytes:
+    """Apply the DOCX or PPTX post-processing; any other output is returned as it is."""
+    if target_format == "docx":
+        return docx_post_process.process(output, paper_size, orientation, table_layouts)
+    if target_format == "pptx":
+        # For PPTX, paper_size parameter is repurposed as slide_size
+        return pptx_post_process.process(output, paper_size)
+    return output
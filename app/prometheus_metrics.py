@@ -6,23 +6,47 @@ and application-level metrics for monitoring and observability.
 
 Note: Counters are incremented when events occur (not synced from external state).
       Gauges are updated periodically to reflect current state.
+
+With several worker processes (WORKERS), prometheus_client writes the values to
+PROMETHEUS_MULTIPROC_DIR and the metrics server adds them up. Counters and
+histograms are summed; a gauge is summed over the live workers when its values
+add up (queues, active conversions) and kept per worker with a pid label
+otherwise (rates, averages). Info metrics are not shared between processes, so
+they become gauges fixed at 1 that carry the same labels.
 """
 
 from __future__ import annotations
 
 import logging
+import os
 from typing import TYPE_CHECKING
 
 from prometheus_client import Counter, Gauge, Histogram, Info
 
 if TYPE_CHECKING:
     from app.chromium_manager import ChromiumManager
+    from app.conversion_executor import ConversionExecutor
     from app.pandoc_metrics import PandocMetrics
+    from app.resource_accounting import ResourceUsage
+    from app.scratch_workspace import ScratchSpace
 
 
 logger = logging.getLogger(__name__)
 
 
+def _build_info(name: str, documentation: str, labelnames: list[str]) -> Info | Gauge:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        return Gauge(f"{name}_info", documentation, labelnames, multiprocess_mode="livemax")
+    return Info(name, documentation)
+
+
+def _set_info(metric: Info | Gauge, labels: dict[str, str]) -> None:
+    if isinstance(metric, Info):
+        metric.info(labels)
+    else:
+        metric.labels(**labels).set(1)
+
+
 # Conversion counters - labeled by source and target format
 pandoc_conversions_total = Counter(
     "pandoc_conversions_total",
@@ -57,6 +81,28 @@ pandoc_subprocess_duration_seconds = Histogram(
     buckets=[0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0],
 )
 
+# Resource usage of each pandoc child process, the PDF engine it ran included
+pandoc_child_cpu_seconds = Histogram(
+    "pandoc_child_cpu_seconds",
+    "CPU time of a pandoc child process in seconds, by mode: user or system",
+    ["source_format", "target_format", "mode"],
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0],
+)
+
+pandoc_child_max_rss_bytes = Histogram(
+    "pandoc_child_max_rss_bytes",
+    "Maximum resident set size of a pandoc child process in bytes",
+    ["source_format", "target_format"],
+    buckets=[16 * 1024**2, 32 * 1024**2, 64 * 1024**2, 128 * 1024**2, 256 * 1024**2, 512 * 1024**2, 1024**3, 2 * 1024**3, 4 * 1024**3, 8 * 1024**3],
+)
+
+pandoc_child_block_io_bytes = Histogram(
+    "pandoc_child_block_io_bytes",
+    "Block I/O of a pandoc child process in bytes, by direction: read or write",
+    ["source_format", "target_format", "direction"],
+    buckets=[0, 64 * 1024, 1024**2, 16 * 1024**2, 64 * 1024**2, 256 * 1024**2, 1024**3],
+)
+
 pandoc_post_processing_duration_seconds = Histogram(
     "pandoc_post_processing_duration_seconds",
     "Time spent in DOCX/PPTX post-processing in seconds",
@@ -64,6 +110,113 @@ pandoc_post_processing_duration_seconds = Histogram(
     buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0],
 )
 
+# CPU-bound pre- and post-processing stages run in the processing pool
+pandoc_processing_queue_seconds = Histogram(
+    "pandoc_processing_queue_seconds",
+    "Time a pre- or post-processing stage waited for a processing worker in seconds",
+    ["stage"],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0],
+)
+
+pandoc_processing_seconds = Histogram(
+    "pandoc_processing_seconds",
+    "Time a pre- or post-processing stage ran in its processing worker in seconds",
+    ["stage"],
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+)
+
+# The stages of a conversion pipeline (app/conversion_pipeline.py)
+pandoc_pipeline_stage_duration_seconds = Histogram(
+    "pandoc_pipeline_stage_duration_seconds",
+    "Time a stage of a conversion pipeline took in seconds",
+    ["stage"],
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0],
+)
+
+pandoc_pipeline_gated_stages_total = Counter(
+    "pandoc_pipeline_gated_stages_total",
+    "Filters and pre-processing steps that only run when the source contains their construct, by outcome: run or skipped",
+    ["stage", "outcome"],
+)
+
+# Conversion queue (admission to the bounded pandoc executor)
+pandoc_queue_wait_seconds = Histogram(
+    "pandoc_queue_wait_seconds",
+    "Time a conversion waited for a free pandoc slot in seconds",
+    buckets=[0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0],
+)
+
+pandoc_queue_size = Gauge(
+    "pandoc_queue_size",
+    "Current number of conversions waiting for a pandoc slot",
+    multiprocess_mode="livesum",
+)
+
+pandoc_active_subprocesses = Gauge(
+    "pandoc_active_subprocesses",
+    "Current number of running pandoc subprocesses",
+    multiprocess_mode="livesum",
+)
+
+# Scratch workspaces (the files of the conversions in progress)
+pandoc_scratch_bytes = Gauge(
+    "pandoc_scratch_bytes",
+    "Bytes in the scratch workspaces of the conversions in progress",
+    multiprocess_mode="livemax",
+)
+
+pandoc_scratch_workspaces = Gauge(
+    "pandoc_scratch_workspaces",
+    "Current number of scratch workspace directories",
+    multiprocess_mode="livemax",
+)
+
+# Load shedding (conversions refused with 503 before they started)
+pandoc_shed_requests_total = Counter(
+    "pandoc_shed_requests_total",
+    "Total number of conversions refused because the service was overloaded",
+    ["target_format", "reason"],
+)
+
+# Cancelled conversions (client gone or deadline passed)
+pandoc_cancelled_conversions_total = Counter(
+    "pandoc_cancelled_conversions_total",
+    "Total number of conversions cancelled because the client disconnected or the deadline passed",
+    ["target_format", "reason"],
+)
+
+# Finished jobs of the asynchronous job API
+pandoc_jobs_total = Counter(
+    "pandoc_jobs_total",
+    "Total number of conversion jobs that finished",
+    ["target_format", "status"],
+)
+
+# Conversion result cache
+pandoc_result_cache_hits_total = Counter(
+    "pandoc_result_cache_hits_total",
+    "Total number of conversions answered from the result cache",
+    ["tier"],
+)
+
+pandoc_result_cache_misses_total = Counter(
+    "pandoc_result_cache_misses_total",
+    "Total number of conversions not found in the result cache",
+)
+
+pandoc_result_cache_evictions_total = Counter(
+    "pandoc_result_cache_evictions_total",
+    "Total number of results evicted from the result cache",
+    ["tier"],
+)
+
+# Requests answered with the output of an identical conversion in flight
+pandoc_coalesced_conversions_total = Counter(
+    "pandoc_coalesced_conversions_total",
+    "Total number of conversions answered with the output of an identical conversion in flight",
+    ["target_format"],
+)
+
 # Request/response size histograms
 pandoc_request_body_bytes = Histogram(
     "pandoc_request_body_bytes",
@@ -81,29 +234,30 @@ pandoc_response_body_bytes = Histogram(
 pandoc_conversion_error_rate_percent = Gauge(
     "pandoc_conversion_error_rate_percent",
     "Document conversion error rate as percentage",
+    multiprocess_mode="liveall",
 )
 
 avg_pandoc_conversion_time_seconds = Gauge(
     "avg_pandoc_conversion_time_seconds",
     "Average document conversion time in seconds",
+    multiprocess_mode="liveall",
 )
 
 # Service lifecycle metrics
 uptime_seconds = Gauge(
     "uptime_seconds",
     "Service uptime in seconds",
+    multiprocess_mode="livemax",
 )
 
 active_conversions = Gauge(
     "active_conversions",
     "Current number of active document conversions",
+    multiprocess_mode="livesum",
 )
 
 # Service info
-pandoc_info = Info(
-    "pandoc",
-    "Pandoc service information",
-)
+pandoc_info = _build_info("pandoc", "Pandoc service information", ["version", "service_version"])
 
 
 # --- SVG-to-PNG (Chromium) metrics ---
@@ -134,48 +288,53 @@ chromium_restarts_total = Counter(
 svg_conversion_error_rate_percent = Gauge(
     "svg_conversion_error_rate_percent",
     "SVG conversion error rate as percentage",
+    multiprocess_mode="liveall",
 )
 
 avg_svg_conversion_time_seconds = Gauge(
     "avg_svg_conversion_time_seconds",
     "Average SVG to PNG conversion time in seconds",
+    multiprocess_mode="liveall",
 )
 
 chromium_uptime_seconds = Gauge(
     "chromium_uptime_seconds",
     "Chromium browser uptime in seconds",
+    multiprocess_mode="liveall",
 )
 
 chromium_consecutive_failures = Gauge(
     "chromium_consecutive_failures",
     "Current number of consecutive Chromium health check failures",
+    multiprocess_mode="liveall",
 )
 
 chromium_cpu_percent = Gauge(
     "chromium_cpu_percent",
     "Current Chromium CPU usage percentage",
+    multiprocess_mode="liveall",
 )
 
 chromium_memory_bytes = Gauge(
     "chromium_memory_bytes",
     "Current Chromium memory usage in bytes",
+    multiprocess_mode="liveall",
 )
 
 chromium_queue_size = Gauge(
     "chromium_queue_size",
     "Current number of requests waiting for an SVG conversion slot",
+    multiprocess_mode="livesum",
 )
 
 chromium_active_conversions = Gauge(
     "chromium_active_conversions",
     "Current number of in-flight SVG conversions",
+    multiprocess_mode="livesum",
 )
 
 # Browser info
-chromium_info = Info(
-    "chromium",
-    "Chromium browser information",
-)
+chromium_info = _build_info("chromium", "Chromium browser information", ["version"])
 
 
 def initialize_pandoc_info(pandoc_version: str, service_version: str) -> None:
@@ -189,11 +348,12 @@ def initialize_pandoc_info(pandoc_version: str, service_version: str) -> None:
         pandoc_version: Version of pandoc binary
         service_version: Version of the service application
     """
-    pandoc_info.info(
+    _set_info(
+        pandoc_info,
         {
             "version": pandoc_version or "unknown",
             "service_version": service_version or "unknown",
-        }
+        },
     )
 
 
@@ -219,11 +379,76 @@ def observe_subprocess_duration(duration_seconds: float) -> None:
     pandoc_subprocess_duration_seconds.observe(duration_seconds)
 
 
+def observe_child_resources(source_format: str, target_format: str, usage: ResourceUsage) -> None:
+    """Record the CPU time, maximum RSS and block I/O of a pandoc child process."""
+    pandoc_child_cpu_seconds.labels(source_format=source_format, target_format=target_format, mode="user").observe(usage.user_cpu_seconds)
+    pandoc_child_cpu_seconds.labels(source_format=source_format, target_format=target_format, mode="system").observe(usage.system_cpu_seconds)
+    pandoc_child_max_rss_bytes.labels(source_format=source_format, target_format=target_format).observe(usage.max_rss_bytes)
+    pandoc_child_block_io_bytes.labels(source_format=source_format, target_format=target_format, direction="read").observe(usage.read_bytes)
+    pandoc_child_block_io_bytes.labels(source_format=source_format, target_format=target_format, direction="write").observe(usage.write_bytes)
+
+
+def observe_queue_wait_duration(duration_seconds: float) -> None:
+    """Record the time a conversion waited for a pandoc slot."""
+    pandoc_queue_wait_seconds.observe(duration_seconds)
+
+
+def increment_shed_request(target_format: str, reason: str) -> None:
+    """Increment the counter of conversions shed for the given reason."""
+    pandoc_shed_requests_total.labels(target_format=target_format, reason=reason).inc()
+
+
+def increment_cancelled_conversion(target_format: str, reason: str) -> None:
+    """Increment the counter of conversions cancelled for the given reason."""
+    pandoc_cancelled_conversions_total.labels(target_format=target_format, reason=reason).inc()
+
+
+def increment_finished_job(target_format: str, status: str) -> None:
+    """Increment the counter of conversion jobs that finished with the given status."""
+    pandoc_jobs_total.labels(target_format=target_format, status=status).inc()
+
+
+def increment_result_cache_hit(tier: str) -> None:
+    """Increment the counter of conversions answered from the given tier of the result cache."""
+    pandoc_result_cache_hits_total.labels(tier=tier).inc()
+
+
+def increment_result_cache_miss() -> None:
+    """Increment the counter of conversions not found in the result cache."""
+    pandoc_result_cache_misses_total.inc()
+
+
+def increment_result_cache_eviction(tier: str) -> None:
+    """Increment the counter of results evicted from the given tier of the result cache."""
+    pandoc_result_cache_evictions_total.labels(tier=tier).inc()
+
+
+def increment_coalesced_conversion(target_format: str) -> None:
+    """Increment the counter of conversions that waited for an identical conversion in flight."""
+    pandoc_coalesced_conversions_total.labels(target_format=target_format).inc()
+
+
 def observe_post_processing_duration(target_format: str, duration_seconds: float) -> None:
     """Record post-processing duration."""
     pandoc_post_processing_duration_seconds.labels(target_format=target_format).observe(duration_seconds)
 
 
+def observe_processing_stage(stage: str, queue_seconds: float, duration_seconds: float) -> None:
+    """Record the time a processing stage waited for a worker and the time it ran."""
+    pandoc_processing_queue_seconds.labels(stage=stage).observe(queue_seconds)
+    pandoc_processing_seconds.labels(stage=stage).observe(duration_seconds)
+
+
+def observe_pipeline_stage(stage: str, duration_seconds: float) -> None:
+    """Record the time a stage of a conversion pipeline took."""
+    pandoc_pipeline_stage_duration_seconds.labels(stage=stage).observe(duration_seconds)
+
+
+def increment_gated_stage(stage: str, *, skipped: bool) -> None:
+    """Count a gated filter or pre-processing step as run or skipped."""
+    pandoc_pipeline_gated_stages_total.labels(stage=stage, outcome="skipped" if skipped else "run").inc()
+
+
 def observe_request_body_size(size_bytes: int) -> None:
     """Record input document size."""
     pandoc_request_body_bytes.observe(size_bytes)
@@ -275,7 +500,7 @@ def update_gauges_from_chromium_manager(chromium_manager: ChromiumManager) -> No
 
         chromium_version = chromium_manager.get_version()
         if chromium_version:
-            chromium_info.info({"version": chromium_version})
+            _set_info(chromium_info, {"version": chromium_version})
 
         logger.debug("Prometheus gauges updated from ChromiumManager")
 
@@ -317,3 +542,44 @@ def update_gauges_from_pandoc_metrics(pandoc_metrics: PandocMetrics) -> None:
 
     except Exception as e:
         logger.exception("Failed to update Prometheus gauges: %s", e)
+
+
+def update_gauges_from_conversion_executor(conversion_executor: ConversionExecutor) -> None:
+    """
+    Update Prometheus gauges from the ConversionExecutor queue state.
+
+    Called before serving metrics, like the other update_gauges_* functions;
+    the queue wait histogram is observed when a conversion is admitted.
+
+    Args:
+        conversion_executor: ConversionExecutor instance to collect metrics from
+    """
+    try:
+        metrics = conversion_executor.get_metrics()
+
+        pandoc_queue_size.set(float(metrics["queue_size"]))
+        pandoc_active_subprocesses.set(float(metrics["active_conversions"]))
+
+        logger.debug("Prometheus gauges updated from ConversionExecutor")
+
+    except Exception as e:
+        logger.exception("Failed to update Prometheus gauges: %s", e)
+
+
+def update_gauges_from_scratch_space(scratch_space: ScratchSpace) -> None:
+    """
+    Update Prometheus gauges from the usage of the scratch workspaces.
+
+    Args:
+        scratch_space: ScratchSpace instance to collect metrics from
+    """
+    try:
+        usage = scratch_space.get_usage()
+
+        pandoc_scratch_bytes.set(float(usage.total_bytes))
+        pandoc_scratch_workspaces.set(float(usage.workspaces))
+
+        logger.debug("Prometheus gauges updated from ScratchSpace")
+
+    except Exception as e:
+        logger.exception("Failed to update Prometheus gauges: %s", e)
@@ -0,0 +1,112 @@
+"""
+Pandoc's default reference documents, served by /docx-template and /pptx-template.
+
+Each download ran `pandoc --print-default-data-file` and sent the file it wrote,
+though the default data files never change for a given pandoc binary. A reference
+document is now generated once per pandoc version and held in memory; the SHA-256
+of its bytes is its strong ETag, so a client that keeps it can revalidate it
+without a download.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+
+import anyio
+
+from app.capabilities import PANDOC_PATH
+from app.scratch_workspace import get_scratch_dir
+
+REFERENCE_DOC_FORMATS = ("docx", "pptx")
+
+
+@dataclass(frozen=True)
+class ReferenceDoc:
+    """
+    A generated reference document.
+
+    Attributes:
+        content: The bytes pandoc printed.
+        etag: SHA-256 of the bytes in hex.
+        pandoc_version: Version of the pandoc that generated it.
+    """
+
+    content: bytes
+    etag: str
+    pandoc_version: str | None
+
+
+async def generate_reference_doc(target_format: str) -> bytes:
+    """
+    Have pandoc print its default reference document for a format.
+
+    Pandoc writes it to a private temporary file, which is read and removed.
+
+    Raises:
+        subprocess.CalledProcessError: If pandoc fails.
+    """
+    fd, name = tempfile.mkstemp(prefix="custom-reference-", suffix=f".{target_format}", dir=get_scratch_dir())
+    os.close(fd)
+    path = anyio.Path(name)
+    try:
+        await anyio.run_process([PANDOC_PATH, "-o", name, "--print-default-data-file", f"reference.{target_format}"], check=True)
+        return await path.read_bytes()
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            await path.unlink()
+
+
+class ReferenceDocCache:
+    """The reference documents of the running pandoc, one per format."""
+
+    def __init__(self) -> None:
+        self._docs: dict[str, ReferenceDoc] = {}
+        # Concurrent first downloads of a format wait for one pandoc run instead of starting their own.
+        self._locks = {target_format: asyncio.Lock() for target_format in REFERENCE_DOC_FORMATS}
+
+    async def get(self, target_format: str, pandoc_version: str | None) -> ReferenceDoc:
+        """
+        The reference document of a format, generated if there is none for this pandoc version.
+
+        Raises:
+            subprocess.CalledProcessError: If pandoc fails; nothing is cached then.
+        """
+        doc = self._docs.get(target_format)
+        if doc is not None and doc.pandoc_version == pandoc_version:
+            return doc
+        async with self._locks[target_format]:
+            doc = self._docs.get(target_format)
+            if doc is None or doc.pandoc_version != pandoc_version:
+                content = await generate_reference_doc(target_format)
+                doc = ReferenceDoc(content, hashlib.sha256(content).hexdigest(), pandoc_version)
+                # A document of an older pandoc is replaced, not kept next to it.
+                self._docs[target_format] = doc
+        return doc
+
+
+class _ReferenceDocCacheHolder:
+    """Holder class for the global ReferenceDocCache singleton."""
+
+    instance: ReferenceDocCache | None = None
+
+
+def get_reference_doc_cache() -> ReferenceDocCache:
+    """
+    Get the global ReferenceDocCache instance.
+
+    Returns:
+        The global ReferenceDocCache singleton
+    """
+    if _ReferenceDocCacheHolder.instance is None:
+        _ReferenceDocCacheHolder.instance = ReferenceDocCache()
+    return _ReferenceDocCacheHolder.instance
+
+
+def reset_reference_doc_cache() -> None:
+    """Reset the global ReferenceDocCache instance (useful for testing)."""
+    _ReferenceDocCacheHolder.instance = None
@@ -0,0 +1,158 @@
+"""
+Single-flight conversions: identical requests in flight share one conversion.
+
+A double-click on export, or several users exporting the same document at once,
+sends identical conversions a few milliseconds apart. The first request of a
+conversion key leads: it converts. A request with the same key that arrives while
+the leader converts waits for the leader and answers with its output instead of
+converting again; a file output is handed to each of them as a hard link of its
+own. The key is the one of the result cache (see get_conversion_key in
+pandoc_controller), so this works whether the result cache is on or off.
+
+The conversion runs in the leader's request, so it owns the spooled source and
+the template files. A waiting request gets its link in its own scratch workspace,
+so the file outlives the leader's. If the leader is cancelled (client gone, deadline passed),
+the waiting requests do not fail with it: the first of them leads a new
+conversion.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from app.constants import get_bool_env
+from app.prometheus_metrics import increment_coalesced_conversion
+from app.scratch_workspace import get_scratch_dir
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# A waiting request: the future of its output and the scratch directory its link goes to.
+_Share = tuple[asyncio.Future[bytes | Path | None], Path]
+
+
+def is_coalescing_enabled() -> bool:
+    """Whether identical conversions in flight share one run (COALESCE_CONVERSIONS, default true)."""
+    return get_bool_env("COALESCE_CONVERSIONS", default=True)
+
+
+def link_output(path: Path, directory: Path) -> Path:
+    """A file of its own in a directory with the content of an output, a hard link where the file system allows it."""
+    fd, name = tempfile.mkstemp(prefix="coalesced-", suffix=path.suffix, dir=directory)
+    os.close(fd)
+    link = Path(name)
+    link.unlink()
+    try:
+        link.hardlink_to(path)
+    except OSError:
+        shutil.copyfile(path, link)
+    return link
+
+
+class ConversionCoalescer:
+    """The conversions in flight, by conversion key."""
+
+    def __init__(self) -> None:
+        # The requests waiting for the conversion of each key in flight, with their scratch
+        # directories. A waiting request gets the output, or None to lead a new conversion after
+        # the leader was cancelled.
+        self._flights: dict[str, list[_Share]] = {}
+
+    async def run(self, key: str | None, target_format: str, convert: Callable[[], Awaitable[bytes | Path]]) -> bytes | Path:
+        """
+        Convert, or wait for the identical conversion in flight.
+
+        Args:
+            key: The conversion key; None converts without coalescing.
+            target_format: The target format, the label of the coalesced counter.
+            convert: Runs the conversion. A file it returns belongs to the caller.
+
+        Returns:
+            The output. A file is the caller's to remove.
+        """
+        if key is None or not is_coalescing_enabled():
+            return await convert()
+        while True:
+            waiting = self._flights.get(key)
+            if waiting is None:
+                return await self._lead(key, convert)
+            share: asyncio.Future[bytes | Path | None] = asyncio.get_running_loop().create_future()
+            waiting.append((share, get_scratch_dir()))
+            increment_coalesced_conversion(target_format)
+            output = await share
+            if output is not None:
+                return output
+            logger.debug("The conversion %s was led by a cancelled request, converting again", key)
+
+    async def _lead(self, key: str, convert: Callable[[], Awaitable[bytes | Path]]) -> bytes | Path:
+        waiting: list[_Share] = []
+        self._flights[key] = waiting
+        try:
+            output = await convert()
+        except asyncio.CancelledError:
+            self._release(key, waiting)
+            for share, _ in waiting:
+                if not share.done():
+                    share.set_result(None)
+            raise
+        except Exception as e:
+            self._release(key, waiting)
+            for share, _ in waiting:
+                if not share.done():
+                    share.set_exception(e)
+            raise
+        # No request joins from here on; the ones waiting get the output.
+        self._release(key, waiting)
+        _share_output(output, waiting)
+        return output
+
+    def _release(self, key: str, waiting: list[_Share]) -> None:
+        if self._flights.get(key) is waiting:
+            del self._flights[key]
+
+
+def _share_output(output: bytes | Path, waiting: list[_Share]) -> None:
+    # Synchronous, so the leader cannot be cancelled between making a link and handing it out.
+    for share, scratch_dir in waiting:
+        # A waiting request that was cancelled gets nothing.
+        if share.done():
+            continue
+        if isinstance(output, bytes):
+            share.set_result(output)
+            continue
+        try:
+            share.set_result(link_output(output, scratch_dir))
+        # The leader still answers; the waiting request fails as if it had converted.
+        except OSError as e:
+            share.set_exception(e)
+
+
+class _ConversionCoalescerHolder:
+    """Holder class for the global ConversionCoalescer singleton."""
+
+    instance: ConversionCoalescer | None = None
+
+
+def get_conversion_coalescer() -> ConversionCoalescer:
+    """
+    Get the global ConversionCoalescer instance.
+
+    Returns:
+        The global ConversionCoalescer singleton
+    """
+    if _ConversionCoalescerHolder.instance is None:
+        _ConversionCoalescerHolder.instance = ConversionCoalescer()
+    return _ConversionCoalescerHolder.instance
+
+
+def reset_conversion_coalescer() -> None:
+    """Reset the global ConversionCoalescer instance (useful for testing)."""
+    _ConversionCoalescerHolder.instance = None
@@ -0,0 +1,58 @@
+"""
+One log line per conversion request.
+
+The access log of uvicorn tells the status of a request, not what its
+conversion cost. The RequestLogMiddleware accounts the child processes of each
+conversion request (app.resource_accounting) and, once the response is sent,
+logs its route, status and duration together with the CPU time, maximum RSS and
+block I/O of those children.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from app.load_shedding import get_conversion_formats
+from app.resource_accounting import account_conversion
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLogMiddleware:
+    """Logs each conversion request with the resources its child processes used."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        formats = get_conversion_formats(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if formats is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code: int | None = None
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start_time = time.monotonic()
+        with account_conversion(*formats) as resources:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # A request that fails or is cancelled before its response started still gets its line.
+                logger.info("POST %s %s in %.3fs, %s", scope["path"], status_code or "without response", time.monotonic() - start_time, resources.describe())
@@ -0,0 +1,111 @@
+"""
+Streaming enforcement of the request body limit.
+
+The limit used to be checked by an HTTP middleware that read the whole body
+into memory first, and the handlers then parsed it a second time. The
+RequestSizeLimitMiddleware sits in front of the application as plain ASGI and
+never holds the body: a request whose Content-Length already exceeds the limit
+is answered with 413 before a single byte is read, and a body without a usable
+Content-Length (chunked uploads) is counted as it streams past. Once the count
+crosses the limit, the client gets its 413 at once and the application sees a
+disconnect, so it stops reading.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+
+from fastapi.responses import PlainTextResponse
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+REQUEST_BODY_TOO_LARGE_MESSAGE = "Request Body too large"
+
+
+class RequestSizeLimitMiddleware:
+    """Rejects HTTP requests whose body exceeds the configured limit with 413."""
+
+    def __init__(self, app: ASGIApp, get_max_body_size: Callable[[], int]) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application.
+            get_max_body_size: Returns the largest accepted request body in bytes.
+                It is asked once per request, so the limit can follow its setting.
+        """
+        self.app = app
+        self.get_max_body_size = get_max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_body_size = self.get_max_body_size()
+        declared_size = get_declared_content_length(scope)
+        if declared_size is not None and declared_size > max_body_size:
+            await self._reject(scope, receive, send, declared_size, max_body_size)
+            return
+
+        received_size = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received_size, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received_size += len(message.get("body", b""))
+                if received_size > max_body_size:
+                    rejected = True
+                    # A response already on its way cannot be replaced; the
+                    # disconnect alone then stops the upload.
+                    if not response_started:
+                        await self._reject(scope, receive, send, received_size, max_body_size)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started
+            if rejected:
+                # The 413 went out in place of whatever the application answers.
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, size: int, max_body_size: int) -> None:
+        error = Exception(f"Body Size {size} > {max_body_size}")
+        logger.error("%s: %s", REQUEST_BODY_TOO_LARGE_MESSAGE, error)
+        response = PlainTextResponse(content=f"{REQUEST_BODY_TOO_LARGE_MESSAGE}: {error!r}", status_code=413)
+        await response(scope, receive, send)
+
+
+def get_declared_content_length(scope: Scope) -> int | None:
+    """
+    Read the Content-Length header of a request.
+
+    Returns:
+        The declared body size, or None when the header is absent or not a
+        non-negative integer. Such a body is still counted while it streams.
+    """
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            try:
+                declared_size = int(value)
+            except ValueError:
+                return None
+            return declared_size if declared_size >= 0 else None
+    return None
@@ -0,0 +1,130 @@
+"""
+Resource usage of the child processes of a conversion.
+
+pandoc_subprocess_duration_seconds tells how long pandoc ran, not what it
+cost: a DOCX -> PDF that waits on tectonic and one that keeps a core busy look
+the same. The executor therefore reaps each pandoc process itself and takes
+its resource usage from the kernel: user and system CPU seconds, maximum
+resident set size and block I/O. The usage of a child includes the children
+it reaped, so a PDF conversion counts the tectonic pandoc ran, and its
+maximum RSS is the larger of the two.
+
+Every child is observed in the pandoc_child_* histograms, labelled by the
+source and target format of its conversion, and the children of one
+conversion request add up to its request log line (app.request_log).
+The SVG rasterization in the shared Chromium spawns no child of its own, so it
+has no usage to account.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import sys
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from app.prometheus_metrics import observe_child_resources
+
+if TYPE_CHECKING:
+    import resource
+    from collections.abc import Iterator
+
+# The kernel counts block I/O in 512-byte units, whatever the block size of the file system.
+BLOCK_SIZE = 512
+
+# ru_maxrss is in bytes on macOS and in kilobytes everywhere else.
+MAX_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+UNKNOWN_FORMAT = "unknown"
+
+_current_resources: ContextVar[ConversionResources | None] = ContextVar("conversion_resources", default=None)
+
+
+@dataclass(frozen=True)
+class ResourceUsage:
+    """
+    What one child process and the children it reaped used.
+
+    Attributes:
+        user_cpu_seconds: CPU time spent in user mode.
+        system_cpu_seconds: CPU time spent in the kernel.
+        max_rss_bytes: Largest resident set size of the process or one of its children.
+        read_bytes: Bytes read from block devices.
+        write_bytes: Bytes written to block devices.
+    """
+
+    user_cpu_seconds: float = 0.0
+    system_cpu_seconds: float = 0.0
+    max_rss_bytes: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+
+    @classmethod
+    def from_rusage(cls, rusage: resource.struct_rusage) -> ResourceUsage:
+        """The usage the kernel reported when the process was reaped."""
+        return cls(
+            user_cpu_seconds=rusage.ru_utime,
+            system_cpu_seconds=rusage.ru_stime,
+            max_rss_bytes=rusage.ru_maxrss * MAX_RSS_UNIT,
+            read_bytes=rusage.ru_inblock * BLOCK_SIZE,
+            write_bytes=rusage.ru_oublock * BLOCK_SIZE,
+        )
+
+
+class ConversionResources:
+    """The usage of all child processes of one conversion."""
+
+    def __init__(self, source_format: str, target_format: str) -> None:
+        """
+        Initialize the account.
+
+        Args:
+            source_format: Format the conversion reads, for the metric labels.
+            target_format: Format the conversion writes, for the metric labels.
+        """
+        self.source_format = source_format
+        self.target_format = target_format
+        self.processes = 0
+        self.user_cpu_seconds = 0.0
+        self.system_cpu_seconds = 0.0
+        self.max_rss_bytes = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+
+    def add(self, usage: ResourceUsage) -> None:
+        """Add the usage of one child process."""
+        self.processes += 1
+        self.user_cpu_seconds += usage.user_cpu_seconds
+        self.system_cpu_seconds += usage.system_cpu_seconds
+        self.max_rss_bytes = max(self.max_rss_bytes, usage.max_rss_bytes)
+        self.read_bytes += usage.read_bytes
+        self.write_bytes += usage.write_bytes
+
+    def describe(self) -> str:
+        """The usage, for the request log line."""
+        return (
+            f"{self.processes} child processes, cpu user {self.user_cpu_seconds:.3f}s sys {self.system_cpu_seconds:.3f}s, "
+            f"max rss {self.max_rss_bytes // 1024} KB, block io read {self.read_bytes // 1024} KB write {self.write_bytes // 1024} KB"
+        )
+
+
+@contextlib.contextmanager
+def account_conversion(source_format: str, target_format: str) -> Iterator[ConversionResources]:
+    """Add up the usage of the child processes the code in the context runs."""
+    resources = ConversionResources(source_format, target_format)
+    token = _current_resources.set(resources)
+    try:
+        yield resources
+    finally:
+        _current_resources.reset(token)
+
+
+def record_child_usage(usage: ResourceUsage) -> None:
+    """Observe the usage of a reaped child process and add it to the account of its conversion."""
+    resources = _current_resources.get()
+    if resources is None:
+        observe_child_resources(UNKNOWN_FORMAT, UNKNOWN_FORMAT, usage)
+        return
+    observe_child_resources(resources.source_format, resources.target_format, usage)
+    resources.add(usage)
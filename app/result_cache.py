@@ -0,0 +1,289 @@
+"""
+Content-addressed cache of conversion results.
+
+Polarion exports the same documents again and again, and each export paid the
+full pandoc, tectonic and Chromium cost. A conversion is now keyed by a SHA-256
+of everything its result depends on: the source bytes, the formats, the pandoc
+options, the template bytes, the query parameters and the versions of the
+binaries and of the service. A repeated conversion is answered from the cache.
+
+The cache has two tiers, each evicting its least recently used entries. A
+bounded in-memory tier holds the smaller results; an on-disk tier
+(RESULT_CACHE_DIR) holds results up to its own size and survives restarts when
+the directory is a volume. The key doubles as the ETag of a response, so a
+client that sends it back in If-None-Match gets a 304 without a conversion.
+
+The memory tier belongs to one process. The disk tier is shared by the worker
+processes (app.workers): its directory is the index, an entry's mtime its last
+use, and its size is measured from the directory, under a file lock, whenever a
+result is stored.
+
+The cache is off unless RESULT_CACHE_ENABLED is set.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from app.constants import get_bool_env, get_int_env
+from app.prometheus_metrics import increment_result_cache_eviction, increment_result_cache_hit, increment_result_cache_miss
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_MB = 64
+DEFAULT_DISK_MB = 1024
+
+# A result takes at most this share of the memory tier, so one large PDF cannot flush it.
+MAX_MEMORY_ENTRY_FRACTION = 4
+
+MEMORY_TIER = "memory"
+DISK_TIER = "disk"
+
+_CHUNK_SIZE = 1024 * 1024
+
+# Hashing a source this small takes less time than handing it to a worker thread.
+INLINE_HASH_MAX_SIZE = 64 * 1024
+
+# Cache entries are named by their key. Links handed out and partial writes add a uuid and a suffix.
+_KEY = re.compile(r"^[0-9a-f]{64}$")
+_LEFTOVER = re.compile(r"^[0-9a-f]{64}\.[0-9a-f]{32}\.(served|partial)$")
+LOCK_FILE = ".lock"
+
+# A link or partial write this old was left by a process that went away; one
+# younger may still be streamed or written by another worker.
+LEFTOVER_GRACE_PERIOD = 3600
+
+
+def is_result_cache_enabled() -> bool:
+    return get_bool_env("RESULT_CACHE_ENABLED", default=False)
+
+
+def get_result_cache_dir() -> Path:
+    """Directory of the on-disk tier (RESULT_CACHE_DIR)."""
+    return Path(os.environ.get("RESULT_CACHE_DIR") or Path(tempfile.gettempdir()) / "pandoc-service-cache")
+
+
+def build_cache_key(source: bytes | str | Path, parameters: Mapping[str, object], template: bytes | Path | None = None) -> str:
+    """
+    Hash a source, a template and the parameters of its conversion into a cache key.
+
+    Args:
+        source: The source as pandoc gets it; a spooled source is hashed from its file in chunks.
+        parameters: Everything else the result depends on. The values must serialize to JSON.
+        template: The bytes of an uploaded reference document, or the file of a registered one.
+
+    Returns:
+        The key, a SHA-256 in hex.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(parameters, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0template\0")
+    digest.update(_hash(template).digest() if template is not None else b"none")
+    digest.update(b"\0source\0")
+    _hash(source, digest)
+    return digest.hexdigest()
+
+
+def is_cheap_to_hash(source: bytes | str | Path, template: bytes | Path | None = None) -> bool:
+    """Whether a source and a template are held in memory and small enough for build_cache_key to run on the event loop."""
+    if isinstance(source, Path) or isinstance(template, Path):
+        return False
+    return len(source) + len(template or b"") <= INLINE_HASH_MAX_SIZE
+
+
+def _hash(content: bytes | str | Path, digest: hashlib._Hash | None = None) -> hashlib._Hash:
+    """Feed content into a SHA-256, a file in chunks."""
+    digest = digest or hashlib.sha256()
+    if isinstance(content, Path):
+        with content.open("rb") as content_file:
+            while chunk := content_file.read(_CHUNK_SIZE):
+                digest.update(chunk)
+    else:
+        digest.update(content.encode("utf-8") if isinstance(content, str) else content)
+    return digest
+
+
+class ResultCache:
+    """
+    The two tiers of the result cache. Its methods touch the disk and are meant to run in a worker thread.
+
+    Results the disk tier hands out are hard links next to its entries, so an
+    eviction cannot remove a file while it is being sent. The caller removes them.
+    """
+
+    def __init__(self, memory_max_bytes: int | None = None, disk_dir: Path | None = None, disk_max_bytes: int | None = None) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            memory_max_bytes: Size of the memory tier, 0 to turn it off. If None,
+                RESULT_CACHE_MEMORY_MB is read (0-1048576, default 64).
+            disk_dir: Directory of the disk tier. If None, RESULT_CACHE_DIR is read.
+            disk_max_bytes: Size of the disk tier, 0 to turn it off. If None,
+                RESULT_CACHE_DISK_MB is read (0-1048576, default 1024).
+        """
+        self.memory_max_bytes = memory_max_bytes if memory_max_bytes is not None else get_int_env("RESULT_CACHE_MEMORY_MB", DEFAULT_MEMORY_MB, 0, 1024 * 1024) * 1024 * 1024
+        self.disk_dir = disk_dir or get_result_cache_dir()
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else get_int_env("RESULT_CACHE_DISK_MB", DEFAULT_DISK_MB, 0, 1024 * 1024) * 1024 * 1024
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | Path | None:
+        """
+        Look a result up, counting the hit or miss.
+
+        Returns:
+            The result held in memory, a link to the file of a disk entry too
+            large for the memory tier (the caller removes it), or None.
+        """
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+                increment_result_cache_hit(MEMORY_TIER)
+                return content
+            if self.disk_max_bytes > 0:
+                try:
+                    result = self._read_disk_entry(key, self.disk_dir / key)
+                # Not stored, or evicted meanwhile by this or another worker.
+                except FileNotFoundError:
+                    pass
+                else:
+                    increment_result_cache_hit(DISK_TIER)
+                    return result
+        increment_result_cache_miss()
+        return None
+
+    def put(self, key: str, content: bytes | Path) -> None:
+        """Store a result in the tiers it fits in. A Path is copied, the caller keeps the file."""
+        size = len(content) if isinstance(content, bytes) else content.stat().st_size
+        if size <= self.memory_max_bytes // MAX_MEMORY_ENTRY_FRACTION:
+            memory_content = content if isinstance(content, bytes) else content.read_bytes()
+            with self._lock:
+                self._put_in_memory(key, memory_content)
+        if 0 < size <= self.disk_max_bytes:
+            try:
+                self._put_on_disk(key, content)
+            # A full or read-only cache volume must not fail the conversion it caches.
+            except OSError as e:
+                logger.warning("Could not store a conversion result in %s: %s", self.disk_dir, e)
+
+    def _read_disk_entry(self, key: str, entry_path: Path) -> bytes | Path:
+        # Marks the entry as recently used, for the eviction of every worker.
+        _touch(entry_path)
+        # A small entry is promoted into memory, where the next hit finds it.
+        if entry_path.stat().st_size <= self.memory_max_bytes // MAX_MEMORY_ENTRY_FRACTION:
+            content = entry_path.read_bytes()
+            self._put_in_memory(key, content)
+            return content
+        served_path = self.disk_dir / f"{key}.{uuid.uuid4().hex}.served"
+        served_path.hardlink_to(entry_path)
+        return served_path
+
+    def _put_in_memory(self, key: str, content: bytes) -> None:
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = content
+        self._memory_bytes += len(content)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            increment_result_cache_eviction(MEMORY_TIER)
+
+    def _put_on_disk(self, key: str, content: bytes | Path) -> None:
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        entry_path = self.disk_dir / key
+        # Stored already, by this or another worker.
+        with contextlib.suppress(FileNotFoundError):
+            _touch(entry_path)
+            return
+        # Written aside and renamed, so no worker reads half an entry.
+        partial_path = self.disk_dir / f"{key}.{uuid.uuid4().hex}.partial"
+        try:
+            if isinstance(content, bytes):
+                partial_path.write_bytes(content)
+            else:
+                with content.open("rb") as source_file, partial_path.open("wb") as entry_file:
+                    shutil.copyfileobj(source_file, entry_file, _CHUNK_SIZE)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                partial_path.unlink()
+            raise
+        partial_path.replace(entry_path)
+        _touch(entry_path)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Evict the least recently used entries while the directory holds more than the disk tier's size, and remove stale leftovers."""
+        with (self.disk_dir / LOCK_FILE).open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = []
+            total_bytes = 0
+            stale_before = time.time() - LEFTOVER_GRACE_PERIOD
+            for path in self.disk_dir.iterdir():
+                try:
+                    stat_result = path.stat()
+                except FileNotFoundError:
+                    continue
+                if _LEFTOVER.match(path.name):
+                    if stat_result.st_mtime < stale_before:
+                        with contextlib.suppress(OSError):
+                            path.unlink()
+                # Files the cache did not write are left alone.
+                elif _KEY.match(path.name):
+                    entries.append((stat_result.st_mtime_ns, path.name, stat_result.st_size))
+                    total_bytes += stat_result.st_size
+            for _, evicted_key, evicted_size in sorted(entries):
+                if total_bytes <= self.disk_max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    (self.disk_dir / evicted_key).unlink()
+                total_bytes -= evicted_size
+                increment_result_cache_eviction(DISK_TIER)
+
+
+def _touch(path: Path) -> None:
+    """Set an entry's mtime, its last use, to the nanosecond: the filesystem's own clock may give entries stored together the same time."""
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class _ResultCacheHolder:
+    """Holder class for the global ResultCache singleton."""
+
+    instance: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Get the global ResultCache instance.
+
+    Returns:
+        The global ResultCache singleton
+    """
+    if _ResultCacheHolder.instance is None:
+        _ResultCacheHolder.instance = ResultCache()
+    return _ResultCacheHolder.instance
+
+
+def reset_result_cache() -> None:
+    """Reset the global ResultCache instance (useful for testing)."""
+    _ResultCacheHolder.instance = None
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic.alias_generators import to_camel
 
 
 class VersionSchema(BaseModel):
@@ -10,3 +11,31 @@ class VersionSchema(BaseModel):
     pandocService: str | None = Field()  # noqa: N815
     timestamp: str | None = Field()
     chromium: str | None = Field()
+    tectonic: str | None = Field()
+
+
+class JobSchema(BaseModel):
+    # Same camelCase JSON field names as the version info.
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    job_id: str = Field(description="Id to poll the job and download its result with")
+    status: str = Field(description="queued, running, succeeded or failed")
+    source_format: str = Field()
+    target_format: str = Field()
+    file_name: str = Field(description="File name the result is downloaded as")
+    created_at: str = Field(description="Submission time (ISO 8601)")
+    started_at: str | None = Field(default=None)
+    finished_at: str | None = Field(default=None)
+    expires_at: str | None = Field(default=None, description="Time a finished job is removed at the latest")
+    error: str | None = Field(default=None, description="Why the job failed")
+    result_size: int | None = Field(default=None, description="Size of the result in bytes")
+
+
+class TemplateSchema(BaseModel):
+    # camelCase like the job info.
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    template_id: str = Field(description="SHA-256 of the template, usable as template_id like its name")
+    name: str | None = Field(default=None, description="Name the template is registered under")
+    format: str = Field(description="docx or pptx")
+    size: int = Field(description="Size of the template in bytes")
@@ -0,0 +1,294 @@
+"""
+Per-request scratch workspaces.
+
+Spooled sources, the files pandoc reads and writes, uploaded templates, bundles
+and the intermediates tectonic leaves next to its input were spread over the
+default temp dir and the working directory of the service. They now all land
+under one scratch root (SCRATCH_DIR), which can be a tmpfs mount: a request
+gets a directory of its own there when it writes its first file, and the
+directory goes with everything in it once the response is sent. pandoc runs in
+that directory with TMPDIR pointing to it, so the PDF engine it spawns writes
+there too. A conversion job has a workspace of its own while it runs.
+
+The bytes under the scratch root count against SCRATCH_MAX_MB; while the quota
+is used up the load shedder refuses new conversions. A janitor removes the
+workspaces of worker processes that died, and anything older than
+SCRATCH_ORPHAN_AGE. The usage is exported as pandoc_scratch_bytes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import anyio
+import psutil
+
+from app.constants import get_int_env
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Callable
+
+    from starlette.types import ASGIApp, Receive, Scope, Send
+
+# A workspace is removed with its request; one this old is left from a conversion that is long gone.
+DEFAULT_ORPHAN_AGE = 6 * 3600
+MAX_ORPHAN_AGE = 7 * 24 * 3600
+
+# The janitor looks for orphans this often.
+JANITOR_INTERVAL = 60.0
+
+# A workspace of this process exists a moment before it counts as in use; one that young is no orphan.
+ORPHAN_GRACE_PERIOD = 60.0
+
+# The usage is measured at most this often, not once per request.
+USAGE_SAMPLE_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+_current_workspace: ContextVar[Workspace | None] = ContextVar("scratch_workspace", default=None)
+
+
+def get_scratch_root() -> Path:
+    """Root directory of the scratch workspaces (SCRATCH_DIR)."""
+    return Path(os.environ.get("SCRATCH_DIR") or Path(tempfile.gettempdir()) / "pandoc-service-scratch")
+
+
+@dataclass(frozen=True)
+class ScratchUsage:
+    """
+    What the scratch root holds.
+
+    Attributes:
+        total_bytes: Size of all files under the root.
+        workspaces: Number of workspace directories.
+    """
+
+    total_bytes: int = 0
+    workspaces: int = 0
+
+
+class Workspace:
+    """The scratch directory of one request or job, created on first use."""
+
+    def __init__(self, space: ScratchSpace) -> None:
+        """
+        Initialize the workspace.
+
+        Args:
+            space: The scratch space the directory is created in.
+        """
+        self.space = space
+        self._path: Path | None = None
+
+    @property
+    def path(self) -> Path:
+        """The directory, created by the first call."""
+        if self._path is None:
+            self.space.root.mkdir(parents=True, exist_ok=True)
+            # The pid tells the janitor whose workspace it is.
+            self._path = Path(tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=self.space.root))
+            self.space.active.add(self._path)
+        return self._path
+
+    async def remove(self) -> None:
+        """Remove the directory with everything in it, if it was created, in a worker thread."""
+        if self._path is None:
+            return
+        path, self._path = self._path, None
+        # It may hold a spooled upload and pandoc's output. It stays active, out of the janitor's way, until it is gone.
+        await anyio.to_thread.run_sync(functools.partial(shutil.rmtree, path, ignore_errors=True))
+        self.space.active.discard(path)
+
+
+class ScratchSpace:
+    """The scratch root: its workspaces, its quota and its janitor."""
+
+    def __init__(self, root: Path | None = None, max_bytes: int | None = None, orphan_age: int | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Initialize the scratch space.
+
+        Args:
+            root: Directory of the workspaces. If None, SCRATCH_DIR is read.
+            max_bytes: Quota of the root, 0 for none. If None, SCRATCH_MAX_MB is read (0-1048576, default 0).
+            orphan_age: Seconds after which the janitor removes a workspace of a live process.
+                If None, SCRATCH_ORPHAN_AGE is read (60-604800, default 21600).
+            clock: Time source for the usage sampling interval.
+        """
+        self.root = get_scratch_root() if root is None else root
+        self.max_bytes = get_int_env("SCRATCH_MAX_MB", 0, 0, 1024 * 1024) * 1024 * 1024 if max_bytes is None else max_bytes
+        self.orphan_age = get_int_env("SCRATCH_ORPHAN_AGE", DEFAULT_ORPHAN_AGE, 60, MAX_ORPHAN_AGE) if orphan_age is None else orphan_age
+        # The workspaces of this process that are in use, which the janitor leaves alone.
+        self.active: set[Path] = set()
+        self._clock = clock
+        self._usage = ScratchUsage()
+        self._usage_sampled_at: float | None = None
+        self._janitor: asyncio.Task[None] | None = None
+
+    def describe(self) -> str:
+        """The root and its quota, for the startup log."""
+        quota = f"{self.max_bytes // (1024 * 1024)} MB" if self.max_bytes else "no quota"
+        return f"{self.root} ({quota})"
+
+    @contextlib.asynccontextmanager
+    async def workspace(self) -> AsyncIterator[Workspace]:
+        """Give the files of the code in the context a workspace of their own, removed when it ends."""
+        workspace = Workspace(self)
+        token = _current_workspace.set(workspace)
+        try:
+            yield workspace
+        finally:
+            _current_workspace.reset(token)
+            await workspace.remove()
+
+    def get_usage(self) -> ScratchUsage:
+        """What the root holds, measured at most once per USAGE_SAMPLE_INTERVAL."""
+        now = self._clock()
+        if self._usage_sampled_at is None or now - self._usage_sampled_at >= USAGE_SAMPLE_INTERVAL:
+            self._usage_sampled_at = now
+            self._usage = self._measure_usage()
+        return self._usage
+
+    def is_full(self) -> bool:
+        """Whether the files under the root use up the quota."""
+        return bool(self.max_bytes) and self.get_usage().total_bytes >= self.max_bytes
+
+    def _measure_usage(self) -> ScratchUsage:
+        total_bytes = 0
+        workspaces = 0
+        for directory, subdirectories, files in os.walk(self.root):
+            if directory == str(self.root):
+                workspaces = len(subdirectories)
+            for name in files:
+                # A file may go between the listing and the stat.
+                with contextlib.suppress(OSError):
+                    total_bytes += os.lstat(os.path.join(directory, name)).st_size  # noqa: PTH118
+        return ScratchUsage(total_bytes, workspaces)
+
+    def remove_orphans(self) -> int:
+        """
+        Remove what no conversion uses anymore.
+
+        That is a workspace of a process that is gone, one of this process that
+        is not in use, and any other entry older than the orphan age.
+
+        Returns:
+            The number of entries removed.
+        """
+        if not self.root.is_dir():
+            return 0
+        removed = 0
+        now = time.time()
+        for entry in self.root.iterdir():
+            if entry in self.active:
+                continue
+            try:
+                modified_at = entry.lstat().st_mtime
+            except FileNotFoundError:
+                continue
+            if modified_at >= now - self.orphan_age and not self._is_orphaned_workspace(entry, now - modified_at):
+                continue
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+            self.active.discard(entry)
+            removed += 1
+        return removed
+
+    def _is_orphaned_workspace(self, entry: Path, age: float) -> bool:
+        pid, separator, _ = entry.name.partition("-")
+        if not separator or not pid.isdigit() or not entry.is_dir():
+            return False
+        if int(pid) == os.getpid():
+            return age > ORPHAN_GRACE_PERIOD
+        return not psutil.pid_exists(int(pid))
+
+    def start_janitor(self) -> None:
+        """Remove the orphans left by a previous run, then keep looking for them in the background."""
+        logger.info("Scratch workspaces in %s", self.describe())
+        self._janitor = asyncio.create_task(self._remove_orphans_periodically())
+
+    async def stop_janitor(self) -> None:
+        """Stop the janitor."""
+        if self._janitor is None:
+            return
+        self._janitor.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._janitor
+        self._janitor = None
+
+    async def _remove_orphans_periodically(self) -> None:
+        while True:
+            try:
+                removed = await anyio.to_thread.run_sync(self.remove_orphans)
+                if removed:
+                    logger.info("Removed %d orphaned scratch entries from %s", removed, self.root)
+            # The janitor keeps going; the next round may succeed.
+            except OSError as e:
+                logger.warning("Removing orphaned scratch entries failed: %s", e)
+            await asyncio.sleep(JANITOR_INTERVAL)
+
+
+def get_scratch_dir() -> Path:
+    """The directory for the scratch files of the current request or job: its workspace, or the scratch root outside of one."""
+    workspace = _current_workspace.get()
+    if workspace is not None:
+        return workspace.path
+    root = get_scratch_space().root
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+class ScratchWorkspaceMiddleware:
+    """Gives every request a workspace, removed once the response is sent."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # A request that writes no file creates no directory.
+        async with get_scratch_space().workspace():
+            await self.app(scope, receive, send)
+
+
+class _ScratchSpaceHolder:
+    """Holder class for the global ScratchSpace singleton."""
+
+    instance: ScratchSpace | None = None
+
+
+def get_scratch_space() -> ScratchSpace:
+    """
+    Get the global ScratchSpace instance.
+
+    Returns:
+        The global ScratchSpace singleton
+    """
+    if _ScratchSpaceHolder.instance is None:
+        _ScratchSpaceHolder.instance = ScratchSpace()
+    return _ScratchSpaceHolder.instance
+
+
+def reset_scratch_space() -> None:
+    """Reset the global ScratchSpace instance (useful for testing)."""
+    _ScratchSpaceHolder.instance = None
@@ -0,0 +1,248 @@
+"""
+Registry of the reference documents DOCX and PPTX conversions are styled with.
+
+The docx-with-template and pptx-with-template endpoints took the template as a
+multipart part on every request, so the same corporate template was uploaded
+thousands of times a day. A template is now registered once under a name and
+referenced by a conversion with its name or its id, the SHA-256 of its bytes.
+
+Templates live on local disk (TEMPLATES_DIR). A template's bytes are stored
+once under its id, with its format as the extension, so two names for the same
+template share one file; a name is a small file holding the file name of the
+template it points to. Both are replaced atomically, so concurrent uploads and
+conversions never see a half-written template.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.constants import get_int_env
+
+# The part of the package that tells a DOCX from a PPTX.
+TEMPLATE_FORMAT_PARTS = {"docx": "word/document.xml", "pptx": "ppt/presentation.xml"}
+
+DEFAULT_MAX_TEMPLATES = 1000
+
+NAMES_DIR = "names"
+
+# An id is a SHA-256 in hex; a name is anything else made of these characters.
+_TEMPLATE_ID = re.compile(r"^[0-9a-f]{64}$")
+_TEMPLATE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,99}$")
+
+
+class TemplateNotFoundError(Exception):
+    """Raised when no template is registered under a name or id."""
+
+    def __init__(self, template_ref: str) -> None:
+        super().__init__(f"Template {template_ref} not found")
+
+
+class InvalidTemplateError(ValueError):
+    """Raised when an upload is not a DOCX or PPTX, or a template is used for the other format."""
+
+
+class TemplateStoreFullError(Exception):
+    """Raised when a name is registered while TEMPLATES_MAX_COUNT names are."""
+
+
+def get_templates_dir() -> Path:
+    """Root directory of the template store (TEMPLATES_DIR)."""
+    return Path(os.environ.get("TEMPLATES_DIR") or Path(tempfile.gettempdir()) / "pandoc-service-templates")
+
+
+def get_template_format(template: bytes) -> str:
+    """
+    Tell the format of a template from its parts.
+
+    Raises:
+        InvalidTemplateError: If the template is neither a DOCX nor a PPTX.
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(template)) as package:
+            names = set(package.namelist())
+    except zipfile.BadZipFile as e:
+        raise InvalidTemplateError("A template must be a DOCX or PPTX file") from e
+    for template_format, part in TEMPLATE_FORMAT_PARTS.items():
+        if part in names:
+            return template_format
+    raise InvalidTemplateError("A template must be a DOCX or PPTX file")
+
+
+def is_template_name(name: str) -> bool:
+    """Whether a name can be registered. A name never looks like an id, so a reference is never ambiguous."""
+    return bool(_TEMPLATE_NAME.match(name)) and not _TEMPLATE_ID.match(name)
+
+
+@dataclass(frozen=True)
+class StoredTemplate:
+    """
+    A registered template.
+
+    Attributes:
+        template_id: SHA-256 of the template's bytes.
+        template_format: docx or pptx.
+        path: File pandoc reads as --reference-doc.
+        size: Size in bytes.
+        name: Name it was registered or looked up under, None if it was looked up by id.
+    """
+
+    template_id: str
+    template_format: str
+    path: Path
+    size: int
+    name: str | None = None
+
+
+class TemplateStore:
+    """The on-disk registry of templates. Its methods touch the disk and are meant to run in a worker thread."""
+
+    def __init__(self, root: Path | None = None, max_templates: int | None = None) -> None:
+        """
+        Initialize the store. Its directories are created with the first template.
+
+        Args:
+            root: Directory of the store. If None, TEMPLATES_DIR is read.
+            max_templates: Names that can be registered. If None, TEMPLATES_MAX_COUNT
+                is read (1-100000, default 1000).
+        """
+        self.root = root or get_templates_dir()
+        self.max_templates = max_templates if max_templates is not None else get_int_env("TEMPLATES_MAX_COUNT", DEFAULT_MAX_TEMPLATES, 1, 100000)
+        # Registering and deleting check and change several files; within a process they take turns.
+        self._lock = threading.Lock()
+
+    def put(self, name: str, template: bytes) -> tuple[StoredTemplate, bool]:
+        """
+        Register a template under a name, replacing what the name pointed to.
+
+        Returns:
+            The stored template and whether the name is new.
+
+        Raises:
+            InvalidTemplateError: If the name cannot be registered or the template is neither a DOCX nor a PPTX.
+            TemplateStoreFullError: If the name is new and TEMPLATES_MAX_COUNT names are registered.
+        """
+        if not is_template_name(name):
+            raise InvalidTemplateError(f"Invalid template name: {name}")
+        template_format = get_template_format(template)
+        template_id = hashlib.sha256(template).hexdigest()
+        path = self.root / f"{template_id}.{template_format}"
+        name_path = self.root / NAMES_DIR / name
+        with self._lock:
+            created = not name_path.exists()
+            if created and self._count_names() >= self.max_templates:
+                raise TemplateStoreFullError(f"{self.max_templates} templates are registered already")
+            if not path.exists():
+                _write_atomically(path, template)
+            previous = self._read_name(name)
+            _write_atomically(name_path, path.name.encode("ascii"))
+            if previous is not None and previous != path:
+                self._remove_if_unnamed(previous)
+        return StoredTemplate(template_id, template_format, path, len(template), name), created
+
+    def get(self, template_ref: str) -> StoredTemplate:
+        """
+        Look a template up by its name or its id.
+
+        Raises:
+            TemplateNotFoundError: If nothing is registered under the reference.
+        """
+        name = None
+        if _TEMPLATE_ID.match(template_ref):
+            path = next((path for path in (self.root / f"{template_ref}.{template_format}" for template_format in TEMPLATE_FORMAT_PARTS) if path.exists()), None)
+        elif is_template_name(template_ref):
+            name = template_ref
+            path = self._read_name(template_ref)
+        else:
+            path = None
+        if path is None:
+            raise TemplateNotFoundError(template_ref)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError as e:
+            raise TemplateNotFoundError(template_ref) from e
+        return StoredTemplate(path.stem, path.suffix.removeprefix("."), path, size, name)
+
+    def delete(self, template_ref: str) -> None:
+        """
+        Remove a name, and the template it pointed to if no other name does; or, by id, a template and every name pointing to it.
+
+        Raises:
+            TemplateNotFoundError: If nothing is registered under the reference.
+        """
+        with self._lock:
+            stored = self.get(template_ref)
+            if stored.name is not None:
+                (self.root / NAMES_DIR / stored.name).unlink()
+                self._remove_if_unnamed(stored.path)
+                return
+            for name_path in self._name_paths():
+                if self._read_name(name_path.name) == stored.path:
+                    name_path.unlink()
+            stored.path.unlink()
+
+    def _read_name(self, name: str) -> Path | None:
+        try:
+            file_name = (self.root / NAMES_DIR / name).read_text(encoding="ascii").strip()
+        except FileNotFoundError:
+            return None
+        return self.root / file_name
+
+    def _name_paths(self) -> list[Path]:
+        names_dir = self.root / NAMES_DIR
+        if not names_dir.is_dir():
+            return []
+        return [path for path in names_dir.iterdir() if is_template_name(path.name)]
+
+    def _count_names(self) -> int:
+        return len(self._name_paths())
+
+    def _remove_if_unnamed(self, path: Path) -> None:
+        if all(self._read_name(name_path.name) != path for name_path in self._name_paths()):
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+
+
+def _write_atomically(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, partial_name = tempfile.mkstemp(dir=path.parent, prefix=".partial-")
+    try:
+        with os.fdopen(descriptor, "wb") as partial_file:
+            partial_file.write(content)
+        Path(partial_name).replace(path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            Path(partial_name).unlink()
+        raise
+
+
+class _TemplateStoreHolder:
+    """Holder class for the global TemplateStore singleton."""
+
+    instance: TemplateStore | None = None
+
+
+def get_template_store() -> TemplateStore:
+    """
+    Get the global TemplateStore instance.
+
+    Returns:
+        The global TemplateStore singleton
+    """
+    if _TemplateStoreHolder.instance is None:
+        _TemplateStoreHolder.instance = TemplateStore()
+    return _TemplateStoreHolder.instance
+
+
+def reset_template_store() -> None:
+    """Reset the global TemplateStore instance (useful for testing)."""
+    _TemplateStoreHolder.instance = None
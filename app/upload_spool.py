@@ -0,0 +1,315 @@
+"""
+Spooling of uploaded sources on their way to pandoc.
+
+A source used to be read into one bytes object, handed through the
+preprocessors and then written to the temp file pandoc reads, so a large upload
+lived in memory several times over. It is now read in chunks instead. A source
+that stays within SPOOL_MAX_SIZE is kept in memory as before; a larger one is
+written chunk by chunk to a file in the request's scratch workspace, and that path is what the endpoints
+hand to pandoc. Only a conversion that runs a preprocessor loads the file back,
+since the preprocessors work on the whole document.
+
+A multipart source is parsed by read_form, which keeps a file part in memory up
+to the same size and writes a larger one straight to a scratch file: spool_upload
+hands that file over as it is, so a large upload is written to disk once. It
+drives python-multipart's parser itself, through its public callbacks, instead
+of reaching into Starlette's parser for where a part is stored.
+
+A source given with an ``encoding`` is transcoded to UTF-8 while it is spooled,
+which is what pandoc reads.
+"""
+
+from __future__ import annotations
+
+import codecs
+import contextlib
+import io
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import anyio
+from python_multipart import MultipartParser
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import parse_options_header
+from starlette.datastructures import FormData, Headers, UploadFile
+from starlette.exceptions import HTTPException
+from starlette.formparsers import MultiPartException
+
+from app.scratch_workspace import get_scratch_dir
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterable, AsyncIterator
+
+    from python_multipart.multipart import MultipartCallbacks
+    from starlette.requests import Request
+
+# Starlette keeps a multipart part in memory up to the same size.
+SPOOL_MAX_SIZE = 1024 * 1024
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+SCRATCH_FILE_PREFIX = "pandoc-source-"
+
+# The limits request.form applies to a multipart form.
+MAX_FORM_FILES = 1000
+MAX_FORM_FIELDS = 1000
+
+
+async def spool_stream(chunks: AsyncIterable[bytes], encoding: str | None = None) -> bytes | str | Path:
+    """
+    Collect a streamed source, spilling it to a scratch file once it gets large.
+
+    Args:
+        chunks: The source as it arrives, e.g. ``request.stream()``.
+        encoding: Encoding of the source. When given, a source kept in memory is
+            decoded to str and a spooled one is transcoded to UTF-8.
+
+    Returns:
+        The source as bytes (or str with an encoding), or the Path of the scratch
+        file holding it. The caller removes the file with discard_source.
+    """
+    iterator = aiter(chunks)
+    buffer = bytearray()
+    async for chunk in iterator:
+        buffer += chunk
+        if len(buffer) > SPOOL_MAX_SIZE:
+            return await _spool_to_file(bytes(buffer), iterator, encoding)
+    data = bytes(buffer)
+    return data.decode(encoding) if encoding else data
+
+
+async def spool_upload(upload: UploadFile, encoding: str | None = None) -> bytes | str | Path:
+    """
+    Spool an uploaded multipart file the way spool_stream spools a body.
+
+    A file read_form already wrote to a scratch file is handed over as it is,
+    unless it has to be transcoded.
+    """
+    if isinstance(upload, _ScratchUpload) and upload.path is not None and not encoding:
+        path = upload.path
+        await upload.close()
+        return path
+    return await spool_stream(_read_upload(upload), encoding)
+
+
+async def read_form(request: Request, max_part_size: int) -> FormData:
+    """
+    Parse the form of a request like request.form, with the file parts of a multipart form spooled by _ScratchUpload.
+
+    Raises:
+        HTTPException: 400 if the multipart data is malformed, as request.form raises it.
+    """
+    content_type, _ = parse_options_header(request.headers.get("Content-Type"))
+    if content_type != b"multipart/form-data":
+        return await request.form(max_part_size=max_part_size)
+    async with contextlib.aclosing(request.stream()) as stream:
+        try:
+            return await _ScratchFormParser(request.headers, stream, max_part_size).parse()
+        except MultiPartException as e:
+            raise HTTPException(status_code=400, detail=e.message) from e
+
+
+async def load_source(source: bytes | str | Path) -> bytes | str:
+    """Return a source in memory, reading it back if it was spooled to a file."""
+    if isinstance(source, Path):
+        return await anyio.Path(source).read_bytes()
+    return source
+
+
+def get_source_size(source: bytes | str | Path) -> int:
+    """Size of a source in bytes, as pandoc will read it."""
+    if isinstance(source, Path):
+        return source.stat().st_size
+    if isinstance(source, str):
+        return len(source.encode("utf-8"))
+    return len(source)
+
+
+def discard_source(source: bytes | str | Path | None) -> None:
+    """Remove the scratch file of a spooled source. Anything else is left alone."""
+    if isinstance(source, Path):
+        source.unlink(missing_ok=True)
+
+
+class _ScratchUpload(UploadFile):
+    """A multipart file part: in memory up to SPOOL_MAX_SIZE, then in a named scratch file that spool_upload hands over as it is."""
+
+    def __init__(self, filename: str, headers: Headers, scratch_dir: Path) -> None:
+        self._buffer = io.BytesIO()
+        super().__init__(self._buffer, size=0, filename=filename, headers=headers)
+        self._scratch_dir = scratch_dir
+        self.path: Path | None = None
+
+    async def write(self, data: bytes) -> None:
+        if self.path is None and self._buffer.tell() + len(data) <= SPOOL_MAX_SIZE:
+            self._buffer.write(data)
+        else:
+            await anyio.to_thread.run_sync(self._write_to_scratch_file, data)
+        self.size = (self.size or 0) + len(data)
+
+    def _write_to_scratch_file(self, data: bytes) -> None:
+        if self.path is None:
+            fd, name = tempfile.mkstemp(prefix=SCRATCH_FILE_PREFIX, dir=self._scratch_dir)
+            # Closed with the upload; the request's workspace removes it.
+            self.file = os.fdopen(fd, "w+b")
+            self.file.write(self._buffer.getvalue())
+            self._buffer.close()
+            self.path = Path(name)
+        self.file.write(data)
+
+
+@dataclass
+class _FormPart:
+    headers: list[tuple[bytes, bytes]] = field(default_factory=list)
+    content_disposition: bytes = b""
+    name: str = ""
+    data: bytearray = field(default_factory=bytearray)
+    upload: _ScratchUpload | None = None
+
+
+class _ScratchFormParser:
+    """
+    Parse a multipart form with python-multipart, with the limits and errors of Starlette's MultiPartParser.
+
+    A field part is decoded to str and may hold max_part_size bytes. A file
+    part becomes a _ScratchUpload; the parser callbacks only collect its data,
+    which parse writes once the chunk is fed, since a write may go to disk.
+    """
+
+    def __init__(self, headers: Headers, stream: AsyncIterator[bytes], max_part_size: int) -> None:
+        self.headers = headers
+        self.stream = stream
+        self.max_part_size = max_part_size
+        # Looked up while the request's workspace is current; the parts are written from worker threads.
+        self.scratch_dir = get_scratch_dir()
+        self.items: list[tuple[str, str | UploadFile]] = []
+        self.uploads: list[_ScratchUpload] = []
+        self._charset = "utf-8"
+        self._part = _FormPart()
+        self._header_name = b""
+        self._header_value = b""
+        self._fields = 0
+        self._file_data: list[tuple[_ScratchUpload, bytes]] = []
+
+    async def parse(self) -> FormData:
+        """
+        Parse the form from the request stream.
+
+        Raises:
+            MultiPartException: If the multipart data is malformed or exceeds a limit.
+        """
+        _, params = parse_options_header(self.headers["Content-Type"])
+        charset = params.get(b"charset", b"utf-8").decode("latin-1")
+        with contextlib.suppress(LookupError):
+            self._charset = codecs.lookup(charset).name
+        if b"boundary" not in params:
+            raise MultiPartException("Missing boundary in multipart.")
+
+        callbacks: MultipartCallbacks = {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+        try:
+            parser = MultipartParser(params[b"boundary"], callbacks)
+            async for chunk in self.stream:
+                parser.write(chunk)
+                await self._write_file_data()
+            parser.finalize()
+            await self._write_file_data()
+            for upload in self.uploads:
+                await upload.seek(0)
+        except BaseException as e:
+            for upload in self.uploads:
+                upload.file.close()
+            if isinstance(e, FormParserError):
+                raise MultiPartException("Invalid multipart data.") from e
+            raise
+        return FormData(self.items)
+
+    async def _write_file_data(self) -> None:
+        for upload, data in self._file_data:
+            await upload.write(data)
+        self._file_data.clear()
+
+    def on_part_begin(self) -> None:
+        self._part = _FormPart()
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        name = self._header_name.lower()
+        if name == b"content-disposition":
+            self._part.content_disposition = self._header_value
+        self._part.headers.append((name, self._header_value))
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._part.content_disposition)
+        if b"name" not in options:
+            raise MultiPartException('The Content-Disposition header field "name" must be provided.')
+        self._part.name = self._decode(options[b"name"])
+        if b"filename" not in options:
+            self._fields += 1
+            if self._fields > MAX_FORM_FIELDS:
+                raise MultiPartException(f"Too many fields. Maximum number of fields is {MAX_FORM_FIELDS}.")
+            return
+        if len(self.uploads) >= MAX_FORM_FILES:
+            raise MultiPartException(f"Too many files. Maximum number of files is {MAX_FORM_FILES}.")
+        self._part.upload = _ScratchUpload(self._decode(options[b"filename"]), Headers(raw=self._part.headers), self.scratch_dir)
+        self.uploads.append(self._part.upload)
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part.upload is not None:
+            self._file_data.append((self._part.upload, data[start:end]))
+            return
+        if len(self._part.data) + end - start > self.max_part_size:
+            raise MultiPartException(f"Part exceeded maximum size of {self.max_part_size // 1024}KB.")
+        self._part.data += data[start:end]
+
+    def on_part_end(self) -> None:
+        self.items.append((self._part.name, self._decode(self._part.data) if self._part.upload is None else self._part.upload))
+
+    def _decode(self, value: bytes | bytearray) -> str:
+        try:
+            return value.decode(self._charset)
+        except UnicodeDecodeError:
+            return value.decode("latin-1")
+
+
+async def _read_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(SPOOL_CHUNK_SIZE):
+        yield chunk
+
+
+async def _spool_to_file(head: bytes, rest: AsyncIterator[bytes], encoding: str | None) -> Path:
+    # Looked up first, so an unknown encoding fails before anything is written.
+    decoder = codecs.getincrementaldecoder(encoding)() if encoding else None
+
+    def to_utf8(chunk: bytes, *, final: bool = False) -> bytes:
+        return chunk if decoder is None else decoder.decode(chunk, final=final).encode("utf-8")
+
+    fd, name = tempfile.mkstemp(prefix=SCRATCH_FILE_PREFIX, dir=get_scratch_dir())
+    os.close(fd)
+    path = Path(name)
+    try:
+        async with await anyio.open_file(path, "wb") as scratch_file:
+            await scratch_file.write(to_utf8(head))
+            async for chunk in rest:
+                await scratch_file.write(to_utf8(chunk))
+            await scratch_file.write(to_utf8(b"", final=True))
+    except BaseException:
+        # Also on cancellation: a half-written scratch file must not stay behind.
+        discard_source(path)
+        raise
+    return path
@@ -0,0 +1,200 @@
+"""
+Several worker processes behind one port.
+
+A single uvicorn process runs the Python side of every conversion (the
+python-docx post-processing, the lxml and BeautifulSoup preprocessors) on one
+core, whatever the size of the pod. With WORKERS above 1, uvicorn's supervisor
+starts that many worker processes that share the listening socket; SIGHUP to the
+supervisor replaces them one by one without dropping the port.
+
+The supervisor prepares what the workers share before it starts them:
+
+- PROMETHEUS_MULTIPROC_DIR, cleared, where the workers write their metrics; the
+  supervisor serves their sum on the metrics port.
+- With CHROMIUM_MODE=shared, one headless Chromium the workers connect to over
+  CDP, instead of one browser per worker (CHROMIUM_MODE=per-worker).
+
+Everything else is per worker: PANDOC_MAX_CONCURRENT_CONVERSIONS, the load shedding
+limits, the job workers and the memory tier of the result cache apply to each
+process.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import IO
+
+import uvicorn
+
+from app.chromium_manager import CHROMIUM_ARGS
+from app.constants import get_int_env
+from app.metrics_server import get_metrics_port, is_metrics_server_enabled, serve_metrics_in_thread
+from app.tls import load_tls_options
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 1
+MAX_WORKERS = 64
+
+CHROMIUM_PER_WORKER = "per-worker"
+CHROMIUM_SHARED = "shared"
+CHROMIUM_MODES = (CHROMIUM_PER_WORKER, CHROMIUM_SHARED)
+
+# Set in the environment the workers inherit, so each knows the supervisor runs the metrics server.
+SUPERVISOR_PID_ENV = "PANDOC_SERVICE_SUPERVISOR_PID"
+
+# Seconds the shared browser has to report its CDP endpoint.
+CHROMIUM_STARTUP_TIMEOUT = 30.0
+
+_DEVTOOLS_LISTENING = re.compile(r"DevTools listening on (ws://\S+)")
+
+
+def get_worker_count() -> int:
+    """Number of worker processes (WORKERS, 1-64, default 1)."""
+    return get_int_env("WORKERS", DEFAULT_WORKERS, 1, MAX_WORKERS)
+
+
+def get_chromium_mode() -> str:
+    """Whether the workers share one browser (CHROMIUM_MODE=shared) or launch one each (per-worker, the default)."""
+    mode = os.environ.get("CHROMIUM_MODE", CHROMIUM_PER_WORKER).strip().lower()
+    if mode not in CHROMIUM_MODES:
+        logger.warning("Invalid CHROMIUM_MODE '%s', expected one of %s. Using default %s.", mode, ", ".join(CHROMIUM_MODES), CHROMIUM_PER_WORKER)
+        return CHROMIUM_PER_WORKER
+    return mode
+
+
+def get_multiprocess_dir() -> Path:
+    """Directory the workers write their metrics to (PROMETHEUS_MULTIPROC_DIR)."""
+    return Path(os.environ.get("PROMETHEUS_MULTIPROC_DIR") or Path(tempfile.gettempdir()) / "pandoc-service-metrics")
+
+
+def is_supervised_worker() -> bool:
+    """Whether this process is a worker started by the supervisor."""
+    return SUPERVISOR_PID_ENV in os.environ
+
+
+def prepare_multiprocess_dir(directory: Path) -> None:
+    """Empty the metrics directory, so counters of a previous run do not count twice."""
+    if directory.is_dir():
+        for path in directory.iterdir():
+            if path.suffix == ".db":
+                path.unlink(missing_ok=True)
+    directory.mkdir(parents=True, exist_ok=True)
+
+
+class SharedChromium:
+    """A headless Chromium of the supervisor that the workers connect to over CDP."""
+
+    def __init__(self) -> None:
+        self.endpoint: str | None = None
+        self._process: subprocess.Popen[str] | None = None
+        self._user_data_dir: str | None = None
+
+    def start(self) -> str:
+        """
+        Launch the browser on a free local port.
+
+        Returns:
+            The CDP endpoint of the browser.
+
+        Raises:
+            RuntimeError: If the browser does not report its endpoint in time.
+        """
+        from playwright.sync_api import sync_playwright  # noqa: PLC0415 - only the supervisor of a shared browser needs it
+
+        with sync_playwright() as playwright:
+            executable = playwright.chromium.executable_path
+        # Remote debugging needs a profile directory of its own.
+        self._user_data_dir = tempfile.mkdtemp(prefix="pandoc-chromium-")
+        self._process = subprocess.Popen(  # noqa: S603 - the executable is Playwright's bundled Chromium
+            [executable, "--headless", "--remote-debugging-address=127.0.0.1", "--remote-debugging-port=0", f"--user-data-dir={self._user_data_dir}", *CHROMIUM_ARGS],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if self._process.stderr is None:
+            self.stop()
+            raise RuntimeError("The shared Chromium has no stderr")
+        self.endpoint = _read_endpoint(self._process.stderr, time.monotonic() + CHROMIUM_STARTUP_TIMEOUT)
+        if self.endpoint is None:
+            self.stop()
+            raise RuntimeError("The shared Chromium did not report its CDP endpoint")
+        # Chromium keeps writing to stderr; a full pipe would stall it.
+        threading.Thread(target=_drain, args=(self._process.stderr,), name="shared-chromium-stderr", daemon=True).start()
+        logger.info("Shared Chromium started (pid %d) at %s", self._process.pid, self.endpoint)
+        return self.endpoint
+
+    def stop(self) -> None:
+        """Terminate the browser and remove its profile."""
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            self._process = None
+        if self._user_data_dir is not None:
+            shutil.rmtree(self._user_data_dir, ignore_errors=True)
+            self._user_data_dir = None
+
+
+def _read_endpoint(stderr: IO[str], deadline: float) -> str | None:
+    # Chromium prints the endpoint on stderr once it listens.
+    while time.monotonic() < deadline:
+        line = stderr.readline()
+        if not line:
+            return None
+        match = _DEVTOOLS_LISTENING.search(line)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _drain(stderr: IO[str]) -> None:
+    for line in stderr:
+        logger.debug("Shared Chromium: %s", line.rstrip())
+
+
+def run_workers(port: int, workers: int, share_chromium: bool) -> None:
+    """
+    Serve the app from several worker processes until the supervisor is stopped.
+
+    Args:
+        port: The port the workers share.
+        workers: Number of worker processes.
+        share_chromium: Start one browser for all workers.
+    """
+    multiprocess_dir = get_multiprocess_dir()
+    prepare_multiprocess_dir(multiprocess_dir)
+    # The workers are spawned, not forked, so they import prometheus_client with this environment.
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(multiprocess_dir)
+    os.environ[SUPERVISOR_PID_ENV] = str(os.getpid())
+
+    shared_chromium: SharedChromium | None = None
+    if share_chromium:
+        shared_chromium = SharedChromium()
+        try:
+            os.environ["CHROMIUM_CDP_ENDPOINT"] = shared_chromium.start()
+        # Each worker then launches a browser of its own.
+        except Exception as e:  # noqa: BLE001
+            logger.error("Failed to start the shared Chromium, the workers launch their own: %s", e)
+            shared_chromium = None
+
+    if is_metrics_server_enabled():
+        serve_metrics_in_thread(get_metrics_port())
+
+    logger.info("Starting %d worker processes (Chromium %s)", workers, "shared" if shared_chromium else "per worker")
+    try:
+        uvicorn.run("app.pandoc_controller:app", host="", port=port, workers=workers, **load_tls_options())
+    finally:
+        if shared_chromium is not None:
+            shared_chromium.stop()
@@ -0,0 +1,151 @@
+-- docx_latex_bundle.lua
+--
+-- The filters of the DOCX -> LaTeX/PDF path, run as one --lua-filter.
+--
+-- Passed separately, each of these filters started a Lua interpreter of its
+-- own, loaded the pandoc modules into it and walked the document again. This
+-- bundle loads them all into one interpreter, in their usual order, and merges
+-- consecutive filters into one filter whenever that keeps their order: pandoc
+-- walks a typewise filter once per kind of element it handles (inline
+-- elements, inline lists, block elements, block lists, then Meta and Pandoc),
+-- so filters that handle, say, Span and Math share a single inline walk.
+--
+-- A filter joins the one before it when
+--
+--   * both walk typewise (a topdown filter always walks alone),
+--   * they handle different elements, and
+--   * it handles no kind of element that comes before a kind the merged filter
+--     already handles: an inline handler cannot join a filter with a Table
+--     handler, since it would then run before that handler instead of after.
+--     A Pandoc handler runs after everything, so nothing joins it.
+--
+-- Meta handlers move behind the later handlers of their filter, and filters
+-- that share a walk see each other's elements in document order rather than
+-- one after the other. So the filters listed here must not depend on what a
+-- later one does in their Meta handler, and must leave the elements a later one
+-- handles as they found them. The golden tests in
+-- tests/test_docx_latex_filter_bundle.py hold the bundle to the output of the
+-- separate filters. A filter that cannot join the one before it starts a
+-- filter of its own, so a change to one of them may cost a walk, but never
+-- reorders its handlers.
+
+-- In the order of DOCX_LATEX_FILTERS in app/conversion_pipeline.py, which runs
+-- them one by one when the bundle is turned off.
+local COMPONENTS = {
+  "docx_text_decorations",
+  "docx_colors_to_latex",
+  "docx_math_colors_to_latex",
+  "docx_paragraphs_to_latex",
+  "docx_lists_to_latex",
+  "docx_tables_to_latex",
+  "docx_caption_labels_to_latex",
+}
+
+-- The order in which a typewise walk applies the handlers of a filter.
+local INLINE, INLINES, BLOCK, BLOCKS, META, PANDOC = 1, 2, 3, 4, 5, 6
+
+local KIND = {
+  Inline = INLINE, Inlines = INLINES, Block = BLOCK, Blocks = BLOCKS, Meta = META, Pandoc = PANDOC,
+}
+for _, name in ipairs({
+  "Cite", "Code", "Emph", "Image", "LineBreak", "Link", "Math", "Note", "Quoted", "RawInline", "SmallCaps",
+  "SoftBreak", "Space", "Span", "Str", "Strikeout", "Strong", "Subscript", "Superscript", "Underline",
+}) do
+  KIND[name] = INLINE
+end
+for _, name in ipairs({
+  "BlockQuote", "BulletList", "CodeBlock", "DefinitionList", "Div", "Figure", "Header", "HorizontalRule",
+  "LineBlock", "OrderedList", "Para", "Plain", "RawBlock", "Table",
+}) do
+  KIND[name] = BLOCK
+end
+
+local DIRECTORY = PANDOC_SCRIPT_FILE:match("^(.*[/\\])") or ""
+
+-- The components the source has nothing for, as a comma-separated variable
+-- (-V skip-filters=docx_lists_to_latex,...): see app/content_features.py.
+local SKIPPED = {}
+local skip_variable = PANDOC_WRITER_OPTIONS and PANDOC_WRITER_OPTIONS.variables["skip-filters"]
+if skip_variable ~= nil then
+  for name in tostring(skip_variable):gmatch("[^,]+") do
+    SKIPPED[name] = true
+  end
+end
+
+-- The filters of one component, as pandoc would read them from its own file: a
+-- returned list of filters, a returned filter, or else its global handlers.
+-- Each component gets globals of its own, as it did in an interpreter of its own.
+local function load_component(name)
+  local globals = setmetatable({}, { __index = _G })
+  local chunk = assert(loadfile(DIRECTORY .. name .. ".lua", "t", globals))
+  local returned = chunk()
+  if type(returned) == "table" then
+    local filters = returned[1] ~= nil and returned or { returned }
+    for _, filter in ipairs(filters) do
+      for key in pairs(filter) do
+        if key ~= "traverse" and KIND[key] == nil then
+          error(name .. ".lua handles " .. key .. ", which the bundle cannot place")
+        end
+      end
+    end
+    return filters
+  end
+  local filter = {}
+  for key, value in pairs(globals) do
+    if KIND[key] and type(value) == "function" then
+      filter[key] = value
+    end
+  end
+  return { filter }
+end
+
+-- Whether a filter can join the merged one without running a handler of its
+-- own before one it used to follow. A Meta handler may move behind the body
+-- handlers, but not before a Pandoc handler, which sees the metadata too.
+local function can_join(merged, latest_kind, filter)
+  if merged.traverse == "topdown" or filter.traverse == "topdown" then
+    return false
+  end
+  for key in pairs(filter) do
+    if key ~= "traverse" then
+      if merged[key] then
+        return false
+      end
+      if KIND[key] < latest_kind and (KIND[key] ~= META or latest_kind == PANDOC) then
+        return false
+      end
+    end
+  end
+  return true
+end
+
+local function latest_kind_of(filter, latest_kind)
+  for key in pairs(filter) do
+    if KIND[key] and KIND[key] ~= META and KIND[key] > latest_kind then
+      latest_kind = KIND[key]
+    end
+  end
+  return latest_kind
+end
+
+local filters = {}
+local merged, latest_kind = nil, 0
+for _, name in ipairs(COMPONENTS) do
+  for _, filter in ipairs(SKIPPED[name] and {} or load_component(name)) do
+    if merged ~= nil and can_join(merged, latest_kind, filter) then
+      for key, handler in pairs(filter) do
+        merged[key] = handler
+      end
+    else
+      merged = {}
+      for key, handler in pairs(filter) do
+        merged[key] = handler
+      end
+      latest_kind = 0
+      filters[#filters + 1] = merged
+    end
+    latest_kind = latest_kind_of(filter, latest_kind)
+  end
+end
+
+return filters
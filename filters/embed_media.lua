@@ -0,0 +1,22 @@
+--[[
+Carry the media a reader extracted inside the document, as `data:` URIs.
+
+The DOCX, EPUB and ODT readers keep the images of a document in pandoc's media
+bag and point at them by name. The media bag is not part of the JSON AST, so a
+document read once into JSON and rendered to several targets afterwards would
+lose its images. This filter runs on the reading side only: an image found in
+the media bag gets its contents as a `data:` URI, which every writer embeds and
+which the sandbox and strip_document_images.lua both let through.
+
+An image the media bag does not hold, an address the document names, is left
+as it is.
+]]
+
+function Image(element)
+  local mime_type, contents = pandoc.mediabag.lookup(element.src)
+  if not contents then
+    return nil
+  end
+  element.src = pandoc.mediabag.make_data_uri(mime_type or "application/octet-stream", contents)
+  return element
+end
@@ -20,6 +20,13 @@ PROTECTED_ENDPOINTS = [
     ("post", "/convert/html/to/pptx-with-template"),
     ("get", "/docx-template"),
     ("get", "/pptx-template"),
+    ("post", "/jobs/convert/html/to/docx"),
+    ("get", "/jobs/0123456789abcdef0123456789abcdef"),
+    ("get", "/jobs/0123456789abcdef0123456789abcdef/result"),
+    ("delete", "/jobs/0123456789abcdef0123456789abcdef"),
+    ("put", "/templates/corporate"),
+    ("get", "/templates/corporate"),
+    ("delete", "/templates/corporate"),
 ]
 
 
@@ -191,6 +198,9 @@ def test_conversion_open_without_key(monkeypatch: pytest.MonkeyPatch) -> None:
         ("/convert/html/to/docx-with-template", True),
         ("/convert/html/to/pptx-with-template", True),
         ("/convert/html/to/unknown", True),
+        ("/jobs/convert/html/to/pdf", True),
+        ("/jobs/0123456789abcdef0123456789abcdef/result", True),
+        ("/templates/corporate", True),
         ("/docx-template", True),
         ("/pptx-template", True),
         ("/docx-template/", True),
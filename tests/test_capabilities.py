@@ -0,0 +1,237 @@
+"""Tests for the startup-probed capability registry."""
+
+import asyncio
+import os
+import subprocess
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.capabilities import (
+    Capabilities,
+    CapabilityRegistry,
+    get_capabilities,
+    get_capability_registry,
+    is_tectonic_bundle_cached,
+    probe_pandoc_list,
+    probe_pandoc_version,
+    probe_tectonic,
+    reset_capability_registry,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    """Reset the global registry before and after each test."""
+    reset_capability_registry()
+    yield
+    reset_capability_registry()
+
+
+def completed(stdout: bytes) -> MagicMock:
+    """A finished process as anyio.run_process returns it."""
+    return MagicMock(stdout=stdout)
+
+
+def fake_binaries(command: list[str], **_kwargs) -> MagicMock:
+    """Answer the probes the way pandoc and tectonic would."""
+    outputs = {
+        ("/usr/local/bin/pandoc", "--version"): b"pandoc 3.8.3\nFeatures: +server +lua\n",
+        ("/usr/local/bin/pandoc", "--list-input-formats"): b"docx\nhtml\nmarkdown\n",
+        ("/usr/local/bin/pandoc", "--list-output-formats"): b"docx\nlatex\n",
+        ("/usr/local/bin/pandoc", "--list-extensions"): b"+smart\n-raw_html\n",
+        ("/usr/bin/tectonic", "--version"): b"Tectonic 0.16.9\n",
+    }
+    return completed(outputs[tuple(command)])
+
+
+def sleep_then_block(intervals: int):
+    """Let the refresh loop pass the given number of intervals at once, then hold it."""
+    remaining = intervals
+
+    async def sleep(_seconds: float) -> None:
+        nonlocal remaining
+        if remaining == 0:
+            await asyncio.Event().wait()
+        remaining -= 1
+
+    return sleep
+
+
+def refresh_then_signal(outcomes: list, done: asyncio.Event):
+    """Play back the given refresh outcomes and set ``done`` with the last one."""
+    remaining = list(outcomes)
+
+    def refresh() -> Capabilities:
+        outcome = remaining.pop(0)
+        if not remaining:
+            done.set()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return refresh
+
+
+@pytest.mark.asyncio
+async def test_probe_pandoc_version():
+    with patch("anyio.run_process", AsyncMock(return_value=completed(b"pandoc 3.1.9\nCopyright (C) 2006-2023 John MacFarlane\n"))) as mock_run:
+        assert await probe_pandoc_version() == "3.1.9"
+
+    mock_run.assert_awaited_once_with(["/usr/local/bin/pandoc", "--version"], check=True)
+
+
+@pytest.mark.asyncio
+async def test_probe_pandoc_version_returns_none_on_error():
+    with patch("anyio.run_process", AsyncMock(side_effect=subprocess.SubprocessError("Command failed"))):
+        assert await probe_pandoc_version() is None
+
+
+@pytest.mark.asyncio
+async def test_probe_pandoc_list():
+    with patch("anyio.run_process", AsyncMock(return_value=completed(b"docx\n\n html \n"))):
+        assert await probe_pandoc_list("--list-input-formats") == frozenset({"docx", "html"})
+
+
+@pytest.mark.asyncio
+async def test_probe_pandoc_list_is_empty_on_error():
+    with patch("anyio.run_process", AsyncMock(side_effect=FileNotFoundError("not found"))):
+        assert await probe_pandoc_list("--list-input-formats") == frozenset()
+
+
+@pytest.mark.asyncio
+async def test_probe_tectonic_available():
+    """Return available and the version when the tectonic command succeeds."""
+    with patch("anyio.run_process", AsyncMock(return_value=completed(b"Tectonic 0.16.9\n"))) as mock_run:
+        assert await probe_tectonic() == ("available", "0.16.9")
+
+    mock_run.assert_awaited_once_with(["/usr/bin/tectonic", "--version"], check=True)
+
+
+@pytest.mark.parametrize("error", [FileNotFoundError("not found"), subprocess.CalledProcessError(1, "tectonic")])
+@pytest.mark.asyncio
+async def test_probe_tectonic_unavailable(error):
+    """Return unavailable when tectonic is missing or fails."""
+    with patch("anyio.run_process", AsyncMock(side_effect=error)):
+        assert await probe_tectonic() == ("unavailable", None)
+
+
+@pytest.mark.asyncio
+async def test_probe_tectonic_unknown_on_unexpected_error():
+    """Return unknown when an unexpected error occurs."""
+    with patch("anyio.run_process", AsyncMock(side_effect=RuntimeError("boom"))):
+        assert await probe_tectonic() == ("unknown", None)
+
+
+def test_is_tectonic_bundle_cached(tmp_path):
+    with patch.dict(os.environ, {"TECTONIC_CACHE_DIR": str(tmp_path)}):
+        assert not is_tectonic_bundle_cached()
+        (tmp_path / "formats").mkdir()
+        assert is_tectonic_bundle_cached()
+
+
+def test_is_tectonic_bundle_cached_without_cache_dir(tmp_path):
+    with patch.dict(os.environ, {"TECTONIC_CACHE_DIR": str(tmp_path / "missing")}):
+        assert not is_tectonic_bundle_cached()
+
+
+def test_snapshot_is_empty_before_the_first_refresh():
+    capabilities = CapabilityRegistry(refresh_interval=0).get()
+
+    assert capabilities == Capabilities()
+    assert capabilities.pandoc_version is None
+    assert capabilities.probed_at is None
+
+
+@pytest.mark.asyncio
+async def test_refresh_probes_all_binaries():
+    registry = CapabilityRegistry(refresh_interval=0)
+    manager = MagicMock()
+    manager.get_version.return_value = "148.0.7778.96"
+
+    with (
+        patch("anyio.run_process", AsyncMock(side_effect=fake_binaries)),
+        patch("app.capabilities.get_chromium_manager", return_value=manager),
+        patch("app.capabilities.is_tectonic_bundle_cached", return_value=True),
+    ):
+        capabilities = await registry.refresh()
+
+    assert capabilities is registry.get()
+    assert capabilities.pandoc_version == "3.8.3"
+    assert capabilities.input_formats == frozenset({"docx", "html", "markdown"})
+    assert capabilities.output_formats == frozenset({"docx", "latex"})
+    assert capabilities.extensions == frozenset({"smart", "raw_html"})
+    assert capabilities.tectonic == "available"
+    assert capabilities.tectonic_version == "0.16.9"
+    assert capabilities.tectonic_bundle_cached
+    assert capabilities.chromium_version == "148.0.7778.96"
+    assert capabilities.probed_at is not None
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_read_without_spawning_processes():
+    registry = CapabilityRegistry(refresh_interval=0)
+    with patch("anyio.run_process", AsyncMock(side_effect=fake_binaries)) as mock_run, patch("app.capabilities.get_chromium_manager"):
+        await registry.refresh()
+        probes = mock_run.await_count
+        for _ in range(10):
+            registry.get()
+
+    assert probes == 5
+    assert mock_run.await_count == probes
+
+
+@pytest.mark.asyncio
+async def test_periodic_refresh_reprobes_until_stopped():
+    registry = CapabilityRegistry(refresh_interval=1)
+    refreshed = asyncio.Event()
+    refresh = AsyncMock(side_effect=refresh_then_signal([Capabilities(), Capabilities()], refreshed))
+
+    with patch.object(registry, "refresh", refresh), patch("app.capabilities.asyncio.sleep", sleep_then_block(2)):
+        registry.start_periodic_refresh()
+        await asyncio.wait_for(refreshed.wait(), 1)
+        await registry.stop_periodic_refresh()
+
+    assert refresh.await_count == 2
+    assert registry._refresh_task is None
+
+
+@pytest.mark.asyncio
+async def test_failed_periodic_refresh_keeps_running():
+    registry = CapabilityRegistry(refresh_interval=1)
+    refreshed = asyncio.Event()
+    refresh = AsyncMock(side_effect=refresh_then_signal([RuntimeError("boom"), Capabilities()], refreshed))
+
+    with patch.object(registry, "refresh", refresh), patch("app.capabilities.asyncio.sleep", sleep_then_block(2)):
+        registry.start_periodic_refresh()
+        await asyncio.wait_for(refreshed.wait(), 1)
+        await registry.stop_periodic_refresh()
+
+    assert refresh.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_no_periodic_refresh_by_default():
+    registry = CapabilityRegistry()
+
+    registry.start_periodic_refresh()
+
+    assert registry.refresh_interval == 0
+    assert registry._refresh_task is None
+    await registry.stop_periodic_refresh()
+
+
+def test_refresh_interval_is_read_from_environment():
+    with patch.dict(os.environ, {"CAPABILITIES_REFRESH_INTERVAL": "300"}):
+        assert CapabilityRegistry().refresh_interval == 300
+
+
+@pytest.mark.parametrize("value", ["-1", "86401", "hourly"])
+def test_invalid_refresh_interval_falls_back_to_default(value):
+    with patch.dict(os.environ, {"CAPABILITIES_REFRESH_INTERVAL": value}):
+        assert CapabilityRegistry().refresh_interval == 0
+
+
+def test_get_capability_registry_returns_singleton():
+    assert get_capability_registry() is get_capability_registry()
+    assert get_capabilities() is get_capability_registry().get()
@@ -1679,3 +1679,28 @@ async def test_chromium_manager_error_rate_only_successes():
     # Error rate should be 0% (SVG conversions don't affect HTML error rate)
     error_rate = metrics_obj.get_error_rate()
     assert error_rate == 0.0
+
+
+@pytest.mark.asyncio
+async def test_chromium_manager_connects_to_a_shared_browser():
+    """With a CDP endpoint the manager connects instead of launching a browser."""
+    playwright = MagicMock()
+    playwright.chromium.connect_over_cdp = AsyncMock(return_value="shared browser")
+    playwright.chromium.launch = AsyncMock()
+    with patch.dict(os.environ, {"CHROMIUM_CDP_ENDPOINT": "ws://127.0.0.1:40000/devtools/browser/1"}):
+        manager = ChromiumManager()
+
+    assert await manager._connect_or_launch(playwright) == "shared browser"
+    playwright.chromium.connect_over_cdp.assert_awaited_once_with("ws://127.0.0.1:40000/devtools/browser/1")
+    playwright.chromium.launch.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_chromium_manager_launches_a_browser_when_the_shared_one_is_gone():
+    playwright = MagicMock()
+    playwright.chromium.connect_over_cdp = AsyncMock(side_effect=ConnectionRefusedError("gone"))
+    playwright.chromium.launch = AsyncMock(return_value="own browser")
+    manager = ChromiumManager(config=ChromiumConfig(cdp_endpoint="ws://127.0.0.1:40000/devtools/browser/1"))
+
+    assert await manager._connect_or_launch(playwright) == "own browser"
+    assert playwright.chromium.launch.await_args.kwargs["headless"] is True
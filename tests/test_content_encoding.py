@@ -0,0 +1,192 @@
+"""Tests for compressed request and response bodies."""
+
+import gzip
+import os
+import zlib
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from app import content_encoding, pandoc_controller
+from app.content_encoding import DECODED_CHUNK_SIZE, RequestDecompressionMiddleware, ResponseCompressionMiddleware, choose_encoding, is_textual
+from app.request_size_limit import RequestSizeLimitMiddleware
+
+requires_zstd = pytest.mark.skipif(content_encoding.zstd is None, reason="Python was built without zstd")
+
+HTML = b"<html><body>" + b"<p>Lorem ipsum dolor sit amet</p>" * 200 + b"</body></html>"
+
+
+def build_app(max_body_size: int = 10 * 1024 * 1024) -> FastAPI:
+    app = FastAPI()
+    chunk_sizes: list[int] = []
+    app.state.chunk_sizes = chunk_sizes
+
+    @app.get("/html")
+    def html() -> Response:
+        return Response(HTML, media_type="text/html", headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    def small() -> Response:
+        return Response(b"<p>x</p>", media_type="text/html")
+
+    @app.get("/pdf")
+    def pdf() -> Response:
+        return Response(b"%PDF" * 1000, media_type="application/pdf")
+
+    @app.post("/echo")
+    async def echo(request: Request) -> Response:
+        body = b""
+        async for chunk in request.stream():
+            chunk_sizes.append(len(chunk))
+            body += chunk
+        return PlainTextResponse(f"{len(body)} {request.headers.get('content-encoding')}")
+
+    app.add_middleware(RequestSizeLimitMiddleware, get_max_body_size=lambda: max_body_size)
+    app.add_middleware(RequestDecompressionMiddleware)
+    app.add_middleware(ResponseCompressionMiddleware)
+    return app
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        (None, None),
+        ("", None),
+        ("gzip", "gzip"),
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("zstd;q=0.5, gzip", "gzip"),
+        ("br", None),
+        ("*", "zstd"),
+        ("*;q=0, gzip;q=0.1", "gzip"),
+        ("gzip;q=0, zstd;q=0", None),
+        ("gzip;q=oops", None),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    with patch("app.content_encoding.get_supported_encodings", return_value=("zstd", "gzip")):
+        assert choose_encoding(accept_encoding) == expected
+
+
+def test_choose_encoding_skips_what_python_cannot_do():
+    with patch("app.content_encoding.get_supported_encodings", return_value=("gzip",)):
+        assert choose_encoding("zstd") is None
+        assert choose_encoding("zstd, gzip;q=0.5") == "gzip"
+
+
+@pytest.mark.parametrize(
+    ("media_type", "expected"),
+    [("text/html; charset=utf-8", True), ("text/plain", True), ("application/json", True), ("application/x-latex", True), ("application/rtf", True), ("application/pdf", False), ("application/octet-stream", False), ("", False)],
+)
+def test_is_textual(media_type, expected):
+    assert is_textual(media_type) is expected
+
+
+def test_textual_response_is_compressed():
+    response = TestClient(build_app()).get("/html", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    # httpx decompresses the body.
+    assert response.content == HTML
+    assert response.num_bytes_downloaded < len(HTML) / 10
+
+
+@pytest.mark.parametrize(("path", "headers"), [("/html", {"Accept-Encoding": "identity"}), ("/small", {"Accept-Encoding": "gzip"}), ("/pdf", {"Accept-Encoding": "gzip"})])
+def test_response_is_sent_as_it_is(path, headers):
+    response = TestClient(build_app()).get(path, headers=headers)
+
+    assert "content-encoding" not in response.headers
+    assert response.status_code == 200
+
+
+def test_response_compression_can_be_turned_off():
+    with patch.dict(os.environ, {"RESPONSE_COMPRESSION_ENABLED": "false"}):
+        response = TestClient(build_app()).get("/html", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"abc"'
+
+
+@requires_zstd
+def test_response_is_compressed_with_zstd():
+    response = TestClient(build_app()).get("/html", headers={"Accept-Encoding": "zstd"})
+
+    assert response.headers["content-encoding"] == "zstd"
+
+
+def test_gzip_request_body_is_decompressed():
+    body = b"# Title\n" * 100_000
+    response = TestClient(build_app()).post("/echo", content=gzip.compress(body), headers={"Content-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.text == f"{len(body)} None"
+
+
+def test_decompressed_body_reaches_the_application_in_bounded_pieces():
+    app = build_app()
+    TestClient(app).post("/echo", content=gzip.compress(b"\0" * (5 * DECODED_CHUNK_SIZE)), headers={"Content-Encoding": "gzip"})
+
+    assert max(app.state.chunk_sizes) <= DECODED_CHUNK_SIZE
+    assert sum(app.state.chunk_sizes) == 5 * DECODED_CHUNK_SIZE
+
+
+def test_concatenated_gzip_members_are_read_to_the_end():
+    response = TestClient(build_app()).post("/echo", content=gzip.compress(b"a" * 10) + gzip.compress(b"b" * 20), headers={"Content-Encoding": "gzip"})
+
+    assert response.text == "30 None"
+
+
+@requires_zstd
+def test_zstd_request_body_is_decompressed():
+    body = b"<p>zstd</p>" * 10_000
+    response = TestClient(build_app()).post("/echo", content=content_encoding.zstd.compress(body), headers={"Content-Encoding": "zstd"})
+
+    assert response.text == f"{len(body)} None"
+
+
+def test_body_limit_applies_to_the_decompressed_body():
+    bomb = gzip.compress(b"\0" * (10 * 1024 * 1024))
+    assert len(bomb) < 64 * 1024
+
+    # The application sees the disconnect the limit leaves it.
+    response = TestClient(build_app(max_body_size=1024 * 1024), raise_server_exceptions=False).post("/echo", content=bomb, headers={"Content-Encoding": "gzip"})
+
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("content", [b"not gzip at all", gzip.compress(b"x" * 1000)[:-10]])
+def test_corrupt_or_truncated_body_is_refused(content):
+    response = TestClient(build_app(), raise_server_exceptions=False).post("/echo", content=content, headers={"Content-Encoding": "gzip"})
+
+    assert response.status_code == 400
+    assert response.text.startswith("Invalid compressed request body")
+
+
+def test_unsupported_content_encoding_is_refused():
+    response = TestClient(build_app()).post("/echo", content=b"x", headers={"Content-Encoding": "br"})
+
+    assert response.status_code == 415
+    assert "gzip" in response.headers["accept-encoding"]
+
+
+def test_convert_reads_a_compressed_source_and_compresses_its_output(tmp_path):
+    output_path = tmp_path / "output.html"
+    output_path.write_bytes(HTML)
+    seen = {}
+
+    async def convert_to_file(source, *_args, **_kwargs) -> Path:
+        seen["source"] = source
+        return output_path
+
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(side_effect=convert_to_file)):
+        response = TestClient(pandoc_controller.app).post("/convert/markdown/to/html", content=zlib.compress(b"# Title", wbits=31), headers={"Content-Encoding": "gzip", "Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert seen["source"] == b"# Title"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == HTML
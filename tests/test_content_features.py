@@ -0,0 +1,86 @@
+"""Tests for the scan of a source for the constructs its optional stages handle."""
+
+import io
+import zipfile
+
+import pytest
+
+from app import html_image_pre_process, html_lists_pre_process, html_math_color_pre_process, html_paragraph_pre_process
+from app.content_features import CAPTIONS, IMAGES, INLINE_CSS, LISTS, MATH, TABLES, scan_content
+
+_DOCUMENT = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math"><w:body>{}</w:body></w:document>'
+
+
+def _docx(parts: dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as docx:
+        for name, body in parts.items():
+            docx.writestr(name, _DOCUMENT.format(body))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    ("html", "expected"),
+    [
+        (b"<p>Plain text</p>", set()),
+        (b'<p style="text-align: center">x</p>', {INLINE_CSS}),
+        (b"<div class='pandoc-para'>x</div>", {INLINE_CSS}),
+        (b"<UL><li>x</li></UL><ol start=2><li>y</li></ol>", {LISTS}),
+        (b"<table><tr><td>x</td></tr></table>", {TABLES}),
+        (b'<img src="data:image/png;base64,AA"/>', {IMAGES}),
+        (b'<script type="math/tex">x^2</script>', {MATH}),
+        (b'<p class="polarion-rte-caption-paragraph">Table 1</p>', {CAPTIONS}),
+    ],
+)
+def test_html_features(html, expected):
+    assert scan_content(html, "html") == expected
+
+
+def test_html_lookalikes_are_not_features():
+    assert scan_content(b"<p>An <tablet>, an <ulcer>, an <imgur> link</p>", "html") == frozenset()
+
+
+@pytest.mark.parametrize("encoded", ["<table>".encode("utf-16"), "<table>".encode("utf-16-le")])
+def test_html_in_a_wide_encoding_is_not_scanned(encoded):
+    assert scan_content(encoded, "html") is None
+
+
+def test_docx_features_are_found_in_every_body_part():
+    source = _docx(
+        {
+            "word/document.xml": '<w:p><w:pPr><w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr></w:pPr></w:p>',
+            "word/footnotes.xml": "<w:tbl><w:tr/></w:tbl>",
+            "word/header1.xml": "<w:p><m:oMathPara><m:oMath/></m:oMathPara></w:p>",
+        }
+    )
+
+    assert scan_content(source, "docx") == {LISTS, TABLES, MATH}
+
+
+def test_docx_features_do_not_depend_on_the_namespace_prefix():
+    source = _docx({"word/document.xml": "<wp:tbl xmlns:wp='http://schemas.openxmlformats.org/wordprocessingml/2006/main'><wp:tblPr/></wp:tbl>"})
+
+    assert scan_content(source, "docx") == {TABLES}
+
+
+def test_docx_without_features():
+    source = _docx({"word/document.xml": "<w:tblPr/><w:p><w:r><w:t>plain, no w:tbl or numPr</w:t></w:r></w:p>", "word/media/chart.xml": "<w:tbl/>"})
+
+    assert scan_content(source, "docx") == frozenset()
+
+
+def test_a_broken_docx_is_not_scanned():
+    assert scan_content(b"PK not a zip", "docx") is None
+
+
+def test_other_formats_are_not_scanned():
+    assert scan_content(b"# Title\n\n- item", "markdown") is None
+
+
+def test_html_steps_leave_a_source_without_their_construct_alone():
+    """What the scan lets a source skip would not have changed it."""
+    source = b'<html><body><h1 class="title">Title</h1><p>Text with <b>bold</b>, <a href="#x">a link</a> and an <em>emphasis</em>.</p></body></html>'
+
+    assert scan_content(source, "html") == frozenset()
+    for step in (html_lists_pre_process, html_paragraph_pre_process, html_math_color_pre_process, html_image_pre_process):
+        assert step.preprocess(source) == source
@@ -0,0 +1,67 @@
+"""Tests for the packaging of multi-target conversion outputs."""
+
+import email
+import zipfile
+
+import pytest
+
+from app.conversion_bundle import BundleEntry, create_boundary, wants_multipart, write_multipart, write_zip
+
+
+@pytest.fixture
+def entries(tmp_path) -> list[BundleEntry]:
+    pdf_path = tmp_path / "pandoc-output"
+    pdf_path.write_bytes(b"%PDF-1.7")
+    return [
+        BundleEntry("docx", "report.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", b"PK docx"),
+        BundleEntry("pdf", "report.pdf", "application/pdf", pdf_path),
+        BundleEntry("html", "report.html", "text/html", b"<p>report</p>"),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("accept", "expected"),
+    [
+        (None, False),
+        ("", False),
+        ("*/*", False),
+        ("application/zip", False),
+        ("multipart/mixed", True),
+        ("text/plain, Multipart/Mixed; q=0.9", True),
+        ("multipart/mixed, application/zip", False),
+    ],
+)
+def test_wants_multipart(accept, expected):
+    assert wants_multipart(accept) is expected
+
+
+def test_boundaries_differ():
+    assert create_boundary() != create_boundary()
+
+
+def test_write_zip(entries, tmp_path):
+    destination = tmp_path / "bundle.zip"
+
+    write_zip(entries, destination)
+
+    with zipfile.ZipFile(destination) as archive:
+        assert archive.namelist() == ["report.docx", "report.pdf", "report.html"]
+        assert archive.read("report.pdf") == b"%PDF-1.7"
+        assert archive.read("report.html") == b"<p>report</p>"
+        # Compressed containers are stored, text is deflated.
+        assert archive.getinfo("report.docx").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("report.pdf").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("report.html").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_write_multipart(entries, tmp_path):
+    destination = tmp_path / "bundle"
+    boundary = create_boundary()
+
+    write_multipart(entries, destination, boundary)
+
+    message = email.message_from_bytes(f"Content-Type: multipart/mixed; boundary={boundary}\r\n\r\n".encode() + destination.read_bytes())
+    parts = message.get_payload()
+    assert [part.get_content_type() for part in parts] == ["application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/pdf", "text/html"]
+    assert [part.get_filename() for part in parts] == ["report.docx", "report.pdf", "report.html"]
+    assert [part.get_payload(decode=True) for part in parts] == [b"PK docx", b"%PDF-1.7", b"<p>report</p>"]
@@ -0,0 +1,234 @@
+"""Tests for the cancellation of conversions nobody waits for anymore."""
+
+import asyncio
+import os
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+from starlette.responses import PlainTextResponse
+
+from app.conversion_cancellation import ConversionCancellationMiddleware, get_conversion_timeout, get_requested_timeout
+
+
+def cancelled_count(target_format: str, reason: str) -> float:
+    return REGISTRY.get_sample_value("pandoc_cancelled_conversions_total", {"target_format": target_format, "reason": reason}) or 0.0
+
+
+def make_scope(path: str = "/convert/markdown/to/pdf", query_string: bytes = b"", headers: list | None = None, method: str = "POST") -> dict:
+    return {"type": "http", "method": method, "path": path, "query_string": query_string, "headers": headers or []}
+
+
+class Connection:
+    """The server side of one request: a body, a client that may leave, and what was sent back."""
+
+    def __init__(self, body: bytes = b"# x") -> None:
+        self.messages = [{"type": "http.request", "body": body, "more_body": False}]
+        self.gone = asyncio.Event()
+        self.sent: list[dict] = []
+
+    async def receive(self) -> dict:
+        if self.messages:
+            return self.messages.pop(0)
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message: dict) -> None:
+        self.sent.append(message)
+
+    @property
+    def status(self) -> int | None:
+        return next((message["status"] for message in self.sent if message["type"] == "http.response.start"), None)
+
+
+def slow_app(events: list[str], duration: float = 5.0):
+    """A conversion that reads its body, then takes a while and notices when it is cancelled."""
+
+    async def app(scope, receive, send) -> None:
+        await receive()
+        events.append("started")
+        try:
+            await asyncio.sleep(duration)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            # The cleanup of a cancelled conversion may await, too.
+            await asyncio.sleep(0)
+            events.append("cleaned up")
+            raise
+        await PlainTextResponse("converted")(scope, receive, send)
+
+    return app
+
+
+@pytest.mark.parametrize(
+    ("query_string", "headers", "timeout"),
+    [
+        (b"", [], None),
+        (b"timeout=30", [], 30.0),
+        (b"file_name=x.pdf&timeout=2.5", [], 2.5),
+        (b"", [(b"x-conversion-timeout", b"45")], 45.0),
+        (b"timeout=10", [(b"x-conversion-timeout", b"45")], 10.0),
+    ],
+)
+def test_get_requested_timeout(query_string, headers, timeout):
+    assert get_requested_timeout(make_scope(query_string=query_string, headers=headers)) == timeout
+
+
+@pytest.mark.parametrize("value", [b"0", b"-1", b"soon", b"inf", b"nan"])
+def test_get_requested_timeout_rejects_invalid_values(value):
+    with pytest.raises(ValueError, match=r"Timeout|could not convert"):
+        get_requested_timeout(make_scope(query_string=b"timeout=" + value))
+
+
+def test_conversion_timeout_is_read_from_environment():
+    with patch.dict(os.environ, {"CONVERSION_TIMEOUT": "120"}):
+        assert get_conversion_timeout() == 120
+
+
+@pytest.mark.parametrize("value", ["-1", "86401", "long"])
+def test_invalid_conversion_timeout_falls_back_to_default(value):
+    with patch.dict(os.environ, {"CONVERSION_TIMEOUT": value}):
+        assert get_conversion_timeout() == 600
+
+
+@pytest.mark.parametrize(
+    ("default_timeout", "query_string", "timeout"),
+    [
+        (600, b"", 600),
+        (600, b"timeout=30", 30),
+        # The server default is also the longest deadline a client gets.
+        (600, b"timeout=3600", 600),
+        (0, b"", None),
+        (0, b"timeout=3600", 3600),
+    ],
+)
+def test_get_timeout(default_timeout, query_string, timeout):
+    middleware = ConversionCancellationMiddleware(slow_app([]), default_timeout=default_timeout)
+
+    assert middleware.get_timeout(make_scope(query_string=query_string)) == timeout
+
+
+@pytest.mark.asyncio
+async def test_conversion_within_its_deadline_completes():
+    events: list[str] = []
+    connection = Connection()
+    middleware = ConversionCancellationMiddleware(slow_app(events, duration=0.01), default_timeout=5)
+
+    await middleware(make_scope(), connection.receive, connection.send)
+
+    assert events == ["started"]
+    assert connection.status == 200
+
+
+@pytest.mark.asyncio
+async def test_deadline_cancels_the_conversion_with_504():
+    events: list[str] = []
+    connection = Connection()
+    middleware = ConversionCancellationMiddleware(slow_app(events), default_timeout=600)
+    before = cancelled_count("pdf", "deadline")
+
+    await middleware(make_scope(query_string=b"timeout=0.05"), connection.receive, connection.send)
+
+    assert events == ["started", "cancelled", "cleaned up"]
+    assert connection.status == 504
+    assert connection.sent[-1]["body"] == b"Conversion timed out after 0.05 seconds"
+    assert cancelled_count("pdf", "deadline") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_the_conversion():
+    events: list[str] = []
+    connection = Connection()
+    middleware = ConversionCancellationMiddleware(slow_app(events), default_timeout=600)
+    before = cancelled_count("docx", "disconnect")
+
+    call = asyncio.create_task(middleware(make_scope(path="/convert/html/to/docx"), connection.receive, connection.send))
+    await asyncio.sleep(0.05)
+    connection.gone.set()
+    await asyncio.wait_for(call, 1)
+
+    assert events == ["started", "cancelled", "cleaned up"]
+    assert connection.sent == []
+    assert cancelled_count("docx", "disconnect") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_started_response_is_neither_timed_nor_cancelled():
+    events: list[str] = []
+    connection = Connection()
+
+    async def app(scope, receive, send) -> None:
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        connection.gone.set()
+        await asyncio.sleep(0.1)
+        events.append("sent")
+        await send({"type": "http.response.body", "body": b"converted"})
+
+    middleware = ConversionCancellationMiddleware(app, default_timeout=600)
+
+    await middleware(make_scope(query_string=b"timeout=0.05"), connection.receive, connection.send)
+
+    assert events == ["sent"]
+    assert connection.status == 200
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_learns_of_the_disconnect_from_the_watcher():
+    """After the body, a receive of the application waits for the disconnect the watcher sees."""
+    received: list[str] = []
+    connection = Connection()
+
+    async def app(scope, receive, send) -> None:
+        await receive()
+        # A StreamingResponse listens for the disconnect while it sends.
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        received.append((await receive())["type"])
+
+    middleware = ConversionCancellationMiddleware(app, default_timeout=600)
+    call = asyncio.create_task(middleware(make_scope(), connection.receive, connection.send))
+    await asyncio.sleep(0.01)
+    connection.gone.set()
+    await asyncio.wait_for(call, 1)
+
+    assert received == ["http.disconnect"]
+
+
+@pytest.mark.asyncio
+async def test_invalid_timeout_is_rejected_with_400():
+    events: list[str] = []
+    connection = Connection()
+    middleware = ConversionCancellationMiddleware(slow_app(events), default_timeout=600)
+
+    await middleware(make_scope(query_string=b"timeout=soon"), connection.receive, connection.send)
+
+    assert events == []
+    assert connection.status == 400
+
+
+@pytest.mark.asyncio
+async def test_other_requests_are_not_timed():
+    events: list[str] = []
+    connection = Connection()
+    middleware = ConversionCancellationMiddleware(slow_app(events, duration=0.1), default_timeout=600)
+
+    await middleware(make_scope(path="/version", method="GET", query_string=b"timeout=0.01"), connection.receive, connection.send)
+
+    assert events == ["started"]
+    assert connection.status == 200
+
+
+@pytest.mark.asyncio
+async def test_server_cancellation_cancels_the_conversion():
+    events: list[str] = []
+    connection = Connection()
+    middleware = ConversionCancellationMiddleware(slow_app(events), default_timeout=600)
+
+    call = asyncio.create_task(middleware(make_scope(), connection.receive, connection.send))
+    await asyncio.sleep(0.01)
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    await asyncio.sleep(0.01)
+
+    assert events == ["started", "cancelled", "cleaned up"]
@@ -0,0 +1,307 @@
+"""Tests for the bounded, non-blocking pandoc executor."""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.conversion_executor import ConversionExecutor, get_conversion_executor, kill_process_group, reset_conversion_executor
+
+
+@pytest.fixture(autouse=True)
+def reset_executor():
+    """Reset the global executor before and after each test."""
+    reset_conversion_executor()
+    yield
+    reset_conversion_executor()
+
+
+def python_cmd(code: str) -> list[str]:
+    """A command line that runs a snippet of Python, standing in for pandoc."""
+    return [sys.executable, "-c", code]
+
+
+@pytest.mark.asyncio
+async def test_run_succeeds_for_zero_exit_status():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+
+    await executor.run(python_cmd("pass"))
+
+    assert executor.get_metrics()["total_admitted"] == 1
+    assert executor.get_active_conversions() == 0
+
+
+@pytest.mark.asyncio
+async def test_run_raises_called_process_error_for_non_zero_exit_status():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    cmd = python_cmd("raise SystemExit(3)")
+
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        await executor.run(cmd)
+
+    assert exc_info.value.returncode == 3
+    assert exc_info.value.cmd == cmd
+    assert executor.get_active_conversions() == 0
+
+
+@pytest.mark.asyncio
+async def test_run_piped_feeds_stdin_and_returns_stdout():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    source = b"# Title\n" * 100_000
+
+    # More than a pipe buffer each way: neither side may wait for the other.
+    output = await executor.run_piped(python_cmd("import sys; sys.stdout.buffer.write(sys.stdin.buffer.read().upper())"), source)
+
+    assert output == source.upper()
+    assert executor.get_active_conversions() == 0
+
+
+@pytest.mark.asyncio
+async def test_run_piped_without_source_reads_no_stdin():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+
+    assert await executor.run_piped(python_cmd("import sys; sys.stdout.write(repr(sys.stdin.read()))"), None) == b"''"
+
+
+@pytest.mark.asyncio
+async def test_run_piped_raises_called_process_error_for_non_zero_exit_status():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        await executor.run_piped(python_cmd("raise SystemExit(64)"), b"x")
+
+    assert exc_info.value.returncode == 64
+
+
+@pytest.mark.asyncio
+async def test_run_reaps_in_a_worker_thread_without_pidfds(monkeypatch):
+    monkeypatch.delattr(os, "pidfd_open", raising=False)
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+
+    with patch("app.conversion_executor.os.wait4", wraps=os.wait4) as wait4:
+        output = await executor.run_piped(python_cmd("import sys; sys.stdout.buffer.write(sys.stdin.buffer.read())"), b"macOS")
+
+    assert output == b"macOS"
+    wait4.assert_called_once()
+    assert executor.get_active_conversions() == 0
+
+
+@pytest.mark.asyncio
+async def test_run_does_not_block_the_event_loop():
+    """While pandoc runs, other coroutines keep being served."""
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    try:
+        await executor.run(python_cmd("import time; time.sleep(0.3)"))
+    finally:
+        ticker_task.cancel()
+
+    assert ticks >= 5
+
+
+@pytest.mark.asyncio
+async def test_admission_is_bounded_and_first_in_first_out():
+    executor = ConversionExecutor(max_concurrent_conversions=2)
+    running = 0
+    peak = 0
+    order: list[int] = []
+
+    async def convert(index: int) -> None:
+        nonlocal running, peak
+        async with executor.admit():
+            order.append(index)
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+    tasks = []
+    for index in range(6):
+        tasks.append(asyncio.create_task(convert(index)))
+        # Let each task reach the semaphore before the next one is created.
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    assert peak == 2
+    assert order == list(range(6))
+
+
+@pytest.mark.asyncio
+async def test_queue_metrics_track_waiting_conversions():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    release = asyncio.Event()
+
+    async def hold_slot() -> None:
+        async with executor.admit():
+            await release.wait()
+
+    holder = asyncio.create_task(hold_slot())
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(hold_slot()) for _ in range(3)]
+    await asyncio.sleep(0.01)
+
+    assert executor.get_active_conversions() == 1
+    assert executor.get_queue_size() == 3
+    assert executor.get_metrics()["queue_size"] == 3
+
+    release.set()
+    await asyncio.gather(holder, *waiters)
+
+    metrics = executor.get_metrics()
+    assert metrics["queue_size"] == 0
+    assert metrics["active_conversions"] == 0
+    assert metrics["max_queue_size"] == 3
+    assert metrics["total_admitted"] == 4
+    assert metrics["avg_queue_time_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    release = asyncio.Event()
+
+    async def hold_slot() -> None:
+        async with executor.admit():
+            await release.wait()
+
+    holder = asyncio.create_task(hold_slot())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold_slot())
+    await asyncio.sleep(0.01)
+    assert executor.get_queue_size() == 1
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert executor.get_queue_size() == 0
+    release.set()
+    await holder
+    assert executor.get_active_conversions() == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_run_kills_the_process(tmp_path):
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    marker = tmp_path / "finished"
+    task = asyncio.create_task(executor.run(python_cmd(f"import time; time.sleep(2); open({str(marker)!r}, 'w').close()")))
+    await asyncio.sleep(0.3)
+
+    started = time.time()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert time.time() - started < 1.5
+    assert executor.get_active_conversions() == 0
+    await asyncio.sleep(2)
+    assert not marker.exists()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_run_kills_the_processes_it_spawned(tmp_path):
+    """Like tectonic under pandoc, a grandchild goes with the process that started it."""
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    marker = tmp_path / "finished"
+    grandchild = f"import time; time.sleep(1.5); open({str(marker)!r}, 'w').close()"
+    task = asyncio.create_task(executor.run(python_cmd(f"import subprocess, sys; subprocess.run([sys.executable, '-c', {grandchild!r}])")))
+    await asyncio.sleep(0.5)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    await asyncio.sleep(2)
+    assert not marker.exists()
+
+
+def test_kill_process_group_kills_a_running_child():
+    process = subprocess.Popen(python_cmd("import time; time.sleep(30)"), start_new_session=True)
+
+    kill_process_group(process.pid)
+
+    assert process.wait(timeout=5) == -signal.SIGKILL
+
+
+def test_kill_process_group_leaves_the_group_of_a_reaped_child_alone():
+    """The pid of a reaped child may already lead someone else's group."""
+    process = subprocess.Popen(python_cmd("pass"), start_new_session=True)
+    process.wait()
+
+    with patch("app.conversion_executor.os.killpg") as killpg:
+        kill_process_group(process.pid)
+
+    killpg.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_saturated_once_the_queue_reaches_the_threshold():
+    executor = ConversionExecutor(max_concurrent_conversions=1, saturation_queue_size=2)
+    release = asyncio.Event()
+
+    async def hold_slot() -> None:
+        async with executor.admit():
+            await release.wait()
+
+    holder = asyncio.create_task(hold_slot())
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(hold_slot())]
+    await asyncio.sleep(0.01)
+    assert not executor.is_saturated()
+
+    waiters.append(asyncio.create_task(hold_slot()))
+    await asyncio.sleep(0.01)
+    assert executor.is_saturated()
+
+    release.set()
+    await asyncio.gather(holder, *waiters)
+    assert not executor.is_saturated()
+
+
+def test_saturation_threshold_defaults_to_the_concurrency_limit():
+    with patch.dict(os.environ, {"PANDOC_MAX_CONCURRENT_CONVERSIONS": "7"}):
+        assert ConversionExecutor().saturation_queue_size == 7
+
+
+def test_saturation_threshold_is_read_from_environment():
+    with patch.dict(os.environ, {"PANDOC_SATURATION_QUEUE_SIZE": "25"}):
+        assert ConversionExecutor(max_concurrent_conversions=2).saturation_queue_size == 25
+
+
+@pytest.mark.parametrize("value", ["0", "10001", "many"])
+def test_invalid_saturation_threshold_falls_back_to_the_concurrency_limit(value):
+    with patch.dict(os.environ, {"PANDOC_SATURATION_QUEUE_SIZE": value}):
+        assert ConversionExecutor(max_concurrent_conversions=3).saturation_queue_size == 3
+
+
+def test_limit_is_read_from_environment():
+    with patch.dict(os.environ, {"PANDOC_MAX_CONCURRENT_CONVERSIONS": "7"}):
+        assert ConversionExecutor().max_concurrent_conversions == 7
+
+
+@pytest.mark.parametrize("value", ["0", "101", "many"])
+def test_invalid_limit_falls_back_to_default(value):
+    with patch.dict(os.environ, {"PANDOC_MAX_CONCURRENT_CONVERSIONS": value}):
+        assert ConversionExecutor().max_concurrent_conversions == 4
+
+
+def test_explicit_limit_out_of_range_is_rejected():
+    with pytest.raises(ValueError, match="between 1 and 100"):
+        ConversionExecutor(max_concurrent_conversions=0)
+
+
+def test_get_conversion_executor_returns_singleton():
+    assert get_conversion_executor() is get_conversion_executor()
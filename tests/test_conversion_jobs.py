@@ -0,0 +1,390 @@
+"""Tests for the on-disk job store and the workers of the job API."""
+
+import asyncio
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import anyio
+import pytest
+from prometheus_client import REGISTRY
+
+from app.conversion_jobs import (
+    INTERRUPTED_JOB_MESSAGE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    ConversionJob,
+    JobManager,
+    JobQueueFullError,
+    JobStore,
+    get_jobs_dir,
+    get_process_owner,
+    is_owner_alive,
+)
+
+
+def make_job(**kwargs) -> ConversionJob:
+    return ConversionJob(**{"source_format": "markdown", "target_format": "pdf", "file_name": "out.pdf", **kwargs})
+
+
+def finished_jobs(target_format: str, status: str) -> float:
+    return REGISTRY.get_sample_value("pandoc_jobs_total", {"target_format": target_format, "status": status}) or 0.0
+
+
+async def wait_for_status(manager: JobManager, job_id: str, *statuses: str) -> ConversionJob | None:
+    """Poll a job like a client would, until it reaches one of the statuses or is gone."""
+    for _ in range(200):
+        job = manager.get(job_id)
+        if job is None or job.status in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    pytest.fail(f"Job {job_id} never reached {statuses}")
+
+
+async def upper_case(_job: ConversionJob, source: Path) -> bytes:
+    return (await anyio.Path(source).read_bytes()).upper()
+
+
+@pytest.fixture
+def store(tmp_path) -> JobStore:
+    return JobStore(root=tmp_path / "jobs", ttl=60, max_bytes=1024 * 1024)
+
+
+def test_created_job_can_be_loaded(store):
+    job = make_job(paper_size="A4")
+
+    store.create(job, b"# x")
+
+    assert store.load(job.job_id) == job
+    assert store.get_source_path(job.job_id).read_bytes() == b"# x"
+
+
+def test_spooled_source_is_moved_into_the_store(store, tmp_path):
+    spooled = tmp_path / "pandoc-source-1"
+    spooled.write_bytes(b"spooled")
+    job = make_job()
+
+    store.create(job, spooled)
+
+    assert not spooled.exists()
+    assert store.get_source_path(job.job_id).read_bytes() == b"spooled"
+
+
+@pytest.mark.parametrize("job_id", ["unknown", "../../etc", "0123456789abcdef0123456789abcdef"])
+def test_load_of_an_unknown_job_returns_none(store, job_id):
+    assert store.load(job_id) is None
+
+
+def test_unreadable_metadata_is_no_job(store):
+    job = make_job()
+    store.create(job, b"# x")
+    (store.get_job_dir(job.job_id) / "job.json").write_text("{", encoding="utf-8")
+
+    assert store.load(job.job_id) is None
+
+
+def test_evict_removes_expired_jobs_only(tmp_path):
+    now = [1000.0]
+    store = JobStore(root=tmp_path, ttl=60, max_bytes=1024 * 1024, clock=lambda: now[0])
+    expired = make_job(status=JOB_SUCCEEDED, finished_at=900.0)
+    fresh = make_job(status=JOB_FAILED, finished_at=990.0)
+    queued = make_job()
+    for job in (expired, fresh, queued):
+        store.create(job, b"# x")
+
+    assert store.evict() == 1
+
+    assert store.load(expired.job_id) is None
+    assert store.load(fresh.job_id) is not None
+    assert store.load(queued.job_id) is not None
+
+
+def test_evict_removes_the_oldest_finished_jobs_while_the_store_is_too_large(tmp_path):
+    # Each job stores 1000 bytes of source next to its metadata.
+    store = JobStore(root=tmp_path, ttl=3600, max_bytes=3500, clock=lambda: 1000.0)
+    jobs = [make_job(status=JOB_SUCCEEDED, finished_at=900.0 + i) for i in range(3)]
+    for job in jobs:
+        store.create(job, b"x" * 1000)
+    unfinished = make_job(created_at=0.0)
+    store.create(unfinished, b"x" * 1000)
+
+    store.evict()
+
+    assert [store.load(job.job_id) is not None for job in jobs] == [False, False, True]
+    assert store.load(unfinished.job_id) is not None
+
+
+def test_recover_fails_running_jobs_and_returns_queued_ones(store):
+    running = make_job(status=JOB_RUNNING, created_at=1.0)
+    second = make_job(created_at=3.0)
+    first = make_job(created_at=2.0)
+    for job in (running, second, first):
+        store.create(job, b"# x")
+
+    assert store.recover() == [first.job_id, second.job_id]
+
+    interrupted = store.load(running.job_id)
+    assert interrupted.status == JOB_FAILED
+    assert interrupted.error == INTERRUPTED_JOB_MESSAGE
+    assert not store.get_source_path(running.job_id).exists()
+
+
+def test_recover_leaves_the_jobs_of_another_live_process_alone(store):
+    other_worker = get_process_owner(os.getppid())
+    running = make_job(status=JOB_RUNNING)
+    queued = make_job()
+    for job in (running, queued):
+        store.create(job, b"# x")
+        job.owner = other_worker
+        store.save(job)
+
+    assert store.recover() == []
+    assert store.load(running.job_id).status == JOB_RUNNING
+
+
+def test_recover_adopts_the_jobs_of_a_process_that_is_gone(store):
+    gone = make_job()
+    store.create(gone, b"# x")
+    gone.owner = "999999999:1.0"
+    store.save(gone)
+
+    assert store.recover(own_jobs=False) == [gone.job_id]
+    assert store.load(gone.job_id).owner == get_process_owner()
+
+
+def test_janitor_recovery_leaves_own_jobs_alone(store):
+    running = make_job(status=JOB_RUNNING)
+    store.create(running, b"# x")
+
+    assert store.recover(own_jobs=False) == []
+    assert store.load(running.job_id).status == JOB_RUNNING
+
+
+@pytest.mark.parametrize("owner", ["999999999:1.0", "garbage", f"{os.getpid()}:1.0"])
+def test_owner_that_is_not_running_is_dead(owner):
+    assert not is_owner_alive(owner)
+    assert is_owner_alive(get_process_owner())
+
+
+def test_store_is_configured_from_environment(tmp_path):
+    with patch.dict(os.environ, {"JOBS_DIR": str(tmp_path), "JOBS_TTL": "120", "JOBS_MAX_STORE_MB": "5"}):
+        store = JobStore()
+
+    assert store.root == tmp_path
+    assert store.ttl == 120
+    assert store.max_bytes == 5 * 1024 * 1024
+
+
+@pytest.mark.parametrize(("name", "value"), [("JOBS_TTL", "10"), ("JOBS_MAX_STORE_MB", "0")])
+def test_invalid_store_limits_fall_back_to_defaults(name, value):
+    with patch.dict(os.environ, {name: value}):
+        store = JobStore()
+
+    assert (store.ttl, store.max_bytes) == (3600, 1024 * 1024 * 1024)
+
+
+def test_jobs_dir_defaults_to_the_temp_directory():
+    with patch.dict(os.environ, {}, clear=True):
+        assert get_jobs_dir().name == "pandoc-service-jobs"
+
+
+def test_manager_is_configured_from_environment():
+    with patch.dict(os.environ, {"JOBS_MAX_WORKERS": "4", "JOBS_MAX_QUEUED": "7"}):
+        manager = JobManager(upper_case)
+
+    assert (manager.max_workers, manager.max_queued) == (4, 7)
+
+
+@pytest.mark.asyncio
+async def test_job_runs_to_success(store):
+    manager = JobManager(upper_case, store=store, max_workers=1, max_queued=10)
+    before = finished_jobs("pdf", JOB_SUCCEEDED)
+    job = make_job()
+
+    await manager.start()
+    try:
+        await manager.submit(job, b"# x")
+        done = await wait_for_status(manager, job.job_id, JOB_SUCCEEDED, JOB_FAILED)
+    finally:
+        await manager.stop()
+
+    assert done.status == JOB_SUCCEEDED
+    assert done.result_size == 3
+    assert done.started_at is not None
+    assert done.finished_at is not None
+    assert store.get_result_path(job.job_id).read_bytes() == b"# X"
+    assert not store.get_source_path(job.job_id).exists()
+    assert finished_jobs("pdf", JOB_SUCCEEDED) == before + 1
+
+
+@pytest.mark.asyncio
+async def test_output_file_is_moved_into_the_store(store, tmp_path):
+    output = tmp_path / "pandoc-output.pdf"
+
+    async def convert_to_file(_job, _source):
+        output.write_bytes(b"%PDF")
+        return output
+
+    manager = JobManager(convert_to_file, store=store, max_workers=1, max_queued=10)
+    job = make_job()
+
+    await manager.start()
+    try:
+        await manager.submit(job, b"# x")
+        await wait_for_status(manager, job.job_id, JOB_SUCCEEDED)
+    finally:
+        await manager.stop()
+
+    assert not output.exists()
+    assert store.get_result_path(job.job_id).read_bytes() == b"%PDF"
+
+
+@pytest.mark.asyncio
+async def test_failed_conversion_fails_the_job_not_the_worker(store):
+    async def fail_first(job, source):
+        if job.file_name == "broken.pdf":
+            raise RuntimeError("pandoc exited with 43")
+        return await upper_case(job, source)
+
+    manager = JobManager(fail_first, store=store, max_workers=1, max_queued=10)
+    broken = make_job(file_name="broken.pdf")
+    fine = make_job()
+
+    await manager.start()
+    try:
+        await manager.submit(broken, b"# x")
+        await manager.submit(fine, b"# x")
+        failed = await wait_for_status(manager, broken.job_id, JOB_SUCCEEDED, JOB_FAILED)
+        succeeded = await wait_for_status(manager, fine.job_id, JOB_SUCCEEDED, JOB_FAILED)
+    finally:
+        await manager.stop()
+
+    assert failed.status == JOB_FAILED
+    assert failed.error == "pandoc exited with 43"
+    assert not store.get_source_path(broken.job_id).exists()
+    assert succeeded.status == JOB_SUCCEEDED
+
+
+@pytest.mark.asyncio
+async def test_workers_bound_the_jobs_running_at_once(store):
+    release = asyncio.Event()
+
+    async def blocked(job, source):
+        await release.wait()
+        return await upper_case(job, source)
+
+    manager = JobManager(blocked, store=store, max_workers=1, max_queued=10)
+    first, second = make_job(), make_job()
+
+    await manager.start()
+    try:
+        await manager.submit(first, b"# x")
+        await manager.submit(second, b"# x")
+        await wait_for_status(manager, first.job_id, JOB_RUNNING)
+        await asyncio.sleep(0.05)
+        assert manager.get(second.job_id).status == JOB_QUEUED
+
+        release.set()
+        await wait_for_status(manager, second.job_id, JOB_SUCCEEDED)
+    finally:
+        await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_submit_is_refused_while_the_queue_is_full(store):
+    manager = JobManager(upper_case, store=store, max_workers=1, max_queued=1)
+    await manager.submit(make_job(), b"# x")
+    refused = make_job()
+
+    with pytest.raises(JobQueueFullError):
+        await manager.submit(refused, b"# x")
+
+    assert store.load(refused.job_id) is None
+
+
+@pytest.mark.asyncio
+async def test_deleted_queued_job_is_never_run(store):
+    runs = []
+
+    async def record(job, source):
+        runs.append(job.job_id)
+        return await upper_case(job, source)
+
+    manager = JobManager(record, store=store, max_workers=1, max_queued=10)
+    deleted, kept = make_job(), make_job()
+    await manager.submit(deleted, b"# x")
+    await manager.submit(kept, b"# x")
+
+    assert await manager.delete(deleted.job_id)
+    await manager.start()
+    try:
+        await wait_for_status(manager, kept.job_id, JOB_SUCCEEDED)
+    finally:
+        await manager.stop()
+
+    assert runs == [kept.job_id]
+    assert not store.get_job_dir(deleted.job_id).exists()
+
+
+@pytest.mark.asyncio
+async def test_deleting_a_running_job_cancels_its_conversion(store):
+    cancelled = asyncio.Event()
+
+    async def never_finishes(_job, _source):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    manager = JobManager(never_finishes, store=store, max_workers=1, max_queued=10)
+    job = make_job()
+
+    await manager.start()
+    try:
+        await manager.submit(job, b"# x")
+        await wait_for_status(manager, job.job_id, JOB_RUNNING)
+        assert await manager.delete(job.job_id)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert await wait_for_status(manager, job.job_id) is None
+    finally:
+        await manager.stop()
+
+    assert not store.get_job_dir(job.job_id).exists()
+
+
+@pytest.mark.asyncio
+async def test_delete_of_an_unknown_job_returns_false(store):
+    manager = JobManager(upper_case, store=store, max_workers=1, max_queued=10)
+
+    assert not await manager.delete("0123456789abcdef0123456789abcdef")
+
+
+@pytest.mark.asyncio
+async def test_restart_requeues_queued_jobs_and_fails_interrupted_ones(store):
+    started = asyncio.Event()
+
+    async def never_finishes(_job, _source):
+        started.set()
+        await asyncio.sleep(10)
+
+    manager = JobManager(never_finishes, store=store, max_workers=1, max_queued=10)
+    interrupted, waiting = make_job(), make_job()
+    await manager.start()
+    await manager.submit(interrupted, b"# x")
+    await manager.submit(waiting, b"# x")
+    await asyncio.wait_for(started.wait(), 1)
+    await manager.stop()
+
+    restarted = JobManager(upper_case, store=store, max_workers=1, max_queued=10)
+    await restarted.start()
+    try:
+        done = await wait_for_status(restarted, waiting.job_id, JOB_SUCCEEDED, JOB_FAILED)
+    finally:
+        await restarted.stop()
+
+    assert done.status == JOB_SUCCEEDED
+    assert restarted.get(interrupted.job_id).status == JOB_FAILED
+    assert restarted.get(interrupted.job_id).error == INTERRUPTED_JOB_MESSAGE
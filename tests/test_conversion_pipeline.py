@@ -0,0 +1,114 @@
+"""Tests for the declared conversion pipelines and the timing of their stages."""
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.content_features import LISTS, MATH, TABLES
+from app.conversion_pipeline import DOCX_LATEX_FILTERS, PIPELINES, ConversionPipeline, gate_stages, get_pipeline, time_stage
+from app.pandoc_controller import FILTERS, postprocess_output, prepare_source, run_pandoc_conversion
+
+
+def test_declared_filters_exist():
+    for pipeline in PIPELINES.values():
+        for name in (*pipeline.filters, *filter(None, [pipeline.filter_bundle])):
+            assert name in FILTERS
+
+
+def test_gated_filters_belong_to_their_pipeline():
+    for pipeline in PIPELINES.values():
+        gated_filters = {name for name in pipeline.requires if not name.endswith("_pre_process")}
+        assert gated_filters <= set(pipeline.filters)
+
+
+def test_a_source_skips_what_needs_a_feature_it_lacks():
+    pipeline = get_pipeline("docx", "latex")
+
+    assert pipeline.get_skipped(frozenset({LISTS, MATH, TABLES})) == frozenset()
+    assert pipeline.get_skipped(frozenset({TABLES})) == {"docx_list_level_pre_process", "docx_lists_to_latex", "docx_math_color_pre_process", "docx_math_colors_to_latex"}
+
+
+def test_a_source_that_could_not_be_scanned_skips_nothing():
+    assert get_pipeline("html", "docx").get_skipped(None) == frozenset()
+
+
+def test_the_outcome_of_each_gated_stage_is_counted():
+    with patch("app.conversion_pipeline.increment_gated_stage") as increment:
+        skipped = gate_stages(get_pipeline("html", "pdf"), frozenset())
+
+    assert skipped == {"html_tables_to_latex"}
+    increment.assert_called_once_with("html_tables_to_latex", skipped=True)
+
+
+def test_html_to_docx_runs_every_stage():
+    pipeline = get_pipeline("html", "docx")
+
+    assert pipeline.prepare_html
+    assert pipeline.extract_table_layouts
+    assert pipeline.pre_process == "html_pre_process"
+    assert pipeline.filters == ("inline_styles", "html_lists", "html_captions")
+    assert pipeline.post_process == "docx_post_process"
+
+
+def test_docx_to_pdf_and_latex_read_alike():
+    assert get_pipeline("docx", "pdf") is get_pipeline("docx", "latex")
+    assert get_pipeline("docx", "pdf").filters == DOCX_LATEX_FILTERS
+    assert get_pipeline("docx", "pdf").reading == ("docx_latex_pre_process", "+styles")
+    assert get_pipeline("docx", "docx").reading == (None, "")
+
+
+@pytest.mark.parametrize(
+    ("source_format", "target_format", "expected"),
+    [
+        ("markdown", "html", ConversionPipeline()),
+        ("markdown", "docx", ConversionPipeline(post_process="docx_post_process")),
+        ("html", "pptx", ConversionPipeline(prepare_html=True, post_process="pptx_post_process")),
+        ("html", "markdown", ConversionPipeline(prepare_html=True)),
+    ],
+)
+def test_undeclared_pairs_run_pandoc_alone(source_format, target_format, expected):
+    assert get_pipeline(source_format, target_format) == expected
+
+
+def test_a_stage_is_observed_when_it_completes():
+    with patch("app.conversion_pipeline.observe_pipeline_stage") as observe, time_stage("pandoc"):
+        pass
+
+    stage, duration = observe.call_args.args
+    assert stage == "pandoc"
+    assert duration >= 0
+
+
+def test_a_failed_stage_is_not_observed():
+    with patch("app.conversion_pipeline.observe_pipeline_stage") as observe, pytest.raises(ValueError, match="broken"), time_stage("pandoc"):
+        raise ValueError("broken")
+
+    observe.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_docx_to_latex_times_its_pre_processing_and_pandoc():
+    with (
+        patch("app.conversion_pipeline.observe_pipeline_stage") as observe,
+        patch("app.docx_latex_pre_process.preprocess", side_effect=lambda source, _skipped: source),
+        patch("app.pandoc_controller._run_pandoc", AsyncMock(return_value=b"\\section{Title}")),
+    ):
+        assert await run_pandoc_conversion(b"PK docx", "docx", "latex") == b"\\section{Title}"
+
+    assert [call.args[0] for call in observe.call_args_list] == ["content_scan", "docx_latex_pre_process", "pandoc"]
+
+
+@pytest.mark.asyncio
+async def test_post_processing_is_timed_as_its_stage():
+    with patch("app.conversion_pipeline.observe_pipeline_stage") as observe, patch("app.docx_post_process.process", return_value=b"PK processed"):
+        assert await postprocess_output(b"PK", "docx") == b"PK processed"
+
+    assert [call.args[0] for call in observe.call_args_list] == ["docx_post_process"]
+
+
+@pytest.mark.asyncio
+async def test_a_source_without_html_preparation_is_passed_through():
+    with patch("app.conversion_pipeline.observe_pipeline_stage") as observe:
+        assert await prepare_source(b"# Title", get_pipeline("markdown", "docx"), None) == (b"# Title", None)
+
+    observe.assert_not_called()
@@ -0,0 +1,158 @@
+"""Golden tests and a benchmark for ``filters/docx_latex_bundle.lua``.
+
+The bundle runs the filters of the docx->latex path in one Lua interpreter and
+merges the walks it can merge. Whatever it merges, the LaTeX must be the same
+as the one the filters produce passed one by one, on the checked-in DOCX
+fixtures and on a document that exercises every filter at once: coloured,
+highlighted and decorated runs, coloured math, styled paragraphs, re-nested
+lists, shaded tables and table captions, in the form the docx preprocessors
+leave them in.
+"""
+
+from __future__ import annotations
+
+import resource
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app import docx_latex_pre_process
+from app.content_features import scan_content
+from app.conversion_pipeline import DOCX_LATEX_FILTERS, get_pipeline
+
+_PANDOC = shutil.which("pandoc")
+pytestmark = pytest.mark.skipif(_PANDOC is None, reason="pandoc binary not available")
+
+_SEPARATE = [f"--lua-filter=filters/{name}.lua" for name in DOCX_LATEX_FILTERS]
+_BUNDLE = ["--lua-filter=filters/docx_latex_bundle.lua"]
+_DATA = Path(__file__).resolve().parent / "data"
+
+# The sentinels of docx_list_level_pre_process and docx_table_pre_process.
+_LIST_OPEN, _LIST_CLOSE = "", ""
+_CELL_OPEN, _CELL_CLOSE = "", ""
+
+
+def _section(number: int) -> str:
+    def level(depth: int) -> str:
+        return f"{_LIST_OPEN}{depth}{_LIST_CLOSE}"
+
+    return f"""# Section {number}
+
+Text with [red words]{{custom-style="PandocColor__FG_FF0000"}}, [highlighted]{{custom-style="PandocColor__HL_yellow"}},
+[[underlined and boxed]{{.underline}}]{{custom-style="PandocColor__BG_00FF00"}}, ~~struck~~,
+[large]{{custom-style="PandocColor__SZ_32"}}, [math $a^2$ inside]{{custom-style="PandocColor__FG_0000FF__HL_cyan"}} and
+[[[under]{{.underline}} and ~~gone~~]{{custom-style="PandocColor__FG_00AA00"}}]{{.underline}}.
+
+Coloured math $PMCzzzFF0000zzzxzzzPMCENDzzz + y = PMCzzz00FF00zzzzzzzPMCENDzzz$ next to $z^2$.
+
+::: {{custom-style="PandocPara__ALIGN_center__IND_600"}}
+A centered, indented paragraph in [colour]{{custom-style="PandocColor__FG_123456"}}.
+:::
+
+1. {level(0)}First item
+    i. {level(2)}Third level
+    a. {level(1)}Second level
+
+- {level(0)}Bullet in [red]{{custom-style="PandocColor__FG_FF0000"}}
+
+| Head A | Head B |
+|--------|--------|
+| {_CELL_OPEN}bg=FFCC00;tw=0.5;ta=left{_CELL_CLOSE}shaded | {_CELL_OPEN}bg=00CCFF{_CELL_CLOSE}shaded too |
+| plain | [coloured]{{custom-style="PandocColor__FG_FF00FF"}} |
+
+: Table {number} A caption
+
+"""
+
+
+def _document(sections: int) -> bytes:
+    return "".join(_section(number) for number in range(1, sections + 1)).encode()
+
+
+def _to_latex(source: bytes, source_format: str, filters: list[str]) -> bytes:
+    completed = subprocess.run([_PANDOC, "-f", source_format, "-t", "latex", "--standalone", *filters, "-o", "-"], input=source, capture_output=True, check=True)
+    return completed.stdout
+
+
+def test_bundle_writes_what_the_separate_filters_write():
+    source = _document(3)
+
+    latex = _to_latex(source, "markdown", _BUNDLE)
+
+    assert latex == _to_latex(source, "markdown", _SEPARATE)
+    # Every filter had something to do.
+    for emitted in (
+        b"\\textcolor[HTML]{FF0000}",
+        b"\\colorbox[HTML]{FFFF00}",
+        b"\\uline{",
+        b"{\\color[HTML]{FF0000} x}",
+        b"\\leftskip=30.00pt",
+        b"\\begin{enumerate}\\item[]",
+        b"\\cellcolor[HTML]{FFCC00}",
+        b"\\usepackage{colortbl}",
+        b"Table 1 A caption",
+    ):
+        assert emitted in latex, emitted
+
+
+@pytest.mark.parametrize("fixture", ["colored.docx", "test-input.docx", "ref_1234567890.docx", "template-red.docx"])
+def test_bundle_writes_what_the_separate_filters_write_for_a_docx(fixture):
+    source = docx_latex_pre_process.preprocess((_DATA / fixture).read_bytes())
+
+    assert _to_latex(source, "docx+styles", _BUNDLE) == _to_latex(source, "docx+styles", _SEPARATE)
+
+
+@pytest.mark.parametrize("fixture", ["colored.docx", "test-input.docx", "ref_1234567890.docx", "template-red.docx"])
+def test_skipping_what_a_docx_lacks_writes_the_same_latex(fixture):
+    source = (_DATA / fixture).read_bytes()
+    skipped = get_pipeline("docx", "latex").get_skipped(scan_content(source, "docx"))
+    bundled_skips = [name for name in DOCX_LATEX_FILTERS if name in skipped]
+
+    gated = _to_latex(docx_latex_pre_process.preprocess(source, skipped), "docx+styles", [*_BUNDLE, "-V", f"skip-filters={','.join(bundled_skips)}"])
+
+    assert gated == _to_latex(docx_latex_pre_process.preprocess(source), "docx+styles", _SEPARATE)
+
+
+def test_bundle_merges_the_walks_it_can_share():
+    """Seven filter files, nine filters: the bundle runs them as four, in one interpreter."""
+    script = (
+        'PANDOC_SCRIPT_FILE = "filters/docx_latex_bundle.lua"; FORMAT = "latex"\n'
+        "for _, filter in ipairs(dofile(PANDOC_SCRIPT_FILE)) do\n"
+        "  local keys = {}\n"
+        "  for key in pairs(filter) do keys[#keys + 1] = key end\n"
+        "  table.sort(keys)\n"
+        '  print(table.concat(keys, ","))\n'
+        "end\n"
+    )
+    completed = subprocess.run([_PANDOC, "lua", "-e", script], capture_output=True, check=True, text=True)
+
+    assert completed.stdout.split() == ["Inlines,Strikeout,Underline,traverse", "Div,Math,Meta,Pandoc,Span", "Meta,Table", "Str,Table"]
+
+
+def test_benchmark_on_a_large_document(tmp_path):
+    """
+    Benchmark: CPU time of the filters, separate and bundled, on the AST of a large document.
+
+    Run with -s to see the numbers. The timings of a shared runner are too noisy
+    to assert on; the output is compared instead.
+    """
+    ast_path = tmp_path / "large.json"
+    subprocess.run([_PANDOC, "-f", "markdown", "-t", "json", "-o", str(ast_path)], input=_document(300), check=True)
+
+    def best_cpu_time(filters: list[str]) -> tuple[float, bytes]:
+        times = []
+        for _ in range(3):
+            before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            completed = subprocess.run([_PANDOC, "-f", "json", "-t", "latex", *filters, "-o", "-", str(ast_path)], capture_output=True, check=True)
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            times.append(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime)
+        return min(times), completed.stdout
+
+    unfiltered, _ = best_cpu_time([])
+    separate, separate_latex = best_cpu_time(_SEPARATE)
+    bundle, bundle_latex = best_cpu_time(_BUNDLE)
+
+    print(f"\ndocx->latex filters on 300 sections: separate {separate - unfiltered:.3f}s, bundled {bundle - unfiltered:.3f}s of CPU (pandoc alone {unfiltered:.3f}s)")  # noqa: T201 - a benchmark reports its numbers
+    assert bundle_latex == separate_latex
@@ -113,3 +113,12 @@ def test_single_pass_includes_table_cell_preprocessing():
 
     # Verify the sentinel is present
     assert "\ue010bg=D9EAF7\ue011".encode() in single_entries["word/document.xml"]
+
+
+def test_skipped_rewrites_are_left_out():
+    """The list-level rewrite a source without lists skips leaves its paragraphs untagged."""
+    blob = _pack({"word/document.xml": _BODY, "word/styles.xml": STYLES})
+    out = _entries(docx_latex_pre_process.preprocess(blob, frozenset({"docx_list_level_pre_process"})))["word/document.xml"]
+
+    assert b"PandocPara__ALIGN_center" in out
+    assert "\ue000".encode() not in out
@@ -0,0 +1,81 @@
+"""Integration tests for ``filters/embed_media.lua``.
+
+Runs the real ``pandoc`` binary inside the pandoc-service container: a DOCX
+with an image is read to the JSON AST, as a multi-target conversion parses its
+source, and the image must survive into a target rendered from that AST alone.
+"""
+
+from __future__ import annotations
+
+import json
+
+from docker.models.containers import Container
+
+from tests.test_container import TestParameters
+
+PANDOC_PATH = "/usr/local/bin/pandoc"
+EMBED_MEDIA = "/usr/local/share/pandoc/filters/embed_media.lua"
+
+# A 1x1 PNG.
+PNG_DATA_URI = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+
+
+def _run(container: Container, cmd: str) -> bytes:
+    exit_code, output = container.exec_run(["sh", "-c", cmd])
+    assert exit_code == 0, f"command failed (exit {exit_code}): {output.decode()}"
+    return output
+
+
+def _docx_with_image(container: Container) -> str:
+    container.exec_run(["sh", "-c", "mkdir -p /tmp/test"])
+    container.exec_run(["sh", "-c", f"cat > /tmp/test/image.md << 'HEREDOC_EOF'\n![dot]({PNG_DATA_URI})\nHEREDOC_EOF"])
+    _run(container, f"{PANDOC_PATH} -f markdown -t docx -o /tmp/test/image.docx /tmp/test/image.md")
+    return "/tmp/test/image.docx"
+
+
+def _image_sources(ast: dict) -> list[str]:
+    sources = []
+
+    def walk(node: object) -> None:
+        if isinstance(node, dict):
+            if node.get("t") == "Image":
+                sources.append(node["c"][2][0])
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(ast["blocks"])
+    return sources
+
+
+def test_media_bag_image_is_embedded_as_data_uri(test_parameters: TestParameters):
+    docx = _docx_with_image(test_parameters.container)
+
+    ast = json.loads(_run(test_parameters.container, f"{PANDOC_PATH} -f docx -t json {docx} --lua-filter={EMBED_MEDIA}"))
+
+    sources = _image_sources(ast)
+    assert len(sources) == 1
+    assert sources[0].startswith("data:image/png;base64,"), sources
+
+
+def test_without_the_filter_the_ast_only_names_the_image(test_parameters: TestParameters):
+    """The reason for the filter: the media bag does not travel with the JSON AST."""
+    docx = _docx_with_image(test_parameters.container)
+
+    ast = json.loads(_run(test_parameters.container, f"{PANDOC_PATH} -f docx -t json {docx}"))
+
+    assert not _image_sources(ast)[0].startswith("data:")
+
+
+def test_target_rendered_from_the_ast_keeps_the_image(test_parameters: TestParameters):
+    container = test_parameters.container
+    docx = _docx_with_image(container)
+    _run(container, f"{PANDOC_PATH} -f docx -t json -o /tmp/test/image.json {docx} --lua-filter={EMBED_MEDIA}")
+
+    _run(container, f"{PANDOC_PATH} -f json -t docx -o /tmp/test/rendered.docx /tmp/test/image.json")
+
+    # Reading the rendered DOCX back finds the image in its media again.
+    rendered = json.loads(_run(container, f"{PANDOC_PATH} -f docx -t json /tmp/test/rendered.docx --lua-filter={EMBED_MEDIA}"))
+    assert _image_sources(rendered)[0].startswith("data:image/png;base64,")
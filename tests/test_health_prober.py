@@ -0,0 +1,100 @@
+"""Tests for the background dependency prober behind the health endpoints."""
+
+import asyncio
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.health_prober import HealthProber, HealthSnapshot
+
+HEALTHY = {"pandoc": "available", "tectonic": "available", "filesystem": "writable", "chromium": "disabled"}
+
+
+@pytest.mark.parametrize("state", ["unavailable", "unwritable", "unknown"])
+def test_snapshot_is_unhealthy_with_a_failed_dependency(state):
+    assert not HealthSnapshot(dependencies={**HEALTHY, "pandoc": state}).healthy
+
+
+def test_snapshot_is_healthy_with_informational_states():
+    assert HealthSnapshot(dependencies={**HEALTHY, "chromium": "stopped"}).healthy
+
+
+def test_checks_on_demand_while_not_started():
+    check = MagicMock(return_value=HEALTHY)
+    prober = HealthProber(check, interval=10)
+
+    prober.get_snapshot()
+    snapshot = prober.get_snapshot()
+
+    assert check.call_count == 2
+    assert snapshot.dependencies == HEALTHY
+    assert snapshot.checked_at > 0
+
+
+@pytest.mark.asyncio
+async def test_answers_from_the_snapshot_once_started():
+    check = MagicMock(return_value=HEALTHY)
+    prober = HealthProber(check, interval=10)
+
+    await prober.start()
+    try:
+        snapshots = [prober.get_snapshot() for _ in range(100)]
+    finally:
+        await prober.stop()
+
+    assert check.call_count == 1
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_refreshed_in_the_background():
+    states = iter(["writable", "unwritable"])
+    prober = HealthProber(lambda: {"filesystem": next(states, "unwritable")}, interval=1)
+
+    await prober.start()
+    try:
+        assert prober.get_snapshot().healthy
+        await asyncio.sleep(1.2)
+        assert not prober.get_snapshot().healthy
+    finally:
+        await prober.stop()
+
+
+@pytest.mark.asyncio
+async def test_failing_check_reports_unhealthy():
+    check = MagicMock(side_effect=[HEALTHY, RuntimeError("boom")])
+    prober = HealthProber(check, interval=1)
+
+    await prober.start()
+    try:
+        await asyncio.sleep(1.2)
+        snapshot = prober.get_snapshot()
+    finally:
+        await prober.stop()
+
+    assert not snapshot.healthy
+    assert snapshot.dependencies == {"probe": "unknown"}
+
+
+@pytest.mark.asyncio
+async def test_stop_returns_to_checking_on_demand():
+    check = MagicMock(return_value=HEALTHY)
+    prober = HealthProber(check, interval=10)
+    await prober.start()
+    await prober.stop()
+
+    prober.get_snapshot()
+
+    assert check.call_count == 2
+
+
+def test_interval_is_read_from_environment():
+    with patch.dict(os.environ, {"HEALTH_PROBE_INTERVAL": "30"}):
+        assert HealthProber(dict).interval == 30
+
+
+@pytest.mark.parametrize("value", ["0", "301", "often"])
+def test_invalid_interval_falls_back_to_default(value):
+    with patch.dict(os.environ, {"HEALTH_PROBE_INTERVAL": value}):
+        assert HealthProber(dict).interval == 10
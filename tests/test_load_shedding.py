@@ -0,0 +1,342 @@
+"""Tests for load shedding of the conversion endpoints."""
+
+import asyncio
+import os
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import load_shedding
+from app.load_shedding import (
+    LoadShedder,
+    LoadSheddingMiddleware,
+    LoadSheddingPolicy,
+    get_conversion_formats,
+    get_conversion_target_format,
+    get_load_shedder,
+    parse_format_weights,
+    read_cgroup_memory_fraction,
+    read_process_tree_rss,
+    reset_load_shedder,
+)
+from app.pandoc_controller import app
+
+MIB = 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def reset_shedder():
+    """Reset the global shedder before and after each test."""
+    reset_load_shedder()
+    yield
+    reset_load_shedder()
+
+
+def shed_count(target_format: str, reason: str) -> float:
+    return REGISTRY.get_sample_value("pandoc_shed_requests_total", {"target_format": target_format, "reason": reason}) or 0.0
+
+
+def make_client() -> tuple[TestClient, list[str]]:
+    """A client for a conversion stand-in behind the middleware, and the events the app saw."""
+    events: list[str] = []
+
+    async def convert(request: Request) -> PlainTextResponse:
+        events.append("called")
+        events.append(f"weight {get_load_shedder().get_active_weight()}")
+        await request.body()
+        return PlainTextResponse("converted")
+
+    async def version(_request: Request) -> PlainTextResponse:
+        return PlainTextResponse("1")
+
+    inner = Starlette(
+        routes=[
+            Route("/convert/{source_format}/to/{target_format}", convert, methods=["POST"]),
+            Route("/version", version),
+        ]
+    )
+    return TestClient(LoadSheddingMiddleware(inner)), events
+
+
+@pytest.mark.parametrize(
+    ("path", "target_format"),
+    [
+        ("/convert/markdown/to/pdf", "pdf"),
+        ("/convert/html/to/docx/", "docx"),
+        ("/convert/html/to/docx-with-template", "docx"),
+        ("/convert/html/to/pptx-with-template", "pptx"),
+        ("/version", None),
+        ("/docx-template", None),
+        ("/convert/markdown", None),
+    ],
+)
+def test_get_conversion_target_format(path, target_format):
+    assert get_conversion_target_format(path) == target_format
+
+
+def test_get_conversion_formats():
+    assert get_conversion_formats("/convert/html/to/docx-with-template") == ("html", "docx")
+    assert get_conversion_formats("/jobs/convert/html/to/docx") is None
+
+
+def test_policy_is_disabled_by_default():
+    with patch.dict(os.environ, {}, clear=True):
+        policy = LoadSheddingPolicy.from_env()
+
+    assert policy.max_active_weight == 0
+    assert policy.max_queued == 0
+    assert policy.max_rss_bytes == 0
+    assert policy.max_memory_fraction == 0.0
+    assert policy.retry_after == 5
+
+
+def test_policy_is_read_from_environment():
+    env = {
+        "LOAD_SHED_MAX_ACTIVE_WEIGHT": "16",
+        "LOAD_SHED_MAX_QUEUED": "8",
+        "LOAD_SHED_MAX_RSS_MB": "2048",
+        "LOAD_SHED_MAX_MEMORY_FRACTION": "0.85",
+        "LOAD_SHED_RETRY_AFTER": "30",
+        "LOAD_SHED_FORMAT_WEIGHTS": "pdf=6,latex=2",
+    }
+    with patch.dict(os.environ, env):
+        policy = LoadSheddingPolicy.from_env()
+
+    assert policy.max_active_weight == 16
+    assert policy.max_queued == 8
+    assert policy.max_rss_bytes == 2048 * MIB
+    assert policy.max_memory_fraction == 0.85
+    assert policy.retry_after == 30
+    assert policy.get_weight("pdf") == 6
+    assert policy.get_weight("latex") == 2
+    assert policy.get_weight("docx") == 2
+    assert policy.get_weight("markdown") == 1
+
+
+@pytest.mark.parametrize(("name", "value"), [("LOAD_SHED_MAX_MEMORY_FRACTION", "1.5"), ("LOAD_SHED_MAX_QUEUED", "-1"), ("LOAD_SHED_RETRY_AFTER", "0")])
+def test_invalid_policy_values_fall_back_to_default(name, value):
+    with patch.dict(os.environ, {name: value}):
+        policy = LoadSheddingPolicy.from_env()
+
+    assert getattr(policy, name.removeprefix("LOAD_SHED_").lower()) == getattr(LoadSheddingPolicy(), name.removeprefix("LOAD_SHED_").lower())
+
+
+def test_parse_format_weights_skips_invalid_entries():
+    weights = parse_format_weights("pdf=8, =3, epub, html=0, odt=x, rtf=101, plain=3")
+
+    assert weights["pdf"] == 8
+    assert weights["plain"] == 3
+    assert "epub" not in weights
+    assert "html" not in weights
+    assert "odt" not in weights
+    assert "rtf" not in weights
+
+
+def test_read_cgroup_v2_memory_fraction(tmp_path):
+    (tmp_path / "memory.current").write_text("750\n")
+    (tmp_path / "memory.max").write_text("1000\n")
+    with (
+        patch.object(load_shedding, "CGROUP_V2_MEMORY_CURRENT", tmp_path / "memory.current"),
+        patch.object(load_shedding, "CGROUP_V2_MEMORY_MAX", tmp_path / "memory.max"),
+    ):
+        assert read_cgroup_memory_fraction() == 0.75
+
+
+def test_read_cgroup_v2_without_limit(tmp_path):
+    (tmp_path / "memory.current").write_text("750\n")
+    (tmp_path / "memory.max").write_text("max\n")
+    with (
+        patch.object(load_shedding, "CGROUP_V2_MEMORY_CURRENT", tmp_path / "memory.current"),
+        patch.object(load_shedding, "CGROUP_V2_MEMORY_MAX", tmp_path / "memory.max"),
+    ):
+        assert read_cgroup_memory_fraction() is None
+
+
+@pytest.mark.parametrize(("limit", "fraction"), [("2000", 0.25), (str(9223372036854771712), None)])
+def test_read_cgroup_v1_memory_fraction(tmp_path, limit, fraction):
+    (tmp_path / "usage").write_text("500\n")
+    (tmp_path / "limit").write_text(limit)
+    with (
+        patch.object(load_shedding, "CGROUP_V2_MEMORY_CURRENT", tmp_path / "missing"),
+        patch.object(load_shedding, "CGROUP_V1_MEMORY_USAGE", tmp_path / "usage"),
+        patch.object(load_shedding, "CGROUP_V1_MEMORY_LIMIT", tmp_path / "limit"),
+    ):
+        assert read_cgroup_memory_fraction() == fraction
+
+
+def test_read_cgroup_memory_fraction_outside_a_cgroup(tmp_path):
+    with (
+        patch.object(load_shedding, "CGROUP_V2_MEMORY_CURRENT", tmp_path / "missing"),
+        patch.object(load_shedding, "CGROUP_V1_MEMORY_USAGE", tmp_path / "missing"),
+    ):
+        assert read_cgroup_memory_fraction() is None
+
+
+def test_read_process_tree_rss():
+    assert read_process_tree_rss() > 0
+
+
+def test_disabled_policy_admits_everything():
+    shedder = LoadShedder(LoadSheddingPolicy())
+
+    assert all(shedder.try_acquire(4) is None for _ in range(100))
+    assert shedder.get_active_weight() == 400
+
+
+def test_active_weight_limit():
+    shedder = LoadShedder(LoadSheddingPolicy(max_active_weight=6))
+
+    assert shedder.try_acquire(4) is None
+    assert shedder.try_acquire(2) is None
+    assert shedder.try_acquire(1) == "active"
+
+    shedder.release(4)
+    assert shedder.try_acquire(4) is None
+    assert shedder.get_active_weight() == 6
+
+
+def test_idle_service_admits_a_conversion_heavier_than_the_limit():
+    shedder = LoadShedder(LoadSheddingPolicy(max_active_weight=2))
+
+    assert shedder.try_acquire(4) is None
+    assert shedder.try_acquire(1) == "active"
+
+
+def test_queue_limit():
+    shedder = LoadShedder(LoadSheddingPolicy(max_queued=3))
+    with patch("app.load_shedding.get_conversion_executor") as mock_get_executor:
+        mock_get_executor.return_value.get_queue_size.return_value = 2
+        assert shedder.try_acquire(1) is None
+        mock_get_executor.return_value.get_queue_size.return_value = 3
+        assert shedder.try_acquire(1) == "queued"
+
+
+def test_rss_limit():
+    shedder = LoadShedder(LoadSheddingPolicy(max_rss_bytes=100 * MIB))
+    with patch("app.load_shedding.read_process_tree_rss", return_value=101 * MIB):
+        assert shedder.try_acquire(1) == "rss"
+
+
+def test_memory_fraction_limit():
+    shedder = LoadShedder(LoadSheddingPolicy(max_memory_fraction=0.9))
+    with patch("app.load_shedding.read_cgroup_memory_fraction", return_value=0.95):
+        assert shedder.try_acquire(1) == "memory"
+
+
+def test_memory_fraction_limit_without_cgroup_limit():
+    shedder = LoadShedder(LoadSheddingPolicy(max_memory_fraction=0.9))
+    with patch("app.load_shedding.read_cgroup_memory_fraction", return_value=None):
+        assert shedder.try_acquire(1) is None
+
+
+def test_memory_is_sampled_at_most_once_per_interval():
+    now = 100.0
+    shedder = LoadShedder(LoadSheddingPolicy(max_rss_bytes=100 * MIB), clock=lambda: now)
+    with patch("app.load_shedding.read_process_tree_rss", return_value=10 * MIB) as mock_rss:
+        for _ in range(10):
+            shedder.try_acquire(1)
+        assert mock_rss.call_count == 1
+
+        now += load_shedding.MEMORY_SAMPLE_INTERVAL
+        shedder.try_acquire(1)
+        assert mock_rss.call_count == 2
+
+
+def test_middleware_admits_and_releases_a_conversion():
+    client, events = make_client()
+
+    response = client.post("/convert/markdown/to/pdf", content=b"# x")
+
+    assert response.status_code == 200
+    assert events == ["called", "weight 4"]
+    assert get_load_shedder().get_active_weight() == 0
+
+
+def test_middleware_sheds_with_retry_after_before_reading_the_body():
+    client, events = make_client()
+    shedder = get_load_shedder()
+    shedder.policy = LoadSheddingPolicy(max_queued=1, retry_after=12)
+    before = shed_count("pdf", "queued")
+
+    with patch("app.load_shedding.get_conversion_executor") as mock_get_executor:
+        mock_get_executor.return_value.get_queue_size.return_value = 1
+        response = client.post("/convert/markdown/to/pdf", content=b"# x")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "12"
+    assert response.text == "Service overloaded, retry later"
+    assert events == []
+    assert shed_count("pdf", "queued") == before + 1
+    assert shedder.get_active_weight() == 0
+
+
+def test_middleware_releases_the_weight_when_the_app_fails():
+    async def failing(_request: Request) -> PlainTextResponse:
+        raise RuntimeError("boom")
+
+    inner = Starlette(routes=[Route("/convert/{source_format}/to/{target_format}", failing, methods=["POST"])])
+    client = TestClient(LoadSheddingMiddleware(inner), raise_server_exceptions=False)
+
+    assert client.post("/convert/markdown/to/pdf", content=b"# x").status_code == 500
+    assert get_load_shedder().get_active_weight() == 0
+
+
+def test_middleware_ignores_other_requests():
+    client, _ = make_client()
+    get_load_shedder().policy = LoadSheddingPolicy(max_active_weight=1)
+    get_load_shedder().try_acquire(1)
+
+    assert client.get("/version").status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_burst_beyond_the_limit_is_shed():
+    """Of a burst of PDF exports, only as many run as the active weight allows."""
+    release = asyncio.Event()
+    statuses: list[int] = []
+
+    async def inner(scope, receive, send) -> None:
+        await release.wait()
+        await PlainTextResponse("converted")(scope, receive, send)
+
+    middleware = LoadSheddingMiddleware(inner)
+    get_load_shedder().policy = LoadSheddingPolicy(max_active_weight=8)
+
+    async def request() -> None:
+        scope = {"type": "http", "method": "POST", "path": "/convert/markdown/to/pdf", "headers": []}
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message) -> None:
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await middleware(scope, receive, send)
+
+    tasks = [asyncio.create_task(request()) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    assert statuses == [503, 503, 503]
+    assert get_load_shedder().get_active_weight() == 8
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert sorted(statuses) == [200, 200, 503, 503, 503]
+    assert get_load_shedder().get_active_weight() == 0
+
+
+def test_controller_sheds_conversions():
+    get_load_shedder().policy = LoadSheddingPolicy(max_rss_bytes=100 * MIB, retry_after=7)
+    with patch("app.load_shedding.read_process_tree_rss", return_value=101 * MIB), patch("app.pandoc_controller.run_pandoc_conversion_to_output") as mock_convert:
+        response = TestClient(app).post("/convert/markdown/to/html", content=b"# x")
+
+    mock_convert.assert_not_called()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
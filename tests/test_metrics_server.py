@@ -12,7 +12,10 @@ from app.metrics_server import (
     MetricsServer,
     get_metrics_port,
     is_metrics_server_enabled,
+    mark_worker_stopped,
     metrics_app,
+    publish_gauges_periodically,
+    serve_metrics_in_thread,
 )
 from app.pandoc_metrics import reset_pandoc_metrics
 
@@ -47,6 +50,16 @@ class TestMetricsEndpoint:
         assert response.status_code == 200
         assert "uptime_seconds" in response.text
 
+    def test_metrics_endpoint_includes_conversion_queue(self):
+        """Test that metrics endpoint includes the pandoc conversion queue."""
+        client = TestClient(metrics_app)
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert "pandoc_queue_size" in response.text
+        assert "pandoc_active_subprocesses" in response.text
+        assert "pandoc_queue_wait_seconds" in response.text
+
 
 class TestGetMetricsPort:
     """Tests for get_metrics_port function."""
@@ -187,3 +200,47 @@ class TestMetricsServer:
             assert server.is_running is False
 
         anyio.run(run_test)
+
+
+class TestSeveralWorkers:
+    """Tests for the metrics of several worker processes."""
+
+    def test_supervisor_adds_up_the_workers_without_updating_gauges(self, tmp_path):
+        """The supervisor only collects what the workers wrote to the shared directory."""
+        with (
+            patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}),
+            patch("app.metrics_server.multiprocess.MultiProcessCollector") as collector,
+            patch("app.metrics_server.update_gauges") as update_gauges,
+        ):
+            response = TestClient(metrics_app).get("/metrics")
+
+        assert response.status_code == 200
+        collector.assert_called_once()
+        update_gauges.assert_not_called()
+
+    def test_worker_publishes_its_gauges_periodically(self):
+        """A worker sets its gauges without waiting for a scrape."""
+        import anyio
+
+        async def run_test():
+            with patch("app.metrics_server.update_gauges") as update_gauges, patch("app.metrics_server.GAUGE_PUBLISH_INTERVAL", 0.01):
+                with pytest.raises(TimeoutError):
+                    await asyncio.wait_for(publish_gauges_periodically(), 0.05)
+                assert update_gauges.call_count >= 2
+
+        anyio.run(run_test)
+
+    def test_stopped_worker_drops_its_live_gauges(self):
+        with patch("app.metrics_server.multiprocess.mark_process_dead") as mark_process_dead:
+            mark_worker_stopped()
+
+        mark_process_dead.assert_called_once_with(os.getpid())
+
+    def test_supervisor_serves_metrics_from_a_thread(self):
+        with patch("app.metrics_server.uvicorn.Server") as server:
+            thread = serve_metrics_in_thread(19186)
+            thread.join(1)
+
+        assert thread.daemon
+        assert server.call_args.args[0].port == 19186
+        server.return_value.run.assert_called_once()
@@ -1,31 +1,56 @@
+import asyncio
+import hashlib
 import io
 import os
 import platform
 import subprocess
+import tempfile
+import threading
 import zipfile
 from pathlib import Path
 from typing import NamedTuple
-from unittest.mock import AsyncMock, MagicMock, mock_open, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import anyio
 import pytest
 from starlette.responses import Response
 from starlette.testclient import TestClient
 
 # Import the module to test
+from app.capabilities import Capabilities
 from app.constants import API_VERSION
+from app.conversion_jobs import JOB_SUCCEEDED, ConversionJob, JobManager, JobStore
+from app.conversion_pipeline import DOCX_LATEX_FILTERS
 from app.pandoc_controller import (
     ALLOWED_PANDOC_OPTIONS,
     DEFAULT_CONVERSION_OPTIONS,
     FILTERS,
+    _build_pandoc_command,
     app,
+    convert_source_to_targets,
+    get_conversion_key,
     get_request_body_limit_mb,
-    get_tectonic_availability,
     get_temp_directory_writability,
+    health_prober,
+    parse_target_formats,
+    parse_to_ast,
     postprocess_and_build_response,
     process_error,
+    remove_file,
+    render_ast,
+    run_conversion_job,
     run_pandoc_conversion,
+    run_pandoc_conversion_to_output,
     version,
+    write_scratch_file,
+    write_template_file,
 )
+from app.pandoc_metrics import get_pandoc_metrics
+from app.reference_docs import ReferenceDocCache
+from app.result_cache import INLINE_HASH_MAX_SIZE, ResultCache, build_cache_key
+from app.scratch_workspace import get_scratch_dir
+from app.template_store import TemplateStore
+from app.upload_spool import SPOOL_MAX_SIZE
 
 
 class File(NamedTuple):
@@ -34,6 +59,13 @@ class File(NamedTuple):
     content_type: str
 
 
+def write_pandoc_output(directory: Path, content: bytes) -> Path:
+    """Stand in for the file pandoc writes its output to."""
+    output_path = directory / "pandoc-output"
+    output_path.write_bytes(content)
+    return output_path
+
+
 def test_default_conversion_options_includes_heading_levels_filter():
     """Test that heading_levels filter is present in DEFAULT_CONVERSION_OPTIONS."""
     heading_levels_filter = f"--lua-filter={FILTERS['heading_levels']}"
@@ -46,16 +78,15 @@ def test_inline_styles_filter_registered():
     assert f"--lua-filter={FILTERS['inline_styles']}" in ALLOWED_PANDOC_OPTIONS
 
 
-def test_run_pandoc_conversion_appends_inline_styles_filter_for_html_source():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_appends_inline_styles_filter_for_html_source():
     """When source format is html, the inline_styles filter is added to the command."""
     with (
-        patch("subprocess.run") as mock_subprocess,
-        patch("pathlib.Path.open", mock_open(read_data=b"DOCX content")),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"DOCX content")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
-        mock_subprocess.return_value.returncode = 0
-
         source_file_mock = MagicMock()
         source_file_mock.name = "source.html"
         output_file_mock = MagicMock()
@@ -67,52 +98,35 @@ def test_run_pandoc_conversion_appends_inline_styles_filter_for_html_source():
         mock_context_out.__enter__.return_value = output_file_mock
 
         with patch("tempfile.NamedTemporaryFile", side_effect=[mock_context_src, mock_context_out]):
-            run_pandoc_conversion("<p>x</p>", "html", "docx")
+            await run_pandoc_conversion('<p style="color: red">x</p>', "html", "docx")
 
-        mock_subprocess.assert_called_once()
-        cmd = mock_subprocess.call_args.args[0]
+        mock_run.assert_called_once()
+        cmd = mock_run.call_args.args[0]
         assert f"--lua-filter={FILTERS['inline_styles']}" in cmd
 
 
-def test_run_pandoc_conversion_does_not_append_inline_styles_filter_for_non_html_source():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_does_not_append_inline_styles_filter_for_non_html_source():
     """For non-HTML sources the inline_styles filter must not be appended."""
-    with (
-        patch("subprocess.run") as mock_subprocess,
-        patch("pathlib.Path.open", mock_open(read_data=b"<p>x</p>")),
-        patch("pathlib.Path.exists", return_value=True),
-        patch("pathlib.Path.unlink"),
-    ):
-        mock_subprocess.return_value.returncode = 0
-
-        source_file_mock = MagicMock()
-        source_file_mock.name = "source.md"
-        output_file_mock = MagicMock()
-        output_file_mock.name = "output.html"
-
-        mock_context_src = MagicMock()
-        mock_context_src.__enter__.return_value = source_file_mock
-        mock_context_out = MagicMock()
-        mock_context_out.__enter__.return_value = output_file_mock
+    with patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"<p>x</p>")) as mock_run_piped:
+        await run_pandoc_conversion("# x", "markdown", "html")
 
-        with patch("tempfile.NamedTemporaryFile", side_effect=[mock_context_src, mock_context_out]):
-            run_pandoc_conversion("# x", "markdown", "html")
-
-        mock_subprocess.assert_called_once()
-        cmd = mock_subprocess.call_args.args[0]
-        assert f"--lua-filter={FILTERS['inline_styles']}" not in cmd
+    mock_run_piped.assert_called_once()
+    cmd = mock_run_piped.call_args.args[0]
+    assert f"--lua-filter={FILTERS['inline_styles']}" not in cmd
 
 
 @pytest.mark.parametrize("target_format", ["html", "markdown", "plain", "rtf", "epub"])
-def test_run_pandoc_conversion_does_not_append_inline_styles_filter_for_html_to_non_docx_target(target_format):
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_does_not_append_inline_styles_filter_for_html_to_non_docx_target(target_format):
     """The filter emits raw OOXML; it must not be applied when the target writer is not docx."""
     with (
-        patch("subprocess.run") as mock_subprocess,
-        patch("pathlib.Path.open", mock_open(read_data=b"output")),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"output")) as mock_run_piped,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"output")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
-        mock_subprocess.return_value.returncode = 0
-
         source_file_mock = MagicMock()
         source_file_mock.name = "source.html"
         output_file_mock = MagicMock()
@@ -124,23 +138,24 @@ def test_run_pandoc_conversion_does_not_append_inline_styles_filter_for_html_to_
         mock_context_out.__enter__.return_value = output_file_mock
 
         with patch("tempfile.NamedTemporaryFile", side_effect=[mock_context_src, mock_context_out]):
-            run_pandoc_conversion("<p>x</p>", "html", target_format)
+            await run_pandoc_conversion("<p>x</p>", "html", target_format)
 
-        mock_subprocess.assert_called_once()
-        cmd = mock_subprocess.call_args.args[0]
+        # EPUB is written to a file, the text formats come through a pipe.
+        executed = mock_run if target_format == "epub" else mock_run_piped
+        executed.assert_called_once()
+        cmd = executed.call_args.args[0]
         assert f"--lua-filter={FILTERS['inline_styles']}" not in cmd
 
 
-def test_preserve_table_styles_appends_metadata_flag():
+@pytest.mark.asyncio
+async def test_preserve_table_styles_appends_metadata_flag():
     """When preserve_table_styles=True and source is html→docx, -M preserve_table_styles=true is added."""
     with (
-        patch("subprocess.run") as mock_subprocess,
-        patch("pathlib.Path.open", mock_open(read_data=b"DOCX content")),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"DOCX content")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
-        mock_subprocess.return_value.returncode = 0
-
         source_file_mock = MagicMock()
         source_file_mock.name = "source.html"
         output_file_mock = MagicMock()
@@ -152,25 +167,24 @@ def test_preserve_table_styles_appends_metadata_flag():
         mock_context_out.__enter__.return_value = output_file_mock
 
         with patch("tempfile.NamedTemporaryFile", side_effect=[mock_context_src, mock_context_out]):
-            run_pandoc_conversion("<p>x</p>", "html", "docx", preserve_table_styles=True)
+            await run_pandoc_conversion("<p>x</p>", "html", "docx", preserve_table_styles=True)
 
-        mock_subprocess.assert_called_once()
-        cmd = mock_subprocess.call_args.args[0]
+        mock_run.assert_called_once()
+        cmd = mock_run.call_args.args[0]
         assert "-M" in cmd
         m_index = cmd.index("-M")
         assert cmd[m_index + 1] == "preserve_table_styles=true"
 
 
-def test_preserve_table_styles_not_added_when_false():
+@pytest.mark.asyncio
+async def test_preserve_table_styles_not_added_when_false():
     """When preserve_table_styles=False (default), no -M flag is added."""
     with (
-        patch("subprocess.run") as mock_subprocess,
-        patch("pathlib.Path.open", mock_open(read_data=b"DOCX content")),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"DOCX content")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
-        mock_subprocess.return_value.returncode = 0
-
         source_file_mock = MagicMock()
         source_file_mock.name = "source.html"
         output_file_mock = MagicMock()
@@ -182,10 +196,10 @@ def test_preserve_table_styles_not_added_when_false():
         mock_context_out.__enter__.return_value = output_file_mock
 
         with patch("tempfile.NamedTemporaryFile", side_effect=[mock_context_src, mock_context_out]):
-            run_pandoc_conversion("<p>x</p>", "html", "docx", preserve_table_styles=False)
+            await run_pandoc_conversion("<p>x</p>", "html", "docx", preserve_table_styles=False)
 
-        mock_subprocess.assert_called_once()
-        cmd = mock_subprocess.call_args.args[0]
+        mock_run.assert_called_once()
+        cmd = mock_run.call_args.args[0]
         assert "-M" not in cmd
 
 
@@ -195,7 +209,7 @@ def test_docx_colors_to_latex_filter_registered():
     assert f"--lua-filter={FILTERS['docx_colors_to_latex']}" in ALLOWED_PANDOC_OPTIONS
 
 
-def _run_conversion_capturing_cmd(source_data, source_format, target_format):
+async def _run_conversion_capturing_cmd(source_data, source_format, target_format):
     """Shared scaffold for the docx-color-preprocessor wiring tests.
 
     Returns ``(cmd_list, preprocess_call_count)``. Mocks tempfile / pathlib /
@@ -203,14 +217,13 @@ def _run_conversion_capturing_cmd(source_data, source_format, target_format):
     so we can both observe and short-circuit it.
     """
     with (
-        patch("subprocess.run") as mock_subprocess,
-        patch("pathlib.Path.open", mock_open(read_data=b"output")),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"output")) as mock_run_piped,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"output")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
-        patch("app.pandoc_controller.docx_latex_pre_process.preprocess", side_effect=lambda b: b) as mock_pre,
+        patch("app.docx_latex_pre_process.preprocess", side_effect=lambda b, _skipped: b) as mock_pre,
     ):
-        mock_subprocess.return_value.returncode = 0
-
         source_file_mock = MagicMock()
         source_file_mock.name = "source." + source_format
         output_file_mock = MagicMock()
@@ -221,66 +234,112 @@ def _run_conversion_capturing_cmd(source_data, source_format, target_format):
         mock_context_out.__enter__.return_value = output_file_mock
 
         with patch("tempfile.NamedTemporaryFile", side_effect=[mock_context_src, mock_context_out]):
-            run_pandoc_conversion(source_data, source_format, target_format)
+            await run_pandoc_conversion(source_data, source_format, target_format)
 
-        cmd = mock_subprocess.call_args.args[0]
+        # A text output comes through a pipe.
+        cmd = (mock_run if mock_run.called else mock_run_piped).call_args.args[0]
         return cmd, mock_pre.call_count
 
 
-def test_run_pandoc_conversion_invokes_docx_color_preprocessor_for_docx_to_pdf():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_invokes_docx_color_preprocessor_for_docx_to_pdf():
     """For DOCX -> PDF we preprocess the source, switch to docx+styles, and
     add the docx_colors_to_latex filter."""
-    cmd, preprocess_calls = _run_conversion_capturing_cmd(b"PK\x03\x04docx-bytes", "docx", "pdf")
+    cmd, preprocess_calls = await _run_conversion_capturing_cmd(b"PK\x03\x04docx-bytes", "docx", "pdf")
 
     assert preprocess_calls == 1
     assert "docx+styles" in cmd
-    assert f"--lua-filter={FILTERS['docx_colors_to_latex']}" in cmd
+    assert f"--lua-filter={FILTERS['docx_latex_bundle']}" in cmd
 
 
-def test_run_pandoc_conversion_invokes_docx_color_preprocessor_for_docx_to_latex():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_invokes_docx_color_preprocessor_for_docx_to_latex():
     """Same wiring applies when target is raw LaTeX (the writer path is
     identical; the tectonic step is just skipped)."""
-    cmd, preprocess_calls = _run_conversion_capturing_cmd(b"PK\x03\x04docx-bytes", "docx", "latex")
+    cmd, preprocess_calls = await _run_conversion_capturing_cmd(b"PK\x03\x04docx-bytes", "docx", "latex")
 
     assert preprocess_calls == 1
     assert "docx+styles" in cmd
-    assert f"--lua-filter={FILTERS['docx_colors_to_latex']}" in cmd
+    assert f"--lua-filter={FILTERS['docx_latex_bundle']}" in cmd
 
 
-def test_run_pandoc_conversion_skips_docx_color_preprocessor_for_docx_to_docx():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_skips_docx_color_preprocessor_for_docx_to_docx():
     """DOCX passthrough must not invoke the preprocessor — the colors are
     already preserved by the DOCX writer, and we don't want to perturb the
     bytes."""
-    cmd, preprocess_calls = _run_conversion_capturing_cmd(b"PK\x03\x04docx-bytes", "docx", "docx")
+    cmd, preprocess_calls = await _run_conversion_capturing_cmd(b"PK\x03\x04docx-bytes", "docx", "docx")
 
     assert preprocess_calls == 0
     assert "docx+styles" not in cmd
     assert f"--lua-filter={FILTERS['docx_colors_to_latex']}" not in cmd
+    assert f"--lua-filter={FILTERS['docx_latex_bundle']}" not in cmd
 
 
-def test_run_pandoc_conversion_skips_docx_color_preprocessor_for_non_docx_source():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_skips_docx_color_preprocessor_for_non_docx_source():
     """HTML -> PDF must not trigger the DOCX preprocessor; it only handles
     DOCX inputs."""
-    cmd, preprocess_calls = _run_conversion_capturing_cmd("<p>x</p>", "html", "pdf")
+    cmd, preprocess_calls = await _run_conversion_capturing_cmd("<p>x</p>", "html", "pdf")
 
     assert preprocess_calls == 0
     assert "html+styles" not in cmd
     assert f"--lua-filter={FILTERS['docx_colors_to_latex']}" not in cmd
+    assert f"--lua-filter={FILTERS['docx_latex_bundle']}" not in cmd
+
+
+def test_docx_latex_filters_run_as_one_bundle():
+    cmd = _build_pandoc_command(source_format="docx", target_format="latex", source_path="in.docx", output_path="out.tex", validated_options=[])
+
+    assert [argument for argument in cmd if "docx_" in argument] == [f"--lua-filter={FILTERS['docx_latex_bundle']}"]
+
+
+def test_docx_latex_filters_run_one_by_one_without_the_bundle():
+    with patch.dict(os.environ, {"DOCX_LATEX_FILTER_BUNDLE": "false"}):
+        cmd = _build_pandoc_command(source_format="docx", target_format="latex", source_path="in.docx", output_path="out.tex", validated_options=[])
+
+    assert [argument for argument in cmd if "docx_" in argument] == [f"--lua-filter={FILTERS[name]}" for name in DOCX_LATEX_FILTERS]
+
+
+def test_the_bundle_is_told_which_filters_to_skip():
+    skipped = frozenset({"docx_lists_to_latex", "docx_math_color_pre_process", "docx_tables_to_latex"})
+    cmd = _build_pandoc_command(source_format="docx", target_format="latex", source_path="in.docx", output_path="out.tex", validated_options=[], skipped_filters=skipped)
+
+    assert f"--lua-filter={FILTERS['docx_latex_bundle']}" in cmd
+    assert cmd[cmd.index("-V") + 1] == "skip-filters=docx_lists_to_latex,docx_tables_to_latex"
+
+
+def test_skipped_filters_are_left_out_without_the_bundle():
+    skipped = frozenset({"docx_lists_to_latex", "docx_tables_to_latex"})
+    with patch.dict(os.environ, {"DOCX_LATEX_FILTER_BUNDLE": "false"}):
+        cmd = _build_pandoc_command(source_format="docx", target_format="latex", source_path="in.docx", output_path="out.tex", validated_options=[], skipped_filters=skipped)
+
+    assert [argument for argument in cmd if "docx_" in argument] == [f"--lua-filter={FILTERS[name]}" for name in DOCX_LATEX_FILTERS if name not in skipped]
+    assert "-V" not in cmd
+
+
+@pytest.mark.asyncio
+async def test_an_html_source_without_tables_skips_the_table_filter():
+    cmd, _ = await _run_conversion_capturing_cmd(b"<p>x</p>", "html", "latex")
+
+    assert f"--lua-filter={FILTERS['html_tables_to_latex']}" not in cmd
+
+
+@pytest.mark.asyncio
+async def test_no_filter_is_skipped_with_the_content_scan_off():
+    with patch.dict(os.environ, {"PIPELINE_CONTENT_SCAN": "false"}):
+        cmd, _ = await _run_conversion_capturing_cmd(b"<p>x</p>", "html", "latex")
+
+    assert f"--lua-filter={FILTERS['html_tables_to_latex']}" in cmd
 
 
 def test_version_endpoint():
     """Test the version endpoint."""
+    capabilities = Capabilities(pandoc_version="3.1.9", tectonic="available", tectonic_version="0.16.9", chromium_version="148.0.7778.96")
     with (
-        patch("subprocess.run") as mock_subprocess,
+        patch("app.pandoc_controller.get_capabilities", return_value=capabilities),
         patch.dict(os.environ, {"PANDOC_SERVICE_VERSION": "1.0.0", "PANDOC_SERVICE_BUILD_TIMESTAMP": "2024-03-27"}),
-        patch("app.pandoc_controller.get_chromium_manager") as mock_get_manager,
     ):
-        # Mock subprocess run result
-        mock_process = MagicMock()
-        mock_process.stdout = "pandoc 3.1.9\nCopyright (C) 2006-2023 John MacFarlane"
-        mock_subprocess.return_value = mock_process
-        mock_get_manager.return_value.get_version.return_value = "148.0.7778.96"
-
         # Simulate calling the version endpoint
         result = version()
 
@@ -288,52 +347,36 @@ def test_version_endpoint():
         assert result.apiVersion == API_VERSION
         assert result.python == platform.python_version()
         assert result.pandoc == "3.1.9"
+        assert result.tectonic == "0.16.9"
         assert result.pandocService == "1.0.0"
         assert result.timestamp == "2024-03-27"
         assert result.chromium == "148.0.7778.96"
 
 
-def test_version_endpoint_with_subprocess_error():
-    """Test the version endpoint when subprocess fails."""
-    with patch("subprocess.run") as mock_subprocess, patch.dict(os.environ, {"PANDOC_SERVICE_VERSION": "1.0.0", "PANDOC_SERVICE_BUILD_TIMESTAMP": "2024-03-27"}):
-        # Mock subprocess raising an exception
-        mock_subprocess.side_effect = subprocess.SubprocessError("Command failed")
-
+def test_version_endpoint_without_probed_binaries():
+    """Test the version endpoint when the binaries could not be probed."""
+    with (
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities()),
+        patch.dict(os.environ, {"PANDOC_SERVICE_VERSION": "1.0.0", "PANDOC_SERVICE_BUILD_TIMESTAMP": "2024-03-27"}),
+    ):
         # Simulate calling the version endpoint
         result = version()
 
         # Assertions
         assert result.python == platform.python_version()
-        assert result.pandoc is None  # Should be None when subprocess fails
+        assert result.pandoc is None  # Should be None when pandoc could not be run
+        assert result.tectonic is None
         assert result.pandocService == "1.0.0"
         assert result.timestamp == "2024-03-27"
 
 
-def test_get_tectonic_availability_available():
-    """Return available when tectonic command succeeds."""
-    with patch("app.pandoc_controller.subprocess.run") as mock_subprocess:
-        mock_subprocess.return_value = MagicMock(returncode=0)
-
-        result = get_tectonic_availability()
-
-        assert result == "available"
-        mock_subprocess.assert_called_once_with(["/usr/bin/tectonic", "--version"], capture_output=True, check=True)
-
-
-def test_get_tectonic_availability_unavailable():
-    """Return unavailable when subprocess error occurs."""
-    with patch("app.pandoc_controller.subprocess.run", side_effect=FileNotFoundError("not found")):
-        result = get_tectonic_availability()
-
-        assert result == "unavailable"
+def test_version_endpoint_does_not_spawn_processes():
+    """The version is read from the capabilities snapshot, not from a fresh pandoc --version."""
+    with patch("subprocess.run") as mock_subprocess, patch("anyio.run_process") as mock_run_process:
+        version()
 
-
-def test_get_tectonic_availability_unknown_on_unexpected_error():
-    """Return unknown when an unexpected error occurs."""
-    with patch("app.pandoc_controller.subprocess.run", side_effect=RuntimeError("not found")):
-        result = get_tectonic_availability()
-
-        assert result == "unknown"
+    mock_subprocess.assert_not_called()
+    mock_run_process.assert_not_called()
 
 
 def test_get_temp_directory_writability_writable(tmp_path: Path):
@@ -362,8 +405,7 @@ def test_health_endpoint_healthy():
     """Test health endpoint directly. All healthy outputs"""
     with (
         patch("app.pandoc_controller.get_temp_directory_writability", return_value="writable"),
-        patch("app.pandoc_controller.get_tectonic_availability", return_value="available"),
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.1.9"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9", tectonic="available")),
     ):
         test_client = TestClient(app)
         response = test_client.get("/health")
@@ -379,8 +421,7 @@ def test_health_endpoint_unhealthy_temp_unwritable():
     """Test health endpoint directly. Two unhealthy outputs"""
     with (
         patch("app.pandoc_controller.get_temp_directory_writability", return_value="unwritable"),
-        patch("app.pandoc_controller.get_tectonic_availability", return_value="available"),
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.1.9"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9", tectonic="available")),
     ):
         test_client = TestClient(app)
         response = test_client.get("/health")
@@ -396,8 +437,7 @@ def test_health_endpoint_unhealthy_unknown_tectonic_error():
     """Test health endpoint directly. Two unhealthy outputs"""
     with (
         patch("app.pandoc_controller.get_temp_directory_writability", return_value="writable"),
-        patch("app.pandoc_controller.get_tectonic_availability", return_value="unknown"),
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.1.9"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9", tectonic="unknown")),
     ):
         test_client = TestClient(app)
         response = test_client.get("/health")
@@ -413,8 +453,7 @@ def test_health_endpoint_unhealthy_pandoc_unavailable():
     """Test health endpoint directly. Two unhealthy outputs"""
     with (
         patch("app.pandoc_controller.get_temp_directory_writability", return_value="writable"),
-        patch("app.pandoc_controller.get_tectonic_availability", return_value="available"),
-        patch("app.pandoc_controller.get_pandoc_version", return_value=None),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version=None, tectonic="available")),
     ):
         test_client = TestClient(app)
         response = test_client.get("/health")
@@ -426,11 +465,89 @@ def test_health_endpoint_unhealthy_pandoc_unavailable():
         assert response_json["filesystem"] == "writable"
 
 
+def test_health_live_endpoint():
+    """Liveness checks nothing but the process answering."""
+    with patch("app.pandoc_controller.check_dependencies") as mock_check:
+        response = TestClient(app).get("/health/live")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "alive"}
+    mock_check.assert_not_called()
+
+
+def test_health_ready_endpoint_ready():
+    with (
+        patch("app.pandoc_controller.get_temp_directory_writability", return_value="writable"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9", tectonic="available")),
+        patch("app.pandoc_controller.get_conversion_executor") as mock_get_executor,
+    ):
+        mock_get_executor.return_value.is_saturated.return_value = False
+        response = TestClient(app).get("/health/ready")
+
+    response_json = response.json()
+    assert response.status_code == 200
+    assert response_json["status"] == "ready"
+    assert response_json["pandoc"] == "available"
+    assert response_json["queue"] == "available"
+
+
+def test_health_ready_endpoint_not_ready_when_queue_saturated():
+    """A busy replica is taken out of rotation, but stays healthy."""
+    with (
+        patch("app.pandoc_controller.get_temp_directory_writability", return_value="writable"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9", tectonic="available")),
+        patch("app.pandoc_controller.get_conversion_executor") as mock_get_executor,
+    ):
+        mock_get_executor.return_value.is_saturated.return_value = True
+        test_client = TestClient(app)
+        ready_response = test_client.get("/health/ready")
+        health_response = test_client.get("/health")
+
+    assert ready_response.status_code == 503
+    assert ready_response.json()["status"] == "not ready"
+    assert ready_response.json()["queue"] == "saturated"
+    assert health_response.status_code == 200
+
+
+def test_health_ready_endpoint_not_ready_when_unhealthy():
+    with (
+        patch("app.pandoc_controller.get_temp_directory_writability", return_value="unwritable"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9", tectonic="available")),
+        patch("app.pandoc_controller.get_conversion_executor") as mock_get_executor,
+    ):
+        mock_get_executor.return_value.is_saturated.return_value = False
+        response = TestClient(app).get("/health/ready")
+
+    assert response.status_code == 503
+    assert response.json()["status"] == "not ready"
+    assert response.json()["filesystem"] == "unwritable"
+    assert response.json()["queue"] == "available"
+
+
+@pytest.mark.asyncio
+async def test_health_endpoints_answer_from_the_probed_snapshot():
+    """While the prober runs, a health request does not repeat the dependency check."""
+    with (
+        patch("app.pandoc_controller.get_temp_directory_writability", return_value="writable") as mock_writability,
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9", tectonic="available")),
+    ):
+        await health_prober.start()
+        try:
+            test_client = TestClient(app)
+            for _ in range(5):
+                assert test_client.get("/health").status_code == 200
+                assert test_client.get("/health/ready").status_code == 200
+        finally:
+            await health_prober.stop()
+
+    assert mock_writability.call_count == 1
+
+
 def test_convert_endpoint_error_handling():
     """Test error handling in conversion endpoints."""
-    with patch("subprocess.run") as mock_subprocess:
+    with patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run:
         # Simulate subprocess error
-        mock_subprocess.side_effect = subprocess.CalledProcessError(1, "pandoc")
+        mock_run.side_effect = subprocess.CalledProcessError(1, "pandoc")
 
         test_client = TestClient(app)
         source_file = File(
@@ -485,10 +602,11 @@ def test_process_error():
     assert "Custom error message" in response.body.decode("utf-8")
 
 
-def test_postprocess_and_build_response():
+@pytest.mark.asyncio
+async def test_postprocess_and_build_response():
     """Test the postprocess_and_build_response function."""
     with (
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.1.9"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9")),
         patch("app.docx_post_process.process", return_value=b"Processed DOCX content"),
         patch.dict(os.environ, {"PANDOC_SERVICE_VERSION": "1.0.0"}),
     ):
@@ -496,7 +614,7 @@ def test_postprocess_and_build_response():
         docx_content = b"Test DOCX content"
 
         # Test with DOCX format (should call process)
-        response = postprocess_and_build_response(docx_content, "docx", "test.docx")
+        response = await postprocess_and_build_response(docx_content, "docx", "test.docx")
 
         # Assertions
         assert response.status_code == 200
@@ -509,7 +627,7 @@ def test_postprocess_and_build_response():
 
         # Test with non-DOCX format (should not call process)
         pdf_content = b"Test PDF content"
-        response = postprocess_and_build_response(pdf_content, "pdf", "test.pdf")
+        response = await postprocess_and_build_response(pdf_content, "pdf", "test.pdf")
 
         assert response.status_code == 200
         assert response.headers.get("content-type") == "application/pdf"
@@ -581,85 +699,177 @@ def create_mock_docx(files: dict[str, bytes] | None = None) -> bytes:
     return buffer.getvalue()
 
 
-def test_run_pandoc_conversion_with_string_input():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_with_string_input():
     """Test run_pandoc_conversion function with string input."""
-    # Mock subprocess.run
+    # A text conversion of a source in memory goes through pandoc's stdin and stdout.
     with (
-        patch("subprocess.run") as mock_subprocess,
-        patch("pathlib.Path.open", mock_open(read_data=b"Converted content")),
-        patch("pathlib.Path.exists", return_value=True),
-        patch("pathlib.Path.unlink"),
+        patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"Converted content")) as mock_run_piped,
+        patch("tempfile.NamedTemporaryFile") as mock_tempfile,
     ):
-        # Set up mock subprocess
-        mock_subprocess.return_value.returncode = 0
+        result = await run_pandoc_conversion("# Test markdown", "markdown", "html")
 
-        # Create mock files with context manager behavior
-        source_file_mock = MagicMock()
-        source_file_mock.name = "source.md"
-        output_file_mock = MagicMock()
-        output_file_mock.name = "output.html"
+    assert result == b"Converted content"
+    expected_cmd = ["/usr/local/bin/pandoc", "-f", "markdown", "-t", "html", "-o", "-", "-", "--sandbox", "+RTS", "-qg", "-RTS"]
+    mock_run_piped.assert_called_once_with(expected_cmd, b"# Test markdown")
+    mock_tempfile.assert_not_called()
 
-        # Create mock context managers for NamedTemporaryFile
-        mock_context_src = MagicMock()
-        mock_context_src.__enter__.return_value = source_file_mock
 
-        mock_context_out = MagicMock()
-        mock_context_out.__enter__.return_value = output_file_mock
-
-        # Patch tempfile.NamedTemporaryFile to return our mock context managers
-        with patch("tempfile.NamedTemporaryFile", side_effect=[mock_context_src, mock_context_out]):
-            # Test with string input
-            result = run_pandoc_conversion("# Test markdown", "markdown", "html")
-
-            # Assertions
-            assert mock_subprocess.called
-            assert result == b"Converted content"
-
-            # Verify subprocess.run was called with correct args
-            expected_cmd = ["/usr/local/bin/pandoc", "-f", "markdown", "-t", "html", "-o", "output.html", "source.md", "--sandbox"]
-            mock_subprocess.assert_called_once_with(expected_cmd, check=True, shell=False, stdin=subprocess.PIPE)
-
-
-def test_convert_with_encoding():
+def test_convert_with_encoding(tmp_path):
     """Test the convert endpoint with encoding parameter."""
-    # Create patches for the required functions
-    with patch("app.pandoc_controller.run_pandoc_conversion", return_value=b"<html>Test</html>") as mock_convert, patch("app.pandoc_controller.postprocess_and_build_response") as mock_postprocess:
-        # Set up mock for Response
-        mock_response = Response(b"<html>Test</html>", media_type="text/html", status_code=200)
-        mock_postprocess.return_value = mock_response
-
+    output_path = write_pandoc_output(tmp_path, b"<html>Test</html>")
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(return_value=output_path)) as mock_convert:
         test_client = TestClient(app)
         # Send a request with encoding specified
         response = test_client.post("/convert/markdown/to/html?encoding=utf-8", content=b"# Test Content")
 
         # Assertions
         mock_convert.assert_called_once_with("# Test Content", "markdown", "html", DEFAULT_CONVERSION_OPTIONS, preserve_table_styles=False)
-        mock_postprocess.assert_called_once_with(b"<html>Test</html>", "html", "converted-document.html", None, None, None)
         assert response.status_code == 200
         assert response.headers.get("content-type") == "text/html; charset=utf-8"
         assert response.content == b"<html>Test</html>"
 
 
-def test_convert_with_custom_filename():
+def test_convert_with_custom_filename(tmp_path):
     """Test the convert endpoint with custom filename parameter."""
-    # Create patches for the required functions
-    with patch("app.pandoc_controller.run_pandoc_conversion", return_value=b"<html>Test</html>") as mock_convert, patch("app.pandoc_controller.postprocess_and_build_response") as mock_postprocess:
-        # Set up mock for Response
-        mock_response = Response(b"<html>Test</html>", media_type="text/html", status_code=200)
-        mock_postprocess.return_value = mock_response
-
+    output_path = write_pandoc_output(tmp_path, b"<html>Test</html>")
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(return_value=output_path)) as mock_convert:
         test_client = TestClient(app)
         # Send a request with custom filename
         response = test_client.post("/convert/markdown/to/html?file_name=custom.html", content=b"# Test Content")
 
         # Assertions
         mock_convert.assert_called_once_with(b"# Test Content", "markdown", "html", DEFAULT_CONVERSION_OPTIONS, preserve_table_styles=False)
-        mock_postprocess.assert_called_once_with(b"<html>Test</html>", "html", "custom.html", None, None, None)
         assert response.status_code == 200
         assert response.headers.get("content-type") == "text/html; charset=utf-8"
+        assert response.headers.get("content-disposition") == "attachment; filename=custom.html"
         assert response.content == b"<html>Test</html>"
 
 
+def test_convert_past_its_deadline_returns_504():
+    """A conversion that outlives its timeout is cancelled and answered with 504."""
+
+    async def never_finishes(*_args, **_kwargs):
+        await asyncio.sleep(10)
+
+    active_before = get_pandoc_metrics().active_conversions
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", side_effect=never_finishes):
+        response = TestClient(app).post("/convert/markdown/to/html?timeout=0.1", content=b"# Test Content")
+
+    assert response.status_code == 504
+    assert response.text == "Conversion timed out after 0.1 seconds"
+    assert get_pandoc_metrics().active_conversions == active_before
+
+
+@pytest.fixture
+def job_manager(tmp_path):
+    """A job manager on a store of its own. Its workers are not started, so submitted jobs stay queued."""
+    manager = JobManager(run_conversion_job, store=JobStore(root=tmp_path / "jobs", ttl=60, max_bytes=1024 * 1024), max_workers=1, max_queued=10)
+    with patch("app.pandoc_controller.job_manager", manager):
+        yield manager
+
+
+def test_submit_conversion_job(job_manager):
+    """A submitted job is stored and answered with 202 and the job to poll."""
+    response = TestClient(app).post("/jobs/convert/markdown/to/pdf?paper_size=A4&file_name=report.pdf", content=b"# Test Content")
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert job["targetFormat"] == "pdf"
+    assert job["fileName"] == "report.pdf"
+    assert job["finishedAt"] is None
+    assert response.headers["location"] == f"/jobs/{job['jobId']}"
+    stored = job_manager.get(job["jobId"])
+    assert stored.paper_size == "A4"
+    assert job_manager.store.get_source_path(stored.job_id).read_bytes() == b"# Test Content"
+    assert job_manager.get_queue_size() == 1
+
+
+def test_submit_conversion_job_while_the_queue_is_full(job_manager):
+    job_manager.max_queued = 0
+
+    response = TestClient(app).post("/jobs/convert/markdown/to/pdf", content=b"# Test Content")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+
+@pytest.mark.parametrize("formats", ["docx/to/wav", "mp3/to/pdf"])
+def test_submit_conversion_job_with_an_unsupported_format(job_manager, formats):
+    response = TestClient(app).post(f"/jobs/convert/{formats}", content=b"# Test Content")
+
+    assert response.status_code == 400
+    assert "Invalid" in response.text
+    assert job_manager.get_queue_size() == 0
+    assert job_manager.store.list_jobs() == []
+
+
+def test_get_conversion_job(job_manager):
+    job = ConversionJob(source_format="markdown", target_format="pdf", file_name="out.pdf", status="failed", finished_at=0.0, error="pandoc exited with 43")
+    job_manager.store.create(job, b"# x")
+
+    response = TestClient(app).get(f"/jobs/{job.job_id}")
+
+    assert response.status_code == 200
+    assert response.json()["error"] == "pandoc exited with 43"
+    assert response.json()["expiresAt"] == "1970-01-01T00:01:00+00:00"
+
+
+@pytest.mark.usefixtures("job_manager")
+@pytest.mark.parametrize("path", ["/jobs/0123456789abcdef0123456789abcdef", "/jobs/0123456789abcdef0123456789abcdef/result", "/jobs/..%2F..%2Fetc"])
+def test_unknown_conversion_job_returns_404(path):
+    assert TestClient(app).get(path).status_code == 404
+
+
+def test_result_of_an_unfinished_job_returns_409(job_manager):
+    job = ConversionJob(source_format="markdown", target_format="pdf", file_name="out.pdf")
+    job_manager.store.create(job, b"# x")
+
+    response = TestClient(app).get(f"/jobs/{job.job_id}/result")
+
+    assert response.status_code == 409
+    assert response.text == f"Job {job.job_id} is queued"
+
+
+def test_result_of_a_succeeded_job(job_manager):
+    job = ConversionJob(source_format="markdown", target_format="html", file_name="out.html", status=JOB_SUCCEEDED)
+    job_manager.store.create(job, b"# x")
+    job_manager.store.store_result(job.job_id, b"<h1>x</h1>")
+
+    response = TestClient(app).get(f"/jobs/{job.job_id}/result")
+
+    assert response.status_code == 200
+    assert response.content == b"<h1>x</h1>"
+    assert response.headers["content-type"] == "text/html; charset=utf-8"
+    assert response.headers["content-disposition"] == "attachment; filename=out.html"
+
+
+def test_delete_conversion_job(job_manager):
+    job = ConversionJob(source_format="markdown", target_format="pdf", file_name="out.pdf")
+    job_manager.store.create(job, b"# x")
+    test_client = TestClient(app)
+
+    assert test_client.delete(f"/jobs/{job.job_id}").status_code == 204
+    assert test_client.delete(f"/jobs/{job.job_id}").status_code == 404
+    assert test_client.get(f"/jobs/{job.job_id}").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_run_conversion_job_runs_the_conversion_pipeline(tmp_path):
+    source = tmp_path / "source"
+    source.write_bytes(b"# Test Content")
+    output_path = write_pandoc_output(tmp_path, b"<h1>Test Content</h1>")
+    job = ConversionJob(source_format="markdown", target_format="html", file_name="out.html")
+    successes_before = get_pandoc_metrics().total_conversions
+
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(return_value=output_path)) as mock_convert:
+        assert await run_conversion_job(job, source) == output_path
+
+    mock_convert.assert_called_once_with(source, "markdown", "html", DEFAULT_CONVERSION_OPTIONS, preserve_table_styles=False)
+    assert get_pandoc_metrics().total_conversions == successes_before + 1
+
+
 def test_convert_docx_with_ref_source_text():
     """Test convert_docx_with_ref function using text in form data."""
     # Create patches for the required functions
@@ -731,12 +941,10 @@ def test_convert_docx_with_ref_no_template():
         assert response.content == b"DOCX content"
 
 
-def test_convert_docx_to_pdf_with_custom_filename():
+def test_convert_docx_to_pdf_with_custom_filename(tmp_path):
     """Test DOCX to PDF conversion with custom filename and PDF engine."""
-    with patch("app.pandoc_controller.run_pandoc_conversion", return_value=b"%PDF-test") as mock_convert, patch("app.pandoc_controller.postprocess_and_build_response") as mock_postprocess:
-        mock_response = Response(content=b"%PDF-test", media_type="application/pdf", status_code=200)
-        mock_postprocess.return_value = mock_response
-
+    output_path = write_pandoc_output(tmp_path, b"%PDF-test")
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(return_value=output_path)) as mock_convert:
         test_client = TestClient(app)
 
         with Path("tests/data/test-input.docx").open("rb") as file:
@@ -750,10 +958,9 @@ def test_convert_docx_to_pdf_with_custom_filename():
         assert args[2] == "pdf"
         assert "--pdf-engine=tectonic" in args[3]
 
-        mock_postprocess.assert_called_once_with(b"%PDF-test", "pdf", "custom.pdf", None, None, None)
-
         assert response.status_code == 200
         assert response.headers["content-type"] == "application/pdf"
+        assert response.headers["content-disposition"] == "attachment; filename=custom.pdf"
         assert response.content == b"%PDF-test"
 
 
@@ -778,12 +985,14 @@ def test_convert_docx_with_ref_exception():
         assert response.status_code == 400
 
 
-def test_run_pandoc_conversion_validation_edge_cases():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_validation_edge_cases():
     """Test edge cases in the option validation logic of run_pandoc_conversion."""
     with (
-        patch("subprocess.run"),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock),
+        patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"Test content")),
         patch("tempfile.NamedTemporaryFile") as mock_tempfile,
-        patch("pathlib.Path.open", mock_open(read_data=b"Test content")),
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"Test content")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
@@ -811,22 +1020,23 @@ def test_run_pandoc_conversion_validation_edge_cases():
         target_format = "html"
 
         # Should not raise any errors with empty options
-        run_pandoc_conversion(source_data, source_format, target_format, [])
+        await run_pandoc_conversion(source_data, source_format, target_format, [])
 
         # Test with None options (should default to empty list)
-        run_pandoc_conversion(source_data, source_format, target_format, None)
+        await run_pandoc_conversion(source_data, source_format, target_format, None)
 
         # Test bytes input instead of string
         source_data_bytes = b"# Test Markdown"
-        run_pandoc_conversion(source_data_bytes, source_format, target_format, [])
+        await run_pandoc_conversion(source_data_bytes, source_format, target_format, [])
 
 
-def test_run_pandoc_conversion_with_invalid_option():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_with_invalid_option():
     """Test that run_pandoc_conversion rejects invalid options."""
     with (
-        patch("subprocess.run") as mock_subprocess,
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
         patch("tempfile.NamedTemporaryFile") as mock_tempfile,
-        patch("pathlib.Path.open", mock_open(read_data=b"Test content")),
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"Test content")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
@@ -845,18 +1055,19 @@ def test_run_pandoc_conversion_with_invalid_option():
 
         # Verify that an error is raised
         with pytest.raises(ValueError, match=f"Invalid pandoc option: {invalid_option}"):
-            run_pandoc_conversion(source_data, source_format, target_format, [invalid_option])
+            await run_pandoc_conversion(source_data, source_format, target_format, [invalid_option])
 
-        # Ensure subprocess.run was not called
-        mock_subprocess.assert_not_called()
+        # Ensure pandoc was not run
+        mock_run.assert_not_called()
 
 
-def test_run_pandoc_conversion_with_command_injection_attempt():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_with_command_injection_attempt():
     """Test that run_pandoc_conversion prevents command injection attempts."""
     with (
-        patch("subprocess.run") as mock_subprocess,
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
         patch("tempfile.NamedTemporaryFile") as mock_tempfile,
-        patch("pathlib.Path.open", mock_open(read_data=b"Test content")),
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"Test content")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
@@ -875,18 +1086,19 @@ def test_run_pandoc_conversion_with_command_injection_attempt():
 
         # Verify that an error is raised
         with pytest.raises(ValueError, match=f"Invalid pandoc option: {injection_option}"):
-            run_pandoc_conversion(source_data, source_format, target_format, [injection_option])
+            await run_pandoc_conversion(source_data, source_format, target_format, [injection_option])
 
-        # Ensure subprocess.run was not called
-        mock_subprocess.assert_not_called()
+        # Ensure pandoc was not run
+        mock_run.assert_not_called()
 
 
-def test_run_pandoc_conversion_with_valid_reference_doc():
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_with_valid_reference_doc():
     """Test that run_pandoc_conversion accepts valid reference-doc options."""
     with (
-        patch("subprocess.run") as mock_subprocess,
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
         patch("tempfile.NamedTemporaryFile") as mock_tempfile,
-        patch("pathlib.Path.open", mock_open(read_data=b"Test content")),
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"Test content")),
         patch("pathlib.Path.exists", return_value=True),
         patch("pathlib.Path.unlink"),
     ):
@@ -904,11 +1116,11 @@ def test_run_pandoc_conversion_with_valid_reference_doc():
         valid_option = "--reference-doc=ref_1234567890.docx"
 
         # Should not raise any errors
-        run_pandoc_conversion(source_data, source_format, target_format, [valid_option])
+        await run_pandoc_conversion(source_data, source_format, target_format, [valid_option])
 
-        # Ensure subprocess.run was called with the correct arguments
-        mock_subprocess.assert_called_once()
-        args, _ = mock_subprocess.call_args
+        # Ensure pandoc was run with the correct arguments
+        mock_run.assert_called_once()
+        args, _ = mock_run.call_args
         cmd = args[0]
         assert valid_option in cmd
 
@@ -948,11 +1160,12 @@ def test_convert_docx_with_ref_no_source_file():
     assert b"No data or file provided using key 'source'" in response.content
 
 
-def test_postprocess_and_build_response_with_headers():
+@pytest.mark.asyncio
+async def test_postprocess_and_build_response_with_headers():
     """Test postprocess_and_build_response with all headers."""
     with (
         patch("app.docx_post_process.process", side_effect=lambda x, y=None, z=None, layouts=None: x),
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.1.9"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.1.9")),
         patch.dict(os.environ, {"PANDOC_SERVICE_VERSION": "1.0.0"}),
     ):
         # Test with DOCX format (triggers postprocessing)
@@ -961,7 +1174,7 @@ def test_postprocess_and_build_response_with_headers():
         file_name = "test.docx"
 
         # Call function
-        response = postprocess_and_build_response(output, target_format, file_name)
+        response = await postprocess_and_build_response(output, target_format, file_name)
 
         # Check headers
         assert response.headers.get("Content-Disposition") == "attachment; filename=test.docx"
@@ -975,7 +1188,7 @@ def test_postprocess_and_build_response_with_headers():
         file_name = "test.html"
 
         # Call function
-        response = postprocess_and_build_response(output, target_format, file_name)
+        response = await postprocess_and_build_response(output, target_format, file_name)
 
         # Check content and mime type
         assert response.body == output
@@ -998,31 +1211,9 @@ def test_process_error_with_multiline_message():
     assert response.headers.get("content-type") == "text/plain; charset=utf-8"
 
 
-def test_get_docx_template_with_path_handling():
-    """Test get_docx_template with path existence handling."""
-    # Create async mock for anyio.open_file
-    mock_file = AsyncMock()
-    mock_file.read = AsyncMock(return_value=b"Mock DOCX template content")
-
-    async_context_manager = AsyncMock()
-    async_context_manager.__aenter__ = AsyncMock(return_value=mock_file)
-    async_context_manager.__aexit__ = AsyncMock(return_value=None)
-
-    with (
-        patch("anyio.run_process") as mock_run_process,
-        patch("pathlib.Path.exists", side_effect=[False, True]),  # False for initial check, True for finally
-        patch("pathlib.Path.unlink"),
-        patch("app.pandoc_controller.anyio.open_file", return_value=async_context_manager),
-        patch("fastapi.responses.StreamingResponse") as mock_send_file,
-    ):
-        # Mock the anyio.run_process to avoid calling the real pandoc
-        process_mock = MagicMock()
-        process_mock.returncode = 0
-        mock_run_process.return_value = process_mock
-
-        # Mock send_file to return a response
-        mock_response = Response(b"Mock DOCX template content", media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", status_code=200)
-        mock_send_file.return_value = mock_response
+def test_get_docx_template_with_path_handling(reference_doc_cache):
+    """Test get_docx_template sends the generated template."""
+    with patch("anyio.run_process", side_effect=fake_template_pandoc(b"Mock DOCX template content")):
         test_client = TestClient(app)
         # Call endpoint using test client
         response = test_client.get("/docx-template")
@@ -1030,22 +1221,13 @@ def test_get_docx_template_with_path_handling():
         # Assertions
         assert response.status_code == 200
         assert response.headers.get("content-type") == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        assert response.headers.get("content-disposition") == "attachment; filename=reference.docx"
 
 
-def test_convert_endpoint_with_custom_file_extension():
+def test_convert_endpoint_with_custom_file_extension(tmp_path):
     """Test convert endpoint with custom file extension."""
-    with (
-        patch("app.pandoc_controller.run_pandoc_conversion") as mock_run_conversion,
-        patch("app.pandoc_controller.postprocess_and_build_response") as mock_postprocess,
-    ):
-        # Set up mocks
-        mock_run_conversion.return_value = b"Converted content"
-
-        # Create mock response
-        mock_response = MagicMock()
-        mock_response.mimetype = "text/html"
-        mock_response.status_code = 200
-        mock_postprocess.return_value = mock_response
+    output_path = write_pandoc_output(tmp_path, b"Converted content")
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(return_value=output_path)):
         test_client = TestClient(app)
         # Create client and send request with custom file extension
         response = test_client.post("/convert/markdown/to/html?file_name=custom_name.html", content="# Test markdown")
@@ -1053,8 +1235,8 @@ def test_convert_endpoint_with_custom_file_extension():
         # Assertions
         assert response.status_code == 200
 
-        # Verify the custom filename was passed to postprocess_and_build_response
-        mock_postprocess.assert_called_once_with(b"Converted content", "html", "custom_name.html", None, None, None)
+        # Verify the custom filename reached the response
+        assert response.headers["content-disposition"] == "attachment; filename=custom_name.html"
 
 
 def test_docx_with_template_encoding():
@@ -1099,9 +1281,15 @@ def test_docx_with_template_encoding():
         # Assertions
         assert response.status_code == 200
 
-        # Verify the reference doc option was passed
+        # Verify the reference doc option was passed, with a template file of the request's own
         run_options = mock_run_conversion.call_args[0][3]
-        assert any("--reference-doc=ref_1234567890.docx" in opt for opt in run_options)
+        reference_docs = [opt.removeprefix("--reference-doc=") for opt in run_options if opt.startswith("--reference-doc=")]
+        assert len(reference_docs) == 1
+        assert Path(reference_docs[0]).name.startswith("pandoc-template-")
+        assert reference_docs[0].endswith(".docx")
+
+    # Path.unlink was patched for the request.
+    Path(reference_docs[0]).unlink(missing_ok=True)
 
 
 def test_request_body_too_large():
@@ -1244,92 +1432,122 @@ def test_get_request_body_limit_mb_logging_message_content():
         assert "500 MB" in warning_message
 
 
-# Tests for async file I/O in get_docx_template
-def test_get_docx_template_uses_async_file_io():
-    """Test that get_docx_template uses async file I/O with anyio.open_file."""
-    mock_file = AsyncMock()
-    mock_file.read = AsyncMock(return_value=b"Mock DOCX template content")
+# Tests for the default reference documents
+@pytest.fixture
+def reference_doc_cache():
+    cache = ReferenceDocCache()
+    with patch("app.pandoc_controller.get_reference_doc_cache", return_value=cache):
+        yield cache
+
+
+def test_get_docx_template_is_generated_once(reference_doc_cache):
+    """The template is generated by the first download and served from memory afterwards."""
+    written: list[Path] = []
+    with patch("anyio.run_process", side_effect=fake_template_pandoc(b"Mock DOCX template content", written)):
+        test_client = TestClient(app)
+        first = test_client.get("/docx-template")
+        second = test_client.get("/docx-template")
 
-    async_context_manager = AsyncMock()
-    async_context_manager.__aenter__ = AsyncMock(return_value=mock_file)
-    async_context_manager.__aexit__ = AsyncMock(return_value=None)
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content == b"Mock DOCX template content"
+    assert len(written) == 1
+    assert written[0].name != "custom-reference.docx"
 
+
+def test_get_docx_template_is_generated_again_for_another_pandoc(reference_doc_cache):
+    with patch("anyio.run_process", side_effect=fake_template_pandoc(b"3.6")):
+        TestClient(app).get("/docx-template")
     with (
-        patch("anyio.run_process") as mock_run_process,
-        patch("pathlib.Path.exists", return_value=True),
-        patch("pathlib.Path.unlink"),
-        patch("app.pandoc_controller.anyio.open_file", return_value=async_context_manager) as mock_open_file,
+        patch("anyio.run_process", side_effect=fake_template_pandoc(b"3.7")),
+        patch("app.pandoc_controller.get_capabilities", return_value=MagicMock(pandoc_version="3.7")),
     ):
-        process_mock = MagicMock()
-        process_mock.returncode = 0
-        mock_run_process.return_value = process_mock
+        response = TestClient(app).get("/docx-template")
+
+    assert response.content == b"3.7"
+
 
+def test_get_docx_template_file_content(reference_doc_cache):
+    """Test that get_docx_template sends the file content unchanged, with its length."""
+    expected_content = b"Test DOCX binary content with special chars: \x00\x01\x02"
+
+    with patch("anyio.run_process", side_effect=fake_template_pandoc(expected_content)):
         test_client = TestClient(app)
         response = test_client.get("/docx-template")
 
         assert response.status_code == 200
-        # Verify anyio.open_file was called with correct arguments
-        mock_open_file.assert_called_once()
-        call_args = mock_open_file.call_args
-        assert str(call_args[0][0]) == "custom-reference.docx"
-        assert call_args[0][1] == "rb"
+        assert response.content == expected_content
+        assert response.headers["content-length"] == str(len(expected_content))
 
 
-def test_get_docx_template_async_file_read():
-    """Test that get_docx_template correctly reads file content asynchronously."""
-    expected_content = b"Test DOCX binary content with special chars: \x00\x01\x02"
+def test_get_docx_template_sends_etag_and_cache_control(reference_doc_cache):
+    content = b"Mock DOCX template content"
+    with patch("anyio.run_process", side_effect=fake_template_pandoc(content)):
+        test_client = TestClient(app)
+        response = test_client.get("/docx-template")
+        revalidated = test_client.get("/docx-template", headers={"If-None-Match": response.headers["etag"]})
 
-    mock_file = AsyncMock()
-    mock_file.read = AsyncMock(return_value=expected_content)
+    assert response.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+    assert response.headers["cache-control"] == "public, max-age=86400"
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == response.headers["etag"]
 
-    async_context_manager = AsyncMock()
-    async_context_manager.__aenter__ = AsyncMock(return_value=mock_file)
-    async_context_manager.__aexit__ = AsyncMock(return_value=None)
 
+def test_get_docx_template_is_private_behind_an_api_key(reference_doc_cache):
     with (
-        patch("anyio.run_process") as mock_run_process,
-        patch("pathlib.Path.exists", return_value=True),
-        patch("pathlib.Path.unlink"),
-        patch("app.pandoc_controller.anyio.open_file", return_value=async_context_manager),
+        patch.dict(os.environ, {"API_KEY": "secret"}),
+        patch("anyio.run_process", side_effect=fake_template_pandoc(b"Mock DOCX template content")),
     ):
-        process_mock = MagicMock()
-        process_mock.returncode = 0
-        mock_run_process.return_value = process_mock
+        response = TestClient(app).get("/docx-template", headers={"X-API-Key": "secret"})
 
-        test_client = TestClient(app)
-        response = test_client.get("/docx-template")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, max-age=86400"
 
-        assert response.status_code == 200
-        assert response.content == expected_content
-        # Verify async read was called
-        mock_file.read.assert_called_once()
 
+def fake_template_pandoc(content: bytes, written: list[Path] | None = None):
+    """An anyio.run_process stand-in that writes the template where pandoc's -o points."""
 
-def test_get_docx_template_cleanup_on_success():
-    """Test that temporary file is cleaned up after successful template generation."""
-    mock_file = AsyncMock()
-    mock_file.read = AsyncMock(return_value=b"Mock content")
+    async def run_process(cmd, **_kwargs):
+        output_path = Path(cmd[cmd.index("-o") + 1])
+        await anyio.Path(output_path).write_bytes(content)
+        if written is not None:
+            written.append(output_path)
+        process = MagicMock()
+        process.returncode = 0
+        return process
 
-    async_context_manager = AsyncMock()
-    async_context_manager.__aenter__ = AsyncMock(return_value=mock_file)
-    async_context_manager.__aexit__ = AsyncMock(return_value=None)
+    return run_process
 
-    with (
-        patch("anyio.run_process") as mock_run_process,
-        patch("pathlib.Path.exists", return_value=True),
-        patch("pathlib.Path.unlink") as mock_unlink,
-        patch("app.pandoc_controller.anyio.open_file", return_value=async_context_manager),
-    ):
-        process_mock = MagicMock()
-        process_mock.returncode = 0
-        mock_run_process.return_value = process_mock
 
+def test_get_docx_template_cleanup_on_success(reference_doc_cache):
+    """Test that temporary file is cleaned up after successful template generation."""
+    written: list[Path] = []
+    with patch("anyio.run_process", side_effect=fake_template_pandoc(b"Mock content", written)):
         test_client = TestClient(app)
         response = test_client.get("/docx-template")
 
         assert response.status_code == 200
         # Verify cleanup was performed
-        mock_unlink.assert_called_once()
+        assert len(written) == 1
+        assert not written[0].exists()
+
+
+def test_get_docx_template_cleanup_on_failure(reference_doc_cache):
+    """The temporary file is removed when pandoc fails, and nothing is cached."""
+    written: list[Path] = []
+
+    async def failing_pandoc(cmd, **_kwargs):
+        written.append(Path(cmd[cmd.index("-o") + 1]))
+        raise subprocess.CalledProcessError(1, cmd)
+
+    with patch("anyio.run_process", side_effect=failing_pandoc):
+        test_client = TestClient(app, raise_server_exceptions=False)
+        response = test_client.get("/docx-template")
+        assert test_client.get("/docx-template").status_code == 500
+
+    assert response.status_code == 500
+    assert len(written) == 2
+    assert not any(path.exists() for path in written)
 
 
 def create_mock_pptx() -> bytes:
@@ -1384,47 +1602,29 @@ def create_mock_pptx() -> bytes:
     return buffer.getvalue()
 
 
-def test_get_pptx_template():
+def test_get_pptx_template(reference_doc_cache):
     """Test the pptx template retrieval endpoint."""
-    with (
-        patch("anyio.run_process") as mock_run_process,
-        patch("pathlib.Path.exists", return_value=True),
-        patch("pathlib.Path.unlink"),
-        patch("anyio.open_file") as mock_open_file,
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.8.3"),
-    ):
-        # Mock the anyio.run_process to avoid calling the real pandoc
-        process_mock = MagicMock()
-        process_mock.returncode = 0
-        mock_run_process.return_value = process_mock
-
-        # Mock async file context manager
-        mock_file = AsyncMock()
-        mock_file.read = AsyncMock(return_value=create_mock_pptx())
-        mock_async_cm = AsyncMock()
-        mock_async_cm.__aenter__ = AsyncMock(return_value=mock_file)
-        mock_async_cm.__aexit__ = AsyncMock(return_value=None)
-        mock_open_file.return_value = mock_async_cm
-
+    with patch("anyio.run_process", side_effect=fake_template_pandoc(create_mock_pptx())):
         test_client = TestClient(app)
         response = test_client.get("/pptx-template")
 
         # Assertions
         assert response.status_code == 200
         assert response.headers.get("content-type") == "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        assert response.content == create_mock_pptx()
 
 
 def test_convert_pptx_with_template():
     """Test conversion to PPTX with a template."""
     with (
-        patch("subprocess.run"),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock),
         patch("time.time", return_value=1234567890),
         patch("pathlib.Path.unlink"),
         patch("pathlib.Path.exists", return_value=True),
         patch("anyio.open_file") as mock_anyio_open,
-        patch("pathlib.Path.open", create=True) as mock_path_open,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=create_mock_pptx())),
         patch("tempfile.NamedTemporaryFile") as mock_tempfile,
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.8.3"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.8.3")),
     ):
         # Setup mocks for tempfile
         mock_source_file = MagicMock()
@@ -1438,11 +1638,6 @@ def test_convert_pptx_with_template():
         mock_anyio_file.write = AsyncMock()
         mock_anyio_open.return_value.__aenter__.return_value = mock_anyio_file
 
-        # Setup mock for file reading (Path.open for run_pandoc_conversion output)
-        mock_file = MagicMock()
-        mock_file.read.return_value = create_mock_pptx()
-        mock_path_open.return_value.__enter__.return_value = mock_file
-
         # Prepare test data
         source_format = "markdown"
         source_content = b"# Test Markdown Content"
@@ -1462,13 +1657,13 @@ def test_convert_pptx_with_template():
 def test_convert_pptx_without_template():
     """Test conversion to PPTX without a template."""
     with (
-        patch("subprocess.run"),
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock),
         patch("time.time", return_value=1234567890),
         patch("pathlib.Path.unlink"),
         patch("pathlib.Path.exists", return_value=True),
-        patch("pathlib.Path.open", create=True) as mock_path_open,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=create_mock_pptx())),
         patch("tempfile.NamedTemporaryFile") as mock_tempfile,
-        patch("app.pandoc_controller.get_pandoc_version", return_value="3.8.3"),
+        patch("app.pandoc_controller.get_capabilities", return_value=Capabilities(pandoc_version="3.8.3")),
     ):
         # Setup mocks for tempfile
         mock_source_file = MagicMock()
@@ -1477,11 +1672,6 @@ def test_convert_pptx_without_template():
         mock_output_file.name = "output_file"
         mock_tempfile.side_effect = [mock_source_file, mock_output_file]
 
-        # Setup mock for file reading (Path.open for run_pandoc_conversion output)
-        mock_file = MagicMock()
-        mock_file.read.return_value = create_mock_pptx()
-        mock_path_open.return_value.__enter__.return_value = mock_file
-
         # Prepare test data
         source_format = "markdown"
         source_content = b"# Test Markdown Content"
@@ -1495,7 +1685,8 @@ def test_convert_pptx_without_template():
         assert response.headers.get("content-type") == "application/vnd.openxmlformats-officedocument.presentationml.presentation"
 
 
-def test_postprocess_and_build_response_pptx():
+@pytest.mark.asyncio
+async def test_postprocess_and_build_response_pptx():
     """Test postprocess_and_build_response with PPTX format."""
     with patch("app.pptx_post_process.process") as mock_pptx_process:
         mock_pptx_process.return_value = b"processed_pptx_content"
@@ -1505,7 +1696,7 @@ def test_postprocess_and_build_response_pptx():
         file_name = "test.pptx"
         slide_size = "16:9"
 
-        response = postprocess_and_build_response(output, target_format, file_name, slide_size, None)
+        response = await postprocess_and_build_response(output, target_format, file_name, slide_size, None)
 
         # Verify pptx_post_process.process was called
         mock_pptx_process.assert_called_once_with(output, slide_size)
@@ -1514,3 +1705,502 @@ def test_postprocess_and_build_response_pptx():
         assert response.status_code == 200
         assert response.media_type == "application/vnd.openxmlformats-officedocument.presentationml.presentation"
         assert "attachment; filename=test.pptx" in response.headers.get("content-disposition")
+
+
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_reads_a_spooled_source_where_it_lies(tmp_path):
+    """A spooled source needing no preprocessing goes to pandoc as it is, and stays for the caller to remove."""
+    spooled = tmp_path / "spooled.md"
+    spooled.write_bytes(b"# Title")
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("anyio.Path.read_bytes", AsyncMock(return_value=b"<h1>Title</h1>")),
+    ):
+        result = await run_pandoc_conversion(spooled, "markdown", "html")
+
+    assert result == b"<h1>Title</h1>"
+    cmd = mock_run.call_args.args[0]
+    assert cmd[cmd.index("-o") + 2] == str(spooled)
+    assert spooled.exists()
+
+
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_loads_a_spooled_source_to_preprocess_it(tmp_path):
+    spooled = tmp_path / "spooled.html"
+    spooled.write_bytes(b"<ul><li>x</li></ul>")
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        # The first read loads the spooled source, the second one the output.
+        patch("anyio.Path.read_bytes", AsyncMock(side_effect=[b"<ul><li>x</li></ul>", b"DOCX content"])),
+        patch("app.html_lists_pre_process.preprocess", return_value=b"<p>y</p>") as mock_preprocess,
+    ):
+        await run_pandoc_conversion(spooled, "html", "docx")
+
+    mock_preprocess.assert_called_once_with(b"<ul><li>x</li></ul>")
+    assert str(spooled) not in mock_run.call_args.args[0]
+
+
+def test_convert_spools_a_large_body_and_removes_it(tmp_path):
+    """A body beyond the spool size reaches pandoc as a file, which is gone after the request."""
+    body = b"# Title\n" + b"x" * SPOOL_MAX_SIZE
+    seen = {}
+
+    async def fake_conversion(source, *_args, **_kwargs):
+        seen["source"] = source
+        seen["content"] = source.read_bytes()
+        return write_pandoc_output(tmp_path, b"<h1>Title</h1>")
+
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", side_effect=fake_conversion):
+        response = TestClient(app).post("/convert/markdown/to/html", content=body)
+
+    assert response.status_code == 200
+    assert isinstance(seen["source"], Path)
+    assert seen["content"] == body
+    assert not seen["source"].exists()
+
+
+def test_convert_streams_output_from_its_file_and_removes_it(tmp_path):
+    """An output nothing post-processes is sent from pandoc's file, with its length, and the file is removed."""
+    output_path = write_pandoc_output(tmp_path, b"%PDF-" + b"x" * 1000)
+    with (
+        patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(return_value=output_path)),
+        patch("app.pandoc_controller.run_pandoc_conversion") as mock_in_memory,
+    ):
+        response = TestClient(app).post("/convert/markdown/to/pdf", content=b"# Title")
+
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "1005"
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["pandoc-service-version"] == "unknown"
+    assert response.content == b"%PDF-" + b"x" * 1000
+    assert not output_path.exists()
+    mock_in_memory.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_to_output_keeps_the_output_for_the_caller():
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock),
+        patch("app.pandoc_controller.remove_file") as mock_remove,
+    ):
+        output_path = await run_pandoc_conversion_to_output("# x", "markdown", "odt")
+
+    try:
+        assert output_path.exists()
+        # Only the temporary source file was removed.
+        mock_remove.assert_called_once()
+        assert mock_remove.call_args.args[0] != output_path
+    finally:
+        output_path.unlink()
+
+
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_to_output_removes_the_output_when_pandoc_fails():
+    created: list[str] = []
+    original = tempfile.NamedTemporaryFile
+
+    def tracking_temp_file(*args, **kwargs):
+        temp_file = original(*args, **kwargs)
+        created.append(temp_file.name)
+        return temp_file
+
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run", AsyncMock(side_effect=subprocess.CalledProcessError(1, "pandoc"))),
+        patch("tempfile.NamedTemporaryFile", side_effect=tracking_temp_file),
+        pytest.raises(subprocess.CalledProcessError),
+    ):
+        await run_pandoc_conversion_to_output("# x", "markdown", "odt")
+
+    assert len(created) == 2
+    assert not [name for name in created if await anyio.Path(name).exists()]
+
+
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_to_output_pipes_a_text_conversion():
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"<h1>x</h1>")) as mock_run_piped,
+        patch("tempfile.NamedTemporaryFile") as mock_tempfile,
+    ):
+        output = await run_pandoc_conversion_to_output("# x", "markdown", "html")
+
+    assert output == b"<h1>x</h1>"
+    cmd, source = mock_run_piped.call_args.args
+    assert cmd[cmd.index("-o") + 1] == "-"
+    assert source == b"# x"
+    mock_run.assert_not_called()
+    mock_tempfile.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_to_output_reads_a_docx_from_a_file_and_pipes_the_text():
+    created: list[str] = []
+    original = tempfile.NamedTemporaryFile
+
+    def tracking_temp_file(*args, **kwargs):
+        temp_file = original(*args, **kwargs)
+        created.append(temp_file.name)
+        return temp_file
+
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"# x")) as mock_run_piped,
+        patch("tempfile.NamedTemporaryFile", side_effect=tracking_temp_file),
+    ):
+        output = await run_pandoc_conversion_to_output(b"PK\x03\x04docx-bytes", "docx", "markdown")
+
+    assert output == b"# x"
+    cmd, source = mock_run_piped.call_args.args
+    assert created == [cmd[cmd.index("-o") + 2]]
+    assert source is None
+    # The source file is removed once pandoc has read it.
+    assert not await anyio.Path(created[0]).exists()
+
+
+@pytest.mark.asyncio
+async def test_run_pandoc_conversion_to_output_writes_the_source_off_the_event_loop():
+    writers: list[int] = []
+
+    def tracking_write(data, scratch_dir):
+        writers.append(threading.get_ident())
+        return write_scratch_file(data, scratch_dir)
+
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock),
+        patch("app.pandoc_controller.write_scratch_file", side_effect=tracking_write),
+    ):
+        output_path = await run_pandoc_conversion_to_output("# x", "markdown", "odt")
+
+    output_path.unlink()
+    assert len(writers) == 1
+    assert writers[0] != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_get_conversion_key_hashes_only_a_small_source_on_the_event_loop():
+    hashers: list[int] = []
+
+    def tracking_build(*args):
+        hashers.append(threading.get_ident())
+        return build_cache_key(*args)
+
+    with patch("app.pandoc_controller.build_cache_key", side_effect=tracking_build):
+        await get_conversion_key(b"# x", "markdown", "html", [])
+        await get_conversion_key(b"x" * (INLINE_HASH_MAX_SIZE + 1), "markdown", "html", [])
+
+    assert hashers[0] == threading.get_ident()
+    assert hashers[1] != threading.get_ident()
+
+
+def test_remove_file_ignores_a_file_that_is_gone(tmp_path: Path):
+    remove_file(tmp_path / "already-removed")
+
+
+@pytest.mark.asyncio
+async def test_convert_endpoint_answers_with_the_piped_output():
+    with patch("app.conversion_executor.ConversionExecutor.run_piped", AsyncMock(return_value=b"<h1>Title</h1>")):
+        response = TestClient(app).post("/convert/markdown/to/html", content="# Title")
+
+    assert response.status_code == 200
+    assert response.content == b"<h1>Title</h1>"
+    assert response.headers["content-length"] == str(len(b"<h1>Title</h1>"))
+
+
+@pytest.mark.asyncio
+async def test_parse_to_ast_runs_the_reader_without_the_target_filters():
+    with patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run:
+        ast_path = await parse_to_ast("# x", "markdown", "pdf")
+    ast_path.unlink()
+
+    cmd = mock_run.call_args.args[0]
+    assert cmd[1:5] == ["-f", "markdown", "-t", "json"]
+    assert "--track-changes=all" in cmd
+    assert f"--lua-filter={FILTERS['embed_media']}" in cmd
+    assert f"--lua-filter={FILTERS['page_break']}" not in cmd
+    assert "--pdf-engine=tectonic" not in cmd
+
+
+@pytest.mark.asyncio
+async def test_parse_to_ast_reads_a_docx_the_way_its_latex_conversion_does():
+    with (
+        patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run,
+        patch("app.docx_latex_pre_process.preprocess", side_effect=lambda b, _skipped: b) as mock_pre,
+    ):
+        ast_path = await parse_to_ast(b"PK docx", "docx", "pdf")
+    ast_path.unlink()
+
+    assert mock_run.call_args.args[0][1:3] == ["-f", "docx+styles"]
+    mock_pre.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_render_ast_reads_json_with_the_filters_of_the_source_format(tmp_path):
+    ast_path = write_pandoc_output(tmp_path, b"{}")
+    with patch("app.conversion_executor.ConversionExecutor.run", new_callable=AsyncMock) as mock_run:
+        output_path = await render_ast(ast_path, "docx", "latex", DEFAULT_CONVERSION_OPTIONS)
+    output_path.unlink()
+
+    cmd = mock_run.call_args.args[0]
+    assert cmd[1:5] == ["-f", "json", "-t", "latex"]
+    assert str(ast_path) in cmd
+    assert f"--lua-filter={FILTERS['docx_latex_bundle']}" in cmd
+    assert f"--lua-filter={FILTERS['page_break']}" in cmd
+    # The AST is the caller's.
+    assert ast_path.exists()
+
+
+@pytest.mark.parametrize(("targets", "expected"), [("pdf", ["pdf"]), ("docx, pdf,docx,,html", ["docx", "pdf", "html"])])
+def test_parse_target_formats(targets, expected):
+    assert parse_target_formats(targets) == expected
+
+
+@pytest.mark.parametrize(("targets", "message"), [("", "No target format given"), (" , ", "No target format given"), ("pdf,exe", "Invalid target format: exe")])
+def test_parse_target_formats_rejects(targets, message):
+    with pytest.raises(ValueError, match=message):
+        parse_target_formats(targets)
+
+
+@pytest.mark.asyncio
+async def test_convert_source_to_targets_parses_once_per_way_of_reading(tmp_path):
+    """DOCX to PDF and LaTeX share a parse; DOCX to DOCX reads the source without the LaTeX preprocessing."""
+    ast_paths = []
+
+    async def fake_parse(_source, _source_format, target_format):
+        ast_paths.append(write_pandoc_output(tmp_path, target_format.encode()).rename(tmp_path / f"ast-{target_format}"))
+        return ast_paths[-1]
+
+    async def fake_render(ast_path, _source_format, target_format, _options, **_kwargs):
+        return write_pandoc_output(tmp_path, ast_path.read_bytes() + b">" + target_format.encode()).rename(tmp_path / f"out-{target_format}")
+
+    with (
+        patch("app.pandoc_controller.parse_to_ast", side_effect=fake_parse) as mock_parse,
+        patch("app.pandoc_controller.render_ast", side_effect=fake_render),
+        patch("app.pandoc_controller.postprocess_output", side_effect=lambda output, *_args: output + b" processed") as mock_postprocess,
+    ):
+        outputs = await convert_source_to_targets(b"PK docx", "docx", ["pdf", "docx", "latex"], "A4")
+
+    assert mock_parse.call_count == 2
+    assert outputs["pdf"].read_bytes() == b"pdf>pdf"
+    assert outputs["latex"].read_bytes() == b"pdf>latex"
+    assert outputs["docx"] == b"docx>docx processed"
+    mock_postprocess.assert_called_once_with(b"docx>docx", "docx", "A4", None, None)
+    assert not [path for path in ast_paths if path.exists()]
+    assert not (tmp_path / "out-docx").exists()
+
+
+@pytest.mark.asyncio
+async def test_convert_source_to_targets_cancels_the_other_targets_when_one_fails(tmp_path):
+    cancelled = asyncio.Event()
+
+    async def fake_render(_ast_path, _source_format, target_format, _options, **_kwargs):
+        if target_format == "html":
+            raise subprocess.CalledProcessError(1, "pandoc")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with (
+        patch("app.pandoc_controller.parse_to_ast", AsyncMock(side_effect=lambda *_args: write_pandoc_output(tmp_path, b"{}"))),
+        patch("app.pandoc_controller.render_ast", side_effect=fake_render),
+        pytest.raises(subprocess.CalledProcessError),
+    ):
+        await convert_source_to_targets("# x", "markdown", ["pdf", "html"])
+
+    assert cancelled.is_set()
+    assert not (tmp_path / "pandoc-output").exists()
+
+
+def test_convert_to_multiple_answers_with_a_zip(tmp_path):
+    pdf_path = write_pandoc_output(tmp_path, b"%PDF-")
+    outputs = {"docx": b"PK docx", "pdf": pdf_path}
+    with patch("app.pandoc_controller.convert_source_to_targets", AsyncMock(return_value=outputs)) as mock_convert:
+        response = TestClient(app).post("/convert/markdown/to/multiple?targets=docx,pdf&file_name=report.docx", content=b"# Title")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert response.headers["content-disposition"] == "attachment; filename=report.zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.read("report.docx") == b"PK docx"
+        assert archive.read("report.pdf") == b"%PDF-"
+    mock_convert.assert_called_once_with(b"# Title", "markdown", ["docx", "pdf"], None, None, None, preserve_table_styles=False)
+    assert not pdf_path.exists()
+
+
+def test_convert_to_multiple_answers_with_multipart_if_asked(tmp_path):
+    outputs = {"html": write_pandoc_output(tmp_path, b"<h1>Title</h1>")}
+    with patch("app.pandoc_controller.convert_source_to_targets", AsyncMock(return_value=outputs)):
+        response = TestClient(app).post("/convert/markdown/to/multiple?targets=html", content=b"# Title", headers={"Accept": "multipart/mixed"})
+
+    assert response.status_code == 200
+    content_type, boundary = response.headers["content-type"].split("; boundary=")
+    assert content_type == "multipart/mixed"
+    assert response.content.startswith(f"--{boundary}\r\nContent-Type: text/html\r\n".encode())
+    assert b"filename=converted-document.html\r\n\r\n<h1>Title</h1>\r\n" in response.content
+
+
+@pytest.mark.parametrize("targets", ["", "pdf,exe"])
+def test_convert_to_multiple_rejects_invalid_targets(targets):
+    with patch("app.pandoc_controller.convert_source_to_targets") as mock_convert:
+        response = TestClient(app).post(f"/convert/markdown/to/multiple?targets={targets}", content=b"# Title")
+
+    assert response.status_code == 400
+    mock_convert.assert_not_called()
+
+
+@pytest.fixture
+def result_cache(tmp_path):
+    """An enabled result cache of its own, with a disk tier only large results reach."""
+    cache = ResultCache(memory_max_bytes=4096, disk_dir=tmp_path / "cache", disk_max_bytes=1024 * 1024)
+    with patch.dict(os.environ, {"RESULT_CACHE_ENABLED": "true"}), patch("app.pandoc_controller.get_result_cache", return_value=cache):
+        yield cache
+
+
+def test_repeated_conversion_is_answered_from_the_result_cache(result_cache, tmp_path):
+    outputs = iter([write_pandoc_output(tmp_path, b"%PDF-" + b"x" * 5000)])
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(side_effect=lambda *_args, **_kwargs: next(outputs))) as mock_convert:
+        first = TestClient(app).post("/convert/markdown/to/pdf?file_name=a.pdf", content=b"# Title")
+        second = TestClient(app).post("/convert/markdown/to/pdf?file_name=b.pdf", content=b"# Title")
+
+    mock_convert.assert_called_once()
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content == b"%PDF-" + b"x" * 5000
+    assert first.headers["etag"] == second.headers["etag"]
+    assert second.headers["content-disposition"] == "attachment; filename=b.pdf"
+    # Only the cache entry is left, the link the hit was sent from is gone.
+    assert len([path for path in (tmp_path / "cache").iterdir() if path.name != ".lock"]) == 1
+
+
+def test_changed_parameters_miss_the_result_cache(result_cache):
+    with patch("app.pandoc_controller.run_pandoc_conversion", AsyncMock(return_value=b"PK docx")) as mock_convert, patch("app.pandoc_controller.postprocess_output", side_effect=lambda output, *_args: output):
+        first = TestClient(app).post("/convert/markdown/to/docx", content=b"# Title")
+        second = TestClient(app).post("/convert/markdown/to/docx?paper_size=A4", content=b"# Title")
+
+    assert mock_convert.call_count == 2
+    assert first.headers["etag"] != second.headers["etag"]
+
+
+def test_matching_if_none_match_is_answered_with_304(result_cache):
+    with patch("app.pandoc_controller.run_pandoc_conversion", AsyncMock(return_value=b"PK docx")) as mock_convert, patch("app.pandoc_controller.postprocess_output", side_effect=lambda output, *_args: output):
+        etag = TestClient(app).post("/convert/markdown/to/docx", content=b"# Title").headers["etag"]
+        response = TestClient(app).post("/convert/markdown/to/docx", content=b"# Title", headers={"If-None-Match": f'"other", W/{etag}'})
+
+    mock_convert.assert_called_once()
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+
+def test_template_bytes_are_part_of_the_result_cache_key(result_cache):
+    def post(template: bytes):
+        files = {"source": ("test.md", io.BytesIO(b"# Title"), "text/markdown"), "template": ("ref.docx", io.BytesIO(template), "application/octet-stream")}
+        return TestClient(app).post("/convert/markdown/to/docx-with-template", files=files)
+
+    with patch("app.pandoc_controller.run_pandoc_conversion", AsyncMock(return_value=b"PK docx")) as mock_convert, patch("app.pandoc_controller.postprocess_output", side_effect=lambda output, *_args: output):
+        first, same, other = post(b"template 1"), post(b"template 1"), post(b"template 2")
+
+    assert mock_convert.call_count == 2
+    assert first.headers["etag"] == same.headers["etag"] != other.headers["etag"]
+
+
+def test_conversion_without_the_result_cache_has_no_etag():
+    with (
+        patch("app.pandoc_controller.run_pandoc_conversion", AsyncMock(return_value=b"PK docx")),
+        patch("app.pandoc_controller.postprocess_output", side_effect=lambda output, *_args: output),
+        patch("app.pandoc_controller.get_result_cache") as mock_cache,
+    ):
+        response = TestClient(app).post("/convert/markdown/to/docx", content=b"# Title")
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    mock_cache.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_uploaded_templates_get_a_file_each():
+    first = await write_template_file(b"template", "docx")
+    second = await write_template_file(b"template", "docx")
+    try:
+        assert first != second
+        assert Path(first).parent == get_scratch_dir()
+        assert await anyio.Path(first).read_bytes() == b"template"
+    finally:
+        await anyio.Path(first).unlink()
+        await anyio.Path(second).unlink()
+
+
+@pytest.fixture
+def template_store(tmp_path):
+    store = TemplateStore(root=tmp_path / "templates", max_templates=10)
+    with patch("app.pandoc_controller.get_template_store", return_value=store):
+        yield store
+
+
+def test_put_template_registers_it(template_store):
+    template = create_mock_docx()
+
+    created = TestClient(app).put("/templates/corporate", content=template)
+    replaced = TestClient(app).put("/templates/corporate", content=template)
+
+    assert created.status_code == 201
+    assert replaced.status_code == 200
+    assert created.json() == {"templateId": template_store.get("corporate").template_id, "name": "corporate", "format": "docx", "size": len(template)}
+    assert created.headers["etag"] == f'"{created.json()["templateId"]}"'
+
+
+@pytest.mark.parametrize(("name", "content", "message"), [("corporate", b"not a template", b"DOCX or PPTX"), ("bad%20name", create_mock_docx(), b"Invalid template name")])
+def test_put_template_refuses_invalid_templates(template_store, name, content, message):
+    response = TestClient(app).put(f"/templates/{name}", content=content)
+
+    assert response.status_code == 400
+    assert message in response.content
+    assert not template_store.root.exists()
+
+
+def test_get_template_by_name_and_id(template_store):
+    stored, _ = template_store.put("corporate", create_mock_docx())
+
+    by_name = TestClient(app).get("/templates/corporate")
+    by_id = TestClient(app).get(f"/templates/{stored.template_id}")
+
+    assert by_name.status_code == by_id.status_code == 200
+    assert by_name.content == by_id.content == stored.path.read_bytes()
+    assert by_name.headers["content-type"] == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    assert by_name.headers["content-disposition"] == "attachment; filename=corporate.docx"
+
+
+def test_delete_template(template_store):
+    template_store.put("corporate", create_mock_docx())
+
+    assert TestClient(app).delete("/templates/corporate").status_code == 204
+    assert TestClient(app).get("/templates/corporate").status_code == 404
+    assert TestClient(app).delete("/templates/corporate").status_code == 404
+
+
+def test_convert_docx_with_a_registered_template(template_store):
+    stored, _ = template_store.put("corporate", create_mock_docx())
+    with patch("app.pandoc_controller.run_pandoc_conversion", AsyncMock(return_value=b"PK docx")) as mock_convert, patch("app.pandoc_controller.postprocess_output", side_effect=lambda output, *_args: output):
+        response = TestClient(app).post("/convert/markdown/to/docx-with-template?template_id=corporate", files={"source": ("test.md", io.BytesIO(b"# Title"), "text/markdown")})
+
+    assert response.status_code == 200
+    # pandoc reads the registered template where it is stored.
+    assert f"--reference-doc={stored.path}" in mock_convert.call_args.args[3]
+    assert stored.path.exists()
+
+
+@pytest.mark.parametrize(
+    ("endpoint", "files", "status", "message"),
+    [
+        ("docx-with-template?template_id=unknown", {}, 404, b"Template not found"),
+        ("pptx-with-template?template_id=corporate", {}, 400, b"is a docx template"),
+        ("docx-with-template?template_id=corporate", {"template": ("ref.docx", io.BytesIO(b"PK"), "application/octet-stream")}, 400, b"either a template file or a template_id"),
+    ],
+)
+def test_convert_with_an_unusable_registered_template(template_store, endpoint, files, status, message):
+    template_store.put("corporate", create_mock_docx())
+    with patch("app.pandoc_controller.run_pandoc_conversion") as mock_convert:
+        response = TestClient(app).post(f"/convert/markdown/to/{endpoint}", files={"source": ("test.md", io.BytesIO(b"# Title"), "text/markdown"), **files})
+
+    assert response.status_code == status
+    assert message in response.content
+    mock_convert.assert_not_called()
@@ -0,0 +1,136 @@
+"""Tests for the GHC runtime profiles of the pandoc subprocess."""
+
+import os
+import subprocess
+import sys
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.conversion_executor import ConversionExecutor
+from app.pandoc_controller import _build_pandoc_command, app
+from app.pandoc_runtime import (
+    DEFAULT_PROFILES,
+    HEAP_OVERFLOW_EXIT_CODE,
+    PandocHeapExhaustedError,
+    PandocRuntime,
+    get_pandoc_runtime,
+    is_rts_option,
+    parse_rts_profiles,
+    reset_pandoc_runtime,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_runtime():
+    """Reset the global runtime profiles before and after each test."""
+    reset_pandoc_runtime()
+    yield
+    reset_pandoc_runtime()
+
+
+@pytest.mark.parametrize("option", ["-A64m", "-M2g", "-M512M", "-H256m", "-K8m", "-qg", "-qg1", "-qb0", "-N", "-N4", "-F1.5", "-I0", "-c"])
+def test_runtime_flags_are_allowed(option):
+    assert is_rts_option(option)
+
+
+@pytest.mark.parametrize("option", ["-t/tmp/stats", "-S", "-s/etc/passwd", "-po", "-hT", "-A", "--sandbox", "-Mlots", "+RTS"])
+def test_other_flags_are_refused(option):
+    assert not is_rts_option(option)
+
+
+def test_configured_profiles_are_merged_into_the_defaults():
+    profiles = parse_rts_profiles("docx=-A128m -M4g; markdown = -A16m -qg ;")
+
+    assert profiles["docx"] == ("-A128m", "-M4g")
+    assert profiles["markdown"] == ("-A16m", "-qg")
+    assert profiles["default"] == DEFAULT_PROFILES["default"]
+
+
+def test_invalid_profile_entries_are_dropped(caplog):
+    profiles = parse_rts_profiles("docx=-A64m -t/tmp/stats;no-options-here;=-A1m")
+
+    assert profiles["docx"] == ("-A64m",)
+    assert "no-options-here" not in profiles
+    assert "'-t/tmp/stats'" in caplog.text
+    assert "'no-options-here'" in caplog.text
+
+
+def test_heap_cap_applies_to_the_profiles_without_one():
+    runtime = PandocRuntime({"docx": ("-A64m", "-M4g"), "epub": ("-A64m",), "default": ()}, max_heap_mb=1024)
+
+    assert runtime.profiles == {"docx": ("-A64m", "-M4g"), "epub": ("-A64m", "-M1024m"), "default": ("-M1024m",)}
+
+
+@pytest.mark.parametrize(("value", "expected"), [(None, 0), ("2048", 2048), ("-1", 0), ("big", 0)])
+def test_heap_cap_is_read_from_environment(value, expected):
+    env = {} if value is None else {"PANDOC_MAX_HEAP_MB": value}
+    with patch.dict(os.environ, env, clear=True):
+        assert PandocRuntime().max_heap_mb == expected
+
+
+@pytest.mark.parametrize(("source_format", "target_format", "expected"), [("docx", "latex", ("-A64m",)), ("markdown", "docx", ("-A64m",)), ("markdown", "html", ("-qg",))])
+def test_profile_of_the_source_format_comes_first(source_format, target_format, expected):
+    assert PandocRuntime(DEFAULT_PROFILES, max_heap_mb=0).get_options(source_format, target_format) == expected
+
+
+def test_empty_profile_adds_no_arguments():
+    runtime = PandocRuntime({"default": ()}, max_heap_mb=0)
+
+    assert runtime.get_arguments("markdown", "html") == []
+
+
+def test_pandoc_command_ends_with_the_runtime_options():
+    with patch.dict(os.environ, {"PANDOC_RTS_PROFILES": "docx=-A32m -M2g"}):
+        cmd = _build_pandoc_command(source_format="docx", target_format="latex", source_path="in.docx", output_path="out.tex", validated_options=["--toc"])
+
+    assert cmd[-5:] == ["--toc", "+RTS", "-A32m", "-M2g", "-RTS"]
+
+
+@pytest.mark.asyncio
+async def test_verify_drops_a_profile_pandoc_refuses():
+    runtime = PandocRuntime({"docx": ("-A64m",), "default": ("-N99999",)}, max_heap_mb=0)
+
+    async def run_process(cmd, **_kwargs):
+        if "-N99999" in cmd:
+            raise subprocess.CalledProcessError(1, cmd, b"", b"pandoc: too many capabilities")
+
+    with patch("app.pandoc_runtime.anyio.run_process", AsyncMock(side_effect=run_process)) as run:
+        await runtime.verify()
+
+    assert runtime.profiles == {"docx": ("-A64m",), "default": ()}
+    assert run.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_verify_keeps_the_profiles_when_pandoc_is_missing():
+    runtime = PandocRuntime({"docx": ("-A64m",)}, max_heap_mb=0)
+
+    with patch("app.pandoc_runtime.anyio.run_process", AsyncMock(side_effect=FileNotFoundError("pandoc"))):
+        await runtime.verify()
+
+    assert runtime.profiles == {"docx": ("-A64m",)}
+
+
+@pytest.mark.asyncio
+async def test_executor_reports_an_exhausted_heap():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+
+    with pytest.raises(PandocHeapExhaustedError) as raised:
+        await executor.run([sys.executable, "-c", f"import sys; sys.exit({HEAP_OVERFLOW_EXIT_CODE})"])
+
+    assert isinstance(raised.value, subprocess.CalledProcessError)
+
+
+def test_exhausted_heap_is_answered_with_413():
+    error = PandocHeapExhaustedError(HEAP_OVERFLOW_EXIT_CODE, ["pandoc"])
+    with patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(side_effect=error)):
+        response = TestClient(app).post("/convert/markdown/to/html", content=b"# Title")
+
+    assert response.status_code == 413
+    assert response.text.startswith("Document too large to convert within the pandoc heap limit")
+
+
+def test_get_pandoc_runtime_returns_one_instance():
+    assert get_pandoc_runtime() is get_pandoc_runtime()
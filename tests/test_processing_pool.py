@@ -0,0 +1,101 @@
+"""Tests for the pool that runs the CPU-bound pre- and post-processing."""
+
+import asyncio
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+
+from app import processing_stages
+from app.processing_pool import ProcessingPool, get_processing_pool, get_processing_workers, reset_processing_pool
+
+
+@pytest.fixture
+def thread_pool():
+    pool = ProcessingPool(workers=0)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def process_pool():
+    pool = ProcessingPool(workers=1)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.parametrize(("value", "expected"), [(None, 0), ("4", 4), ("-1", 0), ("many", 0), ("65", 0)])
+def test_processing_workers_are_read_from_environment(value, expected):
+    env = {} if value is None else {"PROCESSING_WORKERS": value}
+    with patch.dict(os.environ, env, clear=True):
+        assert get_processing_workers() == expected
+
+
+@pytest.mark.asyncio
+async def test_stages_run_off_the_event_loop_thread(thread_pool):
+    assert await thread_pool.run("test", threading.current_thread) is not threading.current_thread()
+    assert thread_pool.describe() == "worker threads"
+
+
+@pytest.mark.asyncio
+async def test_a_slow_stage_does_not_stall_the_event_loop(thread_pool):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_stage() -> str:
+        started.set()
+        release.wait(5)
+        return "done"
+
+    stage = asyncio.create_task(thread_pool.run("slow", slow_stage))
+    # The loop keeps running other work while the stage blocks its worker.
+    assert await asyncio.to_thread(started.wait, 5)
+    assert not stage.done()
+    release.set()
+
+    assert await stage == "done"
+
+
+@pytest.mark.asyncio
+async def test_stage_queue_and_run_time_are_recorded(thread_pool):
+    with patch("app.processing_pool.observe_processing_stage") as observe:
+        assert await thread_pool.run("html_table_layout", len, b"<table/>") == 8
+
+    stage, queue_seconds, duration = observe.call_args.args
+    assert stage == "html_table_layout"
+    assert queue_seconds >= 0
+    assert duration >= 0
+
+
+@pytest.mark.asyncio
+async def test_stages_run_in_a_worker_process(process_pool):
+    assert await process_pool.run("test", os.getpid) != os.getpid()
+    assert await process_pool.run("html_pre_process", processing_stages.preprocess_source, b"<p>x</p>", "none") == b"<p>x</p>"
+    assert process_pool.describe() == "1 worker processes"
+
+
+@pytest.mark.asyncio
+async def test_a_dead_worker_process_is_replaced(process_pool):
+    with pytest.raises(BrokenProcessPool):
+        await process_pool.run("test", os._exit, 1)
+
+    assert await process_pool.run("test", os.getpid) != os.getpid()
+
+
+def test_postprocess_output_leaves_other_formats_alone():
+    with patch("app.docx_post_process.process") as docx, patch("app.pptx_post_process.process", return_value=b"slides") as pptx:
+        assert processing_stages.postprocess_output(b"<html/>", "html", "A4", None, None) == b"<html/>"
+        assert processing_stages.postprocess_output(b"PK", "pptx", "16:9", None, None) == b"slides"
+
+    docx.assert_not_called()
+    pptx.assert_called_once_with(b"PK", "16:9")
+
+
+def test_get_processing_pool_returns_one_instance():
+    reset_processing_pool()
+    try:
+        assert get_processing_pool() is get_processing_pool()
+    finally:
+        reset_processing_pool()
@@ -4,16 +4,29 @@ import os
 from unittest.mock import MagicMock, patch
 
 import pytest
+from prometheus_client import REGISTRY, Gauge, Info
 
+from app.conversion_executor import ConversionExecutor
 from app.pandoc_metrics import PandocMetrics, get_pandoc_metrics, reset_pandoc_metrics
 from app.prometheus_metrics import (
+    _build_info,
+    _set_info,
+    increment_cancelled_conversion,
     increment_conversion_failure,
     increment_conversion_success,
+    increment_result_cache_eviction,
+    increment_result_cache_hit,
+    increment_result_cache_miss,
+    increment_shed_request,
     increment_template_conversion,
     observe_post_processing_duration,
+    observe_queue_wait_duration,
     observe_request_body_size,
     observe_response_body_size,
     observe_subprocess_duration,
+    pandoc_active_subprocesses,
+    pandoc_queue_size,
+    update_gauges_from_conversion_executor,
     update_gauges_from_pandoc_metrics,
 )
 
@@ -64,6 +77,26 @@ class TestPandocMetrics:
         assert metrics.failed_conversions == 1
         assert metrics.active_conversions == 0
 
+    def test_record_conversion_cancelled(self):
+        """Test recording a cancelled conversion, which neither succeeded nor failed."""
+        metrics = PandocMetrics()
+        metrics.record_conversion_start()
+        metrics.record_conversion_cancelled()
+
+        assert metrics.active_conversions == 0
+        assert metrics.total_conversions == 0
+        assert metrics.failed_conversions == 0
+
+    def test_record_conversion_cached(self):
+        """Test recording a conversion answered from the result cache, which neither succeeded nor failed."""
+        metrics = PandocMetrics()
+        metrics.record_conversion_start()
+        metrics.record_conversion_cached()
+
+        assert metrics.active_conversions == 0
+        assert metrics.total_conversions == 0
+        assert metrics.failed_conversions == 0
+
     def test_error_rate_calculation(self):
         """Test error rate calculation."""
         metrics = PandocMetrics()
@@ -154,6 +187,34 @@ class TestPrometheusMetricsHelpers:
         """Test observing subprocess duration."""
         observe_subprocess_duration(0.5)
 
+    def test_observe_queue_wait_duration(self):
+        """Test observing the wait for a pandoc slot."""
+        observe_queue_wait_duration(0.25)
+
+    def test_increment_shed_request(self):
+        """Test incrementing the shed conversion counter."""
+        before = REGISTRY.get_sample_value("pandoc_shed_requests_total", {"target_format": "pdf", "reason": "queued"}) or 0.0
+        increment_shed_request("pdf", "queued")
+        assert REGISTRY.get_sample_value("pandoc_shed_requests_total", {"target_format": "pdf", "reason": "queued"}) == before + 1
+
+    def test_increment_cancelled_conversion(self):
+        """Test incrementing the cancelled conversion counter."""
+        before = REGISTRY.get_sample_value("pandoc_cancelled_conversions_total", {"target_format": "pdf", "reason": "deadline"}) or 0.0
+        increment_cancelled_conversion("pdf", "deadline")
+        assert REGISTRY.get_sample_value("pandoc_cancelled_conversions_total", {"target_format": "pdf", "reason": "deadline"}) == before + 1
+
+    def test_increment_result_cache_counters(self):
+        """Test incrementing the result cache hit, miss and eviction counters."""
+        hits = REGISTRY.get_sample_value("pandoc_result_cache_hits_total", {"tier": "disk"}) or 0.0
+        misses = REGISTRY.get_sample_value("pandoc_result_cache_misses_total") or 0.0
+        evictions = REGISTRY.get_sample_value("pandoc_result_cache_evictions_total", {"tier": "memory"}) or 0.0
+        increment_result_cache_hit("disk")
+        increment_result_cache_miss()
+        increment_result_cache_eviction("memory")
+        assert REGISTRY.get_sample_value("pandoc_result_cache_hits_total", {"tier": "disk"}) == hits + 1
+        assert REGISTRY.get_sample_value("pandoc_result_cache_misses_total") == misses + 1
+        assert REGISTRY.get_sample_value("pandoc_result_cache_evictions_total", {"tier": "memory"}) == evictions + 1
+
     def test_observe_post_processing_duration(self):
         """Test observing post-processing duration."""
         observe_post_processing_duration("docx", 0.1)
@@ -189,6 +250,42 @@ class TestUpdateGauges:
         # Should not raise, just log the error
         update_gauges_from_pandoc_metrics(mock_metrics)
 
+    def test_update_gauges_from_conversion_executor(self):
+        """Test updating the queue gauges from the ConversionExecutor."""
+        executor = ConversionExecutor(max_concurrent_conversions=2)
+        executor._metrics.update_queue_metrics(queue_size=3, active_conversions=2)
+
+        update_gauges_from_conversion_executor(executor)
+
+        assert pandoc_queue_size._value.get() == 3.0
+        assert pandoc_active_subprocesses._value.get() == 2.0
+
+    def test_update_gauges_from_conversion_executor_handles_errors(self):
+        """Test that the queue gauge update handles errors gracefully."""
+        mock_executor = MagicMock()
+        mock_executor.get_metrics.side_effect = RuntimeError("Test error")
+
+        # Should not raise, just log the error
+        update_gauges_from_conversion_executor(mock_executor)
+
+
+class TestInfoMetrics:
+    """Tests for the info metrics of one or several worker processes."""
+
+    def test_info_is_an_info_metric_in_one_process(self):
+        with patch.dict(os.environ, {}, clear=True):
+            metric = _build_info("test_single_process", "Test information", ["version"])
+
+        assert isinstance(metric, Info)
+
+    def test_info_is_a_gauge_shared_by_several_workers(self, tmp_path):
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}):
+            metric = _build_info("test_several_workers", "Test information", ["version"])
+        _set_info(metric, {"version": "3.7"})
+
+        assert isinstance(metric, Gauge)
+        assert REGISTRY.get_sample_value("test_several_workers_info", {"version": "3.7"}) == 1.0
+
 
 class TestGetPandocMetrics:
     """Tests for global metrics singleton."""
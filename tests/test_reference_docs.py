@@ -0,0 +1,83 @@
+"""Tests for the cache of pandoc's default reference documents."""
+
+import asyncio
+import hashlib
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import anyio
+import pytest
+
+from app.reference_docs import ReferenceDocCache, generate_reference_doc, get_reference_doc_cache, reset_reference_doc_cache
+
+
+def fake_pandoc(calls: list[list[str]], content: bytes = b"PK reference"):
+    async def run_process(cmd, **_kwargs):
+        calls.append(cmd)
+        # Let concurrent callers catch up while pandoc "runs".
+        await asyncio.sleep(0.01)
+        await anyio.Path(cmd[cmd.index("-o") + 1]).write_bytes(content + cmd[-1].encode())
+        return MagicMock(returncode=0)
+
+    return run_process
+
+
+@pytest.mark.asyncio
+async def test_generate_reference_doc_removes_its_file():
+    calls: list[list[str]] = []
+    with patch("anyio.run_process", side_effect=fake_pandoc(calls)):
+        content = await generate_reference_doc("pptx")
+
+    assert content == b"PK referencereference.pptx"
+    assert calls[0][-2:] == ["--print-default-data-file", "reference.pptx"]
+    assert not await anyio.Path(calls[0][calls[0].index("-o") + 1]).exists()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_downloads_run_pandoc_once():
+    cache = ReferenceDocCache()
+    calls: list[list[str]] = []
+    with patch("anyio.run_process", side_effect=fake_pandoc(calls)):
+        docs = await asyncio.gather(*(cache.get("docx", "3.7") for _ in range(5)))
+
+    assert len(calls) == 1
+    assert {doc.etag for doc in docs} == {hashlib.sha256(b"PK referencereference.docx").hexdigest()}
+
+
+@pytest.mark.asyncio
+async def test_each_format_and_pandoc_version_gets_its_own_document():
+    cache = ReferenceDocCache()
+    calls: list[list[str]] = []
+    with patch("anyio.run_process", side_effect=fake_pandoc(calls)):
+        docx = await cache.get("docx", "3.6")
+        pptx = await cache.get("pptx", "3.6")
+        await cache.get("docx", "3.6")
+        upgraded = await cache.get("docx", "3.7")
+
+    assert len(calls) == 3
+    assert docx.etag != pptx.etag
+    assert upgraded.pandoc_version == "3.7"
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_is_not_cached():
+    cache = ReferenceDocCache()
+    calls: list[list[str]] = []
+
+    async def failing_pandoc(cmd, **_kwargs):
+        raise subprocess.CalledProcessError(1, cmd)
+
+    with patch("anyio.run_process", side_effect=failing_pandoc), pytest.raises(subprocess.CalledProcessError):
+        await cache.get("docx", "3.7")
+    with patch("anyio.run_process", side_effect=fake_pandoc(calls)):
+        await cache.get("docx", "3.7")
+
+    assert len(calls) == 1
+
+
+def test_get_reference_doc_cache_returns_one_instance():
+    reset_reference_doc_cache()
+    try:
+        assert get_reference_doc_cache() is get_reference_doc_cache()
+    finally:
+        reset_reference_doc_cache()
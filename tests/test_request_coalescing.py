@@ -0,0 +1,210 @@
+"""Tests for sharing one conversion among identical requests in flight."""
+
+import asyncio
+import os
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import anyio
+import httpx
+import pytest
+
+from app import pandoc_controller
+from app.request_coalescing import ConversionCoalescer, get_conversion_coalescer, link_output, reset_conversion_coalescer
+
+
+class SlowConversion:
+    """A conversion that runs until it is released, counting its runs."""
+
+    def __init__(self, output: bytes | Path | Exception = b"output") -> None:
+        self.output = output
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> bytes | Path:
+        self.runs += 1
+        await self.release.wait()
+        if isinstance(self.output, Exception):
+            raise self.output
+        return self.output
+
+
+async def settle() -> None:
+    # Let the started requests reach the coalescer.
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_one_conversion():
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion()
+    with patch("app.request_coalescing.increment_coalesced_conversion") as coalesced:
+        requests = [asyncio.create_task(coalescer.run("key", "docx", conversion)) for _ in range(3)]
+        await settle()
+        conversion.release.set()
+        outputs = await asyncio.gather(*requests)
+
+    assert outputs == [b"output"] * 3
+    assert conversion.runs == 1
+    assert coalesced.call_count == 2
+    coalesced.assert_called_with("docx")
+
+
+@pytest.mark.asyncio
+async def test_a_finished_conversion_is_not_shared_with_later_requests():
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion()
+    conversion.release.set()
+
+    await coalescer.run("key", "docx", conversion)
+    await coalescer.run("key", "docx", conversion)
+
+    assert conversion.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_different_keys_convert_on_their_own():
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion()
+    requests = [asyncio.create_task(coalescer.run(key, "docx", conversion)) for key in ("a", "b", None)]
+    await settle()
+    conversion.release.set()
+    await asyncio.gather(*requests)
+
+    assert conversion.runs == 3
+
+
+@pytest.mark.asyncio
+async def test_each_request_gets_a_file_of_its_own(tmp_path):
+    output_path = tmp_path / "output.pdf"
+    await anyio.Path(output_path).write_bytes(b"%PDF")
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion(output_path)
+    requests = [asyncio.create_task(coalescer.run("key", "pdf", conversion)) for _ in range(3)]
+    await settle()
+    conversion.release.set()
+    outputs = await asyncio.gather(*requests)
+
+    assert outputs[0] == output_path
+    assert len(set(outputs)) == 3
+    # The leader removes its output once it has sent it, the others keep theirs.
+    await anyio.Path(output_path).unlink()
+    for output in outputs[1:]:
+        assert await anyio.Path(output).read_bytes() == b"%PDF"
+
+
+@pytest.mark.asyncio
+async def test_a_failed_conversion_fails_every_request():
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion(RuntimeError("pandoc failed"))
+    requests = [asyncio.create_task(coalescer.run("key", "docx", conversion)) for _ in range(2)]
+    await settle()
+    conversion.release.set()
+    results = await asyncio.gather(*requests, return_exceptions=True)
+
+    assert [str(result) for result in results] == ["pandoc failed", "pandoc failed"]
+    assert conversion.runs == 1
+
+
+@pytest.mark.asyncio
+async def test_a_waiting_request_converts_again_when_the_leader_is_cancelled():
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion()
+    leader = asyncio.create_task(coalescer.run("key", "docx", conversion))
+    await settle()
+    follower = asyncio.create_task(coalescer.run("key", "docx", conversion))
+    await settle()
+
+    leader.cancel()
+    await settle()
+    conversion.release.set()
+
+    assert await follower == b"output"
+    assert conversion.runs == 2
+    assert leader.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_waiting_request_leaves_the_conversion_running(tmp_path):
+    output_path = tmp_path / "output.pdf"
+    await anyio.Path(output_path).write_bytes(b"%PDF")
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion(output_path)
+    leader = asyncio.create_task(coalescer.run("key", "pdf", conversion))
+    await settle()
+    follower = asyncio.create_task(coalescer.run("key", "pdf", conversion))
+    await settle()
+
+    follower.cancel()
+    await settle()
+    conversion.release.set()
+
+    assert await leader == output_path
+    # The cancelled request got no link to leak.
+    assert [path.name for path in tmp_path.iterdir()] == ["output.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_requests_convert_on_their_own_when_coalescing_is_off():
+    coalescer = ConversionCoalescer()
+    conversion = SlowConversion()
+    with patch.dict(os.environ, {"COALESCE_CONVERSIONS": "false"}):
+        requests = [asyncio.create_task(coalescer.run("key", "docx", conversion)) for _ in range(2)]
+        await settle()
+        conversion.release.set()
+        await asyncio.gather(*requests)
+
+    assert conversion.runs == 2
+
+
+def test_link_output_falls_back_to_a_copy(tmp_path):
+    output_path = tmp_path / "output.html"
+    output_path.write_bytes(b"<p/>")
+    (tmp_path / "follower").mkdir()
+
+    with patch("pathlib.Path.hardlink_to", side_effect=OSError("no links here")):
+        link = link_output(output_path, tmp_path / "follower")
+
+    assert link.read_bytes() == b"<p/>"
+    assert link.parent == tmp_path / "follower"
+    assert link.suffix == ".html"
+
+
+@pytest.mark.asyncio
+async def test_identical_convert_requests_run_pandoc_once(tmp_path):
+    reset_conversion_coalescer()
+    joined = asyncio.Event()
+    released = asyncio.Event()
+    output_path = tmp_path / "output.html"
+
+    async def convert_to_file(*_args, **_kwargs) -> Path:
+        await released.wait()
+        await anyio.Path(output_path).write_bytes(b"<h1>Title</h1>")
+        return output_path
+
+    transport = httpx.ASGITransport(app=pandoc_controller.app)
+    with (
+        patch("app.pandoc_controller.run_pandoc_conversion_to_output", AsyncMock(side_effect=convert_to_file)) as pandoc,
+        patch("app.request_coalescing.increment_coalesced_conversion", side_effect=lambda _target_format: joined.set()),
+    ):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [asyncio.create_task(client.post(f"/convert/markdown/to/html?file_name={name}.html", content="# Title")) for name in ("first", "second")]
+            await joined.wait()
+            released.set()
+            responses = await asyncio.gather(*requests)
+
+    assert pandoc.call_count == 1
+    assert [response.content for response in responses] == [b"<h1>Title</h1>"] * 2
+    assert {response.headers["content-disposition"] for response in responses} == {"attachment; filename=first.html", "attachment; filename=second.html"}
+    # Every file was removed once it had been sent.
+    assert list(tmp_path.iterdir()) == []
+    reset_conversion_coalescer()
+
+
+def test_get_conversion_coalescer_returns_one_instance():
+    reset_conversion_coalescer()
+    try:
+        assert get_conversion_coalescer() is get_conversion_coalescer()
+    finally:
+        reset_conversion_coalescer()
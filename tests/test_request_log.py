@@ -0,0 +1,50 @@
+"""Tests for the request log line of the conversions."""
+
+import logging
+import sys
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.conversion_executor import ConversionExecutor
+from app.request_log import RequestLogMiddleware
+
+
+async def convert(_request: Request) -> PlainTextResponse:
+    await ConversionExecutor(max_concurrent_conversions=1).run([sys.executable, "-c", "pass"])
+    return PlainTextResponse("converted", status_code=200)
+
+
+async def version(_request: Request) -> PlainTextResponse:
+    return PlainTextResponse("1")
+
+
+def get_request_log_lines(caplog) -> list[str]:
+    return [record.getMessage() for record in caplog.records if record.name == "app.request_log"]
+
+
+def make_client() -> TestClient:
+    app = Starlette(routes=[Route("/convert/{source_format}/to/{target_format}", convert, methods=["POST"]), Route("/version", version)])
+    app.add_middleware(RequestLogMiddleware)
+    return TestClient(app)
+
+
+def test_conversion_is_logged_with_the_usage_of_its_children(caplog):
+    with caplog.at_level(logging.INFO, logger="app.request_log"):
+        response = make_client().post("/convert/markdown/to/docx-with-template", content=b"# Title")
+
+    assert response.text == "converted"
+    [line] = get_request_log_lines(caplog)
+    assert line.startswith("POST /convert/markdown/to/docx-with-template 200 in ")
+    assert "1 child processes, cpu user " in line
+    assert "max rss " in line
+
+
+def test_other_requests_are_not_logged(caplog):
+    with caplog.at_level(logging.INFO, logger="app.request_log"):
+        assert make_client().get("/version").text == "1"
+
+    assert get_request_log_lines(caplog) == []
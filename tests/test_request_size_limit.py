@@ -0,0 +1,94 @@
+"""Tests for the streaming request body limit."""
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.request_size_limit import RequestSizeLimitMiddleware, get_declared_content_length
+
+LIMIT = 1024
+
+
+def make_client() -> tuple[TestClient, list[str]]:
+    """A client for an echo app behind the middleware, and the events the app saw."""
+    events: list[str] = []
+
+    async def echo(request: Request) -> PlainTextResponse:
+        events.append("called")
+        try:
+            body = await request.body()
+        except ClientDisconnect:
+            events.append("disconnected")
+            return PlainTextResponse("unreachable", status_code=400)
+        return PlainTextResponse(f"received {len(body)}")
+
+    inner = Starlette(routes=[Route("/echo", echo, methods=["POST"])])
+    return TestClient(RequestSizeLimitMiddleware(inner, get_max_body_size=lambda: LIMIT)), events
+
+
+def chunks(count: int, size: int):
+    for _ in range(count):
+        yield b"x" * size
+
+
+def test_body_within_limit_passes_through():
+    client, events = make_client()
+
+    response = client.post("/echo", content=b"x" * LIMIT)
+
+    assert response.status_code == 200
+    assert response.text == f"received {LIMIT}"
+    assert events == ["called"]
+
+
+def test_declared_content_length_over_limit_is_rejected_before_the_app_runs():
+    client, events = make_client()
+
+    response = client.post("/echo", content=b"x" * (LIMIT + 1))
+
+    assert response.status_code == 413
+    assert response.text == f"Request Body too large: Exception('Body Size {LIMIT + 1} > {LIMIT}')"
+    assert events == []
+
+
+def test_streamed_body_over_limit_is_cut_off():
+    client, events = make_client()
+
+    response = client.post("/echo", content=chunks(4, 512))
+
+    # Without a Content-Length the size is only known once the body is counted.
+    assert response.status_code == 413
+    assert response.text.startswith("Request Body too large: Exception('Body Size ")
+    assert response.text.endswith(f" > {LIMIT}')")
+    assert events == ["called", "disconnected"]
+
+
+def test_streamed_body_within_limit_passes_through():
+    client, _ = make_client()
+
+    response = client.post("/echo", content=chunks(2, 512))
+
+    assert response.status_code == 200
+    assert response.text == f"received {LIMIT}"
+
+
+@pytest.mark.asyncio
+async def test_non_http_scopes_are_passed_through():
+    seen = []
+
+    async def inner(scope, receive, send):
+        seen.append(scope["type"])
+
+    await RequestSizeLimitMiddleware(inner, get_max_body_size=lambda: LIMIT)({"type": "lifespan"}, None, None)
+
+    assert seen == ["lifespan"]
+
+
+def test_get_declared_content_length():
+    assert get_declared_content_length({"headers": [(b"content-length", b"42")]}) == 42
+    assert get_declared_content_length({"headers": [(b"content-type", b"text/plain")]}) is None
+    assert get_declared_content_length({"headers": [(b"content-length", b"many")]}) is None
+    assert get_declared_content_length({"headers": [(b"content-length", b"-1")]}) is None
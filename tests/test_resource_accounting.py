@@ -0,0 +1,129 @@
+"""Tests for the resource usage of the pandoc child processes."""
+
+import asyncio
+import resource
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.conversion_executor import ConversionExecutor
+from app.resource_accounting import BLOCK_SIZE, MAX_RSS_UNIT, ConversionResources, ResourceUsage, account_conversion, record_child_usage
+
+# Keeps a core busy for a moment and holds some memory.
+BUSY_SCRIPT = "import time; data = bytearray(64 * 1024 * 1024); end = time.process_time() + 0.2\nwhile time.process_time() < end: pass"
+
+
+def get_sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_usage_is_taken_from_the_rusage():
+    rusage = resource.struct_rusage((1.5, 0.25, 2048, 0, 0, 0, 0, 0, 0, 8, 4, 0, 0, 0, 0, 0))
+
+    usage = ResourceUsage.from_rusage(rusage)
+
+    assert usage == ResourceUsage(user_cpu_seconds=1.5, system_cpu_seconds=0.25, max_rss_bytes=2048 * MAX_RSS_UNIT, read_bytes=8 * BLOCK_SIZE, write_bytes=4 * BLOCK_SIZE)
+
+
+def test_usage_of_the_children_adds_up():
+    resources = ConversionResources("docx", "pdf")
+    resources.add(ResourceUsage(1.0, 0.5, 100, 10, 20))
+    resources.add(ResourceUsage(2.0, 0.25, 300, 1, 2))
+
+    assert (resources.processes, resources.user_cpu_seconds, resources.system_cpu_seconds) == (2, 3.0, 0.75)
+    assert (resources.max_rss_bytes, resources.read_bytes, resources.write_bytes) == (300, 11, 22)
+    assert resources.describe().startswith("2 child processes, cpu user 3.000s sys 0.750s")
+
+
+def test_usage_is_observed_with_the_formats_of_the_conversion():
+    before = get_sample("pandoc_child_cpu_seconds_sum", source_format="odt", target_format="rst", mode="user")
+
+    with account_conversion("odt", "rst") as resources:
+        record_child_usage(ResourceUsage(user_cpu_seconds=0.5, max_rss_bytes=1024))
+
+    assert resources.processes == 1
+    assert get_sample("pandoc_child_cpu_seconds_sum", source_format="odt", target_format="rst", mode="user") - before == pytest.approx(0.5)
+    assert get_sample("pandoc_child_max_rss_bytes_count", source_format="odt", target_format="rst") >= 1
+
+
+def test_usage_outside_of_a_conversion_is_observed_as_unknown():
+    before = get_sample("pandoc_child_block_io_bytes_count", source_format="unknown", target_format="unknown", direction="write")
+
+    record_child_usage(ResourceUsage(write_bytes=512))
+
+    assert get_sample("pandoc_child_block_io_bytes_count", source_format="unknown", target_format="unknown", direction="write") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_executor_accounts_the_child_process():
+    with account_conversion("markdown", "pdf") as resources:
+        await ConversionExecutor(max_concurrent_conversions=1).run([sys.executable, "-c", BUSY_SCRIPT])
+
+    assert resources.processes == 1
+    assert resources.user_cpu_seconds + resources.system_cpu_seconds >= 0.2
+    assert resources.max_rss_bytes >= 64 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_usage_includes_the_children_the_process_reaped():
+    script = f"import subprocess, sys; subprocess.run([sys.executable, '-c', {BUSY_SCRIPT!r}], check=True)"
+    with account_conversion("markdown", "pdf") as resources:
+        await ConversionExecutor(max_concurrent_conversions=1).run([sys.executable, "-c", script])
+
+    assert resources.processes == 1
+    assert resources.user_cpu_seconds + resources.system_cpu_seconds >= 0.2
+    assert resources.max_rss_bytes >= 64 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_concurrent_children_are_accounted_to_their_own_conversion():
+    executor = ConversionExecutor(max_concurrent_conversions=2)
+
+    async def convert(script):
+        with account_conversion("markdown", "pdf") as resources:
+            await executor.run([sys.executable, "-c", script])
+        return resources
+
+    # The idle child exits after the busy one, which holds more memory.
+    busy, idle = await asyncio.gather(convert(BUSY_SCRIPT), convert("import time; time.sleep(1)"))
+
+    assert busy.user_cpu_seconds + busy.system_cpu_seconds >= 0.2
+    assert busy.max_rss_bytes >= 64 * 1024 * 1024
+    assert idle.user_cpu_seconds + idle.system_cpu_seconds < 0.2
+    assert idle.max_rss_bytes > 0
+
+
+@pytest.mark.asyncio
+async def test_failed_child_is_accounted_too():
+    with account_conversion("markdown", "html") as resources, pytest.raises(subprocess.CalledProcessError):
+        await ConversionExecutor(max_concurrent_conversions=1).run([sys.executable, "-c", "import sys; sys.exit(3)"])
+
+    assert resources.processes == 1
+
+
+@pytest.mark.asyncio
+async def test_piped_output_is_returned_with_the_usage():
+    source = b"x" * (4 * 1024 * 1024)
+    script = "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read())"
+    with account_conversion("markdown", "html") as resources:
+        output = await ConversionExecutor(max_concurrent_conversions=1).run_piped([sys.executable, "-c", script], source)
+
+    assert output == source
+    assert resources.processes == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_child_is_killed_and_reaped():
+    executor = ConversionExecutor(max_concurrent_conversions=1)
+    with patch("app.conversion_executor.record_child_usage") as record:
+        task = asyncio.create_task(executor.run([sys.executable, "-c", "import time; time.sleep(30)"]))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, 5)
+
+    record.assert_not_called()
+    assert executor.get_active_conversions() == 0
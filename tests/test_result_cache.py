@@ -0,0 +1,210 @@
+"""Tests for the content-addressed cache of conversion results."""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.result_cache import (
+    DISK_TIER,
+    INLINE_HASH_MAX_SIZE,
+    MEMORY_TIER,
+    ResultCache,
+    build_cache_key,
+    get_result_cache,
+    get_result_cache_dir,
+    is_cheap_to_hash,
+    is_result_cache_enabled,
+    reset_result_cache,
+)
+
+PARAMETERS = {"source_format": "markdown", "target_format": "pdf", "options": ["--track-changes=all"], "paper_size": None}
+
+
+def hits(tier: str) -> float:
+    return REGISTRY.get_sample_value("pandoc_result_cache_hits_total", {"tier": tier}) or 0.0
+
+
+def misses() -> float:
+    return REGISTRY.get_sample_value("pandoc_result_cache_misses_total") or 0.0
+
+
+def evictions(tier: str) -> float:
+    return REGISTRY.get_sample_value("pandoc_result_cache_evictions_total", {"tier": tier}) or 0.0
+
+
+def key(name: str) -> str:
+    return build_cache_key(name.encode(), PARAMETERS)
+
+
+def test_key_is_stable_for_the_same_conversion():
+    assert build_cache_key(b"# x", PARAMETERS) == build_cache_key(b"# x", dict(reversed(PARAMETERS.items())))
+
+
+@pytest.mark.parametrize(
+    ("source", "parameters", "template"),
+    [
+        (b"# y", PARAMETERS, None),
+        (b"# x", {**PARAMETERS, "paper_size": "A4"}, None),
+        (b"# x", {**PARAMETERS, "options": []}, None),
+        (b"# x", PARAMETERS, b"PK template"),
+    ],
+)
+def test_key_changes_with_every_input(source, parameters, template):
+    assert build_cache_key(source, parameters, template) != build_cache_key(b"# x", PARAMETERS)
+
+
+def test_key_of_a_spooled_source_is_the_key_of_its_bytes(tmp_path):
+    spooled = tmp_path / "pandoc-source-1"
+    spooled.write_bytes(b"x" * 3_000_000)
+
+    assert build_cache_key(spooled, PARAMETERS) == build_cache_key(b"x" * 3_000_000, PARAMETERS) == build_cache_key("x" * 3_000_000, PARAMETERS)
+
+
+def test_only_a_small_source_in_memory_is_cheap_to_hash(tmp_path):
+    assert is_cheap_to_hash(b"# x", b"PK template")
+    assert is_cheap_to_hash("x" * INLINE_HASH_MAX_SIZE)
+    assert not is_cheap_to_hash(b"x" * INLINE_HASH_MAX_SIZE, b"PK")
+    assert not is_cheap_to_hash(tmp_path / "pandoc-source-1")
+    assert not is_cheap_to_hash(b"# x", tmp_path / "template.docx")
+
+
+def test_memory_tier_evicts_the_least_recently_used_result(tmp_path):
+    cache = ResultCache(memory_max_bytes=400, disk_dir=tmp_path, disk_max_bytes=0)
+    before = evictions(MEMORY_TIER)
+    for name in ("a", "b", "c", "d"):
+        cache.put(key(name), name.encode() * 100)
+    # "a" was used last, so "b" goes first.
+    assert cache.get(key("a")) == b"a" * 100
+
+    cache.put(key("e"), b"e" * 100)
+
+    assert cache.get(key("b")) is None
+    assert [cache.get(key(name)) is not None for name in ("a", "c", "d", "e")] == [True] * 4
+    assert evictions(MEMORY_TIER) == before + 1
+
+
+def test_hits_and_misses_are_counted(tmp_path):
+    cache = ResultCache(memory_max_bytes=1024, disk_dir=tmp_path, disk_max_bytes=0)
+    hits_before, misses_before = hits(MEMORY_TIER), misses()
+    cache.put(key("a"), b"a")
+
+    cache.get(key("a"))
+    cache.get(key("b"))
+
+    assert hits(MEMORY_TIER) == hits_before + 1
+    assert misses() == misses_before + 1
+
+
+def test_large_result_is_served_from_a_link_of_its_disk_entry(tmp_path):
+    cache = ResultCache(memory_max_bytes=1024, disk_dir=tmp_path, disk_max_bytes=1024 * 1024)
+    output = tmp_path / "pandoc-output"
+    output.write_bytes(b"%PDF" * 1000)
+    before = hits(DISK_TIER)
+
+    cache.put(key("a"), output)
+    served = cache.get(key("a"))
+
+    assert output.exists()
+    assert served.read_bytes() == b"%PDF" * 1000
+    served.unlink()
+    assert (tmp_path / key("a")).exists()
+    assert hits(DISK_TIER) == before + 1
+
+
+def test_small_disk_result_is_promoted_to_memory(tmp_path):
+    ResultCache(memory_max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1024).put(key("a"), b"docx")
+    cache = ResultCache(memory_max_bytes=1024, disk_dir=tmp_path, disk_max_bytes=1024)
+
+    assert cache.get(key("a")) == b"docx"
+    (tmp_path / key("a")).unlink()
+    assert cache.get(key("a")) == b"docx"
+
+
+def test_disk_tier_evicts_the_least_recently_used_result(tmp_path):
+    cache = ResultCache(memory_max_bytes=0, disk_dir=tmp_path, disk_max_bytes=300)
+    before = evictions(DISK_TIER)
+    for name in ("a", "b", "c"):
+        cache.put(key(name), name.encode() * 100)
+    cache.get(key("a")).unlink()
+
+    cache.put(key("d"), b"d" * 100)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([key("a"), key("c"), key("d"), ".lock"])
+    assert evictions(DISK_TIER) == before + 1
+
+
+def test_disk_tier_is_read_again_after_a_restart(tmp_path):
+    first = ResultCache(memory_max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1024)
+    first.put(key("old"), b"o" * 500)
+    os.utime(tmp_path / key("old"), (1, 1))
+    first.put(key("new"), b"n" * 500)
+    leftover = "0123456789abcdef0123456789abcdef"
+    for suffix in ("served", "partial"):
+        (tmp_path / f"{key('old')}.{leftover}.{suffix}").write_bytes(b"left over")
+        os.utime(tmp_path / f"{key('old')}.{leftover}.{suffix}", (1, 1))
+    (tmp_path / "unrelated.txt").write_bytes(b"not the cache's")
+
+    restarted = ResultCache(memory_max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1024)
+    restarted.put(key("newest"), b"x" * 500)
+
+    # The leftovers are gone, the oldest entry made room and the unrelated file is kept.
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([key("new"), key("newest"), "unrelated.txt", ".lock"])
+
+
+def test_workers_share_the_disk_tier(tmp_path):
+    first = ResultCache(memory_max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1000)
+    second = ResultCache(memory_max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1000)
+    first.put(key("a"), b"a" * 400)
+    served = second.get(key("a"))
+
+    second.put(key("b"), b"b" * 400)
+    first.put(key("c"), b"c" * 400)
+
+    # One size for both: the entry used least recently made room.
+    assert first.get(key("a")) is None
+    assert second.get(key("c")).read_bytes() == b"c" * 400
+    # The link the other worker is still sending is not a leftover.
+    assert served.read_bytes() == b"a" * 400
+
+
+def test_failing_disk_tier_does_not_fail_the_put(tmp_path):
+    blocked = tmp_path / "cache"
+    blocked.write_bytes(b"not a directory")
+    cache = ResultCache(memory_max_bytes=1024, disk_dir=blocked, disk_max_bytes=1024)
+
+    cache.put(key("a"), b"a")
+
+    assert cache.get(key("a")) == b"a"
+
+
+def test_cache_is_configured_from_environment(tmp_path):
+    with patch.dict(os.environ, {"RESULT_CACHE_DIR": str(tmp_path), "RESULT_CACHE_MEMORY_MB": "2", "RESULT_CACHE_DISK_MB": "0"}):
+        cache = ResultCache()
+
+    assert cache.disk_dir == tmp_path
+    assert cache.memory_max_bytes == 2 * 1024 * 1024
+    assert cache.disk_max_bytes == 0
+
+
+@pytest.mark.parametrize(("name", "value"), [("RESULT_CACHE_MEMORY_MB", "-1"), ("RESULT_CACHE_DISK_MB", "lots")])
+def test_invalid_cache_sizes_fall_back_to_defaults(name, value):
+    with patch.dict(os.environ, {name: value}):
+        cache = ResultCache()
+
+    assert (cache.memory_max_bytes, cache.disk_max_bytes) == (64 * 1024 * 1024, 1024 * 1024 * 1024)
+
+
+def test_cache_is_off_by_default():
+    with patch.dict(os.environ, {}, clear=True):
+        assert not is_result_cache_enabled()
+        assert get_result_cache_dir().name == "pandoc-service-cache"
+
+
+def test_get_result_cache_returns_one_instance():
+    reset_result_cache()
+    try:
+        assert get_result_cache() is get_result_cache()
+    finally:
+        reset_result_cache()
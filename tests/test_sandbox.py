@@ -13,7 +13,6 @@ def build(**overrides: object) -> list[str]:
         "source_path": "/tmp/source.html",
         "output_path": "/tmp/output.docx",
         "validated_options": [],
-        "apply_docx_latex_filters": False,
     }
     arguments.update(overrides)
     return _build_pandoc_command(**arguments)  # type: ignore[arg-type]
@@ -0,0 +1,243 @@
+"""Tests for the per-request scratch workspaces."""
+
+import asyncio
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.conversion_executor import ConversionExecutor
+from app.load_shedding import LoadShedder, LoadSheddingPolicy
+from app.prometheus_metrics import update_gauges_from_scratch_space
+from app.scratch_workspace import (
+    ORPHAN_GRACE_PERIOD,
+    ScratchSpace,
+    ScratchWorkspaceMiddleware,
+    get_scratch_dir,
+    get_scratch_root,
+    get_scratch_space,
+    reset_scratch_space,
+)
+
+
+@pytest.fixture
+def scratch_space(tmp_path):
+    """The global scratch space, rooted in a temp directory."""
+    reset_scratch_space()
+    with patch.dict(os.environ, {"SCRATCH_DIR": str(tmp_path / "scratch")}):
+        yield get_scratch_space()
+    reset_scratch_space()
+
+
+def make_old(path: Path, seconds: float) -> None:
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_scratch_root_is_read_from_environment(tmp_path):
+    with patch.dict(os.environ, {"SCRATCH_DIR": str(tmp_path)}):
+        assert get_scratch_root() == tmp_path
+    with patch.dict(os.environ, {}, clear=True):
+        assert get_scratch_root().name == "pandoc-service-scratch"
+
+
+@pytest.mark.parametrize(("value", "expected"), [(None, 0), ("0", 0), ("64", 64 * 1024 * 1024), ("-1", 0), ("lots", 0)])
+def test_quota_is_read_from_environment(tmp_path, value, expected):
+    env = {} if value is None else {"SCRATCH_MAX_MB": value}
+    with patch.dict(os.environ, env, clear=True):
+        assert ScratchSpace(tmp_path).max_bytes == expected
+
+
+@pytest.mark.asyncio
+async def test_workspace_is_created_on_first_use_and_removed_at_the_end(scratch_space):
+    async with scratch_space.workspace() as workspace:
+        scratch_dir = get_scratch_dir()
+        (scratch_dir / "source.md").write_text("# Title")
+
+        assert scratch_dir == workspace.path
+        assert scratch_dir.parent == scratch_space.root
+        assert scratch_dir.name.startswith(f"{os.getpid()}-")
+        assert scratch_dir in scratch_space.active
+
+    assert not scratch_dir.exists()
+    assert scratch_space.active == set()
+
+
+@pytest.mark.asyncio
+async def test_workspace_is_removed_in_a_worker_thread(scratch_space):
+    removers: list[int] = []
+    rmtree = shutil.rmtree
+
+    def tracking_rmtree(path, **kwargs):
+        removers.append(threading.get_ident())
+        rmtree(path, **kwargs)
+
+    with patch("app.scratch_workspace.shutil.rmtree", side_effect=tracking_rmtree):
+        async with scratch_space.workspace() as workspace:
+            scratch_dir = workspace.path
+            (scratch_dir / "output.pdf").write_bytes(b"%PDF-")
+
+    assert not scratch_dir.exists()
+    assert len(removers) == 1
+    assert removers[0] != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_workspace_that_is_not_used_creates_no_directory(scratch_space):
+    async with scratch_space.workspace():
+        pass
+
+    assert not scratch_space.root.exists()
+
+
+def test_files_outside_of_a_workspace_go_to_the_root(scratch_space):
+    assert get_scratch_dir() == scratch_space.root
+    assert scratch_space.root.is_dir()
+
+
+@pytest.mark.asyncio
+async def test_usage_is_measured_at_most_once_per_interval(tmp_path):
+    now = [100.0]
+    space = ScratchSpace(tmp_path, max_bytes=100, clock=lambda: now[0])
+    async with space.workspace() as workspace:
+        (workspace.path / "a").write_bytes(b"x" * 60)
+
+        assert space.get_usage().total_bytes == 60
+        assert space.get_usage().workspaces == 1
+        assert not space.is_full()
+
+        (workspace.path / "b").write_bytes(b"x" * 40)
+        assert space.get_usage().total_bytes == 60
+
+        now[0] += 1.0
+        assert space.get_usage().total_bytes == 100
+        assert space.is_full()
+
+
+def test_space_without_quota_is_never_full(tmp_path):
+    (tmp_path / "big").write_bytes(b"x" * 1000)
+
+    assert not ScratchSpace(tmp_path, max_bytes=0).is_full()
+
+
+@pytest.mark.asyncio
+async def test_janitor_removes_what_no_conversion_uses(tmp_path):
+    space = ScratchSpace(tmp_path, max_bytes=0, orphan_age=3600)
+    dead = tmp_path / "999999-dead"
+    living = tmp_path / "1-living"
+    stale = tmp_path / "1-stale"
+    leaked = tmp_path / f"{os.getpid()}-leaked"
+    loose = tmp_path / "pandoc-source-loose"
+    fresh_loose = tmp_path / "pandoc-source-fresh"
+    for directory in (dead, living, stale, leaked):
+        directory.mkdir()
+    loose.write_bytes(b"x")
+    fresh_loose.write_bytes(b"x")
+    make_old(stale, 7200)
+    make_old(leaked, 2 * ORPHAN_GRACE_PERIOD)
+    make_old(loose, 7200)
+
+    async with space.workspace() as workspace:
+        in_use = workspace.path
+        make_old(in_use, 7200)
+        with patch("app.scratch_workspace.psutil.pid_exists", side_effect=lambda pid: pid != 999999):
+            removed = space.remove_orphans()
+
+        assert in_use.is_dir()
+
+    assert removed == 4
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["1-living", "pandoc-source-fresh"]
+
+
+def test_janitor_leaves_a_new_workspace_of_this_process_alone(tmp_path):
+    space = ScratchSpace(tmp_path, max_bytes=0, orphan_age=3600)
+    (tmp_path / f"{os.getpid()}-starting").mkdir()
+
+    assert space.remove_orphans() == 0
+
+
+@pytest.mark.asyncio
+async def test_janitor_runs_in_the_background(tmp_path):
+    space = ScratchSpace(tmp_path, max_bytes=0, orphan_age=3600)
+    (tmp_path / "999999-dead").mkdir()
+
+    with patch("app.scratch_workspace.psutil.pid_exists", return_value=False):
+        space.start_janitor()
+        # The first round runs at once; a thread hop later it is done.
+        for _ in range(100):
+            if not (tmp_path / "999999-dead").exists():
+                break
+            await asyncio.sleep(0.01)
+        await space.stop_janitor()
+
+    assert not (tmp_path / "999999-dead").exists()
+
+
+def test_middleware_removes_the_workspace_after_the_response_was_sent(scratch_space):
+    seen: dict[str, Path] = {}
+
+    async def convert(_request: Request) -> FileResponse:
+        output = get_scratch_dir() / "output.html"
+        output.write_bytes(b"<p>converted</p>")
+        seen["output"] = output
+        return FileResponse(output)
+
+    async def version(_request: Request) -> PlainTextResponse:
+        return PlainTextResponse("1")
+
+    app = Starlette(routes=[Route("/convert/markdown/to/html", convert, methods=["POST"]), Route("/version", version)])
+    app.add_middleware(ScratchWorkspaceMiddleware)
+    client = TestClient(app)
+
+    response = client.post("/convert/markdown/to/html", content=b"# Title")
+
+    assert response.content == b"<p>converted</p>"
+    assert seen["output"].parent.parent == scratch_space.root
+    assert not seen["output"].parent.exists()
+    assert client.get("/version").text == "1"
+    assert list(scratch_space.root.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_pandoc_runs_in_the_workspace(scratch_space):
+    script = "import os, sys; sys.stdout.write(os.getcwd() + '|' + os.environ['TMPDIR'])"
+    async with scratch_space.workspace() as workspace:
+        output = await ConversionExecutor(max_concurrent_conversions=1).run_piped([sys.executable, "-c", script], None)
+
+        assert output.decode().split("|") == [str(workspace.path), str(workspace.path)]
+
+
+def test_full_scratch_space_sheds_conversions(scratch_space):
+    shedder = LoadShedder(LoadSheddingPolicy())
+    with patch.object(scratch_space, "is_full", return_value=True):
+        assert shedder.try_acquire(1) == "scratch"
+    assert shedder.try_acquire(1) is None
+
+
+@pytest.mark.asyncio
+async def test_usage_is_exported(scratch_space):
+    async with scratch_space.workspace() as workspace:
+        (workspace.path / "source.docx").write_bytes(b"x" * 123)
+        update_gauges_from_scratch_space(scratch_space)
+
+    assert REGISTRY.get_sample_value("pandoc_scratch_bytes") == 123
+    assert REGISTRY.get_sample_value("pandoc_scratch_workspaces") == 1
+
+
+def test_get_scratch_space_returns_one_instance():
+    reset_scratch_space()
+    try:
+        assert get_scratch_space() is get_scratch_space()
+    finally:
+        reset_scratch_space()
@@ -0,0 +1,142 @@
+"""Tests for the on-disk registry of reference documents."""
+
+import hashlib
+import io
+import os
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from app.template_store import (
+    InvalidTemplateError,
+    TemplateNotFoundError,
+    TemplateStore,
+    TemplateStoreFullError,
+    get_template_format,
+    get_template_store,
+    get_templates_dir,
+    is_template_name,
+    reset_template_store,
+)
+
+
+def make_template(template_format: str = "docx", styles: bytes = b"<styles/>") -> bytes:
+    part = "word/document.xml" if template_format == "docx" else "ppt/presentation.xml"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as package:
+        package.writestr(part, b"<document/>")
+        package.writestr("styles.xml", styles)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path) -> TemplateStore:
+    return TemplateStore(root=tmp_path / "templates", max_templates=3)
+
+
+def test_put_registers_a_template_by_name_and_id(store):
+    template = make_template()
+
+    stored, created = store.put("corporate", template)
+
+    assert created
+    assert stored.template_id == hashlib.sha256(template).hexdigest()
+    assert stored.template_format == "docx"
+    assert stored.size == len(template)
+    assert stored.path.read_bytes() == template
+    assert store.get("corporate") == stored
+    assert store.get(stored.template_id).path == stored.path
+    assert store.get(stored.template_id).name is None
+
+
+def test_put_replaces_what_a_name_pointed_to(store):
+    old, _ = store.put("corporate", make_template(styles=b"<old/>"))
+
+    new, created = store.put("corporate", make_template(styles=b"<new/>"))
+
+    assert not created
+    assert store.get("corporate").template_id == new.template_id
+    # No name points to the old template any more.
+    assert not old.path.exists()
+
+
+def test_names_of_one_template_share_its_file(store):
+    first, _ = store.put("corporate", make_template())
+    second, _ = store.put("corporate-2024", make_template())
+
+    assert first.path == second.path
+    store.delete("corporate")
+
+    assert store.get("corporate-2024").path.exists()
+    with pytest.raises(TemplateNotFoundError):
+        store.get("corporate")
+
+
+def test_delete_by_id_removes_the_template_and_its_names(store):
+    stored, _ = store.put("corporate", make_template())
+    store.put("corporate-2024", make_template())
+
+    store.delete(stored.template_id)
+
+    assert not stored.path.exists()
+    for template_ref in ("corporate", "corporate-2024", stored.template_id):
+        with pytest.raises(TemplateNotFoundError):
+            store.get(template_ref)
+
+
+@pytest.mark.parametrize("template_ref", ["unknown", "../../etc/passwd", "0" * 64])
+def test_unknown_template_is_not_found(store, template_ref):
+    with pytest.raises(TemplateNotFoundError, match="not found"):
+        store.get(template_ref)
+    with pytest.raises(TemplateNotFoundError):
+        store.delete(template_ref)
+
+
+@pytest.mark.parametrize("name", ["", "../corporate", ".hidden", "a" * 101, "a b", "f" * 64])
+def test_invalid_names_are_refused(store, name):
+    assert not is_template_name(name)
+    with pytest.raises(InvalidTemplateError, match="Invalid template name"):
+        store.put(name, make_template())
+
+
+@pytest.mark.parametrize("template", [b"not a zip", make_template().replace(b"word/document.xml", b"word/other123.xml")])
+def test_only_docx_and_pptx_templates_are_accepted(store, template):
+    with pytest.raises(InvalidTemplateError, match="DOCX or PPTX"):
+        store.put("corporate", template)
+
+
+def test_template_format_is_read_from_its_parts():
+    assert get_template_format(make_template("docx")) == "docx"
+    assert get_template_format(make_template("pptx")) == "pptx"
+
+
+def test_new_names_are_refused_while_the_store_is_full(store):
+    for name in ("a", "b", "c"):
+        store.put(name, make_template(styles=name.encode()))
+
+    with pytest.raises(TemplateStoreFullError):
+        store.put("d", make_template())
+    # Replacing a registered name is still fine.
+    store.put("a", make_template(styles=b"new"))
+
+
+def test_store_is_configured_from_environment(tmp_path):
+    with patch.dict(os.environ, {"TEMPLATES_DIR": str(tmp_path), "TEMPLATES_MAX_COUNT": "7"}):
+        store = TemplateStore()
+
+    assert store.root == tmp_path
+    assert store.max_templates == 7
+
+
+def test_templates_dir_defaults_to_the_temp_directory():
+    with patch.dict(os.environ, {}, clear=True):
+        assert get_templates_dir().name == "pandoc-service-templates"
+
+
+def test_get_template_store_returns_one_instance():
+    reset_template_store()
+    try:
+        assert get_template_store() is get_template_store()
+    finally:
+        reset_template_store()
@@ -0,0 +1,193 @@
+"""Tests for spooling uploaded sources."""
+
+import io
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+from app.upload_spool import SPOOL_MAX_SIZE, discard_source, get_source_size, load_source, read_form, spool_stream, spool_upload
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_small_source_stays_in_memory():
+    source = await spool_stream(stream(b"# Title", b"\n\nText"))
+
+    assert source == b"# Title\n\nText"
+
+
+@pytest.mark.asyncio
+async def test_small_source_is_decoded_with_encoding():
+    source = await spool_stream(stream("Grüezi".encode("latin-1")), "latin-1")
+
+    assert source == "Grüezi"
+
+
+@pytest.mark.asyncio
+async def test_large_source_is_spooled_to_a_file():
+    chunk = b"x" * (SPOOL_MAX_SIZE // 2)
+    source = await spool_stream(stream(chunk, chunk, chunk, b"tail"))
+    try:
+        assert isinstance(source, Path)
+        assert source.read_bytes() == chunk * 3 + b"tail"
+        assert get_source_size(source) == len(chunk) * 3 + 4
+    finally:
+        discard_source(source)
+
+    assert not source.exists()
+
+
+@pytest.mark.asyncio
+async def test_large_source_is_transcoded_to_utf8():
+    # A multi-byte character split across chunks must survive the incremental decoding.
+    text = "Grüezi " * (SPOOL_MAX_SIZE // 4)
+    encoded = text.encode("utf-16")
+    middle = len(encoded) // 2 + 1
+    source = await spool_stream(stream(encoded[:middle], encoded[middle:]), "utf-16")
+    try:
+        assert isinstance(source, Path)
+        assert source.read_text(encoding="utf-8") == text
+    finally:
+        discard_source(source)
+
+
+@pytest.mark.asyncio
+async def test_unknown_encoding_leaves_no_scratch_file(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+    with pytest.raises(LookupError):
+        await spool_stream(stream(b"x" * (SPOOL_MAX_SIZE + 1)), "no-such-encoding")
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_failing_stream_leaves_no_scratch_file(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+    async def broken():
+        yield b"x" * (SPOOL_MAX_SIZE + 1)
+        raise OSError("connection lost")
+
+    with pytest.raises(OSError, match="connection lost"):
+        await spool_stream(broken())
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_spool_upload_reads_the_file_in_chunks():
+    content = b"y" * (SPOOL_MAX_SIZE + 10)
+    source = await spool_upload(UploadFile(io.BytesIO(content), filename="input.docx"))
+    try:
+        assert isinstance(source, Path)
+        assert await load_source(source) == content
+    finally:
+        discard_source(source)
+
+
+@pytest.mark.asyncio
+async def test_load_source_returns_in_memory_sources_unchanged():
+    assert await load_source(b"data") == b"data"
+    assert await load_source("text") == "text"
+
+
+def test_get_source_size_counts_utf8_bytes():
+    assert get_source_size("ü") == 2
+    assert get_source_size(b"ab") == 2
+
+
+def test_discard_source_ignores_in_memory_sources():
+    discard_source(b"data")
+    discard_source(None)
+
+
+def _multipart_request(content: bytes) -> Request:
+    return _form_request(b'Content-Disposition: form-data; name="source"; filename="input.docx"\r\n\r\n' + content)
+
+
+def _form_request(*parts: bytes) -> Request:
+    boundary = b"spool-boundary"
+    body = b"".join(b"--" + boundary + b"\r\n" + part + b"\r\n" for part in parts) + b"--" + boundary + b"--\r\n"
+    chunks = [body[i : i + 7] for i in range(0, len(body), 7)]
+
+    async def receive():
+        return {"type": "http.request", "body": chunks.pop(0), "more_body": bool(chunks)}
+
+    return Request({"type": "http", "method": "POST", "headers": [(b"content-type", b"multipart/form-data; boundary=" + boundary)]}, receive)
+
+
+@pytest.mark.asyncio
+async def test_read_form_parses_a_form_like_request_form():
+    parts = (
+        b'Content-Disposition: form-data; name="encoding"\r\n\r\nutf-8',
+        b'Content-Disposition: form-data; name="source"; filename="input.md"\r\nContent-Type: text/markdown\r\n\r\n# Title\r\n\r\nText',
+    )
+
+    form = await read_form(_form_request(*parts), SPOOL_MAX_SIZE)
+    expected = await _form_request(*parts).form()
+
+    assert form["encoding"] == expected["encoding"] == "utf-8"
+    assert (form["source"].filename, form["source"].content_type, form["source"].size) == (expected["source"].filename, expected["source"].content_type, expected["source"].size)
+    assert await form["source"].read() == await expected["source"].read() == b"# Title\r\n\r\nText"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "part",
+    [
+        b'Content-Disposition: form-data; name="encoding"\r\n\r\n' + b"x" * 11,
+        b"Content-Disposition: form-data\r\n\r\nx",
+    ],
+)
+async def test_read_form_refuses_a_bad_part_with_400(part):
+    with pytest.raises(HTTPException) as exc_info:
+        await read_form(_form_request(part), 10)
+
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_a_large_multipart_file_is_written_to_disk_once(tmp_path):
+    content = b"z" * (SPOOL_MAX_SIZE + 10)
+
+    with patch("app.upload_spool.get_scratch_dir", return_value=tmp_path):
+        form = await read_form(_multipart_request(content), SPOOL_MAX_SIZE * 4)
+    with patch("app.upload_spool.spool_stream") as mock_spool_stream:
+        source = await spool_upload(form["source"])
+
+    mock_spool_stream.assert_not_called()
+    assert source.parent == tmp_path
+    assert list(tmp_path.iterdir()) == [source]
+    assert await load_source(source) == content
+    discard_source(source)
+
+
+@pytest.mark.asyncio
+async def test_a_small_multipart_file_stays_in_memory(tmp_path):
+    with patch("app.upload_spool.get_scratch_dir", return_value=tmp_path):
+        form = await read_form(_multipart_request(b"# Title"), SPOOL_MAX_SIZE)
+
+    assert await spool_upload(form["source"]) == b"# Title"
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_a_large_multipart_file_with_an_encoding_is_transcoded():
+    content = "ä".encode("latin-1") * (SPOOL_MAX_SIZE + 10)
+
+    form = await read_form(_multipart_request(content), SPOOL_MAX_SIZE * 4)
+    source = await spool_upload(form["source"], "latin-1")
+    try:
+        assert await load_source(source) == "ä".encode() * (SPOOL_MAX_SIZE + 10)
+    finally:
+        discard_source(source)
+        discard_source(form["source"].path)
@@ -0,0 +1,120 @@
+"""Tests for running the service in several worker processes."""
+
+import io
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app import pandoc_controller, workers
+from app.workers import (
+    CHROMIUM_PER_WORKER,
+    CHROMIUM_SHARED,
+    SUPERVISOR_PID_ENV,
+    _read_endpoint,
+    get_chromium_mode,
+    get_worker_count,
+    is_supervised_worker,
+    prepare_multiprocess_dir,
+    run_workers,
+)
+
+
+@pytest.fixture
+def supervisor_env(tmp_path):
+    """Keep the variables run_workers sets for its workers out of the other tests."""
+    with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path / "metrics")}):
+        yield tmp_path / "metrics"
+
+
+@pytest.mark.parametrize(("value", "expected"), [(None, 1), ("4", 4), ("0", 1), ("many", 1), ("65", 1)])
+def test_worker_count_is_read_from_environment(value, expected):
+    env = {} if value is None else {"WORKERS": value}
+    with patch.dict(os.environ, env, clear=True):
+        assert get_worker_count() == expected
+
+
+@pytest.mark.parametrize(("value", "expected"), [(None, CHROMIUM_PER_WORKER), ("shared", CHROMIUM_SHARED), (" Shared ", CHROMIUM_SHARED), ("pooled", CHROMIUM_PER_WORKER)])
+def test_chromium_mode_is_read_from_environment(value, expected):
+    env = {} if value is None else {"CHROMIUM_MODE": value}
+    with patch.dict(os.environ, env, clear=True):
+        assert get_chromium_mode() == expected
+
+
+def test_prepare_multiprocess_dir_drops_the_values_of_a_previous_run(tmp_path):
+    (tmp_path / "counter_12.db").write_bytes(b"old")
+    (tmp_path / "notes.txt").write_bytes(b"kept")
+
+    prepare_multiprocess_dir(tmp_path)
+    prepare_multiprocess_dir(tmp_path / "new")
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["new", "notes.txt"]
+
+
+def test_run_workers_prepares_the_workers_and_serves_their_metrics(supervisor_env):
+    supervisor_env.mkdir()
+    (supervisor_env / "counter_1.db").write_bytes(b"old")
+    with (
+        patch.dict(os.environ, {"METRICS_SERVER_ENABLED": "true"}),
+        patch.object(workers.uvicorn, "run") as run,
+        patch.object(workers, "serve_metrics_in_thread") as serve_metrics,
+        patch.object(workers, "SharedChromium") as shared_chromium,
+    ):
+        run_workers(9082, 4, share_chromium=False)
+        assert os.environ[SUPERVISOR_PID_ENV] == str(os.getpid())
+        assert is_supervised_worker()
+
+    run.assert_called_once()
+    assert run.call_args.args == ("app.pandoc_controller:app",)
+    assert run.call_args.kwargs["workers"] == 4
+    assert run.call_args.kwargs["port"] == 9082
+    serve_metrics.assert_called_once()
+    shared_chromium.assert_not_called()
+    assert list(supervisor_env.iterdir()) == []
+
+
+def test_run_workers_shares_one_browser(supervisor_env):
+    browser = MagicMock()
+    browser.start.return_value = "ws://127.0.0.1:40000/devtools/browser/1"
+    with (
+        patch.object(workers.uvicorn, "run"),
+        patch.object(workers, "serve_metrics_in_thread"),
+        patch.object(workers, "SharedChromium", return_value=browser),
+        patch.dict(os.environ, {"METRICS_SERVER_ENABLED": "false"}),
+    ):
+        run_workers(9082, 2, share_chromium=True)
+        assert os.environ["CHROMIUM_CDP_ENDPOINT"] == "ws://127.0.0.1:40000/devtools/browser/1"
+
+    browser.stop.assert_called_once()
+
+
+def test_workers_launch_their_own_browsers_when_the_shared_one_fails(supervisor_env):
+    browser = MagicMock()
+    browser.start.side_effect = RuntimeError("no browser")
+    with (
+        patch.object(workers.uvicorn, "run") as run,
+        patch.object(workers, "serve_metrics_in_thread"),
+        patch.object(workers, "SharedChromium", return_value=browser),
+        patch.dict(os.environ, {}),
+    ):
+        run_workers(9082, 2, share_chromium=True)
+        assert "CHROMIUM_CDP_ENDPOINT" not in os.environ
+
+    run.assert_called_once()
+    browser.stop.assert_not_called()
+
+
+def test_read_endpoint_finds_the_devtools_line():
+    stderr = io.StringIO("[0101/000000.000000:WARNING] something\n\nDevTools listening on ws://127.0.0.1:40000/devtools/browser/abc\n")
+
+    assert _read_endpoint(stderr, float("inf")) == "ws://127.0.0.1:40000/devtools/browser/abc"
+    assert _read_endpoint(io.StringIO("crashed\n"), float("inf")) is None
+
+
+@pytest.mark.parametrize(("env", "expected_workers", "share_chromium"), [({"WORKERS": "3"}, 3, False), ({"WORKERS": "2", "CHROMIUM_MODE": "shared", "ENABLE_SVG_CONVERSION": "true"}, 2, True)])
+def test_start_server_hands_several_workers_to_the_supervisor(env, expected_workers, share_chromium):
+    with patch.dict(os.environ, env), patch.object(pandoc_controller, "run_workers") as run, patch.object(pandoc_controller.uvicorn, "run") as single:
+        pandoc_controller.start_server(9082)
+
+    run.assert_called_once_with(9082, expected_workers, share_chromium=share_chromium)
+    single.assert_not_called()